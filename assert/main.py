@@ -11,6 +11,7 @@ from typing import Any
 from src.lib.earthsystems_reg import EarthSystemsReg
 from src.models.model_e.model_e_reg import ModelEReg
 from src.lib.utils.logger import logger_setup
+from src.lib.utils.journal import get_run_start
 
 
 # Time stamp
@@ -26,9 +27,19 @@ parser.add_argument('filename', action='store',
                     help='Provide full file path')
 parser.add_argument('-m', '--model', action='store', required=True,
                     help='Provide model type', dest='modeltype')
+parser.add_argument('--resume', action='store', default=None,
+                    help='Resume an interrupted run given its run ID '
+                         '(its start time as YYYYMMDD_HHMMSS)',
+                    dest='run_id')
+parser.add_argument('--force', action='store_true',
+                    help='Run every test, even those with a cached '
+                         'result for the same commit and configuration',
+                    dest='force')
 args = parser.parse_args()
 filename = args.filename
 modeltype = args.modeltype
+run_id = args.run_id
+force = args.force
 
 
 # Removes default threshold level from root logger to allow
@@ -46,7 +57,8 @@ pwd = Path.cwd()
 
 # Main wrapper class
 class Main:
-    def __init__(self, model_type: str, file_name: str):
+    def __init__(self, model_type: str, file_name: str,
+                 run_id: str = None, force: bool = False):
         """
         Wrapper for all the classes
 
@@ -56,15 +68,25 @@ class Main:
             Model type
         file_name : str
             File name of YAML config file
+        run_id : str
+            ID of an interrupted run to resume (None for a new run)
+        force : bool
+            Whether to bypass the result cache
         """
         # Our ASSERT class manager
         self.reg: EarthSystemsReg
 
         self.file_name = file_name
         self.model_type = model_type
+        self.resume = run_id is not None
+
+        # A resumed run keeps its start time, hence its test directories
+        reg_start = get_run_start(run_id) if self.resume \
+            else dt.datetime.now()
 
         if model_type == 'modelE':
-            self.reg = ModelEReg(file_name, dt.datetime.now())
+            self.reg = ModelEReg(file_name, reg_start, resume=self.resume,
+                                 force=force)
         # elif model_type == 'GEOS':
         #     self.reg = GeosReg(file_name, dt.datetime.now())
         # elif model_type == 'GCE':
@@ -72,7 +94,8 @@ class Main:
         # elif model_type == 'NuWRF':
         #     self.reg = NuWrfReg(file_name, dt.datetime.now())
         else:
-            self.reg = EarthSystemsReg(file_name, dt.datetime.now())
+            self.reg = EarthSystemsReg(file_name, reg_start,
+                                       resume=self.resume, force=force)
 
     def run(self) -> Any:
         """
@@ -81,13 +104,18 @@ class Main:
         """
         logger.notice(f'Commencing {self.model_type} regression '
                       f'test of {self.file_name}')
-        self.reg.reset_scratch()
+        if self.resume:
+            logger.notice(f'Resuming run {self.reg.run_id}')
+        else:
+            logger.notice(f'Run ID {self.reg.run_id} (use --resume '
+                          f'{self.reg.run_id} if it is interrupted)')
+            self.reg.reset_scratch()
         self.reg.initialize()
         self.reg.report(dt.datetime.now())
         logger.success('Regression Test Completed.')
 
 
-head = Main(modeltype, filename)
+head = Main(modeltype, filename, run_id, force)
 head.run()
 
 log_file = pwd / 'assert.log'
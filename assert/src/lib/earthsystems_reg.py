@@ -3,17 +3,39 @@ Contains EarthSystemsReg class which acts as a generic manager
 for the regression testing tool
 
 """
+import json
+import time
+import tempfile
+import statistics
 import datetime as dt
 import src.lib.utils.config as config
 import src.lib.utils.paths as paths
 import logging
 
+from pathlib import Path
 from src.lib.earthsystems_testcase import EarthSystemsTestcase
 from src.lib.earthsystems_report import EarthSystemsReport
 
 from src.lib.utils.logger import logger_setup
 from src.lib.utils.server import get_hostname
-from src.lib.utils.access_repo import get_repo
+from src.lib.utils.access_repo import get_repo, git_remote_revision, \
+    git_update_mirror, clear_repo_probes
+from src.lib.utils.executor import (TestExecutor, PipelineExecutor,
+                                    get_max_workers, get_stage_workers)
+from src.lib.utils.scheduler import get_max_cores, get_adaptive_limit, \
+    JobTokenPool
+from src.lib.utils.history import DurationHistory, get_history_file, \
+    parse_walltime
+from src.lib.utils.journal import RunJournal, get_run_id, get_journal_file
+from src.lib.utils.result_cache import ResultCache, get_result_cache_dir
+from src.lib.utils.build_cache import BuildCache, get_build_cache_dir
+from src.lib.utils.batch import BatchBackend, BatchQueue, \
+    get_batch_backend, use_batch
+from src.lib.utils.modules import ModuleResolver, get_modulecmd, \
+    get_module_cache_dir
+from src.lib.utils.process import run_process, format_usage, \
+    get_usage, merge_usage
+from src.lib.utils.watchdog import RunWatchdog
 
 logger = logger_setup(filename=__name__,
                       file_handler=True,
@@ -23,7 +45,8 @@ logger = logger_setup(filename=__name__,
 
 
 class EarthSystemsReg:
-    def __init__(self, yaml_file: str, start_time: dt.datetime):
+    def __init__(self, yaml_file: str, start_time: dt.datetime,
+                 resume: bool = False, force: bool = False):
         """
         Parameters
         ----------
@@ -31,11 +54,21 @@ class EarthSystemsReg:
             YAML config file name
         start_time : dt.datetime
             Starting time as a datetime object
+        resume : bool
+            Whether to resume the interrupted run that started
+            at start_time instead of starting a new one
+        force : bool
+            Whether to run every test even if a result is cached
+            for its commit and configuration
 
         """
         # Timestamp
         self.start_time: dt.datetime = start_time
 
+        # Run ID (also the time stamp of the test directories)
+        self.run_id: str = get_run_id(start_time)
+        self.resume: bool = resume
+
         # Get dictionary from config file
         yaml_dict: dict = config.get_yaml_dict(yaml_file)
 
@@ -45,6 +78,72 @@ class EarthSystemsReg:
         # System Config Info
         self.system_cfg: dict = yaml_dict['systemconfig']
 
+        # Operations performed on every test directory, in order
+        self.stages: list[str] = ['CLONE', 'BUILD', 'RUN', 'COMPARE']
+
+        # Recorded durations of the stages of every test, resource
+        # usage of the commands of the stages being performed, and the
+        # stages that did no work (not recorded, see mark_noop)
+        self.history = DurationHistory(get_history_file(self.system_cfg))
+        self.usage: dict[tuple[str, str], dict] = dict()
+        self.noops: set[tuple[str, str]] = set()
+
+        # Journal of the stage results of this run, and results
+        # journaled before an interruption (when resuming)
+        self.journal = RunJournal(get_journal_file(self.system_cfg,
+                                                   self.run_id))
+        self.journaled: dict[tuple[str, str], dict[str, bool]] = dict()
+        if resume:
+            self.journaled = self.journal.load()
+            logger.notice(f'ESM — Resuming run {self.run_id}: '
+                          f'{len(self.journaled)} test directories '
+                          f'already started')
+
+        # Results of previous runs of the same commit and configuration,
+        # and the ones reused in this run
+        self.force: bool = force
+        self.results = ResultCache(get_result_cache_dir(self.system_cfg))
+        self.cached: dict[tuple[str, str], dict] = dict()
+
+        # Cores shared by the make jobs of builds and the model runs
+        # of this run (threads and processes alike)
+        token_dir = self.get_scratch_dir() or tempfile.gettempdir()
+        build_slots = get_stage_workers(self.system_cfg, self.stages).get(
+            'BUILD', get_max_workers(self.system_cfg))
+        self.tokens = JobTokenPool(
+            str(Path(token_dir) / f'.cores{self.run_id}.json'),
+            get_max_cores(self.system_cfg), build_slots=build_slots
+        )
+
+        # Build artifacts of identical source trees and toolchains
+        self.builds = BuildCache(get_build_cache_dir(self.system_cfg,
+                                                     self.get_scratch_dir()))
+
+        # Environments of the module lists builds and runs load,
+        # resolved once per run (and shared by its processes)
+        self.modules = ModuleResolver(get_module_cache_dir(self.system_cfg),
+                                      get_modulecmd(self.system_cfg),
+                                      since=start_time.timestamp())
+
+        # Commit the tests are run on (resolved when first needed, or
+        # the one journaled when resuming). Repositories are probed
+        # again on every run
+        self.revision: str = self.journal.load_revision() if resume \
+            else None
+        clear_repo_probes()
+
+        # Directory of the shared repository mirrors test directories
+        # check out worktrees of (None to clone every test directory)
+        self.mirror_root: str = None
+
+        # Batch system model runs are submitted to ('usebatch'), or
+        # None to run them as local processes (watched for hangs)
+        self.batch: BatchBackend = get_batch_backend(self.system_cfg) \
+            if use_batch(self.system_cfg) else None
+        # Submits the runs of concurrent tests together
+        self.batch_queue: BatchQueue = BatchQueue(self.batch) \
+            if self.batch else None
+
         # Test Config Class
         self.test_cfg = self.set_test_cfg(yaml_dict)
 
@@ -109,7 +208,7 @@ class EarthSystemsReg:
         """
         pass
 
-    def get_repo(self, directory_name: str, **kwargs) -> None:
+    def get_repo(self, directory_name: str, **kwargs) -> dict:
         """
         Wrapper for get_repo() utility function to fit needs
         of reg classes.
@@ -124,13 +223,140 @@ class EarthSystemsReg:
             Appropriate keyword arguments for
             get_repo() utility function
 
+        Returns
+        -------
+        dict
+            Result of the checkout (see get_repo)
+
+        """
+        if self.mirror_root:
+            kwargs.update(mirror_root=self.mirror_root, fetch=False)
+        if self.revision:
+            kwargs.update(revision=self.revision)
+        return get_repo(repo_type=self.get_repo_type(),
+                        repo_url=self.get_repo_url(),
+                        branch_name=self.get_repo_branch(),
+                        directory_name=directory_name,
+                        host_name=get_hostname(),
+                        **kwargs)
+
+    def get_clone_options(self, test_name: str = None) -> dict:
+        """
+        Retrieves the options of the repository checkout
+        (eg. partial, shallow, or sparse clone).
+
+        Implemented by child classes (model-dependent). There
+        are no options by default.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test the repository is checked out for
+            (None for the options of the whole run)
+
+        Returns
+        -------
+        dict
+            Keyword arguments of get_repo() utility function
+
+        """
+        return dict()
+
+    def get_mirror_root(self) -> str:
+        """
+        Retrieves the directory of the shared repository mirrors:
+        'mirror_dir' from the system config, or 'mirrors' in the
+        scratch directory.
+
+        Returns
+        -------
+        str
+            Mirror directory, or None if mirrors are disabled
+            ('use_mirror: no') or the repository is not a git one
+
         """
-        get_repo(repo_type=self.get_repo_type(),
-                 repo_url=self.get_repo_url(),
-                 branch_name=self.get_repo_branch(),
-                 directory_name=directory_name,
-                 host_name=get_hostname(),
-                 **kwargs)
+        if self.get_repo_type() != 'git' or \
+                not self.system_cfg.get('use_mirror', True):
+            return None
+        mirror_dir = self.system_cfg.get('mirror_dir')
+        if not mirror_dir:
+            mirror_dir = str(Path(self.get_scratch_dir()) / 'mirrors')
+        return mirror_dir
+
+    def update_mirror(self) -> None:
+        """
+        Creates or fetches the mirror of the repository, once per
+        run, before the test directories check it out. If it
+        fails, every test directory clones the repository instead.
+
+        """
+        mirror_root = self.get_mirror_root()
+        if not mirror_root:
+            return
+        options = self.get_clone_options()
+        options.pop('sparse_paths', None)
+        try:
+            git_update_mirror(repo_url=self.get_repo_url(),
+                              mirror_root=mirror_root,
+                              host_name=get_hostname(),
+                              **options)
+        except Exception as e:
+            logger.warning(f'ESM — Could not update the repository '
+                           f'mirror ({e}). Cloning every test '
+                           f'directory instead...')
+            self.mirror_root = None
+            return
+        self.mirror_root = mirror_root
+
+    def get_repo_revision(self) -> str:
+        """
+        Resolves the commit the repository branch points to.
+        It is only resolved once per run (and not at all when
+        resuming a run whose commit was journaled).
+
+        Returns
+        -------
+        str
+            Commit SHA, or None if unknown (not a git repository
+            or the remote could not be reached)
+
+        """
+        if self.revision is None and self.get_repo_type() == 'git':
+            self.revision = git_remote_revision(
+                repo_url=self.get_repo_url(),
+                branch_name=self.get_repo_branch(),
+                host_name=get_hostname()
+            )
+        return self.revision
+
+    def pin_revision(self) -> str:
+        """
+        Resolves the branch to a commit before any test starts, so
+        every test directory checks out (and is verified at) the same
+        commit even if the branch moves during the run. The commit
+        is journaled (a resumed run keeps testing it) and added to
+        the report.
+
+        Returns
+        -------
+        str
+            Commit SHA, or None if unknown
+
+        """
+        journaled = self.revision
+        revision = self.get_repo_revision()
+        if revision and revision == journaled:
+            logger.notice(f'ESM — Resuming {self.get_repo_branch()} at '
+                          f'journaled commit {revision}')
+        elif revision:
+            logger.notice(f'ESM — Testing {self.get_repo_branch()} at '
+                          f'commit {revision}')
+            self.journal.record_revision(revision)
+        else:
+            logger.warning('ESM — Could not resolve the commit to test. '
+                           'Each test directory checks out the branch...')
+        self.report_cfg.set_revision(revision)
+        return revision
 
     def set_test_cfg(self, yaml_dict: dict) -> EarthSystemsTestcase:
         """
@@ -188,6 +414,23 @@ class EarthSystemsReg:
         """
         logger.notice('ESM — Setting up model...')
 
+    def clone(self, test_name: str, cwd: str) -> None:
+        """
+        Checks out the repository in the code directory of a test
+        directory.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test whose code is checked out
+        cwd : str
+            Test directory
+
+        """
+        self.get_repo(directory_name=cwd + '/code',
+                      overwrite=True,
+                      **self.get_clone_options(test_name))
+
     def compile(self, test_name: str, cwd: str) -> None:
         """
         Compiles a test given its name and the appropriate
@@ -205,6 +448,377 @@ class EarthSystemsReg:
         """
         logger.info(f'ESM — Compiling {test_name}...')
 
+    def get_modules(self, test_name: str, test_dir: str) -> list[str]:
+        """
+        Retrieves the modules a test directory's builds and runs
+        load (eg. compiler and MPI library).
+
+        Implemented by child classes (model-dependent).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        list[str]
+            Modules, in load order (none are loaded if empty)
+
+        """
+        return list()
+
+    def get_env(self, test_name: str, test_dir: str) -> dict:
+        """
+        Retrieves the environment of a test directory's build and
+        run subprocesses: the current one with its modules loaded
+        (see get_modules).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        dict
+            Environment, or None to inherit the current one
+
+        """
+        modules = self.get_modules(test_name, test_dir)
+        return self.modules.get_env(modules) if modules else None
+
+    def get_stage_log(self, test_dir: str, stage: str) -> str:
+        """
+        Retrieves the file the output of a stage's commands is
+        written to.
+
+        Parameters
+        ----------
+        test_dir : str
+            Test directory the operations are performed in
+        stage : str
+            'CLONE', 'BUILD', 'RUN', or 'COMPARE'
+
+        Returns
+        -------
+        str
+            Log file (<test directory>/logs/<stage>.log)
+
+        """
+        return str(Path(test_dir) / 'logs' / f'{stage.lower()}.log')
+
+    def get_stage_timeout(self, stage: str) -> float:
+        """
+        Retrieves the time limit of each command of a stage
+        ('timeouts' in the system config, by stage, in seconds
+        or as 'HH:MM:SS').
+
+        Parameters
+        ----------
+        stage : str
+            'CLONE', 'BUILD', 'RUN', or 'COMPARE'
+
+        Returns
+        -------
+        float
+            Seconds, or None for no limit
+
+        """
+        timeout = (self.system_cfg.get('timeouts') or dict()).get(stage)
+        if not timeout:
+            return None
+        if isinstance(timeout, str):
+            return parse_walltime(timeout)
+        return float(timeout)
+
+    def get_run_outputs(self, test_dir: str) -> list[str]:
+        """
+        Retrieves the files and directories a test directory's
+        model run writes its output to, watched for progress by
+        the run's watchdog (in addition to the RUN log).
+
+        Implemented by child classes (model-dependent).
+
+        Parameters
+        ----------
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        list[str]
+            Output files and directories
+
+        """
+        return list()
+
+    def get_watchdog(self, test_dir: str,
+                     log_file: str = None) -> RunWatchdog:
+        """
+        Creates the watchdog of a model run command: the run hangs
+        if it makes no progress for 'stall_interval' in the system
+        config (seconds or 'HH:MM:SS'), see RunWatchdog.
+
+        Parameters
+        ----------
+        test_dir : str
+            Test directory the operations are performed in
+        log_file : str
+            Log file of the command (the RUN log if None)
+
+        Returns
+        -------
+        RunWatchdog
+            Watchdog, or None if runs are not watched
+
+        """
+        stall_interval = self.system_cfg.get('stall_interval')
+        if not stall_interval:
+            return None
+        if isinstance(stall_interval, str):
+            stall_interval = parse_walltime(stall_interval)
+        return RunWatchdog(
+            [log_file or self.get_stage_log(test_dir, 'RUN')] +
+            self.get_run_outputs(test_dir),
+            float(stall_interval),
+            interval=float(self.system_cfg.get('watchdog_interval', 30))
+        )
+
+    def get_hang_file(self, test_dir: str) -> str:
+        """
+        Retrieves the file the stacks of a hung model run are
+        written to (its existence marks the run as a hang).
+
+        Parameters
+        ----------
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        str
+            Hang file (<test directory>/logs/run.hang)
+
+        """
+        return str(Path(self.get_stage_log(test_dir, 'RUN'))
+                   .with_suffix('.hang'))
+
+    def get_results_file(self, test_dir: str) -> str:
+        """
+        Retrieves the file the stages of a test directory store the
+        results they add to its report in (eg. reproducibility
+        counts). It is kept when the test directory is cleared out.
+
+        Parameters
+        ----------
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        str
+            Results file (<test directory>/results.json)
+
+        """
+        return str(Path(test_dir) / 'results.json')
+
+    def read_test_results(self, test_dir: str) -> dict:
+        """
+        Reads the results the stages of a test directory added to
+        its report.
+
+        Parameters
+        ----------
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        dict
+            Report entries (empty if there are none)
+
+        """
+        try:
+            with open(self.get_results_file(test_dir), 'r') as fid:
+                return json.load(fid)
+        except FileNotFoundError:
+            return dict()
+        except (OSError, ValueError) as e:
+            logger.warning(f'ESM — Ignoring unreadable results of '
+                           f'{test_dir}: {e}')
+            return dict()
+
+    def add_test_results(self, test_dir: str, results: dict) -> None:
+        """
+        Adds results to the report of a test directory. Stages may
+        run in worker processes, so they are stored in its results
+        file rather than in memory.
+
+        Parameters
+        ----------
+        test_dir : str
+            Test directory the operations are performed in
+        results : dict
+            Report entries (JSON serializable)
+
+        """
+        test_results = self.read_test_results(test_dir)
+        test_results.update(results)
+        results_file = Path(self.get_results_file(test_dir))
+        results_file.parent.mkdir(parents=True, exist_ok=True)
+        results_file.write_text(json.dumps(test_results))
+
+    def mark_noop(self, test_dir: str, stage: str) -> None:
+        """
+        Marks a stage being performed as one that did no work (eg.
+        nothing to run), so its duration is not recorded: it would
+        make the predicted duration of the test far too short.
+
+        Parameters
+        ----------
+        test_dir : str
+            Test directory the operations are performed in
+        stage : str
+            'CLONE', 'BUILD', 'RUN', or 'COMPARE'
+
+        """
+        self.noops.add((test_dir, stage))
+
+    def add_usage(self, test_dir: str, stage: str, usage: dict) -> None:
+        """
+        Adds resource usage to a stage's, recorded with its duration.
+
+        Parameters
+        ----------
+        test_dir : str
+            Test directory the operations are performed in
+        stage : str
+            'CLONE', 'BUILD', 'RUN', or 'COMPARE'
+        usage : dict
+            Resource usage (see merge_usage)
+
+        """
+        merge_usage(self.usage.setdefault((test_dir, stage), dict()), usage)
+
+    def run_command(self, cmd: list[str], test_dir: str, stage: str,
+                    usage: dict = None, hang_file: str = None,
+                    **kwargs) -> dict:
+        """
+        Runs a command of a stage, streaming its output to the
+        stage's log file unless given another one (see run_process).
+        Its resource usage is added to the stage's, recorded with
+        its duration.
+
+        Commands of the RUN stage are watched (see get_watchdog):
+        a hung run is killed and its stacks are written to its
+        hang file.
+
+        Commands running at the same time in threads of a stage
+        (eg. run legs) collect their usage and stacks apart, and
+        merge them once they all ended.
+
+        Parameters
+        ----------
+        cmd : list[str]
+            Command
+        test_dir : str
+            Test directory the operations are performed in
+        stage : str
+            'CLONE', 'BUILD', 'RUN', or 'COMPARE'
+        usage : dict
+            Resource usage the command's is added to (the stage's
+            if None)
+        hang_file : str
+            File the stacks of a hung command are written to (the
+            test directory's hang file if None)
+        kwargs : dict
+            Other arguments of run_process (eg. cwd, env, log_file)
+
+        Returns
+        -------
+        dict
+            Result of the command (see run_process)
+
+        """
+        kwargs.setdefault('log_file', self.get_stage_log(test_dir, stage))
+        kwargs.setdefault('timeout', self.get_stage_timeout(stage))
+        if stage == 'RUN':
+            kwargs.setdefault('watchdog', self.get_watchdog(
+                test_dir, kwargs['log_file']))
+        result = run_process(cmd, **kwargs)
+        if usage is None:
+            self.add_usage(test_dir, stage, get_usage(result))
+        else:
+            merge_usage(usage, get_usage(result))
+        if result['hung']:
+            Path(hang_file or self.get_hang_file(test_dir)).write_text(
+                result['stacks'] or '')
+        if result['returncode'] != 0:
+            last_line = result['tail'][-1] if result['tail'] else ''
+            raise Exception(f'{" ".join(result["cmd"])} failed '
+                            f'({format_usage(result)}): {last_line}')
+        return result
+
+    def run_make(self, cmd: list[str], key: dict, test_dir: str,
+                 env: dict = None) -> None:
+        """
+        Runs a make command of a build with as many jobs (-j) as its
+        share of the cores not used by model runs and other builds.
+        Its duration is recorded by number of jobs (MAKE stage of
+        the history, see get_make_scaling).
+
+        Parameters
+        ----------
+        cmd : list[str]
+            make command (without -j)
+        key : dict
+            Description of the build and its make target
+        test_dir : str
+            Test directory the build is performed for (its output
+            goes to the BUILD log)
+        env : dict
+            Environment make runs in (the current one if None)
+
+        """
+        with self.tokens.hold('build') as jobs:
+            result = self.run_command([cmd[0], f'-j{jobs}'] + cmd[1:],
+                                      test_dir, 'BUILD', env=env)
+        seconds = result['duration']
+        self.history.record(dict(key, jobs=jobs), 'MAKE', seconds,
+                            usage={name: result[name] for name in
+                                   ['user_time', 'system_time',
+                                    'max_rss']})
+        logger.info(f'ESM — make -j{jobs} {key} took {seconds:.1f}s')
+
+    def get_make_scaling(self, key: dict) -> dict[int, float]:
+        """
+        Retrieves the recorded durations of a make target by number
+        of jobs, to see how a build scales.
+
+        Parameters
+        ----------
+        key : dict
+            Description of the build and its make target
+
+        Returns
+        -------
+        dict[int, float]
+            Median duration in seconds, by number of jobs (only the
+            numbers of jobs with recorded durations)
+
+        """
+        scaling = dict()
+        for jobs in range(1, self.tokens.max_cores + 1):
+            durations = self.history.durations(dict(key, jobs=jobs), 'MAKE')
+            if durations:
+                scaling[jobs] = statistics.median(durations)
+        return scaling
+
     def run(self, test_name: str, cwd: str) -> None:
         """
         Runs a test given its name and the appropriate
@@ -239,6 +853,610 @@ class EarthSystemsReg:
         """
         logger.info(f'ESM — Comparing {test_name}...')
 
+    def new_test_report(self, test_name: str, test_dir: str) -> dict:
+        """
+        Creates the report entry of a test directory with
+        every operation marked as failed.
+
+        Implemented by child classes (model-dependent).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        dict
+            Results of a test
+
+        """
+        test_report = {'TEST': test_name, 'DIRECTORY': test_dir}
+        for stage in self.stages:
+            test_report[stage] = False
+        return test_report
+
+    def run_stage(self, stage: str, test_name: str, test_dir: str) -> bool:
+        """
+        Performs one operation (stage) on a test directory.
+
+        Does not change the working directory, so stages of
+        different tests may run in threads at the same time.
+
+        Every result is journaled. When resuming a run, stages
+        journaled before the interruption are not performed again
+        and their journaled result is returned instead. Likewise,
+        the result of a cached test is returned for each stage.
+
+        Parameters
+        ----------
+        stage : str
+            'CLONE', 'BUILD', 'RUN', or 'COMPARE'
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operation is performed in
+
+        Returns
+        -------
+        bool
+            True if the operation succeeded, False otherwise.
+
+        """
+        journaled = self.journaled.get((test_name, test_dir), dict())
+        if stage in journaled:
+            logger.info(f'ESM — {stage} of {test_name} [{test_dir}] '
+                        f'already performed before the interruption')
+            return journaled[stage]
+        cached = self.cached.get((test_name, test_dir), dict())
+        if isinstance(cached.get(stage), bool):
+            logger.info(f'ESM — {stage} of {test_name} [{test_dir}] '
+                        f'reused from the result cache')
+            return cached[stage]
+
+        self.usage.pop((test_dir, stage), None)
+        self.noops.discard((test_dir, stage))
+        if stage == 'RUN':
+            Path(self.get_hang_file(test_dir)).unlink(missing_ok=True)
+            Path(self.get_results_file(test_dir)).unlink(missing_ok=True)
+        start = time.perf_counter()
+        try:
+            if stage == 'CLONE':
+                self.clone(test_name=test_name, cwd=test_dir)
+            elif stage == 'BUILD':
+                self.compile(test_name=test_name, cwd=test_dir)
+            elif stage == 'RUN' and self.batch:
+                # Batch jobs run on the nodes of the scheduler
+                self.run(test_name=test_name, cwd=test_dir)
+            elif stage == 'RUN':
+                with self.tokens.hold('run', self.get_test_cores(
+                        test_name, test_dir)):
+                    self.run(test_name=test_name, cwd=test_dir)
+            elif stage == 'COMPARE':
+                self.compare(test_name=test_name, cwd=test_dir)
+            else:
+                raise Exception(f'Unknown stage {stage}.')
+        except Exception as e:
+            logger.error(f'ESM — {stage} failed for {test_name} '
+                         f'[{test_dir}]: {e}')
+            self.journal.record(test_name, test_dir, stage, False)
+            self.usage.pop((test_dir, stage), None)
+            return False
+
+        self.journal.record(test_name, test_dir, stage, True)
+        usage = self.usage.pop((test_dir, stage), None)
+        if (test_dir, stage) in self.noops:
+            self.noops.discard((test_dir, stage))
+            logger.debug(f'ESM — {stage} of {test_name} [{test_dir}] '
+                         f'did nothing, its duration is not recorded')
+        else:
+            self.history.record(self.get_test_key(test_name, test_dir),
+                                stage, time.perf_counter() - start,
+                                usage=usage)
+        if stage == self.stages[-1]:
+            # Clears out test directory if it passes
+            paths.clean_dir(test_dir,
+                            exclude=[self.get_results_file(test_dir)])
+        return True
+
+    def run_test(self, test_name: str, test_dir: str) -> dict:
+        """
+        Clones, compiles, runs, and compares a single test directory,
+        stopping at the first operation that fails.
+
+        Each test directory is independent of the others, so this
+        may be called from a worker process.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        dict
+            Results of the test
+
+        """
+        test_report = self.new_test_report(test_name, test_dir)
+        for stage in self.stages:
+            test_report[stage] = self.run_stage(stage, test_name,
+                                                test_dir)
+            if not test_report[stage]:
+                break
+
+        return test_report
+
+    def test_passed(self, test_report: dict) -> bool:
+        """
+        Checks if every operation of a test succeeded.
+
+        Parameters
+        ----------
+        test_report : dict
+            Results of a test
+
+        Returns
+        -------
+        bool
+            True if the test passed, False otherwise.
+
+        """
+        return all(test_report[stage] is True for stage in self.stages)
+
+    def skip_test(self, test_name: str, test_dir: str) -> dict:
+        """
+        Creates the report entry of a test directory that was not
+        run because a test it depends on failed.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations would be performed in
+
+        Returns
+        -------
+        dict
+            Results of the test, with no operation performed
+
+        """
+        test_report = self.new_test_report(test_name, test_dir)
+        for stage in self.stages:
+            test_report[stage] = None
+        return test_report
+
+    def get_test_cores(self, test_name: str, test_dir: str) -> int:
+        """
+        Retrieves the number of cores a test directory's run uses.
+
+        Implemented by child classes (model-dependent).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        int
+            Number of cores
+
+        """
+        return 1
+
+    def get_test_key(self, test_name: str, test_dir: str) -> dict:
+        """
+        Describes a test directory for the duration history.
+        Tests with the same description are expected to take
+        about as long.
+
+        Implemented by child classes (model-dependent).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        dict
+            Test description
+
+        """
+        return {'test': test_name, 'directory': Path(test_dir).name}
+
+    def get_test_duration(self, test_name: str, test_dir: str) -> float:
+        """
+        Predicts how long a test directory takes from its recorded
+        durations.
+
+        Implemented by child classes (model-dependent).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        float
+            Predicted duration in seconds, or None if unknown
+
+        """
+        return self.history.predict(self.get_test_key(test_name, test_dir),
+                                    self.stages)
+
+    def get_result_key(self, test_name: str, test_dir: str) -> dict:
+        """
+        Describes everything the result of a test directory depends
+        on, for the result cache.
+
+        Implemented by child classes (model-dependent).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        dict
+            Test description, or None if results can't be cached
+            (the commit is unknown)
+
+        """
+        revision = self.get_repo_revision()
+        if not revision:
+            return None
+        return {'repository': self.get_repo_url(),
+                'branch': self.get_repo_branch(),
+                'revision': revision,
+                'testcase': self.test_cfg.get_testcase(test_name),
+                'directory': Path(test_dir).name}
+
+    def get_build_key(self, test_name: str, test_dir: str) -> dict:
+        """
+        Describes everything the build of a test directory depends
+        on (source tree and toolchain), for the build cache.
+
+        Implemented by child classes (model-dependent).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        dict
+            Build description, or None if builds can't be cached
+
+        """
+        pass
+
+    def get_build_artifacts(self, test_name: str,
+                            test_dir: str) -> dict[str, str]:
+        """
+        Retrieves the files and directories a build produces.
+
+        Implemented by child classes (model-dependent).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        dict[str, str]
+            Path of each artifact, by artifact name
+
+        """
+        return dict()
+
+    def get_build_patterns(self) -> dict[str, list[str]]:
+        """
+        Retrieves the name patterns of the files cached from each
+        artifact directory (all files if an artifact has none).
+
+        Implemented by child classes (model-dependent).
+
+        Returns
+        -------
+        dict[str, list[str]]
+            File name patterns, by artifact name
+
+        """
+        return dict()
+
+    def restore_build(self, test_name: str, test_dir: str) -> bool:
+        """
+        Restores the build of a test directory from the build
+        cache.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        Returns
+        -------
+        bool
+            True if the build was restored (no need to compile),
+            False otherwise.
+
+        """
+        key = self.get_build_key(test_name, test_dir)
+        artifacts = self.get_build_artifacts(test_name, test_dir)
+        if key is None or not artifacts:
+            return False
+        if not self.builds.restore(key, artifacts):
+            return False
+        logger.info(f'ESM — Build of {test_name} [{test_dir}] restored '
+                    f'from the build cache')
+        return True
+
+    def cache_build(self, test_name: str, test_dir: str) -> None:
+        """
+        Stores the build of a test directory in the build cache.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the operations are performed in
+
+        """
+        key = self.get_build_key(test_name, test_dir)
+        artifacts = self.get_build_artifacts(test_name, test_dir)
+        if key is not None and artifacts:
+            self.builds.store(key, artifacts,
+                              patterns=self.get_build_patterns())
+
+    def get_cached_results(self, jobs: list[tuple]) -> dict:
+        """
+        Looks up the cached result of every job.
+
+        Parameters
+        ----------
+        jobs : list[tuple]
+            (test name, test directory) of each job
+
+        Returns
+        -------
+        dict[tuple[str, str], dict]
+            Cached test report of each job that has one
+
+        """
+        if self.force:
+            logger.info('ESM — Result cache bypassed (forced run)')
+            return dict()
+
+        cached = dict()
+        for test_name, test_dir in jobs:
+            key = self.get_result_key(test_name, test_dir)
+            if key is None:
+                logger.info('ESM — Commit unknown, results not cached')
+                return dict()
+            test_report = self.results.get(key)
+            if test_report:
+                cached[(test_name, test_dir)] = test_report
+                logger.info(f'ESM — Reusing cached result of '
+                            f'{test_name} [{test_dir}]')
+        return cached
+
+    def cache_results(self, jobs: list[tuple],
+                      test_reports: list[dict]) -> None:
+        """
+        Stores the results of the jobs run in this run.
+
+        Skipped tests and tests whose first operation failed
+        (nothing was tested) are not cached.
+
+        Parameters
+        ----------
+        jobs : list[tuple]
+            (test name, test directory) of each job
+        test_reports : list[dict]
+            Results of each job (same order as jobs)
+
+        """
+        for (test_name, test_dir), test_report in zip(jobs, test_reports):
+            if (test_name, test_dir) in self.cached:
+                continue
+            if test_report[self.stages[0]] is not True:
+                continue
+            key = self.get_result_key(test_name, test_dir)
+            if key is None:
+                return
+            self.results.put(key, test_report)
+
+    def get_job_weights(self, jobs: list[tuple]) -> dict[int, float]:
+        """
+        Predicts the duration of every job so the longest ones are
+        started first. Jobs with no prediction get the median of
+        the others.
+
+        Parameters
+        ----------
+        jobs : list[tuple]
+            (test name, test directory) of each job
+
+        Returns
+        -------
+        dict[int, float]
+            Predicted duration of each job index
+
+        """
+        self.history.load()
+        durations = {index: self.get_test_duration(test_name, test_dir)
+                     for index, (test_name, test_dir) in enumerate(jobs)}
+
+        known = [duration for duration in durations.values()
+                 if duration is not None]
+        default = statistics.median(known) if known else 1
+        for index, duration in durations.items():
+            if duration is None:
+                durations[index] = default
+            logger.debug(f'Expected duration of {jobs[index][0]} '
+                         f'[{jobs[index][1]}]: {durations[index]:.0f}s')
+        return durations
+
+    def get_job_dependencies(self, jobs: list[tuple]) -> dict[int, list[int]]:
+        """
+        Maps testcase dependencies onto test directory jobs.
+
+        A test directory depends on the directory with the same
+        name (compiler/mode) of each testcase it depends on, or on
+        all of its directories if there is no such match.
+
+        Parameters
+        ----------
+        jobs : list[tuple]
+            (test name, test directory) of each job
+
+        Returns
+        -------
+        dict[int, list[int]]
+            Indices of the jobs each job index depends on
+
+        """
+        dependencies = self.test_cfg.get_dependencies()
+
+        indices: dict[str, list[int]] = dict()
+        for index, (test_name, _) in enumerate(jobs):
+            indices.setdefault(test_name, list()).append(index)
+
+        job_dependencies = dict()
+        for index, (test_name, test_dir) in enumerate(jobs):
+            job_dependencies[index] = list()
+            for dep in dependencies.get(test_name, []):
+                dep_indices = indices.get(dep, [])
+                matches = [dep_index for dep_index in dep_indices
+                           if Path(jobs[dep_index][1]).name ==
+                           Path(test_dir).name]
+                job_dependencies[index].extend(matches or dep_indices)
+
+        return job_dependencies
+
+    def run_tests(self) -> None:
+        """
+        Runs every test directory set up by the testcase manager.
+
+        If 'pipeline' in the system config gives pool sizes per stage,
+        stages of different tests overlap, each test moving on to its
+        next stage as soon as a worker of that stage is free.
+        Otherwise, test directories are run whole, concurrently when
+        'max_workers' in the system config is greater than 1.
+
+        Either way, a test starts as soon as the tests it depends on
+        have passed (longest expected duration first), and the cores
+        of running tests never exceed 'max_cores' in the system config
+        (the node's cores by default), unless runs are batch jobs.
+        Results are added to the report in test directory order.
+
+        With 'adaptive' in the system config, the number of tests
+        (or stages) running at the same time follows the load of the
+        node, between the configured bounds.
+
+        Tests with a cached result for the same commit and
+        configuration are not run again (unless forced); their
+        cached result is reported and marked as such.
+
+        Results the stages add to a test's report (see
+        add_test_results) are merged into it, and cached with it.
+
+        The repository mirror is fetched once, before any test
+        runs, and each test directory checks out a worktree of it.
+
+        """
+        jobs = list()
+        for test_name, test_dirs in self.test_cfg.get_dirs().items():
+            for test_dir in test_dirs:
+                jobs.append((test_name, test_dir))
+        dependencies = self.get_job_dependencies(jobs)
+        weights = self.get_job_weights(jobs)
+        if self.batch:
+            # Runs are batch jobs, so they don't use the node's cores
+            cores = dict()
+            max_cores = None
+        else:
+            cores = {index: self.get_test_cores(test_name, test_dir)
+                     for index, (test_name, test_dir) in enumerate(jobs)}
+            max_cores = get_max_cores(self.system_cfg)
+        self.cached = self.get_cached_results(jobs)
+        if len(self.cached) < len(jobs):
+            self.update_mirror()
+
+        stage_workers = get_stage_workers(self.system_cfg, self.stages)
+        if stage_workers:
+            limit = get_adaptive_limit(self.system_cfg,
+                                       sum(stage_workers.values()))
+            executor = PipelineExecutor(stage_workers,
+                                        max_cores=max_cores,
+                                        limit=limit)
+            stage_results = executor.run(self.run_stage, jobs,
+                                         dependencies=dependencies,
+                                         weights=weights,
+                                         cores=cores)
+            test_reports = list()
+            for (test_name, test_dir), results in zip(jobs,
+                                                      stage_results):
+                if results:
+                    test_report = self.new_test_report(test_name,
+                                                       test_dir)
+                    test_report.update(results)
+                else:
+                    test_report = self.skip_test(test_name, test_dir)
+                test_reports.append(test_report)
+        else:
+            max_workers = get_max_workers(self.system_cfg)
+            executor = TestExecutor(max_workers, max_cores=max_cores,
+                                    limit=get_adaptive_limit(
+                                        self.system_cfg, max_workers))
+            test_reports = executor.run(self.run_test, jobs,
+                                        dependencies=dependencies,
+                                        weights=weights,
+                                        is_success=self.test_passed,
+                                        on_skip=self.skip_test,
+                                        cores=cores)
+
+        for job, test_report in zip(jobs, test_reports):
+            if job in self.cached:
+                test_report.update({name: value for name, value
+                                    in self.cached[job].items()
+                                    if name not in test_report})
+            else:
+                test_report.update(self.read_test_results(job[1]))
+        self.cache_results(jobs, test_reports)
+        for job, test_report in zip(jobs, test_reports):
+            if job in self.cached:
+                test_report['CACHED'] = True
+            elif Path(self.get_hang_file(job[1])).exists():
+                test_report['HANG'] = True
+            self.report_cfg.add_test(test_report)
+
     def initialize(self) -> None:
         """
         Initializes the regression testing process.
@@ -269,4 +1487,10 @@ class EarthSystemsReg:
 
         """
         logger.notice('ESM — Resetting scratch directory...')
-        paths.clean_dir(self.get_scratch_dir())
+        # Repository mirrors are kept, so only new commits are
+        # fetched, and so are cached builds
+        mirror_root = self.get_mirror_root()
+        exclude = [self.builds.cache_dir]
+        if mirror_root:
+            exclude.append(mirror_root)
+        paths.clean_dir(self.get_scratch_dir(), exclude=exclude)
@@ -53,6 +53,9 @@ class EarthSystemsReport:
         # Start time
         self.start_time = start_time
 
+        # Commit the tests were run on (None if unknown)
+        self.revision: str = None
+
         # Passed on config info
         self.model_cfg = model_cfg
         self.system_cfg = system_cfg
@@ -138,6 +141,18 @@ class EarthSystemsReport:
                   '*': 'Operation not performed'}
         return legend
 
+    def set_revision(self, revision: str) -> None:
+        """
+        Sets the commit the tests were run on.
+
+        Parameters
+        ----------
+        revision : str
+            Commit SHA
+
+        """
+        self.revision = revision
+
     def get_subject(self) -> str:
         """
         Accessor method for subject field
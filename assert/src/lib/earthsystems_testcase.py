@@ -105,6 +105,26 @@ class EarthSystemsTestcase:
         """
         return self.testcases
 
+    def get_testcase(self, test_name: str) -> dict:
+        """
+        Retrieves the configuration of a testcase given its name
+
+        Parameters
+        ----------
+        test_name : str
+            Name of testcase
+
+        Returns
+        -------
+        dict
+            Testcase configuration (empty if there is no such test)
+
+        """
+        for testcase in self.testcases:
+            if testcase['name'] == test_name:
+                return testcase
+        return dict()
+
     def get_runnable(self) -> list[dict]:
         """
         Retrieves list of testcases that will be run
@@ -124,6 +144,46 @@ class EarthSystemsTestcase:
                            'instantiated. Run setup_tests() first.')
             return self.dirs
 
+    def get_dependencies(self) -> dict[str, list[str]]:
+        """
+        Retrieves the testcases each runnable testcase depends on
+        from its 'dependencies' entry (a name, a comma-separated
+        string, a list, or 'none').
+
+        Dependencies on testcases that are not runnable are ignored.
+
+        Returns
+        -------
+        dict[str, list[str]]
+            Runnable test names and the names they depend on
+
+        """
+        names = self.get_testcase_names()
+        runnable = self.get_runnable_names()
+
+        dependencies = dict()
+        for testcase in self.runnable:
+            deps = testcase.get('dependencies')
+            if not deps or deps == 'none':
+                deps = []
+            elif isinstance(deps, str):
+                deps = [dep.strip() for dep in deps.split(',')]
+
+            dependencies[testcase['name']] = list()
+            for dep in deps:
+                if dep not in names:
+                    logger.error(f"{testcase['name']} depends on "
+                                 f"unknown testcase {dep}")
+                    raise Exception(f'Dependency {dep} not found.')
+                elif dep not in runnable:
+                    logger.warning(f"{testcase['name']} depends on "
+                                   f"{dep}, which is not run. "
+                                   f"Ignoring dependency...")
+                else:
+                    dependencies[testcase['name']].append(dep)
+
+        return dependencies
+
     def setup_tests(self, time_stamp: str = None) -> None:
         """
         Set up the directory structure for the tests
@@ -3,19 +3,38 @@
 """
 Contains a function for accessing Git repositories:
 
+ - get_repo
+ - run_checkout
+ - run_git_backend
+ - probe_repo
+ - clear_repo_probes
  - git_clone
+ - git_update_clone
+ - git_tree_hash
+ - git_checkout_revision
  - confirm_git_clone
+ - git_remote_revision
+ - git_sparse_checkout
+ - git_log
+ - git_update_mirror
+ - git_worktree_add
+ - git_mirror_clone
 """
 
 import logging
 import subprocess as sp
 import os
+import asyncio
+import re
+import time
+import hashlib
+import threading
 
 from pathlib import Path
 from src.lib.utils.config import config_section_map
-from src.lib.utils.paths import check_dir_exists, check_file_exists
-from src.lib.utils.server import is_valid_url
+from src.lib.utils.paths import check_dir_exists, async_lock_path
 from src.lib.utils.logger import logger_setup
+from src.lib.utils.process import run_process, format_usage
 
 # Logger format settings
 logger = logger_setup(filename=__name__,
@@ -23,12 +42,23 @@ logger = logger_setup(filename=__name__,
                       file_level=logging.INFO,
                       stream_handler=False)
 
+# Seconds a repository probe is reused (see probe_repo)
+PROBE_TTL = 600
+
+# Repository probes by URL and the locks serializing them
+probes: dict[str, dict] = dict()
+probe_locks: dict[str, threading.Lock] = dict()
+probes_lock = threading.Lock()
+
 
 def get_repo(repo_type: str,
              local: bool = False,
              configs: bool = False,
-             **kwargs) -> None:
+             mirror_root: str = None,
+             **kwargs) -> dict:
     """
+    Synchronous wrapper over the checkout of the version control
+    backends (see the vcs utility module).
 
     Parameters
     ----------
@@ -38,36 +68,118 @@ def get_repo(repo_type: str,
         For CVS – True if a local repo checkout, False otherwise
     configs : bool
         For CVS – True if kwargs is just 'config', False otherwise
+    mirror_root : str
+        For git – directory of the shared repository mirrors. If
+        given, a worktree of the mirror is checked out instead of
+        cloning the repository
     kwargs : dict
         Rest of appropriate entries for respective repository
         access functions
 
+    Returns
+    -------
+    dict
+        Result of the checkout: 'directory', 'revision', 'duration',
+        and 'bytes'
+
     """
     if repo_type == 'git':
-        git_clone(**kwargs)
+        if mirror_root:
+            kwargs['mirror_root'] = mirror_root
+        return run_checkout('git', **kwargs)
     elif repo_type == 'cvs':
         if configs:
-            cvs_checkout_repository(**kwargs)
+            return cvs_checkout_repository(**kwargs)
         elif local:
-            cvs_checkout(**kwargs)
+            return cvs_checkout(**kwargs)
         else:
-            cvs_checkout_repos(**kwargs)
+            return cvs_checkout_repos(**kwargs)
     elif repo_type == 'svn':
-        svn_checkout_repository(**kwargs)
+        return svn_checkout_repository(**kwargs)
     else:
         raise Exception('Repo type must be git, cvs, or svn.')
 
 
+def run_checkout(repo_type: str,
+                 host_name: str = None,
+                 update: bool = False,
+                 **kwargs) -> dict:
+    """
+    Runs the checkout of a version control backend until it is
+    done.
+
+    Parameters
+    ----------
+    repo_type : str
+        Type of repository: git/cvs/svn
+    host_name : str
+        Host name
+    update : bool
+        Whether to update the checkout instead if its directory
+        already exists
+    kwargs : dict
+        Arguments of the checkout() method of the backend
+
+    Returns
+    -------
+    dict
+        Result of the checkout
+
+    """
+    # The backends are built on the functions of this module
+    from src.lib.utils.vcs import get_vcs_backend
+
+    backend = get_vcs_backend(repo_type, host_name=host_name)
+    if update and check_dir_exists(kwargs['directory_name']):
+        return asyncio.run(backend.update(
+            kwargs['directory_name'],
+            branch_name=kwargs.get('branch_name'),
+            revision=kwargs.get('revision'),
+            repo_url=kwargs.get('repo_url')))
+    return asyncio.run(backend.checkout(**kwargs))
+
+
+def run_git_backend(operation: str, host_name: str = None, **kwargs):
+    """
+    Runs an operation of the git backend (see the vcs utility
+    module) until it is done. The git functions of this module are
+    wrappers over it, so clones, updates, and mirrors have a single
+    implementation.
+
+    Parameters
+    ----------
+    operation : str
+        Name of the GitBackend method
+    host_name : str
+        Host name
+    kwargs : dict
+        Arguments of the method
+
+    Returns
+    -------
+    Any
+        Result of the method
+
+    """
+    from src.lib.utils.vcs import GitBackend
+
+    backend = GitBackend(host_name=host_name)
+    return asyncio.run(getattr(backend, operation)(**kwargs))
+
+
 def run_cmd(cmd: list[str], **kwargs) -> bool:
     """
-    Supporting function for running commands related to cloning
+    Supporting function for running commands related to cloning.
+    Output is streamed (see run_process) rather than buffered, and
+    only its last lines are logged if the command fails.
 
     Parameters
     ----------
     cmd : list[str]
        List of strings to run as command in command-line
     kwargs
-       Dictionary of other args for sp
+       Dictionary of other args for run_process (eg. log_file,
+       timeout) and sp
 
     Returns
     -------
@@ -75,13 +187,11 @@ def run_cmd(cmd: list[str], **kwargs) -> bool:
         True if command run was successful, False otherwise.
 
     """
-    run = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE, **kwargs)
-
-    output = run.communicate()
-    return_code = run.wait()
-    if return_code != 0:
-        logger.error(f'0: {output[0].decode("UTF-8")} \n'
-                     f'1: {output[1].decode("UTF-8")}')
+    result = run_process(cmd, **kwargs)
+    if result['returncode'] != 0:
+        output = '\n'.join(result['tail'])
+        logger.error(f'{" ".join(result["cmd"])} failed '
+                     f'({format_usage(result)}):\n{output}')
         return False
     else:
         return True
@@ -109,15 +219,19 @@ def rm_dir(directory_name: str) -> bool:
     return run_cmd(remove_cmd)
 
 
-def check_repo_url(repo_url: str) -> bool:
+def check_repo_url(repo_url: str, host_name: str = None) -> bool:
     """
-    Checks if the repo_url is a valid URL address or a valid local
-    repository/directory.
+    Checks if the repo_url is a reachable repository (including
+    SSH addresses like git@host:repo) or a valid local
+    repository/directory. The check is only done once per
+    repository (see probe_repo).
 
     Parameters
     ----------
     repo_url : str
         Repository address
+    host_name : str
+        Host name
 
     Returns
     -------
@@ -125,14 +239,182 @@ def check_repo_url(repo_url: str) -> bool:
         True if valid URL or local repository, False otherwise.
 
     """
-    return is_valid_url(repo_url) or check_dir_exists(repo_url)
+    return probe_repo(repo_url, host_name=host_name)['reachable']
+
+
+def probe_repo(repo_url: str,
+               host_name: str = None,
+               ttl: float = PROBE_TTL) -> dict:
+    """
+    Checks if a repository is reachable and lists its branches with
+    a single 'git ls-remote'. The probe is remembered for ttl seconds,
+    so the following checkouts of the repository do not reach the
+    server again.
+
+    Local directories that are not git repositories (eg. CVS
+    checkouts) are reachable, without branches.
+
+    Parameters
+    ----------
+    repo_url : str
+        Repository address or local repository
+    host_name : str
+        Host name
+    ttl : float
+        Seconds a previous probe of the repository is reused
+
+    Returns
+    -------
+    dict
+        'reachable' (bool), 'heads' (commit SHA of each branch),
+        'default' (default branch, None if unknown), and 'refs'
+        (other refs resolved since, see git_remote_revision)
+
+    """
+    with probes_lock:
+        lock = probe_locks.setdefault(repo_url, threading.Lock())
+    with lock:
+        probe = probes.get(repo_url)
+        if probe and time.monotonic() - probe['time'] < ttl:
+            return probe
+
+        probe = {'reachable': False, 'heads': dict(), 'default': None,
+                 'refs': dict(), 'time': time.monotonic()}
+        cmd = [get_git_executable(host_name), 'ls-remote', '--symref',
+               repo_url, 'HEAD', 'refs/heads/*']
+        try:
+            run = sp.run(cmd, stdout=sp.PIPE, stderr=sp.PIPE, timeout=60,
+                         stdin=sp.DEVNULL,
+                         env=dict(os.environ, GIT_TERMINAL_PROMPT='0'))
+            error = run.stderr.decode('UTF-8').strip()
+        except (OSError, sp.TimeoutExpired) as e:
+            run, error = None, str(e)
+
+        if run is not None and run.returncode == 0:
+            probe['reachable'] = True
+            for line in run.stdout.decode('UTF-8').splitlines():
+                value, _, name = line.partition('\t')
+                if value.startswith('ref: refs/heads/') and name == 'HEAD':
+                    probe['default'] = value[len('ref: refs/heads/'):]
+                elif name.startswith('refs/heads/'):
+                    probe['heads'][name[len('refs/heads/'):]] = value
+        elif check_dir_exists(repo_url):
+            probe['reachable'] = True
+        else:
+            logger.warning(f'Repository {repo_url} is not reachable: '
+                           f'{error}')
+
+        probes[repo_url] = probe
+        return probe
+
+
+def clear_repo_probes() -> None:
+    """
+    Forgets every repository probe (eg. at the start of a run).
+
+    """
+    with probes_lock:
+        probes.clear()
+
+
+def get_git_executable(host_name: str = None) -> str:
+    """
+    Retrieves the git executable to use on a host
+
+    Parameters
+    ----------
+    host_name : str
+        Host name
+
+    Returns
+    -------
+    str
+        Path or name of the git executable
+
+    """
+    if host_name == 'DISCOVER':
+        return '/usr/local/other/git/2.30.2/libexec/git-core/git'
+    elif host_name == 'PLEIADES':
+        return '/nobackup/gmao_SIteam/git/git-2.21.0/bin/git'
+    else:
+        return 'git'
+
+
+def git_remote_revision(repo_url: str,
+                        branch_name: str = None,
+                        host_name: str = None) -> str:
+    """
+    Resolves the commit a branch of a repository points to,
+    without cloning it. Branches are read from the (remembered)
+    probe of the repository
+
+    Parameters
+    ----------
+    repo_url : str
+        Repository address or local repository
+    branch_name : str
+        Branch (or tag) to resolve, if None the default
+        branch (HEAD) of the repository
+    host_name : str
+        Host name
+
+    Returns
+    -------
+    str
+        Commit SHA, or None if it could not be resolved
+
+    """
+    probe = probe_repo(repo_url, host_name=host_name)
+    if not probe['reachable']:
+        logger.warning(f'Could not resolve {branch_name} of {repo_url}')
+        return None
+    ref = branch_name if branch_name else probe['default']
+    if ref in probe['heads']:
+        return probe['heads'][ref]
+    if ref in probe['refs']:
+        return probe['refs'][ref]
+
+    # Tags (or a repository without a default branch) are resolved on
+    # their own, and remembered with the probe
+    ref = ref if ref else 'HEAD'
+    cmd = [get_git_executable(host_name), 'ls-remote', repo_url,
+           ref, ref + '^{}']
+    try:
+        run = sp.run(cmd, stdout=sp.PIPE, stderr=sp.PIPE, timeout=60)
+    except (OSError, sp.TimeoutExpired) as e:
+        logger.warning(f'Could not resolve {ref} of {repo_url}: {e}')
+        return None
+    if run.returncode != 0:
+        logger.warning(f'Could not resolve {ref} of {repo_url}: '
+                       f'{run.stderr.decode("UTF-8").strip()}')
+        return None
+
+    # Lines are '<sha>\t<ref name>'. Prefer the branch over a tag
+    # with the same name and an annotated tag's commit (^{})
+    refs = dict()
+    for line in run.stdout.decode('UTF-8').splitlines():
+        sha, _, name = line.partition('\t')
+        refs[name] = sha
+    for name in [f'refs/heads/{ref}', f'refs/tags/{ref}^{{}}',
+                 f'refs/tags/{ref}', ref]:
+        if name in refs:
+            probe['refs'][ref] = refs[name]
+            return refs[name]
+    if refs:
+        probe['refs'][ref] = next(iter(refs.values()))
+        return probe['refs'][ref]
+    logger.warning(f'{ref} not found in {repo_url}')
+    return None
 
 
 def config_git_clone(repo_url: str,
                      directory_name: str = None,
                      branch_name: str = None,
                      clone_depth: int = None,
-                     host_name: str = None) -> list[str]:
+                     host_name: str = None,
+                     filter_spec: str = None,
+                     shallow_since: str = None,
+                     sparse: bool = False) -> list[str]:
     """
     Configures the command to run git clone
 
@@ -150,6 +432,14 @@ def config_git_clone(repo_url: str,
         The depth to which to clone
     host_name : str
         Host name
+    filter_spec : str
+        Partial clone filter (eg. 'blob:none' to only download
+        the file contents that are checked out)
+    shallow_since : str
+        Only clone the history after this date
+    sparse : bool
+        Whether to start with a sparse checkout (only the files
+        at the top of the repository)
 
     Returns
     -------
@@ -168,14 +458,7 @@ def config_git_clone(repo_url: str,
                     f'[repo: {repo_url}]...')
 
     # Configuration based on host_name for git clone command
-    if host_name == 'DISCOVER':
-        cmd = ['/usr/local/other/git/2.30.2/libexec/git-core/git',
-               'clone']
-    elif host_name == 'PLEIADES':
-        cmd = ['/nobackup/gmao_SIteam/git/git-2.21.0/bin/git',
-               'clone']
-    else:
-        cmd = ['git', 'clone']
+    cmd = [get_git_executable(host_name), 'clone']
 
     # Configuration for repo branch name argument
     if branch_name:
@@ -189,7 +472,19 @@ def config_git_clone(repo_url: str,
             logger.error('Invalid clone depth. Quitting git clone...')
             raise Exception('git clone failed.')
 
-    # Configuration for repo url argument
+    # Configuration for partial, shallow-since, and sparse clones
+    if filter_spec:
+        cmd.append(f'--filter={filter_spec}')
+    if shallow_since:
+        cmd.append(f'--shallow-since={shallow_since}')
+    if sparse:
+        cmd.append('--sparse')
+
+    # Configuration for repo url argument. Local repositories are
+    # otherwise copied whole, ignoring depth and filter options
+    if (clone_depth or filter_spec or shallow_since) and \
+            check_dir_exists(repo_url):
+        repo_url = 'file://' + str(Path(repo_url).absolute())
     cmd.append(repo_url)
 
     # Configuration for local directory destination argument
@@ -204,12 +499,18 @@ def git_clone(repo_url: str,
               branch_name: str = None,
               clone_depth: int = None,
               overwrite: bool = False,
-              host_name: str = None) -> None:
+              host_name: str = None,
+              filter_spec: str = None,
+              shallow_since: str = None,
+              sparse_paths: list[str] = None,
+              revision: str = None) -> None:
     """
-    Clone model from git repository.
+    Clone model from git repository (see the checkout() method of
+    the git backend). An existing clone of the same repository is
+    only brought up to date when it may be overwritten.
 
-    NOTE: Clones model in the directory it is called
-          from and returns output of git command
+    NOTE: Relative directory names are cloned in the directory it
+          is called from
 
     Parameters
     ----------
@@ -227,62 +528,195 @@ def git_clone(repo_url: str,
         Whether to overwrite an existing directory with the same name
     host_name : str
         Host name
+    filter_spec : str
+        Partial clone filter (eg. 'blob:none')
+    shallow_since : str
+        Only clone the history after this date
+    sparse_paths : list[str]
+        Only check out these directories (sparse checkout)
+    revision : str
+        Commit SHA to check out (the branch is moved to it), so
+        every clone is at the same commit even if the branch moves
 
     """
-    if not check_repo_url(repo_url):
-        logger.error('Invalid repo address. Quitting git clone...')
-        raise Exception('git clone failed.')
+    run_git_backend('checkout', host_name=host_name,
+                    repo_url=repo_url,
+                    directory_name=directory_name,
+                    branch_name=branch_name,
+                    revision=revision,
+                    overwrite=overwrite,
+                    clone_depth=clone_depth,
+                    filter_spec=filter_spec,
+                    shallow_since=shallow_since,
+                    sparse_paths=sparse_paths)
+    logger.success('git clone successful.')
+
+
+def same_repo_url(repo_url1: str, repo_url2: str) -> bool:
+    """
+    Checks if two repository addresses designate the same
+    repository (ignoring a trailing slash or .git suffix, and
+    comparing local repositories by their real path).
 
-    if not directory_name:
-        directory_name = Path(repo_url).stem
+    Parameters
+    ----------
+    repo_url1 : str
+        Repository address or local repository
+    repo_url2 : str
+        Repository address or local repository
+
+    Returns
+    -------
+    bool
+        True if both addresses are the same repository,
+        False otherwise.
 
-    full_dir_path = Path.cwd() / directory_name
+    """
+    def normalize(repo_url: str) -> str:
+        repo_url = repo_url.strip().rstrip('/')
+        if repo_url.startswith('file://'):
+            repo_url = repo_url[len('file://'):]
+        if repo_url.endswith('.git'):
+            repo_url = repo_url[:-len('.git')]
+        if os.path.exists(repo_url):
+            repo_url = os.path.realpath(repo_url)
+        return repo_url
 
-    dir_exists = check_dir_exists(str(full_dir_path))
+    return normalize(repo_url1) == normalize(repo_url2)
 
-    if dir_exists and not overwrite:
-        # Directory with same name already exists but client does not
-        # want to overwrite existing directories
-        logger.warning(f'Destination path {directory_name} already'
-                       f' exists. Quiting git clone...')
-        raise Exception('git clone failed.')
-    elif dir_exists and overwrite:
-        # Directory with same name exists but client wants to
-        # overwrite pre-existing conflicts
-        logger.debug(f'Overwriting existing {directory_name} '
-                     f'directory...')
-        if not rm_dir(directory_name):
-            logger.error('Removal failed. Quitting git clone...')
-            raise Exception('git clone failed.')
 
+def git_update_clone(repo_url: str,
+                     directory_name: str,
+                     branch_name: str = None,
+                     clone_depth: int = None,
+                     host_name: str = None,
+                     shallow_since: str = None,
+                     sparse_paths: list[str] = None,
+                     revision: str = None) -> bool:
+    """
+    Brings an existing clone up to date instead of cloning again
+    (see the update_clone() method of the git backend).
+
+    Parameters
+    ----------
+    repo_url : str
+        Repository address or local repository
+    directory_name : str
+        Existing repository directory
+    branch_name : str
+        Branch (or tag) to update to, if None the default
+        branch of the repository
+    clone_depth : int
+        The depth to which to fetch
+    host_name : str
+        Host name
+    shallow_since : str
+        Only fetch the history after this date
+    sparse_paths : list[str]
+        Only check out these directories (sparse checkout)
+    revision : str
+        Commit SHA to reset to instead of the fetched branch
+
+    Returns
+    -------
+    bool
+        True if the clone was updated, False if it must be
+        cloned again.
+
+    """
+    return run_git_backend('update_clone', host_name=host_name,
+                           repo_url=repo_url,
+                           directory=str(Path(directory_name).absolute()),
+                           branch_name=branch_name,
+                           revision=revision,
+                           clone_depth=clone_depth,
+                           shallow_since=shallow_since,
+                           sparse_paths=sparse_paths)
+
+
+def git_sparse_checkout(directory_name: str,
+                        sparse_paths: list[str],
+                        host_name: str = None) -> bool:
+    """
+    Restricts a checkout to some directories, or disables its
+    sparse checkout without directories (see the sparse_checkout()
+    method of the git backend).
+
+    Parameters
+    ----------
+    directory_name : str
+        Repository directory
+    sparse_paths : list[str]
+        Directories to check out (every file if None or empty)
+    host_name : str
+        Host name
+
+    Returns
+    -------
+    bool
+        True if the sparse checkout was set (or disabled),
+        False otherwise.
+
+    """
     try:
-        cmd = config_git_clone(repo_url=repo_url,
-                               directory_name=directory_name,
-                               branch_name=branch_name,
-                               clone_depth=clone_depth,
-                               host_name=host_name)
-    except:
-        # Any error occurs in git clone command configuration such
-        # as incorrect clone depth information
-        return
-    else:
-        if not run_cmd(cmd):
-            raise Exception('git clone failed.')
-        else:
-            logger.success('git clone successful.')
-            if confirm_git_clone(directory_name):
-                logger.success('git clone verified.')
-            else:
-                raise Exception('git clone could not be verified.')
+        run_git_backend('sparse_checkout', host_name=host_name,
+                        directory=str(Path(directory_name).absolute()),
+                        sparse_paths=sparse_paths)
+    except Exception:
+        return False
+    return True
 
 
-def confirm_git_clone(directory_name: str,
-                      ref_directory: str = str(Path.home())) -> bool:
+def git_log(directory_name: str,
+            since: str = None,
+            max_count: int = None,
+            host_name: str = None) -> str:
+    """
+    Lists the commits of a checkout, one line per commit
+    ('<hash> - <author>, <date> : <subject>').
+
+    Parameters
+    ----------
+    directory_name : str
+        Repository directory
+    since : str
+        Only list the commits after this date
+    max_count : int
+        Maximum number of commits listed
+    host_name : str
+        Host name
+
+    Returns
+    -------
+    str
+        Commit log, or None if it could not be read
+
     """
-    Checks if git clone works externally
+    cmd = [get_git_executable(host_name), '-C', directory_name, 'log',
+           '--pretty=format:%h - %an, %ad : %s', '--date=short']
+    if since:
+        cmd.append(f'--since={since}')
+    if max_count:
+        cmd.append(f'-{max_count}')
+    try:
+        run = sp.run(cmd, stdout=sp.PIPE, stderr=sp.PIPE)
+    except OSError as e:
+        logger.warning(f'Could not read the log of {directory_name}: {e}')
+        return None
+    if run.returncode != 0:
+        logger.warning(f'Could not read the log of {directory_name}: '
+                       f'{run.stderr.decode("UTF-8").strip()}')
+        return None
+    return run.stdout.decode('UTF-8')
 
-    NOTE: Clones model in the directory it is called from and returns
-          output of git command
+
+def confirm_git_clone(directory_name: str,
+                      ref_directory: str = str(Path.home()),
+                      revision: str = None,
+                      host_name: str = None) -> bool:
+    """
+    Checks if git clone works externally: the directory is a git
+    checkout, at the expected commit if one is given
 
     Parameters
     ----------
@@ -290,37 +724,338 @@ def confirm_git_clone(directory_name: str,
         The name given to the directory containing the new repository
     ref_directory : str
         The name of the reference directory to search from
+    revision : str
+        Commit SHA the checkout must be at
+    host_name : str
+        Host name
 
     Returns
     -------
     bool
 
     """
-    pwd = Path.cwd()
-    repo_directory = Path(directory_name)
+    # Relative names are resolved from the current directory
+    repo_directory = Path.cwd() / directory_name
 
     # Exception Instance 1: Repo directory does not exist
-    if repo_directory not in list(pwd.glob('*')):
-        # raise Exception('git clone failed – repo directory not created')
+    if not repo_directory.is_dir():
         logger.error('Repo directory not created.')
         return False
 
-    # Exception Instance 2: Repo directory is empty
-    # (i.e. doesn't at least contain .git file)
-    if not list(repo_directory.iterdir()) and \
-            not check_file_exists(directory_name + '/.git'):
-        # raise Exception('git clone failed – repo directory is empty')
-        logger.error('Repo directory is empty.')
+    # Exception Instance 2: Repo directory is not a checkout
+    head = git_head_revision(str(repo_directory), host_name=host_name)
+    if head is None:
+        logger.error('Repo directory is not a git checkout.')
+        return False
+
+    # Exception Instance 3: Checkout is not at the expected commit
+    if revision and head != revision:
+        logger.error(f'Repo directory is at {head} instead of '
+                     f'{revision}.')
         return False
 
     return True
 
 
-def cvs_update(tag: str, mod: str = None) -> bool:
+def git_head_revision(directory_name: str,
+                      host_name: str = None,
+                      ref: str = 'HEAD') -> str:
     """
-    Query files that need to be updated and update those files.
+    Retrieves the commit a checkout is at.
 
-    NOTE: needs to be called from src directory
+    Parameters
+    ----------
+    directory_name : str
+        Repository directory
+    host_name : str
+        Host name
+    ref : str
+        Object to resolve instead of HEAD
+
+    Returns
+    -------
+    str
+        Commit SHA of HEAD, or None if not a git checkout
+
+    """
+    try:
+        run = sp.run([get_git_executable(host_name), '-C', directory_name,
+                      'rev-parse', '--verify', '-q', ref],
+                     stdout=sp.PIPE, stderr=sp.PIPE)
+    except OSError:
+        return None
+    if run.returncode != 0:
+        return None
+    return run.stdout.decode('UTF-8').strip()
+
+
+def git_tree_hash(directory_name: str, host_name: str = None) -> str:
+    """
+    Retrieves the hash of the source tree a checkout is at. Unlike
+    the commit, it only changes if the files change.
+
+    Parameters
+    ----------
+    directory_name : str
+        Repository directory
+    host_name : str
+        Host name
+
+    Returns
+    -------
+    str
+        Tree hash of HEAD, or None if not a git checkout
+
+    """
+    return git_head_revision(directory_name, host_name=host_name,
+                             ref='HEAD^{tree}')
+
+
+def git_checkout_revision(directory_name: str,
+                          revision: str,
+                          clone_depth: int = None,
+                          host_name: str = None) -> bool:
+    """
+    Moves a checkout to a commit, fetching it first if the checkout
+    does not have it (see the move_to() method of the git backend).
+
+    Parameters
+    ----------
+    directory_name : str
+        Repository directory
+    revision : str
+        Commit SHA
+    clone_depth : int
+        The depth to which to fetch the commit
+    host_name : str
+        Host name
+
+    Returns
+    -------
+    bool
+        True if the checkout is at the commit, False otherwise.
+
+    """
+    try:
+        run_git_backend('move_to', host_name=host_name,
+                        directory=str(Path(directory_name).absolute()),
+                        revision=revision,
+                        clone_depth=clone_depth)
+    except Exception:
+        return False
+    return True
+
+
+def get_mirror_dir(mirror_root: str, repo_url: str) -> str:
+    """
+    Retrieves the directory of the mirror of a repository. Each
+    repository URL gets its own mirror, named after the repository
+    and a hash of the URL.
+
+    Parameters
+    ----------
+    mirror_root : str
+        Directory of the shared repository mirrors
+    repo_url : str
+        Repository address or local repository
+
+    Returns
+    -------
+    str
+        Path of the (bare) mirror repository
+
+    """
+    name = re.sub(r'[^\w.-]', '_', Path(repo_url.rstrip('/')).stem)
+    digest = hashlib.sha1(repo_url.encode('UTF-8')).hexdigest()[:12]
+    return str(Path(mirror_root) / f'{name}-{digest}.git')
+
+
+def mirror_lock(mirror_dir: str):
+    """
+    Holds an exclusive lock on a mirror, so concurrent tests (or runs)
+    do not update it or add worktrees to it at the same time. The
+    lock is asynchronous (see async_lock_path).
+
+    Parameters
+    ----------
+    mirror_dir : str
+        Path of the mirror repository
+
+    """
+    return async_lock_path(mirror_dir)
+
+
+def git_update_mirror(repo_url: str,
+                      mirror_root: str,
+                      host_name: str = None,
+                      clone_depth: int = None,
+                      filter_spec: str = None,
+                      shallow_since: str = None) -> str:
+    """
+    Creates the bare mirror of a repository, or fetches the new
+    commits of every branch into it if it already exists (see the
+    update_mirror() method of the git backend).
+
+    Parameters
+    ----------
+    repo_url : str
+        Repository address or local repository
+    mirror_root : str
+        Directory of the shared repository mirrors
+    host_name : str
+        Host name
+    clone_depth : int
+        The depth to which to create the mirror
+    filter_spec : str
+        Partial clone filter of the mirror (eg. 'blob:none')
+    shallow_since : str
+        Only mirror the history after this date
+
+    Returns
+    -------
+    str
+        Path of the mirror repository
+
+    """
+    return run_git_backend('update_mirror', host_name=host_name,
+                           repo_url=repo_url,
+                           mirror_root=mirror_root,
+                           clone_depth=clone_depth,
+                           filter_spec=filter_spec,
+                           shallow_since=shallow_since)
+
+
+def git_worktree_add(mirror_dir: str,
+                     directory_name: str,
+                     branch_name: str = None,
+                     overwrite: bool = False,
+                     host_name: str = None,
+                     sparse_paths: list[str] = None) -> None:
+    """
+    Checks out a branch of a mirror into a new worktree (see the
+    add_worktree() method of the git backend).
+
+    Parameters
+    ----------
+    mirror_dir : str
+        Path of the mirror repository
+    directory_name : str
+        Directory of the worktree
+    branch_name : str
+        Branch (or tag) to check out, if None the default branch
+        of the mirror
+    overwrite : bool
+        Whether to overwrite an existing directory with the same name
+    host_name : str
+        Host name
+    sparse_paths : list[str]
+        Only check out these directories (sparse checkout)
+
+    """
+    run_git_backend('add_worktree', host_name=host_name,
+                    mirror_dir=mirror_dir,
+                    directory=str(Path(directory_name).absolute()),
+                    ref=branch_name,
+                    overwrite=overwrite,
+                    sparse_paths=sparse_paths)
+
+
+def is_worktree_of(directory_name: str,
+                   mirror_dir: str,
+                   host_name: str = None) -> bool:
+    """
+    Checks if a directory is a worktree of a mirror.
+
+    Parameters
+    ----------
+    directory_name : str
+        Directory to check
+    mirror_dir : str
+        Path of the mirror repository
+    host_name : str
+        Host name
+
+    Returns
+    -------
+    bool
+        True if the directory is a worktree of the mirror,
+        False otherwise.
+
+    """
+    if not check_dir_exists(directory_name):
+        return False
+    return run_git_backend('is_worktree_of', host_name=host_name,
+                           directory=directory_name,
+                           mirror_dir=mirror_dir)
+
+
+def git_mirror_clone(repo_url: str,
+                     mirror_root: str,
+                     directory_name: str = None,
+                     branch_name: str = None,
+                     overwrite: bool = False,
+                     fetch: bool = True,
+                     host_name: str = None,
+                     clone_depth: int = None,
+                     filter_spec: str = None,
+                     shallow_since: str = None,
+                     sparse_paths: list[str] = None,
+                     revision: str = None) -> None:
+    """
+    Checks out a repository from its shared mirror instead of
+    cloning it: the mirror is created (or fetched) if needed and
+    a worktree of it is added (see the mirror_checkout() method of
+    the git backend).
+
+    Parameters
+    ----------
+    repo_url : str
+        Repository address or local repository
+    mirror_root : str
+        Directory of the shared repository mirrors
+    directory_name : str
+        Custom local directory name for repository,
+        if None checkout repo name
+    branch_name : str
+        Check out tag branch_name, if None checkout
+        default tag of repo
+    overwrite : bool
+        Whether to overwrite an existing directory with the same name
+    fetch : bool
+        Whether to fetch the mirror first. If False, it is only
+        created when missing (it was already fetched in this run)
+    host_name : str
+        Host name
+    clone_depth : int
+        The depth to which to create the mirror
+    filter_spec : str
+        Partial clone filter of the mirror (eg. 'blob:none')
+    shallow_since : str
+        Only mirror the history after this date
+    sparse_paths : list[str]
+        Only check out these directories (sparse checkout)
+    revision : str
+        Commit SHA to check out instead of the branch
+
+    """
+    run_git_backend('checkout', host_name=host_name,
+                    repo_url=repo_url,
+                    directory_name=directory_name,
+                    branch_name=branch_name,
+                    revision=revision,
+                    overwrite=overwrite,
+                    mirror_root=mirror_root,
+                    fetch=fetch,
+                    clone_depth=clone_depth,
+                    filter_spec=filter_spec,
+                    shallow_since=shallow_since,
+                    sparse_paths=sparse_paths)
+    logger.success('git worktree successful.')
+
+
+def cvs_update(tag: str, mod: str = None, cwd: str = None) -> bool:
+    """
+    Query files that need to be updated and update those files.
 
     Parameters
     ----------
@@ -328,6 +1063,8 @@ def cvs_update(tag: str, mod: str = None) -> bool:
         CVS tag to check for new files
     mod : str
         Module directory being updated
+    cwd : str
+        src directory of the checkout (current directory if None)
 
     Returns
     -------
@@ -342,7 +1079,7 @@ def cvs_update(tag: str, mod: str = None) -> bool:
 
     # first query files that need to be updated
     cmd = ['cvs', '-nq', 'up', '-r', tag]
-    run = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE)
+    run = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE, cwd=cwd)
     output = run.communicate()
     return_code = run.wait()
     if return_code != 0:
@@ -350,7 +1087,7 @@ def cvs_update(tag: str, mod: str = None) -> bool:
               f'1: {output[1].decode("UTF-8")}')
         raise Exception('CVS update query failed')
     upd_files = []
-    changed_files = output[0].split('\n')
+    changed_files = output[0].decode('UTF-8').split('\n')
     for i in range(len(changed_files)):
         file = changed_files[i]
         if not file:
@@ -364,7 +1101,7 @@ def cvs_update(tag: str, mod: str = None) -> bool:
     # now, update
     for i in range(len(upd_files)):
         cmd = ['cvs', 'up', '-r', tag, upd_files[i]]
-        run = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE)
+        run = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE, cwd=cwd)
         output = run.communicate()
         return_code = run.wait()
         if return_code != 0:
@@ -385,12 +1122,11 @@ def cvs_update(tag: str, mod: str = None) -> bool:
 
 def cvs_checkout(tag: str,
                  mod: str,
-                 directory_name: str = None) -> tuple[bytes, bytes]:
+                 directory_name: str = None,
+                 cwd: str = None) -> dict:
     """
-    Checkout model from CVS repository.
-
-    NOTE: Checks out model in the directory it is
-          called from and returns output of cvs command.
+    Checkout model from CVS repository (CVSROOT environment
+    variable).
 
     Parameters
     ----------
@@ -401,37 +1137,28 @@ def cvs_checkout(tag: str,
     directory_name : str
         Check out into directory_name instead,
         if None checkout into mod
+    cwd : str
+        Directory to check out in (current directory if None)
 
     Returns
     -------
-    tuple[bytes, bytes]
-        A tuple containing output of command (stdout and stderr)
+    dict
+        Result of the checkout
     """
 
     logger.info(f'Checking out [tag: {tag}, module: {mod}]...')
 
-    cvs_root = os.environ['CVSROOT']
-
-    if directory_name:
-        cmd = ['cvs', '-d', cvs_root, 'co', '-P', '-r', tag, mod]
-        # cmd = ['cvs', 'co', '-P', '-r', tag, '-d', directory_name, mod]
-    else:
-        cmd = ['cvs', 'co', '-P', '-r', tag, mod]
-    print(cmd)
-    run = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE)
-
-    output = run.communicate()
-    return_code = run.wait()
-    if return_code != 0:
-        print(f'0: {output[0].decode("UTF-8")} \n'
-              f'1: {output[1].decode("UTF-8")}')
-        raise Exception('CVS checkout failed')
+    directory = Path(cwd if cwd else Path.cwd()) / \
+        (directory_name if directory_name else mod)
+    result = run_checkout('cvs', repo_url=os.environ['CVSROOT'],
+                          directory_name=str(directory), branch_name=tag,
+                          module=mod)
 
     logger.info('done.\n')
-    return output
+    return result
 
 
-def cvs_checkout_repository(config) -> None:
+def cvs_checkout_repository(config) -> dict:
     """
     Cvs checkout repository function
 
@@ -441,36 +1168,29 @@ def cvs_checkout_repository(config) -> None:
 
     Returns
     -------
+    dict
+        Result of the checkout (updated if it exists)
 
     """
     logger.info('Checkout user-specified cvs repository...')
     user_config = config_section_map(config, 'USERCONFIG')
     repo = user_config['repo_url']
-    tag = user_config['repo_branch']
-    user_id = user_config['repo_user_id']
     module = user_config['repo_module']
 
     cvs_repo = user_config['scratch_dir'] + '/builds'
-    if not os.path.exists(cvs_repo):
-        os.makedirs(cvs_repo)
-    # if os.path.exists(cvs_repo):
-    #   return
-    cmd = (['cvs', '-Q', '-d', ':ext:' + user_id + '@' +
-            repo, 'co', '-P', '-r', tag, module])
-
     logger.info(f'Checking out {repo} into {cvs_repo}')
-    cwd = os.getcwd()
-    os.chdir(cvs_repo)
-    proc = sp.Popen(cmd)
-    proc.wait()
-    os.chdir(cwd)
+    return run_checkout('cvs', update=True, repo_url=repo,
+                        directory_name=f'{cvs_repo}/{module}',
+                        branch_name=user_config['repo_branch'],
+                        module=module,
+                        user_id=user_config['repo_user_id'])
 
 
 def cvs_checkout_repos(tag: str,
                        mod: str,
                        repo_url: str,
                        user_id: str,
-                       directory_name: str) -> None:
+                       directory_name: str) -> dict:
     """
     Cvs checkout repos function
 
@@ -485,29 +1205,25 @@ def cvs_checkout_repos(tag: str,
     user_id : str
         User ID
     directory_name : str
-        Check out into directory_name instead,
-        if None checkout into mod
-
-    """
-    cmd = (['cvs', '-Q', '-d', ':ext:' + user_id + '@' +
-            repo_url, 'co', '-P', '-r', tag, mod])
+        Directory the module is checked out in
 
-    if not os.path.exists(directory_name):
-        os.makedirs(directory_name)
+    Returns
+    -------
+    dict
+        Result of the checkout (updated if it exists)
 
+    """
     logger.info(f'Checking out {repo_url} into {directory_name}')
-    cwd = os.getcwd()
-    os.chdir(directory_name)
-    proc = sp.Popen(cmd)
-    proc.wait()
-    os.chdir(cwd)
+    return run_checkout('cvs', update=True, repo_url=repo_url,
+                        directory_name=f'{directory_name}/{mod}',
+                        branch_name=tag, module=mod, user_id=user_id)
 
 
 def confirm_cvs_checkouts():
     pass
 
 
-def svn_checkout_repository(config) -> None:
+def svn_checkout_repository(config) -> dict:
     """
     Svn checkout repository function
 
@@ -515,21 +1231,20 @@ def svn_checkout_repository(config) -> None:
     ----------
     config
 
+    Returns
+    -------
+    dict
+        Result of the checkout (updated if it exists)
+
     """
     logger.info('Checkout user-specified svn repository...')
     user_config = config_section_map(config, 'USERCONFIG')
     repo = user_config['repo_url']
 
     svn_repo = user_config['scratch_dir'] + '/builds/geosctm_repo'
-    if os.path.exists(svn_repo):
-        return
-    cmd = (['svn', '--quiet', 'checkout', repo, svn_repo])
-
     logger.info(f'Checking out {repo} into {svn_repo}')
-    cwd = os.getcwd()
-    proc = sp.Popen(cmd)
-    proc.wait()
-    os.chdir(cwd)
+    return run_checkout('svn', update=True, repo_url=repo,
+                        directory_name=svn_repo)
 
 
 def confirm_svn_checkout():
@@ -0,0 +1,845 @@
+"""
+Utilities for submitting regression test jobs to a batch system
+(or running them as local processes) and waiting for them.
+
+A job is described by a dictionary with the keys:
+
+    - name: job name
+    - script: bash script to run
+    - cwd: directory the script is run in (optional)
+    - cores: number of cores (tasks) the job uses (optional, 1)
+    - walltime: time limit as 'HH:MM:SS' (optional)
+    - env: environment the script runs in (optional, the current
+      one), eg. with modules loaded (see modules.py)
+    - output/error: files the script's stdout/stderr are written
+      to (optional, the script name with .out/.err)
+
+When a job script ends, its exit code is written to an exit marker
+(the script name with .exit) so completions can be watched for.
+
+Contains:
+
+    - get_exit_marker
+    - read_exit_marker
+    - use_batch
+    - get_batch_backend
+    - BatchBackend
+    - LocalBackend
+    - SlurmBackend
+    - BatchQueue
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import subprocess as sp
+
+from pathlib import Path
+from typing import Callable
+from concurrent.futures import Future
+from src.lib.utils.logger import logger_setup
+from src.lib.utils.executor import get_max_workers
+from src.lib.utils.history import parse_walltime, format_walltime
+from src.lib.utils.watcher import CompletionWatcher
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+# States a job ends in
+FINAL_STATES = ['COMPLETED', 'FAILED', 'CANCELLED']
+
+# SLURM job states mapped to the states used here
+SLURM_STATES = {'PENDING': 'PENDING',
+                'CONFIGURING': 'PENDING',
+                'REQUEUED': 'PENDING',
+                'REQUEUE_HOLD': 'PENDING',
+                'RESV_DEL_HOLD': 'PENDING',
+                'RUNNING': 'RUNNING',
+                'COMPLETING': 'RUNNING',
+                'SUSPENDED': 'RUNNING',
+                'STAGE_OUT': 'RUNNING',
+                'COMPLETED': 'COMPLETED',
+                'CANCELLED': 'CANCELLED'}
+
+# Runs a job script ($0) and writes its exit code to the exit
+# marker ($1), renamed into place so it never appears half-written
+RUN_SCRIPT = ('bash "$0"; CODE=$?; echo $CODE > "$1.tmp" && '
+              'mv "$1.tmp" "$1"; exit $CODE')
+
+
+def get_exit_marker(job: dict) -> str:
+    """
+    Retrieves the file a job's exit code is written to when
+    its script ends.
+
+    Parameters
+    ----------
+    job : dict
+        Job description
+
+    Returns
+    -------
+    str
+        Exit marker path
+
+    """
+    return str(Path(job['script']).with_suffix('.exit'))
+
+
+def read_exit_marker(marker: str) -> str:
+    """
+    Retrieves the final state of a job from its exit marker.
+
+    Parameters
+    ----------
+    marker : str
+        Exit marker path
+
+    Returns
+    -------
+    str
+        'COMPLETED' or 'FAILED', or None if the job has not
+        ended (no marker yet)
+
+    """
+    try:
+        exit_code = Path(marker).read_text().strip()
+    except OSError:
+        return None
+    return 'COMPLETED' if exit_code == '0' else 'FAILED'
+
+
+def use_batch(system_cfg: dict) -> bool:
+    """
+    Checks if jobs are submitted to a batch system ('usebatch' in
+    the system configuration).
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'usebatch')
+
+    Returns
+    -------
+    bool
+        True if jobs are submitted to SLURM, False otherwise.
+
+    """
+    batch = system_cfg.get('usebatch')
+    return batch is True or str(batch).lower() == 'yes'
+
+
+def get_batch_backend(system_cfg: dict) -> 'BatchBackend':
+    """
+    Creates the backend jobs are submitted through: SLURM if
+    'usebatch' is set in the system configuration, local
+    processes otherwise.
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'usebatch',
+        'sponsorid', 'partition', 'batch_interval' and
+        'max_workers')
+
+    Returns
+    -------
+    BatchBackend
+        Batch backend
+
+    """
+    interval = float(system_cfg.get('batch_interval', 60))
+    if use_batch(system_cfg):
+        return SlurmBackend(account=system_cfg.get('sponsorid'),
+                            partition=system_cfg.get('partition'),
+                            interval=interval)
+    return LocalBackend(max_workers=get_max_workers(system_cfg),
+                        interval=min(interval, 5))
+
+
+class BatchBackend:
+    def __init__(self, interval: float = 60):
+        """
+        Parameters
+        ----------
+        interval : float
+            Seconds between two status polls while waiting
+
+        """
+        self.interval: float = interval
+
+    def submit(self, jobs: list[dict]) -> list[str]:
+        """
+        Submits jobs.
+
+        Implemented by child classes (backend-dependent).
+
+        Parameters
+        ----------
+        jobs : list[dict]
+            Job descriptions
+
+        Returns
+        -------
+        list[str]
+            ID of each job (same order as jobs)
+
+        """
+        pass
+
+    def poll(self, job_ids: list[str]) -> dict[str, str]:
+        """
+        Retrieves the state of jobs, with as few queries to the
+        batch system as possible.
+
+        Implemented by child classes (backend-dependent).
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            Job IDs
+
+        Returns
+        -------
+        dict[str, str]
+            State of each job: 'PENDING', 'RUNNING', 'COMPLETED',
+            'FAILED', or 'CANCELLED'
+
+        """
+        pass
+
+    def cancel(self, job_ids: list[str]) -> None:
+        """
+        Cancels jobs.
+
+        Implemented by child classes (backend-dependent).
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            Job IDs
+
+        """
+        pass
+
+    def wait(self, job_ids: list[str],
+             timeout: float = None,
+             watcher: CompletionWatcher = None,
+             on_complete: Callable[[str, str], None] = None
+             ) -> dict[str, str]:
+        """
+        Polls jobs every interval until they have all ended.
+
+        With a completion watcher, jobs are polled as soon as
+        completion files (eg. exit markers) appear instead of
+        waiting for the end of the interval (other files written
+        meanwhile do not cause a poll).
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            Job IDs
+        timeout : float
+            Seconds after which unfinished jobs are cancelled
+            (no limit if None)
+        watcher : CompletionWatcher
+            Started watcher of the directories jobs write to
+        on_complete : Callable[[str, str], None]
+            Called with the ID and state of each job as soon
+            as it ends
+
+        Returns
+        -------
+        dict[str, str]
+            Final state of each job
+
+        """
+        start = time.monotonic()
+        states = {job_id: 'PENDING' for job_id in job_ids}
+        while True:
+            pending = [job_id for job_id, state in states.items()
+                       if state not in FINAL_STATES]
+            if pending:
+                states.update(self.poll(pending))
+                for job_id in pending:
+                    if on_complete and states[job_id] in FINAL_STATES:
+                        on_complete(job_id, states[job_id])
+            counts = {state: list(states.values()).count(state)
+                      for state in sorted(set(states.values()))}
+            logger.info('Batch jobs — ' + ', '.join(
+                f'{count} {state.lower()}'
+                for state, count in counts.items()))
+
+            pending = [job_id for job_id, state in states.items()
+                       if state not in FINAL_STATES]
+            if not pending:
+                return states
+            if timeout is not None and \
+                    time.monotonic() - start > timeout:
+                logger.warning(f'Cancelling {len(pending)} batch job(s) '
+                               f'still running after {timeout}s')
+                self.cancel(pending)
+                for job_id in pending:
+                    states[job_id] = 'CANCELLED'
+                return states
+            if watcher:
+                watcher.poll(self.interval)
+            else:
+                time.sleep(self.interval)
+
+    def run(self, jobs: list[dict], timeout: float = None) -> list[str]:
+        """
+        Submits jobs and waits for them to end.
+
+        Parameters
+        ----------
+        jobs : list[dict]
+            Job descriptions
+        timeout : float
+            Seconds after which unfinished jobs are cancelled
+            (no limit if None)
+
+        Returns
+        -------
+        list[str]
+            Final state of each job (same order as jobs)
+
+        """
+        if not jobs:
+            return list()
+        job_ids = self.submit(jobs)
+        states = self.wait(job_ids, timeout=timeout)
+        return [states[job_id] for job_id in job_ids]
+
+
+class LocalBackend(BatchBackend):
+    def __init__(self, max_workers: int = 1, interval: float = 1):
+        """
+        Parameters
+        ----------
+        max_workers : int
+            Maximum number of job scripts running at the same time
+        interval : float
+            Seconds between two status polls while waiting
+
+        """
+        super().__init__(interval)
+        self.max_workers: int = max(1, max_workers)
+
+        # Submitted jobs and their state
+        self.jobs: dict[str, dict] = dict()
+        self.states: dict[str, str] = dict()
+
+        # Jobs waiting for a worker and processes of running jobs
+        self.queued: list[str] = list()
+        self.processes: dict[str, sp.Popen] = dict()
+        self.count: int = 0
+
+    def start_queued(self) -> None:
+        """
+        Starts queued jobs while workers are free.
+
+        """
+        while self.queued and len(self.processes) < self.max_workers:
+            job_id = self.queued.pop(0)
+            job = self.jobs[job_id]
+            script = Path(job['script'])
+            output = job.get('output') or str(script.with_suffix('.out'))
+            error = job.get('error') or str(script.with_suffix('.err'))
+            with open(output, 'w') as stdout, open(error, 'w') as stderr:
+                self.processes[job_id] = sp.Popen(
+                    ['bash', '-c', RUN_SCRIPT, str(script),
+                     get_exit_marker(job)],
+                    cwd=job.get('cwd'), env=job.get('env'),
+                    stdout=stdout, stderr=stderr
+                )
+            self.states[job_id] = 'RUNNING'
+            logger.debug(f'Started {job["name"]} [{job_id}]')
+
+    def submit(self, jobs: list[dict]) -> list[str]:
+        """
+        LocalBackend implementation of submit()
+
+        Parameters
+        ----------
+        jobs : list[dict]
+            Job descriptions
+
+        Returns
+        -------
+        list[str]
+            ID of each job (same order as jobs)
+
+        """
+        job_ids = list()
+        for job in jobs:
+            self.count += 1
+            job_id = f'local_{self.count}'
+            self.jobs[job_id] = job
+            self.states[job_id] = 'PENDING'
+            self.queued.append(job_id)
+            job_ids.append(job_id)
+        logger.info(f'Submitted {len(jobs)} local job(s)')
+        self.start_queued()
+        return job_ids
+
+    def poll(self, job_ids: list[str]) -> dict[str, str]:
+        """
+        LocalBackend implementation of poll()
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            Job IDs
+
+        Returns
+        -------
+        dict[str, str]
+            State of each job
+
+        """
+        for job_id, process in list(self.processes.items()):
+            return_code = process.poll()
+            if return_code is None and \
+                    read_exit_marker(get_exit_marker(self.jobs[job_id])):
+                # The script ended, only its wrapper is left to exit
+                return_code = process.wait()
+            if return_code is None:
+                continue
+            del self.processes[job_id]
+            self.states[job_id] = 'COMPLETED' if return_code == 0 \
+                else 'FAILED'
+        self.start_queued()
+        return {job_id: self.states[job_id] for job_id in job_ids}
+
+    def cancel(self, job_ids: list[str]) -> None:
+        """
+        LocalBackend implementation of cancel()
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            Job IDs
+
+        """
+        for job_id in job_ids:
+            if job_id in self.queued:
+                self.queued.remove(job_id)
+            elif job_id in self.processes:
+                process = self.processes.pop(job_id)
+                process.terminate()
+                process.wait()
+            else:
+                continue
+            self.states[job_id] = 'CANCELLED'
+
+
+class SlurmBackend(BatchBackend):
+    def __init__(self, account: str = None,
+                 partition: str = None,
+                 interval: float = 60,
+                 max_array_running: int = None,
+                 sbatch: str = 'sbatch',
+                 squeue: str = 'squeue',
+                 sacct: str = 'sacct',
+                 scancel: str = 'scancel'):
+        """
+        Parameters
+        ----------
+        account : str
+            Account (sponsor ID) jobs are charged to
+        partition : str
+            Partition jobs are submitted to (default partition
+            if None)
+        interval : float
+            Seconds between two status polls while waiting
+        max_array_running : int
+            Maximum number of tasks of an array running at the
+            same time (no limit if None)
+        sbatch, squeue, sacct, scancel : str
+            SLURM commands
+
+        """
+        super().__init__(interval)
+        self.account: str = account
+        self.partition: str = partition
+        self.max_array_running: int = max_array_running
+        self.sbatch: str = sbatch
+        self.squeue: str = squeue
+        self.sacct: str = sacct
+        self.scancel: str = scancel
+
+        # Exit marker of each submitted job
+        self.exit_markers: dict[str, str] = dict()
+
+    def write_array_script(self, jobs: list[dict], script_dir: Path,
+                           name: str) -> Path:
+        """
+        Writes the script of a job array running one job per task.
+        The jobs are listed in a manifest read by each task.
+
+        Parameters
+        ----------
+        jobs : list[dict]
+            Job descriptions (they share their number of cores)
+        script_dir : Path
+            Directory the script and manifest are written in
+        name : str
+            Base name of the script and manifest
+
+        Returns
+        -------
+        Path
+            Job array script
+
+        """
+        manifest = script_dir / f'{name}.manifest'
+        with open(manifest, 'w') as fid:
+            for job in jobs:
+                script = Path(job['script'])
+                fields = [job.get('cwd') or str(script.parent),
+                          str(script),
+                          job.get('output') or
+                          str(script.with_suffix('.out')),
+                          job.get('error') or
+                          str(script.with_suffix('.err')),
+                          get_exit_marker(job)]
+                if any('\t' in field or '\n' in field
+                       for field in fields):
+                    raise Exception(f'Invalid path in job '
+                                    f'{job["name"]}.')
+                fid.write('\t'.join(fields) + '\n')
+
+        walltimes = [parse_walltime(job['walltime']) for job in jobs
+                     if job.get('walltime')]
+        array = f'0-{len(jobs) - 1}'
+        if self.max_array_running:
+            array += f'%{self.max_array_running}'
+
+        lines = ['#!/bin/bash',
+                 f'#SBATCH -J {name}',
+                 f'#SBATCH --array={array}',
+                 f'#SBATCH --ntasks={max(1, jobs[0].get("cores", 1))}',
+                 f'#SBATCH -o {script_dir}/{name}_%A_%a.log']
+        if walltimes:
+            lines.append(f'#SBATCH --time={format_walltime(max(walltimes))}')
+        if self.account:
+            lines.append(f'#SBATCH --account={self.account}')
+        if self.partition:
+            lines.append(f'#SBATCH --partition={self.partition}')
+        lines += [f'MANIFEST={manifest}',
+                  'IFS=$\'\\t\' read -r CWD SCRIPT OUTPUT ERROR EXIT '
+                  '< <(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" '
+                  '"$MANIFEST")',
+                  'cd "$CWD" || exit 1',
+                  f'bash -c \'{RUN_SCRIPT}\' "$SCRIPT" "$EXIT" '
+                  '> "$OUTPUT" 2> "$ERROR"',
+                  '']
+
+        array_script = script_dir / f'{name}.bash'
+        array_script.write_text('\n'.join(lines))
+        return array_script
+
+    def submit(self, jobs: list[dict]) -> list[str]:
+        """
+        SlurmBackend implementation of submit()
+
+        Jobs are submitted as one job array per number of cores
+        and environment (every task of an array gets the same
+        resources and the environment sbatch is called in), so a
+        test matrix takes a handful of submissions instead of one
+        per job. The array's walltime is the longest of its jobs.
+
+        Parameters
+        ----------
+        jobs : list[dict]
+            Job descriptions
+
+        Returns
+        -------
+        list[str]
+            ID of each job (<array ID>_<task ID>, same order
+            as jobs)
+
+        """
+        groups: dict[tuple, list[int]] = dict()
+        for index, job in enumerate(jobs):
+            group = (job.get('cores', 1),
+                     json.dumps(job.get('env'), sort_keys=True))
+            groups.setdefault(group, list()).append(index)
+
+        job_ids: list[str] = [None] * len(jobs)
+        for number, ((cores, _), indices) in enumerate(groups.items()):
+            script_dir = Path(jobs[indices[0]]['script']).parent
+            name = f'assert_{os.getpid()}_{int(time.time())}_{cores}'
+            if number:
+                name += f'_{number}'
+            array_script = self.write_array_script(
+                [jobs[index] for index in indices], script_dir, name
+            )
+            env = jobs[indices[0]].get('env')
+            export = ['--export=ALL'] if env else list()
+            run = sp.run([self.sbatch, '--parsable'] + export +
+                         [str(array_script)], env=env,
+                         stdout=sp.PIPE, stderr=sp.PIPE)
+            if run.returncode != 0:
+                logger.error(f'sbatch failed: '
+                             f'{run.stderr.decode("UTF-8").strip()}')
+                raise Exception('Job array submission failed.')
+            array_id = run.stdout.decode('UTF-8').strip().split(';')[0]
+            logger.info(f'Submitted job array {array_id} of '
+                        f'{len(indices)} job(s) with {cores} core(s)')
+            for task, index in enumerate(indices):
+                job_ids[index] = f'{array_id}_{task}'
+                self.exit_markers[job_ids[index]] = \
+                    get_exit_marker(jobs[index])
+        return job_ids
+
+    def poll(self, job_ids: list[str]) -> dict[str, str]:
+        """
+        SlurmBackend implementation of poll()
+
+        Jobs whose exit marker was written are done. The others
+        are listed with a single squeue call for all arrays, and
+        those that left the queue are looked up with a single
+        sacct call.
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            Job IDs (<array ID>_<task ID>)
+
+        Returns
+        -------
+        dict[str, str]
+            State of each job (jobs not found yet are 'PENDING')
+
+        """
+        states = dict()
+        for job_id in job_ids:
+            state = read_exit_marker(self.exit_markers.get(job_id, ''))
+            if state:
+                states[job_id] = state
+        queried = [job_id for job_id in job_ids if job_id not in states]
+        if not queried:
+            return states
+
+        arrays = ','.join(sorted({job_id.split('_')[0]
+                                  for job_id in queried}))
+        run = sp.run([self.squeue, '-h', '-r', '-o', '%i %T',
+                      '-j', arrays], stdout=sp.PIPE, stderr=sp.PIPE)
+        if run.returncode == 0:
+            for line in run.stdout.decode('UTF-8').splitlines():
+                fields = line.split()
+                if len(fields) == 2:
+                    states[fields[0]] = SLURM_STATES.get(fields[1],
+                                                         'FAILED')
+        else:
+            # squeue fails for IDs that already left the queue
+            logger.debug(f'squeue failed: '
+                         f'{run.stderr.decode("UTF-8").strip()}')
+
+        if any(job_id not in states for job_id in queried):
+            run = sp.run([self.sacct, '-n', '-P', '-X',
+                          '-o', 'JobID,State', '-j', arrays],
+                         stdout=sp.PIPE, stderr=sp.PIPE)
+            for line in run.stdout.decode('UTF-8').splitlines():
+                fields = line.split('|')
+                if len(fields) < 2 or fields[0] in states:
+                    continue
+                # eg. 'CANCELLED by 1234'
+                state = fields[1].split()[0] if fields[1] else 'PENDING'
+                states[fields[0]] = SLURM_STATES.get(state, 'FAILED')
+
+        return {job_id: states.get(job_id, 'PENDING')
+                for job_id in job_ids}
+
+    def cancel(self, job_ids: list[str]) -> None:
+        """
+        SlurmBackend implementation of cancel()
+
+        Parameters
+        ----------
+        job_ids : list[str]
+            Job IDs
+
+        """
+        if job_ids:
+            sp.run([self.scancel] + list(job_ids),
+                   stdout=sp.PIPE, stderr=sp.PIPE)
+
+
+class BatchQueue:
+    def __init__(self, backend: BatchBackend, delay: float = 1):
+        """
+        Submits the jobs of concurrent callers (eg. the run legs of
+        every test running at the same time) together, so SLURM gets
+        one job array per number of cores and environment instead of
+        one per caller, and polls all of them from a single thread.
+
+        Parameters
+        ----------
+        backend : BatchBackend
+            Backend jobs are submitted through (only called from
+            the queue's thread)
+        delay : float
+            Seconds jobs wait for the submissions of other callers
+            (and between two checks for exit markers)
+
+        """
+        self.backend: BatchBackend = backend
+        self.delay: float = delay
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Sets up an empty queue, with no thread polling it.
+
+        """
+        self.lock = threading.Lock()
+        self.thread: threading.Thread = None
+
+        # Jobs waiting to be submitted (with their future and
+        # timeout), and submitted jobs (with their future and
+        # deadline) by job ID
+        self.queued: list[tuple[dict, Future, float]] = list()
+        self.running: dict[str, tuple[Future, float]] = dict()
+
+    def __getstate__(self) -> dict:
+        # Queued jobs and the polling thread stay in this process
+        return {'backend': self.backend, 'delay': self.delay}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.reset()
+
+    def submit(self, jobs: list[dict],
+               timeout: float = None) -> list[Future]:
+        """
+        Queues jobs for the next submission.
+
+        Parameters
+        ----------
+        jobs : list[dict]
+            Job descriptions
+        timeout : float
+            Seconds after their submission after which the jobs
+            are cancelled (no limit if None)
+
+        Returns
+        -------
+        list[Future]
+            Future of each job (same order as jobs), set to its
+            final state once it ended
+
+        """
+        futures = [Future() for _ in jobs]
+        with self.lock:
+            self.queued.extend((job, future, timeout)
+                               for job, future in zip(jobs, futures))
+            if not self.thread:
+                self.thread = threading.Thread(target=self.serve,
+                                               name='batch-queue',
+                                               daemon=True)
+                self.thread.start()
+        return futures
+
+    def submit_queued(self, queued: list[tuple[dict, Future, float]],
+                      watcher: CompletionWatcher) -> None:
+        """
+        Submits queued jobs in a single call to the backend.
+
+        Parameters
+        ----------
+        queued : list[tuple[dict, Future, float]]
+            Jobs, with their future and timeout
+        watcher : CompletionWatcher
+            Started watcher of the directories jobs write to
+
+        """
+        jobs = [job for job, _, _ in queued]
+        for job in jobs:
+            # The exit marker of a previous attempt was removed
+            watcher.seen.discard(get_exit_marker(job))
+            watcher.add_path(str(Path(job['script']).parent))
+        try:
+            job_ids = self.backend.submit(jobs)
+        except Exception as e:
+            for _, future, _ in queued:
+                future.set_exception(e)
+            return
+        now = time.monotonic()
+        for job_id, (_, future, timeout) in zip(job_ids, queued):
+            deadline = now + timeout if timeout is not None else None
+            self.running[job_id] = (future, deadline)
+
+    def poll_running(self) -> None:
+        """
+        Polls the submitted jobs, setting the future of the ones
+        that ended, and cancels the ones past their deadline.
+
+        """
+        states = self.backend.poll(list(self.running))
+        counts = {state: list(states.values()).count(state)
+                  for state in sorted(set(states.values()))}
+        logger.info('Batch jobs — ' + ', '.join(
+            f'{count} {state.lower()}' for state, count in counts.items()))
+
+        now = time.monotonic()
+        expired = [job_id for job_id, (_, deadline) in self.running.items()
+                   if states[job_id] not in FINAL_STATES and
+                   deadline is not None and now > deadline]
+        if expired:
+            logger.warning(f'Cancelling {len(expired)} batch job(s) '
+                           f'past their timeout')
+            self.backend.cancel(expired)
+            states.update({job_id: 'CANCELLED' for job_id in expired})
+        for job_id, state in states.items():
+            if state in FINAL_STATES:
+                future, _ = self.running.pop(job_id)
+                future.set_result(state)
+
+    def serve(self) -> None:
+        """
+        Submits the queued jobs every delay, and polls the submitted
+        ones as soon as exit markers appear or every interval of the
+        backend, until no job is left.
+
+        """
+        with CompletionWatcher(list(), suffixes=['.exit'],
+                               interval=self.backend.interval) as watcher:
+            polled = time.monotonic()
+            try:
+                while True:
+                    found = watcher.poll(self.delay)
+                    with self.lock:
+                        queued, self.queued = self.queued, list()
+                        if not queued and not self.running:
+                            self.thread = None
+                            return
+                    if queued:
+                        self.submit_queued(queued, watcher)
+                    deadlines = [deadline for _, deadline
+                                 in self.running.values()
+                                 if deadline is not None]
+                    now = time.monotonic()
+                    if self.running and \
+                            (found or now - polled >= self.backend.interval
+                             or any(now > deadline
+                                    for deadline in deadlines)):
+                        polled = now
+                        self.poll_running()
+            except Exception as e:
+                logger.error(f'Batch queue failed: {e}')
+                with self.lock:
+                    queued, self.queued = self.queued, list()
+                    self.thread = None
+                for future in [future for _, future, _ in queued] + \
+                        [future for future, _ in self.running.values()]:
+                    future.set_exception(e)
+                self.running = dict()
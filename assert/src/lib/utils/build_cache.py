@@ -0,0 +1,278 @@
+"""
+Utilities for caching build artifacts (executables and object
+files) by the source tree and toolchain they were built with, so
+identical builds are restored instead of compiled again.
+
+Artifacts are restored by hardlink (or reflink, or copy when the
+cache is on another filesystem), and entries are written under a
+temporary name and renamed, so ASSERT instances on different nodes
+can share a cache.
+
+    - get_build_cache_dir
+    - link_file
+    - link_tree
+    - BuildCache
+"""
+
+import os
+import json
+import fcntl
+import shutil
+import fnmatch
+import logging
+import tempfile
+
+from pathlib import Path
+from src.lib.utils.result_cache import make_cache_key
+from src.lib.utils.access_repo import rm_dir
+from src.lib.utils.logger import logger_setup
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+# ioctl cloning a file's extents (reflink) on btrfs, XFS, ...
+FICLONE = 0x40049409
+
+
+def get_build_cache_dir(system_cfg: dict, scratch_dir: str = None) -> str:
+    """
+    Retrieves the build cache directory from the system
+    configuration. It defaults to the scratch directory (kept
+    when it is reset) since restoring by hardlink needs the
+    cache and the test directories on the same filesystem.
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'build_cache_dir')
+    scratch_dir : str
+        Scratch directory
+
+    Returns
+    -------
+    str
+        Path of the build cache directory
+
+    """
+    cache_dir = system_cfg.get('build_cache_dir')
+    if not cache_dir:
+        if scratch_dir:
+            cache_dir = str(Path(scratch_dir) / 'build_cache')
+        else:
+            cache_dir = str(Path.home() / '.assert' / 'builds')
+    return cache_dir
+
+
+def link_file(source: str, destination: str) -> str:
+    """
+    Makes a file available at another path without copying its
+    data if possible: hardlink, then reflink, then copy.
+
+    Parameters
+    ----------
+    source : str
+        Existing file
+    destination : str
+        New file (replaced if it exists)
+
+    Returns
+    -------
+    str
+        'hardlink', 'reflink', or 'copy'
+
+    """
+    Path(destination).unlink(missing_ok=True)
+    try:
+        os.link(source, destination)
+        return 'hardlink'
+    except OSError:
+        pass
+    try:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        shutil.copystat(source, destination)
+        return 'reflink'
+    except OSError:
+        Path(destination).unlink(missing_ok=True)
+    shutil.copy2(source, destination)
+    return 'copy'
+
+
+def link_tree(source: str, destination: str,
+              patterns: list[str] = None) -> int:
+    """
+    Links the files of a directory (or a single file) into
+    another, creating the directories needed (see link_file).
+    Symbolic links are recreated.
+
+    Parameters
+    ----------
+    source : str
+        Existing file or directory
+    destination : str
+        Destination file or directory
+    patterns : list[str]
+        Only link the files whose name matches one of these
+        patterns (eg. '*.o'), all files if None
+
+    Returns
+    -------
+    int
+        Number of files linked
+
+    """
+    source = Path(source)
+    if not source.is_dir():
+        Path(destination).parent.mkdir(parents=True, exist_ok=True)
+        link_file(str(source), destination)
+        return 1
+
+    count = 0
+    for root, dirs, files in os.walk(source):
+        target = Path(destination) / Path(root).relative_to(source)
+        target.mkdir(parents=True, exist_ok=True)
+        for name in files + [name for name in dirs
+                             if (Path(root) / name).is_symlink()]:
+            if patterns and \
+                    not any(fnmatch.fnmatch(name, p) for p in patterns):
+                continue
+            path = Path(root) / name
+            if path.is_symlink():
+                (target / name).unlink(missing_ok=True)
+                (target / name).symlink_to(os.readlink(path))
+            else:
+                link_file(str(path), str(target / name))
+            count += 1
+    return count
+
+
+class BuildCache:
+    def __init__(self, cache_dir: str):
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            Directory the builds are stored in (one directory
+            per key, holding each artifact)
+
+        """
+        self.cache_dir: str = cache_dir
+
+    def get_entry(self, key: dict) -> Path:
+        """
+        Retrieves the directory a build is stored in.
+
+        Parameters
+        ----------
+        key : dict
+            Build description (eg. source tree, rundeck, compiler
+            version, modelErc)
+
+        Returns
+        -------
+        Path
+            Build directory (may not exist)
+
+        """
+        digest = make_cache_key(key)
+        return Path(self.cache_dir) / digest[:2] / digest
+
+    def restore(self, key: dict, artifacts: dict[str, str]) -> bool:
+        """
+        Restores the artifacts of a cached build.
+
+        Parameters
+        ----------
+        key : dict
+            Build description
+        artifacts : dict[str, str]
+            Path each artifact (file or directory) is restored to,
+            by artifact name
+
+        Returns
+        -------
+        bool
+            True if the build was cached and restored, False
+            otherwise.
+
+        """
+        entry = self.get_entry(key)
+        if not entry.is_dir():
+            return False
+        if not all((entry / name).exists() for name in artifacts):
+            logger.warning(f'Ignoring incomplete cached build {entry}')
+            return False
+        try:
+            count = sum(link_tree(str(entry / name), path)
+                        for name, path in artifacts.items())
+        except OSError as e:
+            logger.warning(f'Could not restore cached build {entry}: {e}')
+            return False
+        logger.info(f'Restored {count} files from cached build {entry}')
+        return True
+
+    def store(self, key: dict, artifacts: dict[str, str],
+              patterns: dict[str, list[str]] = None) -> bool:
+        """
+        Stores the artifacts of a build. They are linked into a
+        temporary directory renamed into place, so readers never
+        see a partial build; if another instance stored the same
+        build first, its copy is kept. Stored files are made
+        read-only, since the builds they are restored to share them.
+
+        Parameters
+        ----------
+        key : dict
+            Build description
+        artifacts : dict[str, str]
+            Path of each artifact (file or directory), by artifact
+            name
+        patterns : dict[str, list[str]]
+            Name patterns of the files stored from an artifact
+            directory (eg. '*.o'), by artifact name (all files
+            if not given)
+
+        Returns
+        -------
+        bool
+            True if the build is cached, False otherwise.
+
+        """
+        patterns = patterns if patterns else dict()
+        entry = self.get_entry(key)
+        if entry.is_dir():
+            return True
+        missing = [path for path in artifacts.values()
+                   if not Path(path).exists()]
+        if missing:
+            logger.debug(f'Build not cached, missing artifacts: {missing}')
+            return False
+
+        tmp_dir = None
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(dir=entry.parent, suffix='.tmp')
+            for name, path in artifacts.items():
+                link_tree(path, str(Path(tmp_dir) / name),
+                          patterns=patterns.get(name))
+            with open(Path(tmp_dir) / 'key.json', 'w') as fid:
+                json.dump(key, fid, default=str)
+            for root, _, files in os.walk(tmp_dir):
+                for name in files:
+                    path = Path(root) / name
+                    if not path.is_symlink():
+                        path.chmod(path.stat().st_mode & 0o555)
+            os.rename(tmp_dir, entry)
+        except OSError as e:
+            if tmp_dir:
+                rm_dir(tmp_dir)
+            if entry.is_dir():
+                # Stored by another instance in the meantime
+                return True
+            logger.warning(f'Could not cache build in {entry}: {e}')
+            return False
+        logger.info(f'Build cached in {entry}')
+        return True
@@ -0,0 +1,291 @@
+"""
+Utilities for checking out several repositories (git, CVS, or svn)
+at the same time, eg. the new and baseline tags of a model plus its
+externals.
+
+Checkouts run on the version control backends (see the vcs utility
+module), so each command runs in its own working directory (the
+process-wide working directory is never changed). At most max_workers
+checkouts run at the same time, and transient failures (network
+errors) are retried with exponential backoff.
+
+    - is_transient
+    - get_checkout_manager
+    - CheckoutManager
+"""
+
+import re
+import time
+import asyncio
+import logging
+
+from pathlib import Path
+from src.lib.utils.access_repo import rm_dir
+from src.lib.utils.vcs import get_vcs_backend, VcsBackend
+from src.lib.utils.logger import logger_setup
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+# Errors worth retrying (the server or the network was unavailable)
+TRANSIENT_ERRORS = re.compile(
+    r'could not resolve host|connection (refused|reset|timed out)|'
+    r'timed out|temporary failure|early eof|remote end hung up|'
+    r'unexpected disconnect|network is unreachable|rpc failed|'
+    r'end of file from server|lost connection|returned error: 50[234]',
+    re.IGNORECASE
+)
+
+
+def is_transient(error: str) -> bool:
+    """
+    Checks if a checkout failed for a reason that may go away
+    (eg. network or server errors) and is worth retrying.
+
+    Parameters
+    ----------
+    error : str
+        Error output of the checkout
+
+    Returns
+    -------
+    bool
+        True if the checkout should be retried, False otherwise.
+
+    """
+    return bool(TRANSIENT_ERRORS.search(error))
+
+
+def get_checkout_manager(system_cfg: dict,
+                         host_name: str = None) -> 'CheckoutManager':
+    """
+    Creates the checkout manager described by the system config
+    ('checkout_workers' and 'checkout_retries').
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info
+    host_name : str
+        Host name (selects the git executable)
+
+    Returns
+    -------
+    CheckoutManager
+        Checkout manager
+
+    """
+    return CheckoutManager(
+        max_workers=int(system_cfg.get('checkout_workers', 4)),
+        retries=int(system_cfg.get('checkout_retries', 3)),
+        host_name=host_name
+    )
+
+
+class CheckoutManager:
+    def __init__(self, max_workers: int = 4,
+                 retries: int = 3,
+                 backoff: float = 2,
+                 max_backoff: float = 60,
+                 timeout: float = None,
+                 host_name: str = None,
+                 commands: dict[str, str] = None):
+        """
+        Parameters
+        ----------
+        max_workers : int
+            Maximum number of checkouts at the same time
+        retries : int
+            Number of times a transient failure is retried
+        backoff : float
+            Seconds before the first retry, doubled for each
+            next one
+        max_backoff : float
+            Maximum number of seconds between two attempts
+        timeout : float
+            Seconds after which a command of a checkout is
+            terminated (and the attempt counts as a transient
+            failure), no limit if None
+        host_name : str
+            Host name (selects the git executable)
+        commands : dict[str, str]
+            Path of the git, cvs, and svn executables, instead of
+            the ones of the backends
+
+        """
+        self.max_workers: int = max(1, max_workers)
+        self.retries: int = max(0, retries)
+        self.backoff: float = backoff
+        self.max_backoff: float = max_backoff
+        self.timeout: float = timeout
+        self.host_name: str = host_name
+        self.commands: dict[str, str] = commands if commands else dict()
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        Retrieves the delay before retrying a checkout.
+
+        Parameters
+        ----------
+        attempt : int
+            Number of the attempt that failed (1 for the first)
+
+        Returns
+        -------
+        float
+            Seconds to wait
+
+        """
+        return min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+
+    def get_backend(self, repo_type: str) -> VcsBackend:
+        """
+        Creates the backend checking out a type of repository.
+
+        Parameters
+        ----------
+        repo_type : str
+            Type of repository: git/cvs/svn
+
+        Returns
+        -------
+        VcsBackend
+            Backend of the repository type
+
+        """
+        backend = get_vcs_backend(repo_type, host_name=self.host_name,
+                                  timeout=self.timeout)
+        if repo_type in self.commands:
+            backend.executable = self.commands[repo_type]
+        return backend
+
+    async def attempt(self, spec: dict) -> tuple[dict, str]:
+        """
+        Runs a checkout once.
+
+        Parameters
+        ----------
+        spec : dict
+            Checkout: 'type' (git, cvs, or svn), optionally 'name',
+            and the arguments of the checkout() method of its
+            backend ('repo_url', 'directory_name', 'branch_name',
+            and backend-specific options)
+
+        Returns
+        -------
+        tuple[dict, str]
+            Result of the checkout (None if it failed), and the
+            error (None if it succeeded)
+
+        """
+        backend = self.get_backend(spec['type'])
+        options = {key: value for key, value in spec.items()
+                   if key not in ['type', 'name']}
+        try:
+            return await backend.checkout(**options), None
+        except asyncio.TimeoutError:
+            return None, f'timed out after {self.timeout}s'
+        except Exception as e:
+            return None, str(e)
+
+    async def checkout(self, spec: dict,
+                       semaphore: asyncio.Semaphore = None) -> dict:
+        """
+        Checks out a repository, retrying transient failures.
+
+        Parameters
+        ----------
+        spec : dict
+            Checkout (see attempt)
+        semaphore : asyncio.Semaphore
+            Semaphore held during each attempt (not while waiting
+            to retry), limiting the checkouts at the same time
+
+        Returns
+        -------
+        dict
+            Result: 'name', 'type', 'directory', 'success',
+            'attempts', 'duration' (seconds), 'revision', and
+            'error'
+
+        """
+        name = spec.get('name', spec['directory_name'])
+        start = time.monotonic()
+        attempts = 0
+        while True:
+            attempts += 1
+            if semaphore:
+                async with semaphore:
+                    result, error = await self.attempt(spec)
+            else:
+                result, error = await self.attempt(spec)
+            if result:
+                logger.info(f'Checked out {name} ({spec["type"]}) '
+                            f'in {attempts} attempt(s)')
+                break
+            if attempts > self.retries or not is_transient(error):
+                logger.error(f'Checkout of {name} failed: {error}')
+                break
+            delay = self.get_delay(attempts)
+            logger.warning(f'Checkout of {name} failed ({error}). '
+                           f'Retrying in {delay:.1f}s...')
+            # Partial checkouts would make the next attempt fail
+            rm_dir(str(Path(spec['directory_name']).absolute()))
+            await asyncio.sleep(delay)
+
+        return {'name': name,
+                'type': spec['type'],
+                'directory': spec['directory_name'],
+                'success': result is not None,
+                'attempts': attempts,
+                'duration': time.monotonic() - start,
+                'revision': result['revision'] if result else None,
+                'error': error}
+
+    async def checkout_all(self, specs: list[dict]) -> list[dict]:
+        """
+        Checks out repositories concurrently (at most max_workers at
+        the same time).
+
+        Parameters
+        ----------
+        specs : list[dict]
+            Checkouts (see attempt)
+
+        Returns
+        -------
+        list[dict]
+            Result of each checkout, in the order of specs
+
+        """
+        semaphore = asyncio.Semaphore(self.max_workers)
+        return list(await asyncio.gather(
+            *[self.checkout(spec, semaphore) for spec in specs]))
+
+    def run(self, specs: list[dict]) -> list[dict]:
+        """
+        Checks out repositories concurrently until they are all
+        done (see checkout_all).
+
+        Parameters
+        ----------
+        specs : list[dict]
+            Checkouts (see attempt)
+
+        Returns
+        -------
+        list[dict]
+            Result of each checkout, in the order of specs
+
+        """
+        if not specs:
+            return list()
+        results = asyncio.run(self.checkout_all(specs))
+        failed = [result['name'] for result in results
+                  if not result['success']]
+        if failed:
+            logger.warning(f'{len(failed)} checkout(s) failed: {failed}')
+        return results
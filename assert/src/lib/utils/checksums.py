@@ -0,0 +1,156 @@
+"""
+Utilities for comparing model outputs (restart files, diagnostics)
+without reading them into memory: files are hashed or compared in
+chunks, so multi-gigabyte outputs cost one pass each.
+
+    - hash_file
+    - compare_files
+    - get_file_state
+    - wait_for_file
+"""
+
+import time
+import hashlib
+import logging
+
+from pathlib import Path
+from typing import Callable
+from src.lib.utils.logger import logger_setup
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+# Bytes read at once
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def hash_file(path: str, algorithm: str = 'sha256',
+              chunk_size: int = CHUNK_SIZE) -> str:
+    """
+    Hashes a file in chunks.
+
+    Parameters
+    ----------
+    path : str
+        File
+    algorithm : str
+        hashlib algorithm
+    chunk_size : int
+        Bytes read at once
+
+    Returns
+    -------
+    str
+        Hex digest of the file's contents
+
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fid:
+        for chunk in iter(lambda: fid.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compare_files(path1: str, path2: str,
+                  chunk_size: int = CHUNK_SIZE) -> bool:
+    """
+    Checks if two files are identical (bit for bit), reading both
+    in step and stopping at the first chunk that differs.
+
+    Parameters
+    ----------
+    path1, path2 : str
+        Files
+    chunk_size : int
+        Bytes read at once from each file
+
+    Returns
+    -------
+    bool
+        True if the files have the same contents, False otherwise.
+
+    """
+    if Path(path1).stat().st_size != Path(path2).stat().st_size:
+        return False
+    with open(path1, 'rb') as fid1, open(path2, 'rb') as fid2:
+        while True:
+            chunk1 = fid1.read(chunk_size)
+            chunk2 = fid2.read(chunk_size)
+            if chunk1 != chunk2:
+                logger.debug(f'{path1} and {path2} differ after byte '
+                             f'{fid1.tell() - len(chunk1)}')
+                return False
+            if not chunk1:
+                return True
+
+
+def get_file_state(path: str) -> tuple:
+    """
+    Summarizes a file so that changes to it can be detected.
+
+    Parameters
+    ----------
+    path : str
+        File
+
+    Returns
+    -------
+    tuple
+        Size and modification time (ns), or None if the file
+        does not exist
+
+    """
+    try:
+        stat = Path(path).stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def wait_for_file(path: str, done: Callable[[], bool],
+                  interval: float = 1,
+                  ready: Callable[[], bool] = None) -> bool:
+    """
+    Waits for a file being written by another process to be
+    complete: it exists, its size and modification time did not
+    change between two polls, and the writer signaled it is
+    complete (eg. by writing another file), if it can.
+
+    A writer pausing in the middle of the file looks the same as a
+    writer that is done with it, so files rewritten in place should
+    be waited for with a signal.
+
+    Parameters
+    ----------
+    path : str
+        File
+    done : Callable[[], bool]
+        Tells if the writing process ended (the file will not
+        be written anymore)
+    interval : float
+        Seconds between two polls
+    ready : Callable[[], bool]
+        Tells if the writer signaled the file is complete (not
+        waited for if None)
+
+    Returns
+    -------
+    bool
+        True if the file is complete, False if the writer ended
+        without writing it.
+
+    """
+    previous = None
+    while True:
+        ended = done()
+        state = get_file_state(path)
+        if state and (ended or (state == previous and
+                                (ready is None or ready()))):
+            return True
+        if ended:
+            return False
+        previous = state
+        time.sleep(interval)
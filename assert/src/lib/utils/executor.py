@@ -0,0 +1,399 @@
+"""
+Utilities for executing regression test jobs concurrently.
+
+    - get_max_workers
+    - get_stage_workers
+    - TestExecutor
+    - PipelineExecutor
+"""
+
+import logging
+
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                FIRST_COMPLETED, wait)
+from typing import Any, Callable
+from src.lib.utils.logger import logger_setup
+from src.lib.utils.scheduler import DagScheduler, CoreBudget, AdaptiveLimit
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+
+def get_max_workers(system_cfg: dict) -> int:
+    """
+    Retrieves the maximum number of concurrent test jobs
+    from the system configuration.
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'max_workers')
+
+    Returns
+    -------
+    int
+        Maximum number of concurrent jobs (1 means serial)
+
+    """
+    max_workers = system_cfg.get('max_workers', 1)
+    if not max_workers:
+        return 1
+    try:
+        max_workers = int(max_workers)
+    except (TypeError, ValueError):
+        logger.warning(f'Invalid max_workers value [{max_workers}]. '
+                       f'Running tests serially...')
+        return 1
+    return max(1, max_workers)
+
+
+def get_stage_workers(system_cfg: dict,
+                      stages: list[str]) -> dict[str, int]:
+    """
+    Retrieves the pool size of each pipeline stage from the
+    'pipeline' entry of the system configuration.
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'pipeline')
+    stages : list[str]
+        Stage names in order (eg. ['CLONE', 'BUILD', 'RUN', 'COMPARE'])
+
+    Returns
+    -------
+    dict[str, int]
+        Number of workers of each stage, or an empty dictionary
+        if tests are not pipelined
+
+    """
+    pipeline = system_cfg.get('pipeline')
+    if not pipeline:
+        return dict()
+    if not isinstance(pipeline, dict):
+        logger.warning('pipeline must map stage names to pool sizes. '
+                       'Not pipelining tests...')
+        return dict()
+
+    sizes = {str(stage).upper(): size for stage, size in pipeline.items()}
+    stage_workers = dict()
+    for stage in stages:
+        try:
+            stage_workers[stage] = max(1, int(sizes.get(stage, 1)))
+        except (TypeError, ValueError):
+            logger.warning(f'Invalid {stage} pool size '
+                           f'[{sizes[stage]}]. Using 1...')
+            stage_workers[stage] = 1
+    return stage_workers
+
+
+class TestExecutor:
+    # Keeps pytest from collecting this class as a test
+    __test__ = False
+
+    def __init__(self, max_workers: int = 1, max_cores: int = None,
+                 limit: AdaptiveLimit = None):
+        """
+        Parameters
+        ----------
+        max_workers : int
+            Maximum number of jobs run at the same time.
+            A value of 1 runs every job serially in this process.
+        max_cores : int
+            Maximum number of cores used by running jobs in total
+            (no limit if None)
+        limit : AdaptiveLimit
+            Adapts the number of jobs run at the same time (up to
+            max_workers) to the load of the node (fixed if None)
+
+        """
+        self.max_workers: int = max(1, max_workers)
+        self.max_cores: int = max_cores
+        self.limit: AdaptiveLimit = limit
+
+    def run(self, func: Callable, jobs: list[tuple],
+            dependencies: dict[int, list[int]] = None,
+            weights: dict[int, float] = None,
+            is_success: Callable[[Any], bool] = None,
+            on_skip: Callable[..., Any] = None,
+            cores: dict[int, int] = None) -> list[Any]:
+        """
+        Runs func on every job and returns the results in the same
+        order as the jobs, regardless of completion order.
+
+        A job is started as soon as every job it depends on has
+        finished successfully. Ready jobs are started longest
+        critical path first. Jobs depending on a failed job are
+        not run.
+
+        With a core budget, a ready job only starts if its cores fit
+        in what running jobs leave free; smaller jobs further down
+        the ready list are started (backfilled) around it meanwhile.
+        With an adaptive limit, fewer jobs are started while the
+        node is loaded.
+
+        Parameters
+        ----------
+        func : Callable
+            Picklable callable run for each job
+        jobs : list[tuple]
+            Positional arguments for each call to func
+        dependencies : dict[int, list[int]]
+            Indices of the jobs each job index depends on
+        weights : dict[int, float]
+            Expected cost of each job index (defaults to 1)
+        is_success : Callable[[Any], bool]
+            Decides from a result whether a job succeeded
+            (every job succeeds if None)
+        on_skip : Callable[..., Any]
+            Called with a skipped job's arguments to make its result
+            (None is used if not given)
+        cores : dict[int, int]
+            Number of cores each job index uses (defaults to 1)
+
+        Returns
+        -------
+        list[Any]
+            Results of func for each job (same order as jobs)
+
+        """
+        if not dependencies:
+            dependencies = dict()
+        scheduler = DagScheduler(
+            {index: dependencies.get(index, [])
+             for index in range(len(jobs))},
+            weights=weights
+        )
+        results: list[Any] = [None] * len(jobs)
+
+        def finish(index: int, result: Any) -> None:
+            results[index] = result
+            success = is_success(result) if is_success else True
+            for skipped in scheduler.finish(index, success):
+                if on_skip:
+                    results[skipped] = on_skip(*jobs[skipped])
+
+        if self.max_workers == 1 or len(jobs) <= 1:
+            logger.info(f'Running {len(jobs)} job(s) serially...')
+            while not scheduler.done():
+                index = scheduler.ready()[0]
+                scheduler.start(index)
+                finish(index, func(*jobs[index]))
+            return results
+
+        workers = min(self.max_workers, len(jobs))
+        budget = CoreBudget(self.max_cores) if self.max_cores else None
+        if not cores:
+            cores = dict()
+        job_cores = {index: budget.request(cores.get(index, 1))
+                     if budget else 0 for index in range(len(jobs))}
+
+        logger.info(f'Running {len(jobs)} job(s) in a pool of '
+                    f'{workers} processes' +
+                    (f' within {budget.max_cores} cores...'
+                     if budget else '...'))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            running = dict()
+            while not scheduler.done():
+                admitted = min(workers, self.limit.update()) \
+                    if self.limit else workers
+                for index in scheduler.ready():
+                    if len(running) >= admitted:
+                        break
+                    if budget:
+                        if not budget.fits(job_cores[index]):
+                            continue
+                        budget.acquire(job_cores[index])
+                    scheduler.start(index)
+                    running[pool.submit(func, *jobs[index])] = index
+                done, _ = wait(running, return_when=FIRST_COMPLETED,
+                               timeout=self.limit.interval
+                               if self.limit else None)
+                for future in done:
+                    index = running.pop(future)
+                    if budget:
+                        budget.release(job_cores[index])
+                    finish(index, future.result())
+
+        return results
+
+
+class PipelineExecutor:
+    def __init__(self, stage_workers: dict[str, int],
+                 max_cores: int = None,
+                 core_stage: str = 'RUN',
+                 limit: AdaptiveLimit = None):
+        """
+        Parameters
+        ----------
+        stage_workers : dict[str, int]
+            Stage names in the order jobs go through them,
+            mapped to the number of workers of each stage's pool
+        max_cores : int
+            Maximum number of cores used in total by jobs in the
+            core stage (no limit if None)
+        core_stage : str
+            Stage whose jobs hold their cores while running
+        limit : AdaptiveLimit
+            Adapts the number of stages run at the same time
+            (across all pools) to the load of the node (only
+            bounded by the pools if None)
+
+        """
+        self.stages: list[str] = list(stage_workers)
+        self.stage_workers: dict[str, int] = {
+            stage: max(1, workers)
+            for stage, workers in stage_workers.items()
+        }
+        self.max_cores: int = max_cores
+        self.core_stage: str = core_stage
+        self.limit: AdaptiveLimit = limit
+
+    def log_depths(self, queues: dict[str, list],
+                   active: dict[str, int],
+                   previous: str = None) -> str:
+        """
+        Logs the number of queued and running jobs of every stage,
+        unless they are the same as the previous time.
+
+        Parameters
+        ----------
+        queues : dict[str, list]
+            Jobs waiting for each stage
+        active : dict[str, int]
+            Number of jobs running in each stage
+        previous : str
+            Depths logged the previous time (None if never)
+
+        Returns
+        -------
+        str
+            Depths of the stages
+
+        """
+        depths = ', '.join(f'{stage} {len(queues[stage])} queued/'
+                           f'{active[stage]} running'
+                           for stage in self.stages)
+        if depths != previous:
+            logger.info(f'Pipeline — {depths}')
+        return depths
+
+    def run(self, func: Callable[..., bool], jobs: list[tuple],
+            dependencies: dict[int, list[int]] = None,
+            weights: dict[int, float] = None,
+            cores: dict[int, int] = None) -> list[dict[str, bool]]:
+        """
+        Moves every job through the stages, each stage having its own
+        bounded pool of threads. A job moves on to its next stage as
+        soon as its current stage succeeds, so stages of different
+        jobs overlap.
+
+        A job enters the first stage once every job it depends on has
+        passed all stages. Queued jobs are started longest critical
+        path first. With a core budget, jobs only enter the core stage
+        if their cores fit, smaller jobs backfilling around them.
+        With an adaptive limit, fewer stages run at the same time
+        while the node is loaded.
+
+        Parameters
+        ----------
+        func : Callable[..., bool]
+            Called as func(stage, *job), returns whether the
+            stage succeeded
+        jobs : list[tuple]
+            Positional arguments for each call to func
+        dependencies : dict[int, list[int]]
+            Indices of the jobs each job index depends on
+        weights : dict[int, float]
+            Expected cost of each job index (defaults to 1)
+        cores : dict[int, int]
+            Number of cores each job index uses in the core stage
+            (defaults to 1)
+
+        Returns
+        -------
+        list[dict[str, bool]]
+            Result of each stage attempted by each job (same order
+            as jobs). Jobs skipped because a dependency failed
+            have no results.
+
+        """
+        if not dependencies:
+            dependencies = dict()
+        scheduler = DagScheduler(
+            {index: dependencies.get(index, [])
+             for index in range(len(jobs))},
+            weights=weights
+        )
+        results: list[dict[str, bool]] = [dict() for _ in jobs]
+
+        budget = CoreBudget(self.max_cores) if self.max_cores else None
+        if not cores:
+            cores = dict()
+        job_cores = {index: budget.request(cores.get(index, 1))
+                     if budget else 0 for index in range(len(jobs))}
+
+        queues: dict[str, list[int]] = {stage: list()
+                                        for stage in self.stages}
+        active: dict[str, int] = {stage: 0 for stage in self.stages}
+        pools = {stage: ThreadPoolExecutor(
+                     max_workers=self.stage_workers[stage],
+                     thread_name_prefix=stage.lower())
+                 for stage in self.stages}
+        running = dict()
+        depths = None
+
+        logger.info(f'Running {len(jobs)} job(s) through stages ' +
+                    ', '.join(f'{stage} ({self.stage_workers[stage]})'
+                              for stage in self.stages) + '...')
+        try:
+            while not scheduler.done():
+                for index in scheduler.ready():
+                    scheduler.start(index)
+                    queues[self.stages[0]].append(index)
+
+                admitted = self.limit.update() if self.limit else None
+                for stage in self.stages:
+                    queues[stage].sort(
+                        key=lambda job: -scheduler.critical_paths[job]
+                    )
+                    for index in list(queues[stage]):
+                        if active[stage] >= self.stage_workers[stage]:
+                            break
+                        if admitted and sum(active.values()) >= admitted:
+                            break
+                        if budget and stage == self.core_stage:
+                            if not budget.fits(job_cores[index]):
+                                continue
+                            budget.acquire(job_cores[index])
+                        queues[stage].remove(index)
+                        future = pools[stage].submit(func, stage,
+                                                     *jobs[index])
+                        running[future] = (index, stage)
+                        active[stage] += 1
+                depths = self.log_depths(queues, active, depths)
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED,
+                               timeout=self.limit.interval
+                               if self.limit else None)
+                for future in done:
+                    index, stage = running.pop(future)
+                    active[stage] -= 1
+                    if budget and stage == self.core_stage:
+                        budget.release(job_cores[index])
+                    success = bool(future.result())
+                    results[index][stage] = success
+
+                    position = self.stages.index(stage)
+                    if success and position + 1 < len(self.stages):
+                        queues[self.stages[position + 1]].append(index)
+                    else:
+                        scheduler.finish(index, success)
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=True)
+
+        return results
@@ -0,0 +1,257 @@
+"""
+Utilities for recording and predicting test durations.
+
+    - get_history_file
+    - format_walltime
+    - parse_walltime
+    - make_history_key
+    - DurationHistory
+"""
+
+import os
+import json
+import math
+import logging
+import datetime as dt
+
+from pathlib import Path
+from src.lib.utils.logger import logger_setup
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+
+def get_history_file(system_cfg: dict) -> str:
+    """
+    Retrieves the duration history file from the system
+    configuration. It is kept outside the scratch directory
+    by default since that is cleaned on every run.
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'history_file')
+
+    Returns
+    -------
+    str
+        Path of the history file
+
+    """
+    history_file = system_cfg.get('history_file')
+    if not history_file:
+        history_file = str(Path.home() / '.assert' / 'durations.jsonl')
+    return history_file
+
+
+def format_walltime(seconds: float) -> str:
+    """
+    Formats a duration as a batch system walltime,
+    rounded up to the minute.
+
+    Parameters
+    ----------
+    seconds : float
+        Duration in seconds
+
+    Returns
+    -------
+    str
+        Walltime as 'HH:MM:SS'
+
+    """
+    minutes = max(1, math.ceil(seconds / 60))
+    return f'{minutes // 60:02d}:{minutes % 60:02d}:00'
+
+
+def parse_walltime(walltime: str) -> float:
+    """
+    Converts a batch system walltime into seconds.
+
+    Parameters
+    ----------
+    walltime : str
+        Walltime as '[HH:]MM:SS'
+
+    Returns
+    -------
+    float
+        Duration in seconds
+
+    """
+    seconds = 0
+    for part in walltime.split(':'):
+        seconds = seconds * 60 + int(part)
+    return float(seconds)
+
+
+def make_history_key(key: dict) -> str:
+    """
+    Converts a test description into a stable string key.
+
+    Parameters
+    ----------
+    key : dict
+        Test description (eg. rundeck, compiler, mode,
+        npes, verification)
+
+    Returns
+    -------
+    str
+        Key for the history
+
+    """
+    return json.dumps(key, sort_keys=True, default=str)
+
+
+class DurationHistory:
+    def __init__(self, history_file: str,
+                 percentile: float = 95,
+                 margin: float = 0.2,
+                 max_samples: int = 20):
+        """
+        Parameters
+        ----------
+        history_file : str
+            File the durations are appended to (one JSON record
+            per line)
+        percentile : float
+            Percentile of past durations used for predictions
+        margin : float
+            Fraction added on top of the percentile
+        max_samples : int
+            Number of most recent durations kept per test and stage
+
+        """
+        self.history_file: str = history_file
+        self.percentile: float = percentile
+        self.margin: float = margin
+        self.max_samples: int = max_samples
+
+        # Durations read from the history file, keyed by (test, stage)
+        self.samples: dict[tuple[str, str], list[float]] = dict()
+
+    def record(self, key: dict, stage: str, seconds: float,
+               usage: dict = None) -> None:
+        """
+        Appends the duration of a test stage to the history.
+
+        Each record is written with a single append so concurrent
+        test processes never interleave records.
+
+        Parameters
+        ----------
+        key : dict
+            Test description
+        stage : str
+            Stage name
+        seconds : float
+            Elapsed time of the stage
+        usage : dict
+            Resource usage of the stage's commands (eg. CPU time,
+            maximum RSS), recorded with the duration if given
+
+        """
+        record = {'key': make_history_key(key),
+                  'stage': stage,
+                  'seconds': round(seconds, 3),
+                  'date': dt.datetime.now().isoformat(timespec='seconds')}
+        if usage:
+            record['usage'] = usage
+        line = (json.dumps(record) + '\n').encode('UTF-8')
+        try:
+            Path(self.history_file).parent.mkdir(parents=True,
+                                                 exist_ok=True)
+            fd = os.open(self.history_file,
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.warning(f'Could not record duration in '
+                           f'{self.history_file}: {e}')
+            return
+
+        samples = self.samples.setdefault((record['key'], stage), list())
+        samples.append(seconds)
+        del samples[:-self.max_samples]
+
+    def load(self) -> None:
+        """
+        Reads every duration in the history file, keeping the
+        most recent ones of each test stage.
+
+        """
+        self.samples = dict()
+        if not Path(self.history_file).is_file():
+            return
+
+        with open(self.history_file, 'r') as history:
+            for line in history:
+                try:
+                    record = json.loads(line)
+                    sample = (record['key'], record['stage'])
+                    seconds = float(record['seconds'])
+                except (ValueError, KeyError, TypeError):
+                    # Partially written or corrupted record
+                    continue
+                self.samples.setdefault(sample, list()).append(seconds)
+
+        for samples in self.samples.values():
+            del samples[:-self.max_samples]
+        logger.debug(f'Loaded durations of {len(self.samples)} test '
+                     f'stages from {self.history_file}')
+
+    def durations(self, key: dict, stage: str) -> list[float]:
+        """
+        Retrieves the recorded durations of a test stage.
+
+        Parameters
+        ----------
+        key : dict
+            Test description
+        stage : str
+            Stage name
+
+        Returns
+        -------
+        list[float]
+            Most recent durations, oldest first
+
+        """
+        return list(self.samples.get((make_history_key(key), stage), []))
+
+    def predict(self, key: dict, stages: list[str]) -> float:
+        """
+        Predicts the duration of a test as the sum, over its stages,
+        of a high percentile of past durations plus a margin.
+
+        Parameters
+        ----------
+        key : dict
+            Test description
+        stages : list[str]
+            Stages to include in the prediction
+
+        Returns
+        -------
+        float
+            Predicted duration in seconds, or None unless every
+            stage of the test has history (a partial sum would
+            underestimate it)
+
+        """
+        prediction = 0
+        for stage in stages:
+            samples = sorted(self.durations(key, stage))
+            if not samples:
+                return None
+            # Nearest-rank percentile
+            rank = math.ceil(self.percentile / 100 * len(samples))
+            value = samples[min(len(samples), max(1, rank)) - 1]
+            prediction += value * (1 + self.margin)
+        return prediction
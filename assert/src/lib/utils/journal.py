@@ -0,0 +1,232 @@
+"""
+Utilities for journaling the stage results (and the commit tested)
+of a regression test run so an interrupted run can be resumed.
+
+    - get_run_id
+    - get_run_start
+    - get_journal_file
+    - RunJournal
+"""
+
+import os
+import json
+import logging
+import datetime as dt
+
+from pathlib import Path
+from src.lib.utils.logger import logger_setup
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+# Format of run IDs (also the time stamp of test directories)
+RUN_ID_FORMAT = '%Y%m%d_%H%M%S'
+
+
+def get_run_id(start_time: dt.datetime) -> str:
+    """
+    Converts the start time of a run into its ID.
+
+    Parameters
+    ----------
+    start_time : dt.datetime
+        Starting time of the run
+
+    Returns
+    -------
+    str
+        Run ID (eg. '20240131_235959')
+
+    """
+    return start_time.strftime(RUN_ID_FORMAT)
+
+
+def get_run_start(run_id: str) -> dt.datetime:
+    """
+    Converts a run ID back into the start time of the run.
+
+    Parameters
+    ----------
+    run_id : str
+        Run ID (eg. '20240131_235959')
+
+    Returns
+    -------
+    dt.datetime
+        Starting time of the run
+
+    """
+    try:
+        return dt.datetime.strptime(run_id, RUN_ID_FORMAT)
+    except ValueError:
+        logger.error(f'Invalid run ID [{run_id}]')
+        raise Exception(f'Invalid run ID {run_id}: expected '
+                        f'YYYYMMDD_HHMMSS.')
+
+
+def get_journal_file(system_cfg: dict, run_id: str) -> str:
+    """
+    Retrieves the journal file of a run. Journals are kept in
+    'journal_dir' from the system configuration, outside the
+    scratch directory by default since that is cleaned on
+    every new run.
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'journal_dir')
+    run_id : str
+        Run ID
+
+    Returns
+    -------
+    str
+        Path of the journal file
+
+    """
+    journal_dir = system_cfg.get('journal_dir')
+    if not journal_dir:
+        journal_dir = str(Path.home() / '.assert' / 'journals')
+    return str(Path(journal_dir) / f'{run_id}.jsonl')
+
+
+class RunJournal:
+    def __init__(self, journal_file: str):
+        """
+        Parameters
+        ----------
+        journal_file : str
+            File the stage results are appended to (one JSON
+            record per line)
+
+        """
+        self.journal_file: str = journal_file
+
+    def append(self, record: dict, description: str) -> None:
+        """
+        Appends a record to the journal.
+
+        Each record is written with a single append so records of
+        concurrent test processes never interleave, and a crash can
+        at worst leave one partial last line (ignored when loading).
+
+        Parameters
+        ----------
+        record : dict
+            Record (JSON serializable)
+        description : str
+            What is journaled (for the warning if it fails)
+
+        """
+        record['date'] = dt.datetime.now().isoformat(timespec='seconds')
+        line = (json.dumps(record) + '\n').encode('UTF-8')
+        try:
+            Path(self.journal_file).parent.mkdir(parents=True,
+                                                 exist_ok=True)
+            fd = os.open(self.journal_file,
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.warning(f'Could not journal {description} '
+                           f'in {self.journal_file}: {e}')
+
+    def record(self, test_name: str, test_dir: str,
+               stage: str, success: bool) -> None:
+        """
+        Appends the result of a test stage to the journal.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test
+        test_dir : str
+            Test directory the stage was performed in
+        stage : str
+            Stage name
+        success : bool
+            Whether the stage succeeded
+
+        """
+        self.append({'test': test_name,
+                     'directory': test_dir,
+                     'stage': stage,
+                     'success': bool(success)},
+                    f'{stage} of {test_name}')
+
+    def record_revision(self, revision: str) -> None:
+        """
+        Appends the commit the run is pinned to to the journal, so
+        a resumed run tests the same commit.
+
+        Parameters
+        ----------
+        revision : str
+            Commit SHA
+
+        """
+        self.append({'revision': revision}, f'commit {revision}')
+
+    def load_revision(self) -> str:
+        """
+        Reads the commit the run was pinned to. If it was recorded
+        more than once, the last one is kept.
+
+        Returns
+        -------
+        str
+            Commit SHA, or None if none was journaled
+
+        """
+        revision = None
+        if not Path(self.journal_file).is_file():
+            return revision
+
+        with open(self.journal_file, 'r') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                    if isinstance(record, dict) and record.get('revision'):
+                        revision = str(record['revision'])
+                except ValueError:
+                    # Partially written or corrupted record
+                    continue
+        return revision
+
+    def load(self) -> dict[tuple[str, str], dict[str, bool]]:
+        """
+        Reads the stage results recorded in the journal. If a stage
+        was recorded more than once, the last result is kept.
+
+        Returns
+        -------
+        dict[tuple[str, str], dict[str, bool]]
+            Result of each recorded stage, keyed by
+            (test name, test directory)
+
+        """
+        results = dict()
+        if not Path(self.journal_file).is_file():
+            return results
+
+        with open(self.journal_file, 'r') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                    test = (record['test'], record['directory'])
+                    stage = record['stage']
+                    success = bool(record['success'])
+                except (ValueError, KeyError, TypeError):
+                    # Commit, partially written or corrupted record
+                    continue
+                results.setdefault(test, dict())[stage] = success
+
+        logger.debug(f'Loaded results of {len(results)} test '
+                     f'directories from {self.journal_file}')
+        return results
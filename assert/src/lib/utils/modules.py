@@ -0,0 +1,374 @@
+"""
+Utilities for resolving environment modules (Lmod or Tcl) into the
+environment variables they set, so module lists are loaded once per
+run instead of in every compile and run script.
+
+The difference a module list makes to the environment (PATH,
+LD_LIBRARY_PATH, ...) is cached on disk by module list and host, and
+applied to the environment of the subprocesses that need it.
+
+    - get_module_lists
+    - get_modulecmd
+    - get_module_cache_dir
+    - apply_env_diff
+    - ModuleResolver
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import subprocess as sp
+
+from pathlib import Path
+from src.lib.utils.logger import logger_setup
+from src.lib.utils.paths import lock_path
+from src.lib.utils.result_cache import make_cache_key
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+# Loads modules ($@) with modulecmd ($0) and prints the environment
+# before and after, separated by an empty entry
+RESOLVE_SCRIPT = ('env -0 && printf "\\0" && '
+                  'eval "$("$0" bash purge)" && '
+                  'eval "$("$0" bash load "$@")" && env -0')
+
+# Variables bash itself changes between the two environments
+SHELL_VARIABLES = ['_', 'SHLVL', 'PWD', 'OLDPWD']
+
+
+def get_module_lists(system_cfg: dict) -> dict[str, list[str]]:
+    """
+    Retrieves the configured module lists: the names listed in
+    'modulelist' and the modules of each (both comma-separated
+    or lists).
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'modulelist' and
+        one entry per module list)
+
+    Returns
+    -------
+    dict[str, list[str]]
+        Modules, by module list name
+
+    """
+    def split(value) -> list[str]:
+        if not value:
+            return list()
+        if isinstance(value, str):
+            value = value.split(',')
+        return [str(item).strip() for item in value if str(item).strip()]
+
+    return {name: split(system_cfg.get(name))
+            for name in split(system_cfg.get('modulelist'))}
+
+
+def get_modulecmd(system_cfg: dict) -> str:
+    """
+    Retrieves the command modules are resolved with: 'modulecmd' of
+    the system configuration, Lmod's ($LMOD_CMD), the Tcl modulecmd
+    of $MODULESHOME, or 'modulecmd' on the PATH.
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'modulecmd')
+
+    Returns
+    -------
+    str
+        modulecmd executable
+
+    """
+    if system_cfg.get('modulecmd'):
+        return str(system_cfg['modulecmd'])
+    if os.environ.get('LMOD_CMD'):
+        return os.environ['LMOD_CMD']
+    if os.environ.get('MODULESHOME'):
+        modulecmd = Path(os.environ['MODULESHOME']) / 'bin' / 'modulecmd'
+        if modulecmd.exists():
+            return str(modulecmd)
+    return 'modulecmd'
+
+
+def get_module_cache_dir(system_cfg: dict) -> str:
+    """
+    Retrieves the module environment cache directory from the
+    system configuration.
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'module_cache_dir')
+
+    Returns
+    -------
+    str
+        Path of the module environment cache directory
+
+    """
+    cache_dir = system_cfg.get('module_cache_dir')
+    if not cache_dir:
+        cache_dir = str(Path.home() / '.assert' / 'modules')
+    return cache_dir
+
+
+def apply_env_diff(diff: dict[str, str], env: dict = None) -> dict:
+    """
+    Applies an environment difference to an environment.
+
+    Parameters
+    ----------
+    diff : dict[str, str]
+        Value of each variable set, or None for each variable unset
+    env : dict
+        Environment (os.environ if None), not modified
+
+    Returns
+    -------
+    dict
+        New environment
+
+    """
+    env = dict(os.environ if env is None else env)
+    for name, value in diff.items():
+        if value is None:
+            env.pop(name, None)
+        else:
+            env[name] = value
+    return env
+
+
+class ModuleResolver:
+    def __init__(self, cache_dir: str, modulecmd: str = 'modulecmd',
+                 since: float = None, timeout: float = 300):
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            Directory the environment differences are stored in
+            (one JSON file per module list and host)
+        modulecmd : str
+            modulecmd executable (Lmod or Tcl)
+        since : float
+            Time (seconds since the epoch) before which cached
+            differences are resolved again, eg. the start of the
+            run (cached differences are always used if None)
+        timeout : float
+            Seconds a module list may take to resolve
+
+        """
+        self.cache_dir: str = cache_dir
+        self.modulecmd: str = modulecmd
+        self.since: float = since
+        self.timeout: float = timeout
+
+        # Differences already resolved or read by this instance
+        self.resolved: dict[str, dict[str, str]] = dict()
+
+    def get_key(self, modules: list[str]) -> dict:
+        """
+        Retrieves the description a module list is cached by.
+
+        Parameters
+        ----------
+        modules : list[str]
+            Modules, in load order
+
+        Returns
+        -------
+        dict
+            Module list, host, modulecmd and module path
+
+        """
+        return {'modules': list(modules),
+                'host': os.uname().nodename,
+                'modulecmd': self.modulecmd,
+                'modulepath': os.environ.get('MODULEPATH')}
+
+    def get_file(self, modules: list[str]) -> Path:
+        """
+        Retrieves the file the difference of a module list is
+        stored in.
+
+        Parameters
+        ----------
+        modules : list[str]
+            Modules, in load order
+
+        Returns
+        -------
+        Path
+            Cache file (may not exist)
+
+        """
+        digest = make_cache_key(self.get_key(modules))
+        return Path(self.cache_dir) / f'{digest}.json'
+
+    def evaluate(self, modules: list[str]) -> dict[str, str]:
+        """
+        Purges the loaded modules and loads a module list in a
+        shell, and compares its environment before and after.
+
+        Parameters
+        ----------
+        modules : list[str]
+            Modules, in load order
+
+        Returns
+        -------
+        dict[str, str]
+            Value of each variable set, or None for each
+            variable unset
+
+        """
+        try:
+            run = sp.run(['bash', '-c', RESOLVE_SCRIPT, self.modulecmd] +
+                         list(modules), stdout=sp.PIPE, stderr=sp.PIPE,
+                         timeout=self.timeout)
+        except (OSError, sp.TimeoutExpired) as e:
+            raise Exception(f'Could not load modules {modules}: {e}')
+        if run.returncode != 0:
+            raise Exception(f'Could not load modules {modules}: '
+                            f'{run.stderr.decode("UTF-8").strip()}')
+
+        before, _, after = run.stdout.decode('UTF-8').partition('\0\0')
+        environments = list()
+        for text in [before, after]:
+            entries = [entry.partition('=') for entry in text.split('\0')
+                       if '=' in entry]
+            environments.append({name: value
+                                 for name, _, value in entries})
+        before, after = environments
+        diff = {name: value for name, value in after.items()
+                if before.get(name) != value}
+        diff.update({name: None for name in before if name not in after})
+        for name in SHELL_VARIABLES:
+            diff.pop(name, None)
+        return diff
+
+    def read(self, cache_file: Path) -> dict[str, str]:
+        """
+        Reads a cached environment difference.
+
+        Parameters
+        ----------
+        cache_file : Path
+            Cache file
+
+        Returns
+        -------
+        dict[str, str]
+            Environment difference, or None if there is none or it
+            was resolved before self.since
+
+        """
+        try:
+            with open(cache_file, 'r') as fid:
+                entry = json.load(fid)
+            if self.since is not None and entry['time'] < self.since:
+                return None
+            return entry['diff']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f'Ignoring unreadable module environment '
+                           f'{cache_file}: {e}')
+            return None
+
+    def write(self, cache_file: Path, modules: list[str],
+              diff: dict[str, str]) -> None:
+        """
+        Stores an environment difference. The file is written under
+        a temporary name and renamed, so readers never see a partial
+        difference.
+
+        Parameters
+        ----------
+        cache_file : Path
+            Cache file
+        modules : list[str]
+            Modules, in load order
+        diff : dict[str, str]
+            Environment difference
+
+        """
+        entry = {'key': self.get_key(modules), 'time': time.time(),
+                 'diff': diff}
+        try:
+            fd, tmp_name = tempfile.mkstemp(dir=cache_file.parent,
+                                            suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as fid:
+                    json.dump(entry, fid)
+                os.replace(tmp_name, cache_file)
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        except OSError as e:
+            logger.warning(f'Could not cache module environment in '
+                           f'{cache_file}: {e}')
+
+    def resolve(self, modules: list[str]) -> dict[str, str]:
+        """
+        Retrieves the environment difference of a module list,
+        resolving it only if it isn't cached. Concurrent threads,
+        processes, or runs take turns, so only the first one
+        resolves it.
+
+        Parameters
+        ----------
+        modules : list[str]
+            Modules, in load order
+
+        Returns
+        -------
+        dict[str, str]
+            Value of each variable set, or None for each
+            variable unset
+
+        """
+        cache_file = self.get_file(modules)
+        if cache_file.name in self.resolved:
+            return self.resolved[cache_file.name]
+
+        with lock_path(str(cache_file)):
+            diff = self.read(cache_file)
+            if diff is None:
+                start = time.perf_counter()
+                diff = self.evaluate(modules)
+                logger.info(f'Resolved modules {modules} in '
+                            f'{time.perf_counter() - start:.1f}s '
+                            f'({len(diff)} variables)')
+                self.write(cache_file, modules, diff)
+        self.resolved[cache_file.name] = diff
+        return diff
+
+    def get_env(self, modules: list[str], env: dict = None) -> dict:
+        """
+        Retrieves the environment subprocesses run in with a module
+        list loaded.
+
+        Parameters
+        ----------
+        modules : list[str]
+            Modules, in load order
+        env : dict
+            Environment the modules are loaded in (os.environ
+            if None)
+
+        Returns
+        -------
+        dict
+            New environment
+
+        """
+        return apply_env_diff(self.resolve(modules), env)
@@ -40,6 +40,8 @@ Utilities for running commands.
   - Other Functions
       * which
       * create_link
+      * lock_path
+      * async_lock_path
 
   - Command line arguments
       * parse_command_line_args
@@ -53,9 +55,12 @@ Utilities for running commands.
 """
 import os
 import sys
+import fcntl
+import asyncio
 import shutil
 import filecmp
 import logging
+import contextlib
 import subprocess as sp
 
 from pathlib import Path
@@ -538,14 +543,17 @@ def recurs_find_files(src_dir: str, pattern: str) -> list[str]:
     return [str(obj) for obj in list(Path(src_dir).rglob(pattern))]
 
 
-def clean_dir(adir: str) -> None:
+def clean_dir(adir: str, exclude: list[str] = None) -> None:
     """
     'Safe' way to clean the contents of a directory
 
     Parameters
     ----------
     adir : directory
+    exclude : list[str]
+        Paths in the directory that are kept
     """
+    excluded = [os.path.abspath(path) for path in exclude or []]
 
     if adir == '/' or adir == "\\":
         logger.error('Cannot clean %s', adir)
@@ -554,6 +562,8 @@ def clean_dir(adir: str) -> None:
         for file_object in os.listdir(adir):
             logger.info('Will clean up %s', adir)
             file_object_path = os.path.join(adir, file_object)
+            if os.path.abspath(file_object_path) in excluded:
+                continue
             if os.path.isfile(file_object_path):
                 os.unlink(file_object_path)
             else:
@@ -673,6 +683,56 @@ def create_link(target: str, directory: str, link_name: str) -> None:
     run = sp.check_call(cmd)
 
 
+@contextlib.contextmanager
+def lock_path(path: str):
+    """
+    Holds an exclusive lock on a path (through the '<path>.lock'
+    file), so concurrent threads, processes, or runs sharing it
+    take turns.
+
+    Parameters
+    ----------
+    path : str
+        Locked file or directory (may not exist)
+
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(str(path) + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextlib.asynccontextmanager
+async def async_lock_path(path: str, interval: float = 0.1):
+    """
+    Asynchronous version of lock_path: the lock is polled instead of
+    blocking the event loop, so a cancelled task stops waiting for it.
+
+    Parameters
+    ----------
+    path : str
+        Locked file or directory (may not exist)
+    interval : float
+        Seconds between two attempts at taking the lock
+
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(str(path) + '.lock', 'w') as lock_file:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(interval)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
 def are_dir_trees_equal(dir1, dir2) -> bool:
     """
     Compare two directories recursively. Files in each directory are
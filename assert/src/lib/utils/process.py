@@ -0,0 +1,261 @@
+"""
+Utilities for running commands (clones, builds, model runs) without
+keeping their output in memory: it is streamed line by line to a log
+file, and only its last lines are kept for reports.
+
+Commands run in their own session, so a timeout (or a watchdog
+finding a command hung) terminates the whole process group (SIGTERM,
+then SIGKILL after a grace period), and their resource usage (CPU
+time, maximum RSS) is collected with wait4.
+
+    - format_usage
+    - get_usage
+    - merge_usage
+    - kill_group
+    - run_process
+"""
+
+import os
+import time
+import signal
+import logging
+import threading
+import collections
+import subprocess as sp
+
+from pathlib import Path
+from src.lib.utils.logger import logger_setup
+from src.lib.utils.watchdog import RunWatchdog
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+# Longest line read at once (longer lines are split)
+MAX_LINE = 64 * 1024
+
+
+def format_usage(result: dict) -> str:
+    """
+    Summarizes the outcome and resource usage of a command.
+
+    Parameters
+    ----------
+    result : dict
+        Result of run_process
+
+    Returns
+    -------
+    str
+        eg. 'exit 0, 12.3s wall, 40.1s user, 2.0s sys,
+        max RSS 512.0 MiB'
+
+    """
+    if result.get('hung'):
+        outcome = 'hung'
+    elif result['timed_out']:
+        outcome = 'timed out'
+    else:
+        outcome = f'exit {result["returncode"]}'
+    return (f'{outcome}, {result["duration"]:.1f}s wall, '
+            f'{result["user_time"]:.1f}s user, '
+            f'{result["system_time"]:.1f}s sys, '
+            f'max RSS {result["max_rss"] / 1024:.1f} MiB')
+
+
+def get_usage(result: dict) -> dict:
+    """
+    Retrieves the resource usage of a command.
+
+    Parameters
+    ----------
+    result : dict
+        Result of run_process
+
+    Returns
+    -------
+    dict
+        commands (1), user_time and system_time (CPU seconds),
+        and max_rss (KiB)
+
+    """
+    return {'commands': 1,
+            'user_time': round(result['user_time'], 3),
+            'system_time': round(result['system_time'], 3),
+            'max_rss': result['max_rss']}
+
+
+def merge_usage(usage: dict, other: dict) -> dict:
+    """
+    Adds the resource usage of commands to that of others: the
+    numbers of commands and CPU times add up, and the largest
+    maximum RSS is kept.
+
+    Parameters
+    ----------
+    usage : dict
+        Resource usage (see get_usage), updated
+    other : dict
+        Resource usage added to it
+
+    Returns
+    -------
+    dict
+        The updated usage
+
+    """
+    usage['commands'] = usage.get('commands', 0) + other.get('commands', 0)
+    for name in ['user_time', 'system_time']:
+        usage[name] = round(usage.get(name, 0) + other.get(name, 0), 3)
+    usage['max_rss'] = max(usage.get('max_rss', 0), other.get('max_rss', 0))
+    return usage
+
+
+def kill_group(process: sp.Popen, sig: int) -> None:
+    """
+    Sends a signal to the process group of a command started in
+    its own session.
+
+    Parameters
+    ----------
+    process : sp.Popen
+        Command
+    sig : int
+        Signal (eg. signal.SIGTERM)
+
+    """
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def run_process(cmd: list[str], log_file: str = None,
+                timeout: float = None, grace: float = 10,
+                tail_lines: int = 100, watchdog: RunWatchdog = None,
+                **kwargs) -> dict:
+    """
+    Runs a command, streaming its output (stdout and stderr) to a
+    log file. It is terminated (SIGTERM, then SIGKILL) if it runs
+    longer than its timeout, or if its watchdog finds it hung (its
+    stacks are sampled first).
+
+    Parameters
+    ----------
+    cmd : list[str]
+        Command
+    log_file : str
+        File the output is appended to (only the tail is kept
+        if None)
+    timeout : float
+        Seconds the command may run (no limit if None)
+    grace : float
+        Seconds between SIGTERM and SIGKILL
+    tail_lines : int
+        Number of last output lines kept
+    watchdog : RunWatchdog
+        Watchdog checking the command makes progress (none if None)
+    kwargs : dict
+        Other arguments of sp.Popen (eg. cwd, env)
+
+    Returns
+    -------
+    dict
+        returncode (negative signal number if killed by a signal),
+        timed_out, hung, duration (seconds), user_time and
+        system_time (CPU seconds of the command and its children),
+        max_rss (KiB), tail (last lines of output), and stacks
+        (sampled if hung, None otherwise)
+
+    """
+    tail = collections.deque(maxlen=tail_lines)
+    status = dict()
+    log = None
+    if log_file:
+        Path(log_file).parent.mkdir(parents=True, exist_ok=True)
+        log = open(log_file, 'a', errors='replace')
+        log.write(f'$ {" ".join(str(arg) for arg in cmd)}\n')
+        log.flush()
+
+    start = time.perf_counter()
+    try:
+        process = sp.Popen(cmd, stdin=sp.DEVNULL, stdout=sp.PIPE,
+                           stderr=sp.STDOUT, start_new_session=True,
+                           **kwargs)
+    except BaseException:
+        if log:
+            log.close()
+        raise
+
+    def read() -> None:
+        for line in iter(lambda: process.stdout.readline(MAX_LINE), b''):
+            text = line.decode('UTF-8', errors='replace')
+            tail.append(text.rstrip('\n'))
+            if log:
+                log.write(text)
+                log.flush()
+
+    def wait() -> None:
+        _, code, usage = os.wait4(process.pid, 0)
+        status.update(code=code, usage=usage)
+
+    reader = threading.Thread(target=read, daemon=True)
+    waiter = threading.Thread(target=wait, daemon=True)
+    reader.start()
+    waiter.start()
+    timed_out, hung, stacks = False, False, None
+    try:
+        while waiter.is_alive():
+            remaining = None if timeout is None \
+                else timeout - (time.perf_counter() - start)
+            if watchdog and (remaining is None or
+                             remaining > watchdog.interval):
+                waiter.join(watchdog.interval)
+                if waiter.is_alive() and watchdog.check(process.pid):
+                    hung = True
+                    stacks = watchdog.sample(process.pid)
+                    logger.warning(f'{cmd[0]} hung, terminating it')
+                    break
+            else:
+                waiter.join(remaining)
+                if waiter.is_alive():
+                    timed_out = True
+                    logger.warning(f'{cmd[0]} timed out after '
+                                   f'{timeout}s, terminating it')
+                    break
+        if waiter.is_alive():
+            kill_group(process, signal.SIGTERM)
+            waiter.join(grace)
+            if waiter.is_alive():
+                kill_group(process, signal.SIGKILL)
+                waiter.join()
+        # Processes left in the group may still hold the output open
+        reader.join(grace)
+        if reader.is_alive():
+            kill_group(process, signal.SIGKILL)
+            reader.join()
+    finally:
+        if waiter.is_alive():
+            kill_group(process, signal.SIGKILL)
+            waiter.join()
+        process.stdout.close()
+        # Reaped by wait4, so Popen must not wait for it again
+        process.returncode = os.waitstatus_to_exitcode(status['code'])
+
+    result = {'cmd': [str(arg) for arg in cmd],
+              'returncode': process.returncode,
+              'timed_out': timed_out,
+              'hung': hung,
+              'duration': time.perf_counter() - start,
+              'user_time': status['usage'].ru_utime,
+              'system_time': status['usage'].ru_stime,
+              'max_rss': status['usage'].ru_maxrss,
+              'tail': list(tail),
+              'stacks': stacks}
+    if log:
+        log.write(f'# {format_usage(result)}\n')
+        log.close()
+    logger.debug(f'{cmd[0]}: {format_usage(result)}')
+    return result
@@ -0,0 +1,160 @@
+"""
+Utilities for caching test results by the commit and configuration
+they were obtained with.
+
+    - get_result_cache_dir
+    - make_cache_key
+    - ResultCache
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+
+from pathlib import Path
+from src.lib.utils.logger import logger_setup
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+
+def get_result_cache_dir(system_cfg: dict) -> str:
+    """
+    Retrieves the result cache directory from the system
+    configuration. It is kept outside the scratch directory
+    by default since that is cleaned on every run.
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'result_cache_dir')
+
+    Returns
+    -------
+    str
+        Path of the result cache directory
+
+    """
+    cache_dir = system_cfg.get('result_cache_dir')
+    if not cache_dir:
+        cache_dir = str(Path.home() / '.assert' / 'results')
+    return cache_dir
+
+
+def make_cache_key(key: dict) -> str:
+    """
+    Hashes a description of everything a test result depends on.
+    Dictionaries are normalized (sorted keys) so equal descriptions
+    always give the same hash.
+
+    Parameters
+    ----------
+    key : dict
+        Test description (eg. commit, testcase, compiler version)
+
+    Returns
+    -------
+    str
+        SHA-256 of the description
+
+    """
+    text = json.dumps(key, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('UTF-8')).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str):
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            Directory the results are stored in (one JSON file
+            per key)
+
+        """
+        self.cache_dir: str = cache_dir
+
+    def get_file(self, key: dict) -> Path:
+        """
+        Retrieves the file a result is stored in.
+
+        Parameters
+        ----------
+        key : dict
+            Test description
+
+        Returns
+        -------
+        Path
+            Result file (may not exist)
+
+        """
+        digest = make_cache_key(key)
+        return Path(self.cache_dir) / digest[:2] / f'{digest}.json'
+
+    def get(self, key: dict) -> dict:
+        """
+        Looks up the result stored for a test description.
+
+        Parameters
+        ----------
+        key : dict
+            Test description
+
+        Returns
+        -------
+        dict
+            Stored test report, or None if there is none
+
+        """
+        result_file = self.get_file(key)
+        try:
+            with open(result_file, 'r') as fid:
+                entry = json.load(fid)
+            test_report = entry['test_report']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f'Ignoring unreadable cached result '
+                           f'{result_file}: {e}')
+            return None
+        logger.debug(f'Cached result found in {result_file}')
+        return test_report
+
+    def put(self, key: dict, test_report: dict) -> None:
+        """
+        Stores the result of a test description. The file is
+        written under a temporary name and renamed, so readers
+        never see a partial result.
+
+        Parameters
+        ----------
+        key : dict
+            Test description
+        test_report : dict
+            Results of the test
+
+        """
+        result_file = self.get_file(key)
+        entry = {'key': key, 'test_report': test_report}
+        try:
+            result_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_name = tempfile.mkstemp(dir=result_file.parent,
+                                            suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as fid:
+                    json.dump(entry, fid, default=str)
+                os.replace(tmp_name, result_file)
+            except BaseException:
+                Path(tmp_name).unlink(missing_ok=True)
+                raise
+        except OSError as e:
+            logger.warning(f'Could not cache result in '
+                           f'{result_file}: {e}')
+            return
+        logger.debug(f'Result cached in {result_file}')
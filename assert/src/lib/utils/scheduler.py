@@ -0,0 +1,708 @@
+"""
+Utilities for scheduling regression test jobs.
+
+    - get_max_cores
+    - get_adaptive_limit
+    - read_system_load
+    - DagScheduler
+    - CoreBudget
+    - AdaptiveLimit
+    - JobTokenPool
+"""
+
+import os
+import json
+import time
+import uuid
+import logging
+import contextlib
+
+from pathlib import Path
+from typing import Hashable
+from src.lib.utils.paths import lock_path
+from src.lib.utils.logger import logger_setup
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+
+def get_max_cores(system_cfg: dict) -> int:
+    """
+    Retrieves the number of cores test jobs may use at the same
+    time: 'max_cores' from the system configuration if set,
+    otherwise the cores available to this process on the node.
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'max_cores')
+
+    Returns
+    -------
+    int
+        Core budget
+
+    """
+    try:
+        node_cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        node_cores = os.cpu_count() or 1
+
+    max_cores = system_cfg.get('max_cores')
+    if not max_cores:
+        return node_cores
+    try:
+        max_cores = int(max_cores)
+    except (TypeError, ValueError):
+        logger.warning(f'Invalid max_cores value [{max_cores}]. '
+                       f'Using the {node_cores} cores of the node...')
+        return node_cores
+    return max(1, max_cores)
+
+
+def get_adaptive_limit(system_cfg: dict,
+                       max_workers: int) -> 'AdaptiveLimit':
+    """
+    Creates the adaptive concurrency limit described by the
+    'adaptive' entry of the system configuration, eg.
+
+        adaptive:
+          min_workers: 2
+          max_iowait: 0.2
+          min_free_memory: 0.1
+          interval: 30
+
+    Parameters
+    ----------
+    system_cfg : dict
+        System configuration info (may contain 'adaptive')
+    max_workers : int
+        Upper bound of the limit (the executor's pool size)
+
+    Returns
+    -------
+    AdaptiveLimit
+        Adaptive limit, or None if concurrency is fixed
+
+    """
+    adaptive = system_cfg.get('adaptive')
+    if not adaptive:
+        return None
+    if not isinstance(adaptive, dict):
+        adaptive = dict()
+    try:
+        return AdaptiveLimit(
+            min_workers=int(adaptive.get('min_workers', 1)),
+            max_workers=int(adaptive.get('max_workers', max_workers)),
+            max_load=adaptive.get('max_load'),
+            max_iowait=float(adaptive.get('max_iowait', 0.2)),
+            min_free_memory=float(adaptive.get('min_free_memory', 0.1)),
+            interval=float(adaptive.get('interval', 30))
+        )
+    except (TypeError, ValueError):
+        logger.warning(f'Invalid adaptive settings [{adaptive}]. '
+                       f'Using fixed concurrency...')
+        return None
+
+
+def read_system_load(proc_dir: str = '/proc') -> dict:
+    """
+    Reads the load of the node from /proc.
+
+    Parameters
+    ----------
+    proc_dir : str
+        Mount point of the proc file system
+
+    Returns
+    -------
+    dict
+        'load' (1-minute load average), 'cpu_times' (cumulative
+        total and iowait CPU time), and 'free_memory' (fraction
+        of memory available). Values that can't be read are None.
+
+    """
+    load = {'load': None, 'cpu_times': None, 'free_memory': None}
+    try:
+        with open(os.path.join(proc_dir, 'loadavg')) as fid:
+            load['load'] = float(fid.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        with open(os.path.join(proc_dir, 'stat')) as fid:
+            # cpu user nice system idle iowait irq softirq steal ...
+            fields = [int(field) for field in fid.readline().split()[1:9]]
+        load['cpu_times'] = (sum(fields), fields[4])
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        meminfo = dict()
+        with open(os.path.join(proc_dir, 'meminfo')) as fid:
+            for line in fid:
+                name, _, value = line.partition(':')
+                meminfo[name] = int(value.split()[0])
+        load['free_memory'] = meminfo['MemAvailable'] / meminfo['MemTotal']
+    except (OSError, ValueError, IndexError, KeyError, ZeroDivisionError):
+        pass
+
+    return load
+
+
+class DagScheduler:
+    def __init__(self, dependencies: dict[Hashable, list[Hashable]],
+                 weights: dict[Hashable, float] = None):
+        """
+        Parameters
+        ----------
+        dependencies : dict[Hashable, list[Hashable]]
+            Every job mapped to the jobs it depends on (its parents)
+        weights : dict[Hashable, float]
+            Expected cost of each job used for critical-path
+            ordering (missing jobs default to 1)
+
+        """
+        # Jobs in the order they were given (used to break ties)
+        self.jobs: list[Hashable] = list(dependencies)
+
+        # Parents and children of each job
+        self.parents: dict[Hashable, set] = dict()
+        self.children: dict[Hashable, set] = {job: set()
+                                              for job in self.jobs}
+        for job, parents in dependencies.items():
+            self.parents[job] = set(parents) if parents else set()
+            for parent in self.parents[job]:
+                if parent not in self.children:
+                    logger.error(f'Unknown dependency [{parent}] '
+                                 f'for job [{job}]')
+                    raise Exception(f'Job {job} depends on unknown '
+                                    f'job {parent}.')
+                self.children[parent].add(job)
+
+        self.check_cycles()
+
+        if not weights:
+            weights = dict()
+        self.weights: dict[Hashable, float] = {
+            job: weights.get(job, 1) for job in self.jobs
+        }
+
+        # Longest path (sum of weights) from a job to the end
+        # of the graph, including the job itself
+        self.critical_paths: dict[Hashable, float] = dict()
+        for job in self.jobs:
+            self.critical_path(job)
+
+        # Job states
+        self.started: set = set()
+        self.finished: set = set()
+        self.failed: set = set()
+        self.skipped: set = set()
+
+    def check_cycles(self) -> None:
+        """
+        Raises an exception naming the jobs of a dependency cycle
+        if the graph is not acyclic.
+
+        """
+        # 0: not visited, 1: on the current path, 2: done
+        state = {job: 0 for job in self.jobs}
+        for root in self.jobs:
+            if state[root]:
+                continue
+            path = [root]
+            stack = [iter(sorted(self.parents[root], key=self.jobs.index))]
+            state[root] = 1
+            while stack:
+                parent = next(stack[-1], None)
+                if parent is None:
+                    state[path.pop()] = 2
+                    stack.pop()
+                elif state[parent] == 1:
+                    cycle = path[path.index(parent):] + [parent]
+                    message = ' -> '.join(str(job) for job in cycle)
+                    logger.error(f'Dependency cycle found: {message}')
+                    raise Exception(f'Dependency cycle: {message}')
+                elif state[parent] == 0:
+                    state[parent] = 1
+                    path.append(parent)
+                    stack.append(iter(sorted(self.parents[parent],
+                                             key=self.jobs.index)))
+
+    def critical_path(self, job: Hashable) -> float:
+        """
+        Computes the critical path length of a job: its own weight
+        plus the longest critical path among its children.
+
+        Parameters
+        ----------
+        job : Hashable
+            Job name
+
+        Returns
+        -------
+        float
+            Critical path length
+
+        """
+        if job in self.critical_paths:
+            return self.critical_paths[job]
+
+        # Iterative post-order so long chains don't hit recursion limits
+        stack = [job]
+        while stack:
+            current = stack[-1]
+            pending = [child for child in self.children[current]
+                       if child not in self.critical_paths]
+            if pending:
+                stack.extend(pending)
+            else:
+                stack.pop()
+                longest = max((self.critical_paths[child]
+                               for child in self.children[current]),
+                              default=0)
+                self.critical_paths[current] = \
+                    self.weights[current] + longest
+
+        return self.critical_paths[job]
+
+    def ready(self) -> list[Hashable]:
+        """
+        Lists the jobs whose parents have all finished successfully
+        and that have not been started, longest critical path first.
+
+        Returns
+        -------
+        list[Hashable]
+            Jobs that can be started now
+
+        """
+        ready = [job for job in self.jobs
+                 if job not in self.started
+                 and job not in self.skipped
+                 and self.parents[job] <= self.finished - self.failed]
+        return sorted(ready, key=lambda job: -self.critical_paths[job])
+
+    def start(self, job: Hashable) -> None:
+        """
+        Marks a job as started.
+
+        Parameters
+        ----------
+        job : Hashable
+            Job name
+
+        """
+        self.started.add(job)
+
+    def finish(self, job: Hashable, success: bool = True) -> list[Hashable]:
+        """
+        Marks a job as finished. If it failed, every job that depends
+        on it (directly or not) is skipped.
+
+        Parameters
+        ----------
+        job : Hashable
+            Job name
+        success : bool
+            Whether the job succeeded
+
+        Returns
+        -------
+        list[Hashable]
+            Jobs newly skipped because of this job's failure
+
+        """
+        self.finished.add(job)
+        if success:
+            return list()
+
+        self.failed.add(job)
+        skipped = list()
+        stack = list(self.children[job])
+        while stack:
+            child = stack.pop()
+            if child in self.skipped or child in self.started:
+                continue
+            self.skipped.add(child)
+            skipped.append(child)
+            stack.extend(self.children[child])
+
+        for child in skipped:
+            logger.warning(f'Skipping job [{child}]: dependency '
+                           f'[{job}] failed')
+        return sorted(skipped, key=self.jobs.index)
+
+    def done(self) -> bool:
+        """
+        Checks if every job has either finished or been skipped.
+
+        Returns
+        -------
+        bool
+            True if there is nothing left to run, False otherwise.
+
+        """
+        return len(self.finished) + len(self.skipped) == len(self.jobs)
+
+
+class CoreBudget:
+    def __init__(self, max_cores: int):
+        """
+        Parameters
+        ----------
+        max_cores : int
+            Number of cores running jobs may use in total
+
+        """
+        self.max_cores: int = max(1, max_cores)
+        self.used: int = 0
+
+    def request(self, cores: int) -> int:
+        """
+        Converts the cores a job asks for into what it will be
+        given: jobs larger than the whole budget get the whole
+        budget (and run alone) instead of never starting.
+
+        Parameters
+        ----------
+        cores : int
+            Number of cores a job asks for
+
+        Returns
+        -------
+        int
+            Number of cores the job will hold
+
+        """
+        cores = max(1, cores)
+        if cores > self.max_cores:
+            logger.warning(f'Job needs {cores} cores but only '
+                           f'{self.max_cores} are available. It will '
+                           f'run alone...')
+            return self.max_cores
+        return cores
+
+    def fits(self, cores: int) -> bool:
+        """
+        Checks if a job can start without exceeding the budget.
+
+        Parameters
+        ----------
+        cores : int
+            Number of cores the job holds
+
+        Returns
+        -------
+        bool
+            True if the job fits, False otherwise.
+
+        """
+        return self.used + cores <= self.max_cores
+
+    def acquire(self, cores: int) -> None:
+        """
+        Reserves cores for a starting job.
+
+        Parameters
+        ----------
+        cores : int
+            Number of cores the job holds
+
+        """
+        self.used += cores
+        logger.debug(f'Cores in use: {self.used}/{self.max_cores}')
+
+    def release(self, cores: int) -> None:
+        """
+        Frees the cores of a finished job.
+
+        Parameters
+        ----------
+        cores : int
+            Number of cores the job held
+
+        """
+        self.used = max(0, self.used - cores)
+        logger.debug(f'Cores in use: {self.used}/{self.max_cores}')
+
+
+class AdaptiveLimit:
+    def __init__(self, min_workers: int = 1,
+                 max_workers: int = 1,
+                 max_load: float = None,
+                 max_iowait: float = 0.2,
+                 min_free_memory: float = 0.1,
+                 interval: float = 30,
+                 proc_dir: str = '/proc'):
+        """
+        Parameters
+        ----------
+        min_workers : int
+            Lowest number of jobs admitted at the same time
+        max_workers : int
+            Highest number of jobs admitted at the same time
+        max_load : float
+            Load average above which fewer jobs are admitted
+            (defaults to the number of cores of the node)
+        max_iowait : float
+            Fraction of CPU time waiting for I/O above which
+            fewer jobs are admitted
+        min_free_memory : float
+            Fraction of available memory below which fewer
+            jobs are admitted
+        interval : float
+            Seconds between two samples of the node's load
+        proc_dir : str
+            Mount point of the proc file system
+
+        """
+        self.max_workers: int = max(1, max_workers)
+        self.min_workers: int = min(max(1, min_workers), self.max_workers)
+        if not max_load:
+            max_load = os.cpu_count() or 1
+        self.max_load: float = float(max_load)
+        self.max_iowait: float = max_iowait
+        self.min_free_memory: float = min_free_memory
+        self.interval: float = interval
+        self.proc_dir: str = proc_dir
+
+        # Start half-way so both directions adapt quickly
+        self.limit: int = max(self.min_workers,
+                              (self.min_workers + self.max_workers) // 2)
+        self.last_sample: float = None
+        self.cpu_times: tuple[int, int] = \
+            read_system_load(proc_dir)['cpu_times']
+
+    def update(self) -> int:
+        """
+        Samples the node's load if the interval has elapsed and
+        admits one job more or less accordingly: fewer if the load
+        average, I/O wait, or memory use is too high, more if they
+        are all comfortably low.
+
+        Returns
+        -------
+        int
+            Number of jobs that may run at the same time
+
+        """
+        now = time.monotonic()
+        if self.last_sample is not None and \
+                now - self.last_sample < self.interval:
+            return self.limit
+        self.last_sample = now
+
+        load = read_system_load(self.proc_dir)
+        iowait = None
+        if load['cpu_times'] and self.cpu_times:
+            total = load['cpu_times'][0] - self.cpu_times[0]
+            if total > 0:
+                iowait = (load['cpu_times'][1] - self.cpu_times[1]) / total
+        self.cpu_times = load['cpu_times']
+
+        reasons = list()
+        if load['load'] is not None and load['load'] > self.max_load:
+            reasons.append(f'load {load["load"]:.1f} > {self.max_load:g}')
+        if iowait is not None and iowait > self.max_iowait:
+            reasons.append(f'iowait {iowait:.0%} > {self.max_iowait:.0%}')
+        if load['free_memory'] is not None and \
+                load['free_memory'] < self.min_free_memory:
+            reasons.append(f'free memory {load["free_memory"]:.0%} < '
+                           f'{self.min_free_memory:.0%}')
+
+        idle = (load['load'] is None or
+                load['load'] < 0.8 * self.max_load) and \
+            (iowait is None or iowait < self.max_iowait / 2) and \
+            (load['free_memory'] is None or
+             load['free_memory'] > 2 * self.min_free_memory)
+
+        previous = self.limit
+        if reasons:
+            self.limit = max(self.min_workers, self.limit - 1)
+        elif idle:
+            self.limit = min(self.max_workers, self.limit + 1)
+
+        sample = ', '.join(
+            [f'load {load["load"]:.1f}' if load['load'] is not None
+             else 'load ?',
+             f'iowait {iowait:.0%}' if iowait is not None
+             else 'iowait ?',
+             f'free memory {load["free_memory"]:.0%}'
+             if load['free_memory'] is not None else 'free memory ?']
+        )
+        if self.limit < previous:
+            logger.info(f'Adaptive — {sample}: admitting {self.limit} '
+                        f'jobs instead of {previous} '
+                        f'({"; ".join(reasons)})')
+        elif self.limit > previous:
+            logger.info(f'Adaptive — {sample}: admitting {self.limit} '
+                        f'jobs instead of {previous}')
+        else:
+            logger.debug(f'Adaptive — {sample}: keeping {self.limit} '
+                         f'jobs')
+        return self.limit
+
+
+class JobTokenPool:
+    def __init__(self, state_file: str, max_cores: int,
+                 build_slots: int = 1):
+        """
+        Parameters
+        ----------
+        state_file : str
+            File the holders of the pool's cores are recorded in,
+            shared by the threads and processes of a run
+        max_cores : int
+            Number of cores builds and model runs may use in total
+        build_slots : int
+            Number of builds that may run at the same time
+
+        """
+        self.state_file: str = state_file
+        self.max_cores: int = max(1, max_cores)
+        self.build_slots: int = max(1, build_slots)
+
+    def read(self) -> dict[str, dict]:
+        """
+        Reads the holders of the pool (call with the pool locked).
+        Holders whose process is gone are dropped.
+
+        Returns
+        -------
+        dict[str, dict]
+            'kind' ('build' or 'run'), 'cores', and 'pid' of every
+            holder, by token
+
+        """
+        try:
+            with open(self.state_file, 'r') as fid:
+                holders = json.load(fid)
+        except (OSError, ValueError):
+            return dict()
+
+        alive = dict()
+        for token, holder in holders.items():
+            try:
+                os.kill(holder['pid'], 0)
+            except ProcessLookupError:
+                continue
+            except (PermissionError, KeyError, TypeError):
+                pass
+            alive[token] = holder
+        return alive
+
+    def write(self, holders: dict[str, dict]) -> None:
+        """
+        Writes the holders of the pool (call with the pool locked).
+
+        Parameters
+        ----------
+        holders : dict[str, dict]
+            Holders by token (see read)
+
+        """
+        Path(self.state_file).parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = f'{self.state_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as fid:
+            json.dump(holders, fid)
+        os.replace(tmp_file, self.state_file)
+
+    def get_share(self, holders: dict[str, dict]) -> int:
+        """
+        Computes the number of jobs a starting build is given: an
+        equal share (one per build slot) of the cores model runs
+        leave free, without taking cores other builds hold. A make
+        keeps its jobs until it ends, so shares are sized for every
+        slot rather than for the builds running now. Builds get at
+        least one job, so they never wait for model runs.
+
+        Parameters
+        ----------
+        holders : dict[str, dict]
+            Holders by token (see read)
+
+        Returns
+        -------
+        int
+            Number of make jobs
+
+        """
+        run_cores = sum(holder['cores'] for holder in holders.values()
+                        if holder['kind'] == 'run')
+        build_cores = sum(holder['cores'] for holder in holders.values()
+                          if holder['kind'] == 'build')
+        free = self.max_cores - run_cores
+        return max(1, min(free // self.build_slots, free - build_cores))
+
+    def acquire(self, kind: str, cores: int = None) -> tuple[str, int]:
+        """
+        Takes cores from the pool.
+
+        Parameters
+        ----------
+        kind : str
+            'build' (given a share of the free cores) or 'run'
+            (holds the cores it asks for)
+        cores : int
+            Number of cores of a model run
+
+        Returns
+        -------
+        tuple[str, int]
+            Token to release, and the number of cores held
+
+        """
+        token = uuid.uuid4().hex
+        with lock_path(self.state_file):
+            holders = self.read()
+            if kind == 'build':
+                cores = self.get_share(holders)
+            holders[token] = {'kind': kind, 'cores': max(1, cores),
+                              'pid': os.getpid()}
+            self.write(holders)
+        logger.debug(f'{kind} holds {holders[token]["cores"]} of '
+                     f'{self.max_cores} cores')
+        return token, holders[token]['cores']
+
+    def release(self, token: str) -> None:
+        """
+        Gives cores back to the pool.
+
+        Parameters
+        ----------
+        token : str
+            Token returned by acquire()
+
+        """
+        with lock_path(self.state_file):
+            holders = self.read()
+            holders.pop(token, None)
+            self.write(holders)
+
+    @contextlib.contextmanager
+    def hold(self, kind: str, cores: int = None):
+        """
+        Holds cores of the pool while a build or model run runs,
+        eg.
+
+            with pool.hold('build') as jobs:
+                run_cmd(['make', f'-j{jobs}', 'gcm'])
+
+        Parameters
+        ----------
+        kind : str
+            'build' or 'run' (see acquire)
+        cores : int
+            Number of cores of a model run
+
+        """
+        token, cores = self.acquire(kind, cores)
+        try:
+            yield cores
+        finally:
+            self.release(token)
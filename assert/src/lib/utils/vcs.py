@@ -0,0 +1,1086 @@
+"""
+Asynchronous version control backends (git, CVS, and svn) sharing
+one interface.
+
+Every command runs in an explicit working directory (the process-wide
+working directory is never changed), its error output is streamed
+into the logger line by line, and cancelling the task running an
+operation terminates the command. Checkouts return a result with the
+revision checked out, the duration, and the size of the checkout.
+The git functions of the access_repo utility module are synchronous
+wrappers over the git backend.
+
+    - get_dir_size
+    - get_vcs_backend
+    - VcsBackend
+    - GitBackend
+    - CvsBackend
+    - SvnBackend
+"""
+
+import os
+import time
+import asyncio
+import logging
+
+from pathlib import Path
+from src.lib.utils.access_repo import get_git_executable, check_repo_url, \
+    config_git_clone, same_repo_url, get_mirror_dir, mirror_lock, rm_dir
+from src.lib.utils.paths import check_dir_exists
+from src.lib.utils.logger import logger_setup
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+
+def get_dir_size(directory: str) -> int:
+    """
+    Adds up the size of the files under a directory.
+
+    Parameters
+    ----------
+    directory : str
+        Directory
+
+    Returns
+    -------
+    int
+        Number of bytes (0 if the directory does not exist)
+
+    """
+    size = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                continue
+    return size
+
+
+def get_vcs_backend(repo_type: str,
+                    host_name: str = None,
+                    timeout: float = None) -> 'VcsBackend':
+    """
+    Creates the backend of a type of repository.
+
+    Parameters
+    ----------
+    repo_type : str
+        Type of repository: git/cvs/svn
+    host_name : str
+        Host name (selects the git executable)
+    timeout : float
+        Seconds after which a command is terminated (no limit
+        if None)
+
+    Returns
+    -------
+    VcsBackend
+        Version control backend
+
+    """
+    if repo_type == 'git':
+        return GitBackend(host_name=host_name, timeout=timeout)
+    elif repo_type == 'cvs':
+        return CvsBackend(timeout=timeout)
+    elif repo_type == 'svn':
+        return SvnBackend(timeout=timeout)
+    else:
+        raise Exception('Repo type must be git, cvs, or svn.')
+
+
+class VcsBackend:
+    def __init__(self, executable: str, timeout: float = None):
+        """
+        Parameters
+        ----------
+        executable : str
+            Path or name of the version control executable
+        timeout : float
+            Seconds after which a command is terminated (no limit
+            if None)
+
+        """
+        self.executable: str = executable
+        self.timeout: float = timeout
+
+    async def run(self, args: list[str], cwd: str) -> tuple[int, str, str]:
+        """
+        Runs a command of the backend, streaming its error output
+        into the logger. If the task is cancelled (or the timeout
+        expires), the command is terminated.
+
+        Parameters
+        ----------
+        args : list[str]
+            Arguments of the command (after the executable)
+        cwd : str
+            Directory the command is run in
+
+        Returns
+        -------
+        tuple[int, str, str]
+            Return code, output, and last lines of error output
+
+        """
+        cmd = [self.executable] + [str(arg) for arg in args]
+        logger.debug(f'Running {" ".join(cmd)} in {cwd}')
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, cwd=cwd, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=dict(os.environ, GIT_TERMINAL_PROMPT='0')
+        )
+        errors = list()
+
+        async def read_errors() -> None:
+            async for line in proc.stderr:
+                line = line.decode('UTF-8', errors='replace').rstrip()
+                if line:
+                    logger.info(f'{Path(self.executable).name}: {line}')
+                    errors.append(line)
+                    del errors[:-20]
+
+        try:
+            output, _, _ = await asyncio.wait_for(
+                asyncio.gather(proc.stdout.read(), read_errors(),
+                               proc.wait()),
+                timeout=self.timeout
+            )
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            await self.terminate(proc)
+            raise
+        return proc.returncode, output.decode('UTF-8', errors='replace'), \
+            '\n'.join(errors)
+
+    async def terminate(self, proc: asyncio.subprocess.Process) -> None:
+        """
+        Terminates a command (killed if it does not stop within
+        5 seconds).
+
+        Parameters
+        ----------
+        proc : asyncio.subprocess.Process
+            Running command
+
+        """
+        if proc.returncode is not None:
+            return
+        logger.warning(f'Terminating {self.executable} '
+                       f'(pid {proc.pid})...')
+        try:
+            proc.terminate()
+            await asyncio.wait_for(proc.wait(), timeout=5)
+        except ProcessLookupError:
+            return
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+
+    async def check(self, args: list[str], cwd: str, action: str) -> str:
+        """
+        Runs a command of the backend, raising an exception (ending
+        with the last line of error output) if it fails.
+
+        Parameters
+        ----------
+        args : list[str]
+            Arguments of the command (after the executable)
+        cwd : str
+            Directory the command is run in
+        action : str
+            Name of the operation (for the error message)
+
+        Returns
+        -------
+        str
+            Output of the command
+
+        """
+        code, output, error = await self.run(args, cwd)
+        if code != 0:
+            logger.error(f'{action} failed: {error}')
+            raise Exception(f'{action} failed: '
+                            f'{error.splitlines()[-1] if error else ""}')
+        return output
+
+    async def checkout(self, repo_url: str,
+                       directory_name: str,
+                       branch_name: str = None,
+                       revision: str = None,
+                       overwrite: bool = False,
+                       **options) -> dict:
+        """
+        Checks out a repository.
+
+        Parameters
+        ----------
+        repo_url : str
+            Repository address
+        directory_name : str
+            Directory of the checkout
+        branch_name : str
+            Branch (or tag) to check out
+        revision : str
+            Revision to check out instead of the tip of the branch
+        overwrite : bool
+            Whether to overwrite an existing directory with the
+            same name
+        options : dict
+            Backend-specific options
+
+        Returns
+        -------
+        dict
+            Result: 'directory', 'revision', 'duration' (seconds),
+            and 'bytes' (size of the checkout)
+
+        """
+        start = time.monotonic()
+        directory = Path(directory_name).absolute()
+        if check_dir_exists(str(directory)):
+            if not overwrite:
+                logger.warning(f'Destination path {directory} already '
+                               f'exists. Quitting checkout...')
+                raise Exception('checkout failed.')
+            rm_dir(str(directory))
+        directory.parent.mkdir(parents=True, exist_ok=True)
+
+        await self.checkout_files(repo_url, str(directory), branch_name,
+                                  revision, **options)
+        return await self.get_result(str(directory), start)
+
+    async def checkout_files(self, repo_url: str,
+                             directory: str,
+                             branch_name: str = None,
+                             revision: str = None,
+                             **options) -> None:
+        """
+        Runs the commands checking out a repository into a new
+        directory.
+
+        Implemented by child classes (backend-dependent).
+
+        Parameters
+        ----------
+        repo_url : str
+            Repository address
+        directory : str
+            Absolute path of the checkout (does not exist)
+        branch_name : str
+            Branch (or tag) to check out
+        revision : str
+            Revision to check out
+        options : dict
+            Backend-specific options
+
+        """
+        pass
+
+    async def update(self, directory_name: str,
+                     branch_name: str = None,
+                     revision: str = None,
+                     repo_url: str = None) -> dict:
+        """
+        Updates an existing checkout.
+
+        Implemented by child classes (backend-dependent).
+
+        Parameters
+        ----------
+        directory_name : str
+            Directory of the checkout
+        branch_name : str
+            Branch (or tag) to update to
+        revision : str
+            Revision to update to instead of the tip of the branch
+        repo_url : str
+            Repository address (needed to change the branch of
+            backends whose branches are addresses, eg. svn)
+
+        Returns
+        -------
+        dict
+            Result (see checkout)
+
+        """
+        pass
+
+    async def get_revision(self, directory_name: str) -> str:
+        """
+        Retrieves the revision of a checkout.
+
+        Implemented by child classes (backend-dependent).
+
+        Parameters
+        ----------
+        directory_name : str
+            Directory of the checkout
+
+        Returns
+        -------
+        str
+            Revision, or None if unknown
+
+        """
+        pass
+
+    async def get_result(self, directory: str, start: float) -> dict:
+        """
+        Describes a finished checkout or update.
+
+        Parameters
+        ----------
+        directory : str
+            Directory of the checkout
+        start : float
+            Monotonic time the operation started at
+
+        Returns
+        -------
+        dict
+            Result (see checkout)
+
+        """
+        revision = await self.get_revision(directory)
+        size = await asyncio.to_thread(get_dir_size, directory)
+        result = {'directory': directory,
+                  'revision': revision,
+                  'duration': time.monotonic() - start,
+                  'bytes': size}
+        logger.info(f'Checked out {directory} at {revision} '
+                    f'({size} bytes in {result["duration"]:.1f}s)')
+        return result
+
+
+class GitBackend(VcsBackend):
+    def __init__(self, host_name: str = None, timeout: float = None):
+        """
+        Parameters
+        ----------
+        host_name : str
+            Host name (selects the git executable)
+        timeout : float
+            Seconds after which a command is terminated (no limit
+            if None)
+
+        """
+        super().__init__(get_git_executable(host_name), timeout=timeout)
+        self.host_name: str = host_name
+
+    async def checkout(self, repo_url: str,
+                       directory_name: str,
+                       branch_name: str = None,
+                       revision: str = None,
+                       overwrite: bool = False,
+                       mirror_root: str = None,
+                       fetch: bool = True,
+                       **options) -> dict:
+        """
+        Git implementation of checkout()
+
+        With a repository mirror (mirror_root), a worktree of the
+        mirror is checked out instead of cloning the repository (the
+        mirror is fetched first unless fetch is False, see
+        mirror_checkout). An existing clone of the same repository
+        is brought up to date in place when it may be overwritten
+        (see update_clone).
+
+        Options are the ones of checkout_files().
+
+        """
+        start = time.monotonic()
+        if not directory_name:
+            directory_name = Path(repo_url).stem
+        directory = str(Path(directory_name).absolute())
+        if mirror_root:
+            await self.mirror_checkout(repo_url, mirror_root, directory,
+                                       branch_name=branch_name,
+                                       revision=revision,
+                                       overwrite=overwrite,
+                                       fetch=fetch, **options)
+            result = await self.get_result(directory, start)
+        elif overwrite and check_dir_exists(directory) and \
+                await self.update_clone(
+                    repo_url, directory, branch_name=branch_name,
+                    revision=revision,
+                    clone_depth=options.get('clone_depth'),
+                    shallow_since=options.get('shallow_since'),
+                    sparse_paths=options.get('sparse_paths')):
+            result = await self.get_result(directory, start)
+        else:
+            result = await super().checkout(repo_url, directory,
+                                            branch_name=branch_name,
+                                            revision=revision,
+                                            overwrite=overwrite,
+                                            **options)
+        if result['revision'] is None or \
+                (revision and result['revision'] != revision):
+            raise Exception('git clone could not be verified.')
+        return result
+
+    async def checkout_files(self, repo_url: str,
+                             directory: str,
+                             branch_name: str = None,
+                             revision: str = None,
+                             clone_depth: int = None,
+                             filter_spec: str = None,
+                             shallow_since: str = None,
+                             sparse_paths: list[str] = None) -> None:
+        """
+        Git implementation of checkout_files()
+
+        Options are the ones of config_git_clone() (sparse_paths
+        restricts the checkout to these directories).
+
+        """
+        if not await asyncio.to_thread(check_repo_url, repo_url,
+                                       host_name=self.host_name):
+            logger.error('Invalid repo address. Quitting git clone...')
+            raise Exception('git clone failed.')
+
+        await self.clone(repo_url, directory, branch_name=branch_name,
+                         clone_depth=clone_depth,
+                         filter_spec=filter_spec,
+                         shallow_since=shallow_since,
+                         sparse=bool(sparse_paths))
+        if sparse_paths:
+            await self.sparse_checkout(directory, sparse_paths)
+        if revision:
+            await self.move_to(directory, revision, clone_depth)
+
+    async def clone(self, repo_url: str,
+                    directory: str,
+                    flags: list[str] = None,
+                    branch_name: str = None,
+                    clone_depth: int = None,
+                    filter_spec: str = None,
+                    shallow_since: str = None,
+                    sparse: bool = False) -> None:
+        """
+        Runs git clone. If no commit is more recent than
+        shallow_since, the last commit(s) are cloned instead.
+
+        Parameters
+        ----------
+        repo_url : str
+            Repository address or local repository
+        directory : str
+            Absolute path of the clone (does not exist)
+        flags : list[str]
+            Other arguments of git clone (eg. --mirror)
+        branch_name : str
+            Branch (or tag) to check out
+        clone_depth : int
+            The depth to which to clone
+        filter_spec : str
+            Partial clone filter (eg. 'blob:none')
+        shallow_since : str
+            Only clone the history after this date
+        sparse : bool
+            Whether to start with a sparse checkout
+
+        """
+        def get_args(depth: int, since: str) -> list[str]:
+            cmd = config_git_clone(repo_url, directory,
+                                   branch_name=branch_name,
+                                   clone_depth=depth,
+                                   host_name=self.host_name,
+                                   filter_spec=filter_spec,
+                                   shallow_since=since,
+                                   sparse=sparse)
+            return cmd[1:2] + (flags if flags else list()) + cmd[2:]
+
+        cwd = Path(directory).parent
+        cwd.mkdir(parents=True, exist_ok=True)
+        code, _, error = await self.run(
+            get_args(clone_depth, shallow_since), str(cwd))
+        if code != 0 and shallow_since:
+            # Fails if no commit is more recent than shallow_since
+            logger.warning(f'Nothing to clone since {shallow_since}. '
+                           f'Cloning the last commit only...')
+            rm_dir(directory)
+            code, _, error = await self.run(
+                get_args(clone_depth if clone_depth else 1, None),
+                str(cwd))
+        if code != 0:
+            logger.error(f'git clone failed: {error}')
+            raise Exception(f'git clone failed: '
+                            f'{error.splitlines()[-1] if error else ""}')
+
+    async def sparse_checkout(self, directory: str,
+                              sparse_paths: list[str] = None) -> None:
+        """
+        Restricts a checkout to some directories (plus the files at
+        the top of the repository). Without directories, a sparse
+        checkout (eg. of a previous run) is disabled, so every file
+        is checked out again.
+
+        Parameters
+        ----------
+        directory : str
+            Directory of the checkout
+        sparse_paths : list[str]
+            Directories to check out (every file if None or empty)
+
+        """
+        git = ['-C', directory, 'sparse-checkout']
+        if sparse_paths:
+            logger.debug(f'Sparse checkout of {sparse_paths} in '
+                         f'{directory}')
+            await self.check(git + ['set', '--cone', *sparse_paths],
+                             directory, 'git sparse-checkout')
+            return
+        _, output, _ = await self.run(['-C', directory, 'config', '--bool',
+                                       'core.sparseCheckout'], directory)
+        if output.strip() == 'true':
+            logger.debug(f'Disabling sparse checkout of {directory}')
+            await self.check(git + ['disable'], directory,
+                             'git sparse-checkout')
+
+    async def reset(self, directory: str, ref: str) -> None:
+        """
+        Resets a checkout to a commit, discarding every local change
+        as well as untracked and ignored files (eg. build products).
+
+        Parameters
+        ----------
+        directory : str
+            Directory of the checkout
+        ref : str
+            Commit to reset to
+
+        """
+        await self.check(['-C', directory, 'reset', '--quiet', '--hard',
+                          ref], directory, f'git reset to {ref}')
+        await self.check(['-C', directory, 'clean', '-q', '-ffdx'],
+                         directory, 'git clean')
+
+    async def move_to(self, directory: str, revision: str,
+                      clone_depth: int = None) -> None:
+        """
+        Resets a clone to a commit, fetching it if the clone does
+        not have it (as when the branch moved since the commit was
+        resolved).
+
+        Parameters
+        ----------
+        directory : str
+            Directory of the clone
+        revision : str
+            Commit SHA
+        clone_depth : int
+            The depth to which to fetch the commit
+
+        """
+        if await self.get_revision(directory) == revision:
+            return
+        code, _, _ = await self.run(['-C', directory, 'cat-file', '-e',
+                                     revision + '^{commit}'], directory)
+        if code != 0:
+            logger.info(f'Fetching {revision} into {directory}...')
+            fetch = ['-C', directory, 'fetch', '--quiet']
+            if clone_depth:
+                fetch.extend(['--depth', str(clone_depth)])
+            await self.check(fetch + ['origin', revision], directory,
+                             f'git fetch of {revision}')
+        await self.reset(directory, revision)
+
+    async def update_clone(self, repo_url: str,
+                           directory: str,
+                           branch_name: str = None,
+                           revision: str = None,
+                           clone_depth: int = None,
+                           shallow_since: str = None,
+                           sparse_paths: list[str] = None) -> bool:
+        """
+        Brings an existing clone up to date instead of cloning again:
+        the branch is fetched, then the checkout is reset to it and
+        cleaned.
+
+        Only done if the directory is a clone of repo_url and has the
+        requested branch checked out (or a detached commit, as when a
+        tag was cloned).
+
+        Parameters
+        ----------
+        repo_url : str
+            Repository address or local repository
+        directory : str
+            Directory of the existing clone
+        branch_name : str
+            Branch (or tag) to update to, if None the default
+            branch of the repository
+        revision : str
+            Commit SHA to reset to instead of the fetched branch
+        clone_depth : int
+            The depth to which to fetch
+        shallow_since : str
+            Only fetch the history after this date
+        sparse_paths : list[str]
+            Only check out these directories (sparse checkout)
+
+        Returns
+        -------
+        bool
+            True if the clone was updated, False if it must be
+            cloned again.
+
+        """
+        code, remote, _ = await self.run(['-C', directory, 'remote',
+                                          'get-url', 'origin'], directory)
+        if code != 0 or not same_repo_url(remote, repo_url):
+            logger.debug(f'{directory} is not a clone of {repo_url}')
+            return False
+        _, head, _ = await self.run(['-C', directory, 'symbolic-ref',
+                                     '--short', '-q', 'HEAD'], directory)
+        head = head.strip()
+        if branch_name and head and head != branch_name:
+            logger.debug(f'{directory} is on branch {head}, '
+                         f'not {branch_name}')
+            return False
+
+        logger.info(f'Updating existing clone {directory} of '
+                    f'{repo_url}...')
+        fetch = ['-C', directory, 'fetch', '--quiet']
+        if clone_depth:
+            fetch.extend(['--depth', str(clone_depth)])
+        if shallow_since:
+            fetch.append(f'--shallow-since={shallow_since}')
+        fetch.extend(['origin', branch_name if branch_name else 'HEAD'])
+        try:
+            await self.check(fetch, directory, 'git fetch')
+            await self.sparse_checkout(directory, sparse_paths)
+            await self.reset(directory, 'FETCH_HEAD')
+            if revision:
+                await self.move_to(directory, revision, clone_depth)
+        except Exception:
+            logger.warning(f'Could not update {directory}. '
+                           f'Cloning again...')
+            return False
+        return True
+
+    async def update_mirror(self, repo_url: str,
+                            mirror_root: str,
+                            clone_depth: int = None,
+                            filter_spec: str = None,
+                            shallow_since: str = None) -> str:
+        """
+        Creates the bare mirror of a repository, or fetches the new
+        commits of every branch into it if it already exists.
+
+        Parameters
+        ----------
+        repo_url : str
+            Repository address or local repository
+        mirror_root : str
+            Directory of the shared repository mirrors
+        clone_depth : int
+            The depth to which to create the mirror
+        filter_spec : str
+            Partial clone filter of the mirror (eg. 'blob:none')
+        shallow_since : str
+            Only mirror the history after this date
+
+        Returns
+        -------
+        str
+            Path of the mirror repository
+
+        """
+        if not await asyncio.to_thread(check_repo_url, repo_url,
+                                       host_name=self.host_name):
+            logger.error('Invalid repo address. Quitting mirror update...')
+            raise Exception('git mirror update failed.')
+
+        mirror_dir = get_mirror_dir(mirror_root, repo_url)
+        async with mirror_lock(mirror_dir):
+            if check_dir_exists(mirror_dir):
+                logger.info(f'Fetching {repo_url} into {mirror_dir}...')
+                await self.check(['-C', mirror_dir, 'fetch', '--prune',
+                                  '--quiet', 'origin'], mirror_dir,
+                                 'git mirror update')
+            else:
+                logger.info(f'Mirroring {repo_url} into {mirror_dir}...')
+                await self.clone(repo_url, mirror_dir,
+                                 flags=['--mirror', '--quiet'],
+                                 clone_depth=clone_depth,
+                                 filter_spec=filter_spec,
+                                 shallow_since=shallow_since)
+        return mirror_dir
+
+    async def add_worktree(self, mirror_dir: str,
+                           directory: str,
+                           ref: str = None,
+                           overwrite: bool = False,
+                           sparse_paths: list[str] = None) -> None:
+        """
+        Checks out a commit of a mirror into a new worktree. The
+        worktree shares the objects of the mirror, so nothing is
+        copied but the checked out files. An existing worktree of
+        the mirror is only reset when it may be overwritten.
+
+        The commit is checked out detached, since a branch can only be
+        checked out in one worktree at a time.
+
+        Parameters
+        ----------
+        mirror_dir : str
+            Path of the mirror repository
+        directory : str
+            Absolute path of the worktree
+        ref : str
+            Branch, tag, or commit to check out, if None the default
+            branch of the mirror
+        overwrite : bool
+            Whether to overwrite an existing directory with the same
+            name
+        sparse_paths : list[str]
+            Only check out these directories (sparse checkout)
+
+        """
+        ref = ref if ref else 'HEAD'
+        async with mirror_lock(mirror_dir):
+            if check_dir_exists(directory):
+                if overwrite and \
+                        await self.reset_worktree(mirror_dir, directory,
+                                                  ref, sparse_paths):
+                    return
+                if not overwrite:
+                    logger.warning(f'Destination path {directory} '
+                                   f'already exists. Quitting git '
+                                   f'worktree...')
+                    raise Exception('git worktree failed.')
+                logger.debug(f'Overwriting existing {directory} '
+                             f'directory...')
+                if not rm_dir(directory):
+                    logger.error('Removal failed. Quitting git '
+                                 'worktree...')
+                    raise Exception('git worktree failed.')
+
+            # Forgets worktrees whose directory was removed (eg. test
+            # directories cleaned after passing)
+            await self.run(['-C', mirror_dir, 'worktree', 'prune'],
+                           mirror_dir)
+
+            # Sparse worktrees are checked out once the sparse checkout
+            # is set, so the other files are never written
+            args = ['-C', mirror_dir, 'worktree', 'add', '--quiet',
+                    '--detach']
+            if sparse_paths:
+                args.append('--no-checkout')
+            await self.check(args + [directory, ref], mirror_dir,
+                             'git worktree')
+            if sparse_paths:
+                await self.sparse_checkout(directory, sparse_paths)
+                await self.reset(directory, 'HEAD')
+
+    async def reset_worktree(self, mirror_dir: str,
+                             directory: str,
+                             ref: str,
+                             sparse_paths: list[str] = None) -> bool:
+        """
+        Resets an existing worktree of a mirror to a commit of the
+        mirror.
+
+        Parameters
+        ----------
+        mirror_dir : str
+            Path of the mirror repository
+        directory : str
+            Directory of the worktree
+        ref : str
+            Branch, tag, or commit to reset to
+        sparse_paths : list[str]
+            Only check out these directories (sparse checkout)
+
+        Returns
+        -------
+        bool
+            True if the worktree was reset, False if the directory
+            is not a worktree of the mirror (or could not be reset).
+
+        """
+        if not await self.is_worktree_of(directory, mirror_dir):
+            return False
+        code, output, _ = await self.run(['-C', mirror_dir, 'rev-parse',
+                                          '--verify', '-q',
+                                          ref + '^{commit}'], mirror_dir)
+        try:
+            await self.sparse_checkout(directory, sparse_paths)
+            await self.reset(directory,
+                             output.strip() if code == 0 else ref)
+        except Exception:
+            return False
+        logger.debug(f'Reset existing worktree {directory}')
+        return True
+
+    async def is_worktree_of(self, directory: str,
+                             mirror_dir: str) -> bool:
+        """
+        Checks if a directory is a worktree of a mirror.
+
+        Parameters
+        ----------
+        directory : str
+            Directory to check
+        mirror_dir : str
+            Path of the mirror repository
+
+        Returns
+        -------
+        bool
+            True if the directory is a worktree of the mirror,
+            False otherwise.
+
+        """
+        code, output, _ = await self.run(['-C', directory, 'rev-parse',
+                                          '--git-common-dir'], directory)
+        if code != 0:
+            return False
+        # Relative to the directory unless absolute
+        common_dir = os.path.join(directory, output.strip())
+        return os.path.realpath(common_dir) == os.path.realpath(mirror_dir)
+
+    async def mirror_checkout(self, repo_url: str,
+                              mirror_root: str,
+                              directory: str,
+                              branch_name: str = None,
+                              revision: str = None,
+                              overwrite: bool = False,
+                              fetch: bool = True,
+                              clone_depth: int = None,
+                              filter_spec: str = None,
+                              shallow_since: str = None,
+                              sparse_paths: list[str] = None) -> None:
+        """
+        Checks out a repository from its shared mirror instead of
+        cloning it: the mirror is created (or fetched) if needed and
+        a worktree of it is added.
+
+        Parameters
+        ----------
+        repo_url : str
+            Repository address or local repository
+        mirror_root : str
+            Directory of the shared repository mirrors
+        directory : str
+            Absolute path of the worktree
+        branch_name : str
+            Branch (or tag) to check out, if None the default branch
+            of the repository
+        revision : str
+            Commit SHA to check out instead of the branch
+        overwrite : bool
+            Whether to overwrite an existing directory with the same
+            name
+        fetch : bool
+            Whether to fetch the mirror first. If False, it is only
+            created when missing (it was already fetched in this run)
+        clone_depth : int
+            The depth to which to create the mirror
+        filter_spec : str
+            Partial clone filter of the mirror (eg. 'blob:none')
+        shallow_since : str
+            Only mirror the history after this date
+        sparse_paths : list[str]
+            Only check out these directories (sparse checkout)
+
+        """
+        mirror_dir = get_mirror_dir(mirror_root, repo_url)
+        if fetch or not check_dir_exists(mirror_dir):
+            await self.update_mirror(repo_url, mirror_root,
+                                     clone_depth=clone_depth,
+                                     filter_spec=filter_spec,
+                                     shallow_since=shallow_since)
+        await self.add_worktree(mirror_dir, directory,
+                                ref=revision if revision else branch_name,
+                                overwrite=overwrite,
+                                sparse_paths=sparse_paths)
+
+    async def update(self, directory_name: str,
+                     branch_name: str = None,
+                     revision: str = None,
+                     repo_url: str = None) -> dict:
+        """
+        Git implementation of update()
+
+        The checkout is updated from the repository it was cloned
+        from (repo_url is not used).
+
+        """
+        start = time.monotonic()
+        directory = str(Path(directory_name).absolute())
+        await self.check(['-C', directory, 'fetch', '--quiet', 'origin',
+                          branch_name if branch_name else 'HEAD'],
+                         directory, 'git fetch')
+        await self.reset(directory, 'FETCH_HEAD')
+        if revision:
+            await self.move_to(directory, revision)
+        return await self.get_result(directory, start)
+
+    async def get_revision(self, directory_name: str) -> str:
+        """
+        Git implementation of get_revision()
+
+        """
+        code, output, _ = await self.run(['-C', directory_name,
+                                          'rev-parse', 'HEAD'],
+                                         directory_name)
+        return output.strip() if code == 0 else None
+
+
+class CvsBackend(VcsBackend):
+    def __init__(self, executable: str = 'cvs', timeout: float = None):
+        """
+        Parameters
+        ----------
+        executable : str
+            Path or name of the cvs executable
+        timeout : float
+            Seconds after which a command is terminated (no limit
+            if None)
+
+        """
+        super().__init__(executable, timeout=timeout)
+
+    async def checkout_files(self, repo_url: str,
+                             directory: str,
+                             branch_name: str = None,
+                             revision: str = None,
+                             module: str = None,
+                             user_id: str = None) -> None:
+        """
+        CVS implementation of checkout_files()
+
+        repo_url is the CVSROOT (reached through ssh with user_id if
+        given) and the module is checked out as the directory.
+
+        """
+        cvs_root = f':ext:{user_id}@{repo_url}' if user_id else repo_url
+        args = ['-Q', '-d', cvs_root, 'co', '-P']
+        tag = revision if revision else branch_name
+        if tag:
+            args.extend(['-r', tag])
+        # cvs only checks out into a directory where it runs
+        args.extend(['-d', Path(directory).name,
+                     module if module else Path(directory).name])
+        await self.check(args, str(Path(directory).parent), 'cvs checkout')
+
+    async def update(self, directory_name: str,
+                     branch_name: str = None,
+                     revision: str = None,
+                     repo_url: str = None) -> dict:
+        """
+        CVS implementation of update()
+
+        The checkout is updated from its CVSROOT (repo_url is not
+        used).
+
+        """
+        start = time.monotonic()
+        directory = str(Path(directory_name).absolute())
+        args = ['-Q', 'update', '-d', '-P']
+        tag = revision if revision else branch_name
+        if tag:
+            args.extend(['-r', tag])
+        await self.check(args, directory, 'cvs update')
+        return await self.get_result(directory, start)
+
+    async def get_revision(self, directory_name: str) -> str:
+        """
+        CVS implementation of get_revision()
+
+        CVS has no revision of a whole checkout: the sticky tag of the
+        checkout is returned (HEAD if there is none).
+
+        """
+        tag_file = Path(directory_name) / 'CVS' / 'Tag'
+        try:
+            tag = tag_file.read_text().strip()
+        except OSError:
+            return 'HEAD' if (Path(directory_name) / 'CVS').is_dir() \
+                else None
+        # T<branch tag>, N<tag>, or D<date>
+        return tag[1:] if tag else 'HEAD'
+
+
+class SvnBackend(VcsBackend):
+    def __init__(self, executable: str = 'svn', timeout: float = None):
+        """
+        Parameters
+        ----------
+        executable : str
+            Path or name of the svn executable
+        timeout : float
+            Seconds after which a command is terminated (no limit
+            if None)
+
+        """
+        super().__init__(executable, timeout=timeout)
+
+    async def checkout_files(self, repo_url: str,
+                             directory: str,
+                             branch_name: str = None,
+                             revision: str = None) -> None:
+        """
+        SVN implementation of checkout_files()
+
+        Branches are directories of svn repositories: branch_name is
+        appended to repo_url if given.
+
+        """
+        url = f'{repo_url.rstrip("/")}/{branch_name}' if branch_name \
+            else repo_url
+        args = ['--quiet', '--non-interactive', 'checkout']
+        if revision:
+            args.extend(['-r', revision])
+        args.extend([url, directory])
+        await self.check(args, str(Path(directory).parent), 'svn checkout')
+
+    async def update(self, directory_name: str,
+                     branch_name: str = None,
+                     revision: str = None,
+                     repo_url: str = None) -> dict:
+        """
+        SVN implementation of update()
+
+        With a branch, the checkout is switched to the branch of
+        repo_url (see checkout_files), which it is already on unless
+        the branch changed.
+
+        """
+        start = time.monotonic()
+        directory = str(Path(directory_name).absolute())
+        if branch_name:
+            if not repo_url:
+                logger.error(f'Cannot switch {directory} to '
+                             f'{branch_name} without the repository '
+                             f'address.')
+                raise Exception('svn switch failed.')
+            url = f'{repo_url.rstrip("/")}/{branch_name}'
+            args = ['--quiet', '--non-interactive', 'switch']
+            if revision:
+                args.extend(['-r', revision])
+            await self.check(args + [url, directory], directory,
+                             'svn switch')
+            return await self.get_result(directory, start)
+        args = ['--quiet', '--non-interactive', 'update']
+        if revision:
+            args.extend(['-r', revision])
+        await self.check(args + [directory], directory, 'svn update')
+        return await self.get_result(directory, start)
+
+    async def get_revision(self, directory_name: str) -> str:
+        """
+        SVN implementation of get_revision()
+
+        """
+        code, output, _ = await self.run(['info', '--show-item',
+                                          'revision', directory_name],
+                                         directory_name)
+        return output.strip() if code == 0 else None
@@ -0,0 +1,290 @@
+"""
+Utilities for detecting model runs that hang (eg. deadlocked in
+MPI) instead of letting them use their cores until the walltime
+expires.
+
+A run makes progress while its log grows, its output files change,
+or its process tree uses CPU time (read from /proc). Since ranks
+deadlocked in MPI often spin, CPU time alone only keeps a silent run
+alive for a limited time.
+
+    - read_stat
+    - get_process_tree
+    - get_cpu_time
+    - get_files_state
+    - sample_stacks
+    - RunWatchdog
+"""
+
+import os
+import time
+import shutil
+import logging
+import subprocess as sp
+
+from pathlib import Path
+from src.lib.utils.logger import logger_setup
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+# Clock ticks per second of /proc CPU times
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+
+
+def read_stat(pid: int) -> list[str]:
+    """
+    Reads the fields of /proc/<pid>/stat following the command
+    name (which may contain spaces).
+
+    Parameters
+    ----------
+    pid : int
+        Process ID
+
+    Returns
+    -------
+    list[str]
+        Fields from the state (field 3) on, or None if the process
+        does not exist anymore
+
+    """
+    try:
+        stat = Path(f'/proc/{pid}/stat').read_text()
+    except OSError:
+        return None
+    return stat[stat.rindex(')') + 2:].split()
+
+
+def get_process_tree(pid: int) -> list[int]:
+    """
+    Lists a process and its descendants.
+
+    Parameters
+    ----------
+    pid : int
+        Process ID
+
+    Returns
+    -------
+    list[int]
+        IDs of the process and its descendants
+
+    """
+    children: dict[int, list[int]] = dict()
+    for path in Path('/proc').iterdir():
+        if not path.name.isdigit():
+            continue
+        fields = read_stat(int(path.name))
+        if fields:
+            children.setdefault(int(fields[1]), list()).append(
+                int(path.name))
+
+    tree = [pid]
+    for parent in tree:
+        tree.extend(children.get(parent, list()))
+    return tree
+
+
+def get_cpu_time(pids: list[int]) -> float:
+    """
+    Retrieves the CPU time used by processes and their children
+    that ended.
+
+    Parameters
+    ----------
+    pids : list[int]
+        Process IDs
+
+    Returns
+    -------
+    float
+        CPU seconds (user and system)
+
+    """
+    ticks = 0
+    for pid in pids:
+        fields = read_stat(pid)
+        if fields:
+            # utime, stime, cutime, cstime
+            ticks += sum(int(field) for field in fields[11:15])
+    return ticks / CLOCK_TICKS
+
+
+def get_files_state(paths: list[str]) -> tuple:
+    """
+    Summarizes files (or the files under directories) so that
+    changes to them can be detected.
+
+    Parameters
+    ----------
+    paths : list[str]
+        Files or directories (may not exist)
+
+    Returns
+    -------
+    tuple
+        Number of files, total size, and latest modification time
+
+    """
+    count, size, mtime = 0, 0, 0.0
+    for path in paths:
+        path = Path(path)
+        files = path.rglob('*') if path.is_dir() else [path]
+        for file in files:
+            try:
+                stat = file.stat()
+            except OSError:
+                continue
+            if file.is_dir():
+                continue
+            count += 1
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+    return count, size, mtime
+
+
+def sample_stacks(pid: int, timeout: float = 60) -> str:
+    """
+    Samples the stacks of a process tree: the kernel stack of
+    each process (/proc/<pid>/stack, readable by root only on most
+    systems), and the stack of every thread with gdb if available.
+
+    Parameters
+    ----------
+    pid : int
+        Process ID of the root of the tree
+    timeout : float
+        Seconds gdb may take per process
+
+    Returns
+    -------
+    str
+        Stacks of each process
+
+    """
+    gdb = shutil.which('gdb')
+    samples = list()
+    for tree_pid in get_process_tree(pid):
+        try:
+            cmdline = Path(f'/proc/{tree_pid}/cmdline').read_bytes()
+            command = cmdline.replace(b'\0', b' ').decode().strip()
+        except OSError:
+            continue
+        sample = [f'=== {tree_pid}: {command}']
+        try:
+            sample.append(Path(f'/proc/{tree_pid}/wchan').read_text()
+                          .strip() or 'running')
+            sample.append(Path(f'/proc/{tree_pid}/stack').read_text()
+                          .rstrip())
+        except OSError as e:
+            sample.append(f'(kernel stack unavailable: {e.strerror})')
+        if gdb:
+            try:
+                run = sp.run([gdb, '-p', str(tree_pid), '-batch', '-nx',
+                              '-ex', 'thread apply all bt'],
+                             stdout=sp.PIPE, stderr=sp.STDOUT,
+                             stdin=sp.DEVNULL, timeout=timeout)
+                sample.append(run.stdout.decode('UTF-8', errors='replace')
+                              .rstrip())
+            except (OSError, sp.TimeoutExpired) as e:
+                sample.append(f'(gdb failed: {e})')
+        samples.append('\n'.join(sample))
+    return '\n\n'.join(samples)
+
+
+class RunWatchdog:
+    def __init__(self, paths: list[str], stall_interval: float,
+                 max_silence: float = None, interval: float = 30,
+                 min_cpu: float = 0.1):
+        """
+        Parameters
+        ----------
+        paths : list[str]
+            Log files and output directories of the run
+        stall_interval : float
+            Seconds without progress after which the run hangs
+        max_silence : float
+            Seconds without output changes after which the run hangs
+            even if it uses CPU time (4 stall intervals if None)
+        interval : float
+            Seconds between two checks
+        min_cpu : float
+            Fraction of a core the process tree must use on average
+            since the last check for CPU time to count as progress
+
+        """
+        self.paths: list[str] = list(paths)
+        self.stall_interval: float = stall_interval
+        self.max_silence: float = max_silence if max_silence \
+            else 4 * stall_interval
+        self.interval: float = min(interval, stall_interval)
+        self.min_cpu: float = min_cpu
+
+        # Last state seen and when each kind of progress was seen
+        self.files: tuple = None
+        self.cpu_time: float = 0
+        self.checked: float = None
+        self.last_output: float = None
+        self.last_progress: float = None
+
+    def check(self, pid: int) -> bool:
+        """
+        Checks if a run made progress since the last check (the
+        first check only records its state).
+
+        Parameters
+        ----------
+        pid : int
+            Process ID of the run
+
+        Returns
+        -------
+        bool
+            True if the run hangs, False otherwise.
+
+        """
+        now = time.monotonic()
+        files = get_files_state(self.paths)
+        cpu_time = get_cpu_time(get_process_tree(pid))
+        if self.checked is None:
+            self.files, self.cpu_time = files, cpu_time
+            self.checked = self.last_output = self.last_progress = now
+            return False
+
+        if files != self.files:
+            self.last_output = self.last_progress = now
+        elif cpu_time - self.cpu_time >= \
+                self.min_cpu * (now - self.checked):
+            self.last_progress = now
+        self.files, self.cpu_time, self.checked = files, cpu_time, now
+
+        if now - self.last_progress >= self.stall_interval:
+            logger.warning(f'Process {pid} made no progress for '
+                           f'{now - self.last_progress:.0f}s')
+            return True
+        if now - self.last_output >= self.max_silence:
+            logger.warning(f'Process {pid} wrote no output for '
+                           f'{now - self.last_output:.0f}s')
+            return True
+        return False
+
+    def sample(self, pid: int) -> str:
+        """
+        Samples the stacks of a hung run.
+
+        Parameters
+        ----------
+        pid : int
+            Process ID of the run
+
+        Returns
+        -------
+        str
+            Stacks of each process of the run
+
+        """
+        return sample_stacks(pid)
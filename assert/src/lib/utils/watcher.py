@@ -0,0 +1,329 @@
+"""
+Utilities for detecting job completions as their result files
+(.diff, .err, or exit markers) appear in the results/scratch tree.
+
+On Linux the tree is watched with inotify. Since inotify does not
+see files written from other nodes of a shared file system, the
+tree is also rescanned (with scandir) at a low frequency, which is
+all that is done where inotify is not available.
+
+    - CompletionWatcher
+"""
+
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+
+from typing import Iterator
+from src.lib.utils.logger import logger_setup
+
+# Logger settings
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+# inotify event masks (see inotify(7))
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# Header of an inotify event: wd, mask, cookie, len
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class CompletionWatcher:
+    def __init__(self, paths: list[str],
+                 suffixes: list[str] = None,
+                 interval: float = 60,
+                 use_inotify: bool = True):
+        """
+        Parameters
+        ----------
+        paths : list[str]
+            Directories watched, with all their subdirectories
+        suffixes : list[str]
+            Suffixes of the files that signal a completion
+            (defaults to .diff, .err, and .exit)
+        interval : float
+            Seconds between two rescans of the directories
+        use_inotify : bool
+            Whether to use inotify when available (rescans only
+            if False)
+
+        """
+        self.paths: list[str] = [str(path) for path in paths]
+        self.suffixes: list[str] = suffixes if suffixes \
+            else ['.diff', '.err', '.exit']
+        self.interval: float = interval
+        self.use_inotify: bool = use_inotify
+
+        # Files already reported
+        self.seen: set[str] = set()
+
+        # inotify file descriptor and watched directories
+        self.fd: int = None
+        self.watches: dict[int, str] = dict()
+        self.libc = None
+
+        # Time of the next rescan
+        self.next_scan: float = 0
+
+    def __enter__(self) -> 'CompletionWatcher':
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def start(self) -> None:
+        """
+        Starts watching the directories (with inotify if possible).
+
+        """
+        if self.use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.libc = ctypes.CDLL(ctypes.util.find_library('c')
+                                        or 'libc.so.6', use_errno=True)
+                fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+                if fd < 0:
+                    raise OSError(ctypes.get_errno(), 'inotify_init1')
+                self.fd = fd
+            except (OSError, AttributeError) as e:
+                logger.warning(f'inotify not available ({e}). '
+                               f'Scanning every {self.interval}s...')
+                self.fd = None
+
+        if self.fd is not None:
+            for path in self.paths:
+                self.add_watches(path)
+            logger.info(f'Watching {len(self.watches)} directories '
+                        f'with inotify')
+        self.next_scan = 0
+
+    def close(self) -> None:
+        """
+        Stops watching the directories.
+
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+            self.watches = dict()
+
+    def add_path(self, path: str) -> None:
+        """
+        Watches another directory (with all its subdirectories),
+        eg. one jobs were just submitted in. Directories removed and
+        created again are watched again.
+
+        Parameters
+        ----------
+        path : str
+            Directory to watch
+
+        """
+        path = str(path)
+        if path not in self.paths:
+            self.paths.append(path)
+        if self.fd is not None and path not in self.watches.values():
+            self.add_watches(path)
+
+    def add_watches(self, directory: str) -> None:
+        """
+        Watches a directory and its subdirectories with inotify.
+
+        Parameters
+        ----------
+        directory : str
+            Directory to watch
+
+        """
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            wd = self.libc.inotify_add_watch(self.fd,
+                                             os.fsencode(current),
+                                             WATCH_MASK)
+            if wd < 0:
+                logger.warning(f'Could not watch {current} '
+                               f'({os.strerror(ctypes.get_errno())}). '
+                               f'It will only be rescanned...')
+                continue
+            self.watches[wd] = current
+            try:
+                with os.scandir(current) as entries:
+                    stack.extend(entry.path for entry in entries
+                                 if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+
+    def matches(self, path: str) -> bool:
+        """
+        Checks if a file signals a completion and was not
+        reported yet.
+
+        Parameters
+        ----------
+        path : str
+            File path
+
+        Returns
+        -------
+        bool
+            True if the file should be reported, False otherwise.
+
+        """
+        return path not in self.seen and \
+            any(path.endswith(suffix) for suffix in self.suffixes)
+
+    def scan(self, directory: str = None) -> list[str]:
+        """
+        Lists the completion files not reported yet under a
+        directory.
+
+        Parameters
+        ----------
+        directory : str
+            Directory to scan (all watched directories if None)
+
+        Returns
+        -------
+        list[str]
+            New completion files
+
+        """
+        found = list()
+        stack = [directory] if directory else list(self.paths)
+        while stack:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif self.matches(entry.path):
+                            self.seen.add(entry.path)
+                            found.append(entry.path)
+            except OSError:
+                continue
+        return sorted(found)
+
+    def read_events(self) -> list[str]:
+        """
+        Reads the pending inotify events.
+
+        Returns
+        -------
+        list[str]
+            New completion files
+
+        """
+        found = list()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return found
+
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost
+                self.next_scan = 0
+                continue
+            if mask & IN_IGNORED:
+                directory = self.watches.pop(wd, None)
+                if directory in self.paths and os.path.isdir(directory):
+                    # Removed and created again before the event
+                    self.add_watches(directory)
+                    found.extend(self.scan(directory))
+                continue
+            if wd not in self.watches or not name:
+                continue
+
+            path = os.path.join(self.watches[wd], name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may appear before the watch is added
+                    self.add_watches(path)
+                    found.extend(self.scan(path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and \
+                    self.matches(path):
+                self.seen.add(path)
+                found.append(path)
+        return found
+
+    def poll(self, timeout: float = 0) -> list[str]:
+        """
+        Waits until completion files appear or the timeout expires.
+        Other files written in the watched directories (eg. logs)
+        do not end the wait.
+
+        Parameters
+        ----------
+        timeout : float
+            Maximum number of seconds to wait
+
+        Returns
+        -------
+        list[str]
+            New completion files (none if the timeout expired)
+
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if now >= self.next_scan:
+                self.next_scan = now + self.interval
+                found = self.scan()
+                if found:
+                    return found
+            if now >= deadline:
+                return list()
+
+            wait = min(deadline, self.next_scan) - now
+            if self.fd is None:
+                time.sleep(wait)
+            elif select.select([self.fd], [], [], wait)[0]:
+                found = self.read_events()
+                if found:
+                    return found
+
+    def watch(self, timeout: float = None) -> Iterator[str]:
+        """
+        Yields completion files as they appear.
+
+        Parameters
+        ----------
+        timeout : float
+            Seconds after which to stop watching (no limit if None)
+
+        Yields
+        ------
+        str
+            Completion file
+
+        """
+        start = time.monotonic()
+        while True:
+            remaining = self.interval if timeout is None \
+                else timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                return
+            for path in self.poll(remaining):
+                logger.debug(f'Completion file found: {path}')
+                yield path
@@ -7,14 +7,29 @@ import datetime as dt
 import logging
 import src.lib.utils.paths as paths
 import subprocess as sp
+import os
+import shlex
+import shutil
 
 from pathlib import Path
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.lib.earthsystems_reg import EarthSystemsReg
 from src.lib.earthsystems_testcase import EarthSystemsTestcase
 
 from src.models.model_e.model_e_testcase import ModelETestcase
 from src.models.model_e.model_e_report import ModelEReport
+from src.models.model_e.model_e_walltime import get_duration, \
+    get_walltime, parse_npes, make_test_key
 from src.lib.utils.logger import logger_setup
+from src.lib.utils.server import get_hostname
+from src.lib.utils.access_repo import git_tree_hash, rm_dir
+from src.lib.utils.modules import get_module_lists
+from src.lib.utils.checksums import compare_files, wait_for_file, \
+    hash_file, get_file_state
+from src.lib.utils.process import merge_usage
+from src.lib.utils.history import format_walltime, parse_walltime
+from src.lib.utils.batch import get_exit_marker
 
 logger = logger_setup(filename=__name__,
                       file_handler=True,
@@ -24,7 +39,8 @@ logger = logger_setup(filename=__name__,
 
 
 class ModelEReg(EarthSystemsReg):
-    def __init__(self, yaml_file: str, start_time: dt.datetime):
+    def __init__(self, yaml_file: str, start_time: dt.datetime,
+                 resume: bool = False, force: bool = False):
         """
         Parameters
         ----------
@@ -32,9 +48,19 @@ class ModelEReg(EarthSystemsReg):
             YAML config file name
         start_time : dt.datetime
             Starting time as a datetime object
+        resume : bool
+            Whether to resume the interrupted run that started
+            at start_time instead of starting a new one
+        force : bool
+            Whether to run every test even if a result is cached
+            for its commit and configuration
 
         """
-        super().__init__(yaml_file, start_time)
+        super().__init__(yaml_file, start_time, resume=resume,
+                         force=force)
+
+        # Version of each compiler (found when first needed)
+        self.compiler_versions: dict[str, str] = dict()
 
     def get_repo_type(self):
         """
@@ -89,6 +115,76 @@ class ModelEReg(EarthSystemsReg):
         """
         return self.system_cfg['scratchdir']
 
+    def get_last_git_date(self) -> str:
+        """
+        Retrieves the date of the last baseline update (lastGitDate
+        file of the branch baseline in basedir).
+
+        Returns
+        -------
+        str
+            Date of the last baseline update, or None if unknown
+
+        """
+        traps = '_traps' if self.model_cfg.get('buildtype') == 'traps' \
+            else ''
+        date_file = Path(str(self.system_cfg.get('basedir'))) / \
+            f'{self.get_repo_branch()}{traps}' / 'lastGitDate'
+        try:
+            with open(date_file, 'r') as fid:
+                return fid.readline().strip() or None
+        except OSError:
+            logger.debug(f'No baseline date in {date_file}')
+            return None
+
+    def get_clone_options(self, test_name: str = None) -> dict:
+        """
+        ModelE implementation of get_clone_options()
+
+        Options are read from the modelconfig:
+
+            - clone_depth: depth of the clone
+            - clone_filter: partial clone filter (eg. blob:none)
+            - shallow_since: only clone the history after this date
+              ('yes' for the date of the last baseline update)
+            - sparse_paths: directories checked out, which the
+              testcase config of a rundeck may override
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck), or None for the whole run
+
+        Returns
+        -------
+        dict
+            Keyword arguments of get_repo() utility function
+
+        """
+        options = dict()
+        clone_depth = self.model_cfg.get('clone_depth')
+        if clone_depth:
+            options['clone_depth'] = int(clone_depth)
+        filter_spec = self.model_cfg.get('clone_filter')
+        if filter_spec:
+            options['filter_spec'] = str(filter_spec)
+        shallow_since = self.model_cfg.get('shallow_since')
+        if shallow_since is True:
+            shallow_since = self.get_last_git_date()
+        if shallow_since:
+            options['shallow_since'] = str(shallow_since)
+
+        sparse_paths = self.model_cfg.get('sparse_paths')
+        if test_name:
+            sparse_paths = self.test_cfg.get_testcase(test_name).get(
+                'sparse_paths', sparse_paths)
+        if isinstance(sparse_paths, str):
+            sparse_paths = sparse_paths.split(',')
+        if sparse_paths:
+            options['sparse_paths'] = [str(path).strip()
+                                       for path in sparse_paths]
+        return options
+
     def set_test_cfg(self, yaml_dict: dict) -> ModelETestcase:
         """
         Sets the test cfg class according to the model.
@@ -143,14 +239,178 @@ class ModelEReg(EarthSystemsReg):
         """
         self.test_cfg.set_runnable_tests()
         self.test_cfg.setup_tests(
-            time_stamp=self.start_time.strftime('%Y%m%d_%H%M%S')
+            time_stamp=self.run_id
         )
+        self.pin_revision()
         logger.notice('ModelE — setup successful')
 
+    def is_out_of_source(self) -> bool:
+        """
+        Checks if rundecks are built out of source ('makesystem:
+        makeNew'): one clone per compiler and one build of the
+        shared objects per compiler and mode, each rundeck only
+        linking its executable against them.
+
+        Returns
+        -------
+        bool
+            True for out-of-source builds, False for in-source ones
+
+        """
+        return self.system_cfg.get('makesystem') == 'makeNew'
+
+    def get_shared_dir(self, compiler: str) -> Path:
+        """
+        Retrieves the directory of the clone and shared objects of
+        a compiler (out-of-source builds).
+
+        Parameters
+        ----------
+        compiler : str
+            Compiler name (eg. intel, gfortran)
+
+        Returns
+        -------
+        Path
+            Shared directory of this run
+
+        """
+        return Path(self.get_scratch_dir()) / 'modelE' / \
+            f'_shared{self.run_id}' / compiler
+
+    def run_once(self, path: str, func: Callable, **kwargs) -> None:
+        """
+        Performs an operation on a shared path once, however many
+        tests (threads or processes) need it: the first one does it
+        while the others wait, and its outcome is recorded in
+        '<path>.done'.
+
+        Parameters
+        ----------
+        path : str
+            Path the operation produces
+        func : Callable
+            Operation (raises an exception if it fails)
+        kwargs : dict
+            Keyword arguments of the operation
+
+        """
+        marker = Path(path + '.done')
+        with paths.lock_path(path):
+            if marker.exists():
+                outcome = marker.read_text()
+                if outcome != 'ok':
+                    raise Exception(f'{Path(path).name} failed in '
+                                    f'another test: {outcome}')
+                return
+            try:
+                func(**kwargs)
+            except Exception as e:
+                marker.write_text(str(e) or type(e).__name__)
+                raise
+            marker.write_text('ok')
+
+    def clone(self, test_name: str, cwd: str) -> None:
+        """
+        ModelE implementation of clone()
+
+        Out-of-source builds clone the repository once per compiler
+        (without testcase-specific sparse paths) and the code
+        directory of the test is a link to that clone.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+
+        """
+        if not self.is_out_of_source():
+            super().clone(test_name, cwd)
+            return
+
+        compiler = Path(cwd).stem.split('-')[0]
+        code = self.get_shared_dir(compiler) / 'code'
+        self.run_once(str(code), self.get_repo,
+                      directory_name=str(code), overwrite=True,
+                      **self.get_clone_options())
+
+        link = Path(cwd) / 'code'
+        if link.is_symlink():
+            link.unlink()
+        elif link.is_dir():
+            rm_dir(str(link))
+        link.parent.mkdir(parents=True, exist_ok=True)
+        link.symlink_to(code, target_is_directory=True)
+
+    def get_make_cmd(self, target: str, compiler: str, mode: str,
+                     **variables) -> list[str]:
+        """
+        Builds a make command of the decks directory of a
+        compiler's shared clone.
+
+        Parameters
+        ----------
+        target : str
+            make target (eg. rundeck, gcm)
+        compiler : str
+            Compiler name (eg. intel, gfortran)
+        mode : str
+            serial or mpi
+        variables : dict
+            make variables (eg. RUN)
+
+        Returns
+        -------
+        list[str]
+            make command
+
+        """
+        decks = self.get_shared_dir(compiler) / 'code' / 'decks'
+        variables.update(MODELERC=self.get_modelerc_file(compiler))
+        if mode == 'mpi':
+            variables.update(MPI='YES')
+        return [self.system_cfg.get('make', 'make'), '-C', str(decks),
+                target] + [f'{name}={value}'
+                           for name, value in variables.items()]
+
+    def build_shared(self, compiler: str, mode: str, test_dir: str,
+                     env: dict = None) -> None:
+        """
+        Builds the objects shared by every rundeck of a compiler and
+        mode (once per run).
+
+        Parameters
+        ----------
+        compiler : str
+            Compiler name (eg. intel, gfortran)
+        mode : str
+            serial or mpi
+        test_dir : str
+            Test directory the objects are first needed by (their
+            build output goes to its BUILD log)
+        env : dict
+            Environment make runs in (the current one if None)
+
+        """
+        build_dir = self.get_shared_dir(compiler) / mode
+        self.run_once(str(build_dir), self.run_make,
+                      cmd=self.get_make_cmd('libs', compiler, mode,
+                                            BUILDDIR=build_dir),
+                      key={'compiler': compiler, 'mode': mode,
+                           'target': 'libs'}, test_dir=test_dir,
+                      env=env)
+
     def compile(self, test_name: str, cwd: str) -> None:
         """
         ModelE implementation of compile()
 
+        Out-of-source builds link the rundeck's executable (in the
+        test directory's build directory) against the shared
+        objects, built by the first rundeck that needs them. The
+        rundecks sharing the objects are built one at a time.
+
         Parameters
         ----------
         test_name : str
@@ -160,14 +420,694 @@ class ModelEReg(EarthSystemsReg):
 
         """
         logger.info(f'ModelE — Building {test_name}...')
+        if self.restore_build(test_name, cwd):
+            # Not a build: its duration would not predict one
+            self.mark_noop(cwd, 'BUILD')
+            return
+
+        if self.is_out_of_source():
+            compiler, mode = Path(cwd).stem.split('-')[:2]
+            key = {'rundeck': test_name, 'compiler': compiler,
+                   'mode': mode}
+            env = self.get_env(test_name, cwd)
+            self.build_shared(compiler, mode, cwd, env=env)
+            # Serial and MPI tests of a rundeck share its rundeck file
+            self.run_once(str(self.get_shared_dir(compiler) / 'rundecks' /
+                              test_name), self.run_make,
+                          cmd=self.get_make_cmd('rundeck', compiler, mode,
+                                                RUN=test_name,
+                                                OVERWRITE='YES'),
+                          key=dict(key, target='rundeck'), test_dir=cwd,
+                          env=env)
+            # Rundecks of a compiler and mode build in the same
+            # directory, so they take turns
+            build_dir = self.get_shared_dir(compiler) / mode
+            with paths.lock_path(str(build_dir)):
+                self.run_make(self.get_make_cmd(
+                    'gcm', compiler, mode, RUN=test_name,
+                    BUILDDIR=build_dir, EXECDIR=Path(cwd) / 'build'),
+                    key=dict(key, target='gcm'), test_dir=cwd, env=env)
+        else:
+            # Nothing is built in the test directory
+            self.mark_noop(cwd, 'BUILD')
+            # run_cmd(['make', 'rundeck', test_name])
+            # run_cmd(['make', 'gcm', test_name])
+        self.cache_build(test_name, cwd)
+
+    def get_verification(self, test_name: str) -> str:
+        """
+        Retrieves how a rundeck's runs are verified ('verification'
+        in its testcase config).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+
+        Returns
+        -------
+        str
+            eg. 'restartRun', 'compileOnly', or None
+
+        """
+        return self.test_cfg.get_testcase(test_name).get('verification')
+
+    def get_run_npes(self, test_name: str, test_dir: str) -> list[int]:
+        """
+        Retrieves the processor counts a test directory's rundeck is
+        run with: 1 for serial tests, each of the rundeck's npes for
+        MPI tests.
 
-        # run_cmd(['make', 'rundeck', test_name])
-        # run_cmd(['make', 'gcm', test_name])
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        test_dir : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        list[int]
+            Processor counts
+
+        """
+        if Path(test_dir).stem.split('-')[1] == 'mpi':
+            return self.get_npes(test_name)
+        return [1]
+
+    def get_run_outputs(self, test_dir: str) -> list[str]:
+        """
+        ModelE implementation of get_run_outputs()
+
+        Parameters
+        ----------
+        test_dir : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        list[str]
+            Run directory of the test directory (every leg of every
+            processor count)
+
+        """
+        return [str(Path(test_dir) / 'run')]
+
+    def get_leg_dir(self, cwd: str, npes: int, leg: str) -> Path:
+        """
+        Retrieves the directory (CMRUNDIR) a run leg is performed in.
+        Legs run at the same time, so each has its own.
+
+        Parameters
+        ----------
+        cwd : str
+            Test directory named <compiler>-<mode>
+        npes : int
+            Processor count
+        leg : str
+            'continuous' or 'restart'
+
+        Returns
+        -------
+        Path
+            Leg directory (the run directory is <leg dir>/<rundeck>)
+
+        """
+        return Path(cwd) / 'run' / f'np{npes}' / leg
+
+    def has_run(self, test_name: str, cwd: str) -> bool:
+        """
+        Checks if a rundeck was run in a test directory: the setup
+        creates the run directory of every test directory, so the
+        run directories of its legs are looked for instead.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        bool
+            True if a leg of the rundeck was run, False otherwise.
+
+        """
+        return any((self.get_leg_dir(cwd, npes, 'continuous') /
+                    test_name).is_dir()
+                   for npes in self.get_run_npes(test_name, cwd))
+
+    def get_rune(self, cwd: str) -> str:
+        """
+        Retrieves the runE script run legs are performed with.
+
+        Parameters
+        ----------
+        cwd : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        str
+            'rune' in the system config, or the clone's exec/runE
+
+        """
+        return self.system_cfg.get('rune') or \
+            str(Path(cwd) / 'code' / 'exec' / 'runE')
+
+    def can_run(self, test_name: str, cwd: str) -> bool:
+        """
+        Checks if a rundeck's run legs can be performed: its build
+        produced an executable (in-source builds are not performed
+        yet) and runE exists.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        bool
+            True if the legs can be run, False otherwise.
+
+        """
+        bin_dir = Path(self.get_build_artifacts(test_name, cwd)['bin'])
+        if not bin_dir.is_dir() or not any(bin_dir.iterdir()):
+            logger.info(f'ModelE — No executable of {test_name} was '
+                        f'built in {bin_dir}, not running it')
+            return False
+        if not shutil.which(self.get_rune(cwd)):
+            logger.warning(f'ModelE — {self.get_rune(cwd)} not found, '
+                           f'not running {test_name}')
+            return False
+        return True
+
+    def get_run_cmd(self, test_name: str, cwd: str, npes: int,
+                    restart: bool = False) -> list[str]:
+        """
+        Builds the runE command of a run leg.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+        npes : int
+            Processor count
+        restart : bool
+            Whether the leg continues from the checkpoint in its run
+            directory instead of starting from initial conditions
+
+        Returns
+        -------
+        list[str]
+            runE command (see get_rune)
+
+        """
+        cmd = [self.get_rune(cwd), test_name, '-np', str(npes)]
+        if not restart:
+            cmd.append('-cold-restart')
+        return cmd
+
+    def prepare_leg(self, test_name: str, cwd: str, npes: int,
+                    leg: str) -> tuple[Path, dict]:
+        """
+        Creates the directory of a run leg and its modelErc (the
+        compiler's, with the leg directory as CMRUNDIR).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+        npes : int
+            Processor count
+        leg : str
+            'continuous' or 'restart'
+
+        Returns
+        -------
+        tuple[Path, dict]
+            Leg directory, and environment the leg runs in
+
+        """
+        leg_dir = self.get_leg_dir(cwd, npes, leg)
+        (leg_dir / test_name).mkdir(parents=True, exist_ok=True)
+        compiler = Path(cwd).stem.split('-')[0]
+        modelerc_file = self.get_modelerc_file(compiler)
+        lines = modelerc_file.read_text().splitlines() \
+            if modelerc_file.exists() else list()
+        lines = [line for line in lines
+                 if not line.strip().startswith('CMRUNDIR')]
+        (leg_dir / 'modelErc').write_text(
+            '\n'.join(lines + [f'CMRUNDIR={leg_dir}']) + '\n')
+
+        env = dict(self.get_env(test_name, cwd) or os.environ,
+                   MODELERC=str(leg_dir / 'modelErc'))
+        return leg_dir, env
+
+    def run_leg(self, test_name: str, cwd: str, npes: int, leg: str,
+                restart: bool = False) -> dict:
+        """
+        Runs a leg of a rundeck in its own CMRUNDIR (through a
+        modelErc of its own), writing its output to the leg's log.
+
+        Legs run in threads at the same time, so each collects its
+        resource usage, and the stacks of a hung leg are written to
+        the leg's hang file (see merge_legs).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+        npes : int
+            Processor count
+        leg : str
+            'continuous' or 'restart'
+        restart : bool
+            Whether the leg continues from a checkpoint
+
+        Returns
+        -------
+        dict
+            Resource usage of the leg
+
+        """
+        leg_dir, env = self.prepare_leg(test_name, cwd, npes, leg)
+        logger.info(f'ModelE — Running {test_name} on {npes} '
+                    f'processor(s) ({leg} leg)...')
+        usage = dict()
+        self.run_command(self.get_run_cmd(test_name, cwd, npes, restart),
+                         cwd, 'RUN', usage=usage,
+                         hang_file=str(leg_dir / f'{leg}.hang'),
+                         cwd=str(leg_dir / test_name), env=env,
+                         log_file=str(leg_dir / f'{leg}.log'))
+        return usage
+
+    def merge_legs(self, cwd: str, npes: int, futures: list) -> None:
+        """
+        Waits for the legs of a processor count to end, adds their
+        resource usage to the RUN stage's, and gathers the stacks of
+        hung legs in the test directory's hang file.
+
+        Parameters
+        ----------
+        cwd : str
+            Test directory named <compiler>-<mode>
+        npes : int
+            Processor count
+        futures : list
+            Futures of the legs (see run_leg), None for legs not
+            started
+
+        """
+        errors = list()
+        for future in futures:
+            if future is None:
+                continue
+            try:
+                self.add_usage(cwd, 'RUN', future.result())
+            except Exception as e:
+                errors.append(e)
+
+        stacks = list()
+        for leg in ['continuous', 'restart']:
+            hang_file = self.get_leg_dir(cwd, npes, leg) / f'{leg}.hang'
+            if hang_file.exists():
+                stacks.append(f'### {leg} leg\n{hang_file.read_text()}')
+        if stacks:
+            hang_file = Path(self.get_hang_file(cwd))
+            hang_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(hang_file, 'a') as fid:
+                fid.write('\n\n'.join(stacks) + '\n')
+        if errors:
+            raise errors[0]
+
+    def get_checkpoint_signal(self, checkpoint: str) -> str:
+        """
+        Retrieves the file whose writing tells a checkpoint is
+        complete ('restart_signal' in the system config). ModelE
+        writes its checkpoints in turn, so by default it is the
+        other one (fort.2 for fort.1).
+
+        Parameters
+        ----------
+        checkpoint : str
+            Name of the checkpoint (eg. fort.1)
+
+        Returns
+        -------
+        str
+            Name of the signal file
+
+        """
+        if self.system_cfg.get('restart_signal'):
+            return str(self.system_cfg['restart_signal'])
+        return {'fort.1': 'fort.2', 'fort.2': 'fort.1'}.get(checkpoint,
+                                                          checkpoint)
+
+    def copy_run_dir(self, source: Path, destination: Path,
+                     checkpoint: str) -> None:
+        """
+        Copies the run directory of a continuous leg to start a
+        restart leg from one of its checkpoints. Input links are
+        kept as links, and the leg's other checkpoints (possibly
+        being written) are left out.
+
+        Parameters
+        ----------
+        source : Path
+            Run directory of the continuous leg
+        destination : Path
+            Run directory of the restart leg (replaced)
+        checkpoint : str
+            Name of the checkpoint the restart leg starts from
+
+        """
+        if destination.exists():
+            rm_dir(str(destination))
+
+        def ignore(directory: str, names: list[str]) -> list[str]:
+            return [name for name in names
+                    if name.startswith('fort.') and name != checkpoint]
+
+        shutil.copytree(source, destination, symlinks=True, ignore=ignore)
+
+    def run_restart(self, test_name: str, cwd: str, npes: int) -> None:
+        """
+        Runs the continuous and restart legs of a restartRun
+        verification. The restart leg starts from a checkpoint of the
+        continuous leg ('restart_checkpoint' in the system config,
+        fort.1 by default), while the continuous leg goes on.
+
+        The checkpoint is complete once the continuous leg wrote the
+        next one (see get_checkpoint_signal) and it stopped changing.
+        Since it is rewritten in place later on, it is copied again
+        if it changed while it was copied.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+        npes : int
+            Processor count
+
+        """
+        continuous = self.get_leg_dir(cwd, npes, 'continuous') / test_name
+        restart = self.get_leg_dir(cwd, npes, 'restart') / test_name
+        checkpoint = continuous / self.system_cfg.get('restart_checkpoint',
+                                                      'fort.1')
+        signal = continuous / self.get_checkpoint_signal(checkpoint.name)
+        interval = float(self.system_cfg.get('checkpoint_interval', 5))
+        for leg in ['continuous', 'restart']:
+            leg_dir = self.get_leg_dir(cwd, npes, leg)
+            (leg_dir / f'{leg}.hang').unlink(missing_ok=True)
+        if continuous.exists():
+            rm_dir(str(continuous))
+
+        def ready() -> bool:
+            # The signal was written after the checkpoint
+            checkpoint_state = get_file_state(str(checkpoint))
+            signal_state = get_file_state(str(signal))
+            return signal != checkpoint and \
+                checkpoint_state is not None and \
+                signal_state is not None and \
+                signal_state[1] >= checkpoint_state[1]
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(self.run_leg, test_name, cwd, npes,
+                                'continuous')
+            second = None
+            try:
+                while True:
+                    if not wait_for_file(str(checkpoint), first.done,
+                                         interval=interval, ready=ready):
+                        raise Exception(f'{test_name} wrote no '
+                                        f'{checkpoint.name} to restart '
+                                        f'from.')
+                    state = get_file_state(str(checkpoint))
+                    self.copy_run_dir(continuous, restart, checkpoint.name)
+                    copied = restart / checkpoint.name
+                    if get_file_state(str(checkpoint)) == state and \
+                            copied.stat().st_size == state[0]:
+                        break
+                    logger.info(f'ModelE — {checkpoint.name} of '
+                                f'{test_name} changed while copied, '
+                                f'copying it again...')
+                second = pool.submit(self.run_leg, test_name, cwd, npes,
+                                     'restart', restart=True)
+            finally:
+                self.merge_legs(cwd, npes, [first, second])
+
+    def get_leg_job(self, test_name: str, cwd: str, npes: int,
+                    leg: str, restart: bool = False) -> dict:
+        """
+        Describes a run leg as a batch job (see batch.py). Its output
+        goes to the leg's log.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+        npes : int
+            Processor count
+        leg : str
+            'continuous' or 'restart'
+        restart : bool
+            Whether the leg continues from a checkpoint
+
+        Returns
+        -------
+        dict
+            Job description
+
+        """
+        leg_dir, _ = self.prepare_leg(test_name, cwd, npes, leg)
+        # The modelErc is set by the script, so legs with the same
+        # environment can share a job array
+        cmd = self.get_run_cmd(test_name, cwd, npes, restart)
+        script = leg_dir / f'{leg}.bash'
+        script.write_text(
+            f'export MODELERC={shlex.quote(str(leg_dir / "modelErc"))}\n'
+            f'exec {shlex.join(cmd)}\n')
+        # Predicted from the recorded runs, within the stage timeout
+        key = self.get_test_key(test_name, cwd)
+        walltime = parse_walltime(get_walltime(
+            self.history, key, ['RUN'], deck_name=test_name,
+            mode=key['mode'], verification=key['verification']))
+        timeout = self.get_stage_timeout('RUN')
+        if timeout:
+            walltime = min(walltime, timeout)
+        job = {'name': f'{test_name}.np{npes}.{leg}',
+               'script': str(script),
+               'cwd': str(leg_dir / test_name),
+               'cores': npes,
+               'walltime': format_walltime(walltime),
+               'env': self.get_env(test_name, cwd),
+               'output': str(leg_dir / f'{leg}.log'),
+               'error': str(leg_dir / f'{leg}.err')}
+        # The exit marker of a previous attempt would end it at once
+        Path(get_exit_marker(job)).unlink(missing_ok=True)
+        return job
+
+    def run_batch(self, test_name: str, cwd: str) -> None:
+        """
+        Runs the legs of a restartRun verification as batch jobs.
+        The continuous legs of every processor count are queued at
+        once, and each restart leg is queued as soon as its
+        continuous leg ended, from the continuous leg's checkpoint.
+        The batch queue submits the legs of every test running at the
+        same time together (as job arrays with SLURM) and polls them
+        from a single thread, as soon as exit markers appear.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+
+        """
+        checkpoint = self.system_cfg.get('restart_checkpoint', 'fort.1')
+        timeout = self.get_stage_timeout('RUN')
+        npes_list = self.get_run_npes(test_name, cwd)
+        for npes in npes_list:
+            continuous = self.get_leg_dir(cwd, npes, 'continuous')
+            if (continuous / test_name).exists():
+                rm_dir(str(continuous / test_name))
+
+        jobs = [self.get_leg_job(test_name, cwd, npes, 'continuous')
+                for npes in npes_list]
+        continuous_legs = dict(zip(
+            self.batch_queue.submit(jobs, timeout=timeout), npes_list))
+        logger.info(f'ModelE — Queued the continuous legs of '
+                    f'{test_name} on {npes_list} processor(s)')
+
+        failed = list()
+        restart_legs = dict()
+        for future in as_completed(continuous_legs):
+            npes = continuous_legs[future]
+            state = future.result()
+            continuous = self.get_leg_dir(cwd, npes, 'continuous') / \
+                test_name
+            if state != 'COMPLETED':
+                failed.append(f'continuous leg on {npes} processor(s) '
+                              f'{state.lower()}')
+                continue
+            if not (continuous / checkpoint).exists():
+                continue
+            self.copy_run_dir(continuous, self.get_leg_dir(
+                cwd, npes, 'restart') / test_name, checkpoint)
+            job = self.get_leg_job(test_name, cwd, npes, 'restart',
+                                   restart=True)
+            restart_legs[self.batch_queue.submit(
+                [job], timeout=timeout)[0]] = npes
+
+        for future in as_completed(restart_legs):
+            state = future.result()
+            if state != 'COMPLETED':
+                failed.append(f'restart leg on {restart_legs[future]} '
+                              f'processor(s) {state.lower()}')
+        if len(restart_legs) < len(npes_list):
+            failed.append(f'{len(npes_list) - len(restart_legs)} restart '
+                          f'leg(s) not submitted (no complete continuous '
+                          f'leg with a {checkpoint})')
+        if failed:
+            raise Exception(f'Batch jobs of {test_name} failed: '
+                            f'{"; ".join(failed)}')
+
+    def get_restart_files(self, test_name: str, run_dir: Path) -> list[str]:
+        """
+        Lists the final restart files of a run leg (<date>.rsf<rundeck>).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        run_dir : Path
+            Run directory of the leg
+
+        Returns
+        -------
+        list[str]
+            Names of the restart files
+
+        """
+        return sorted(path.name
+                      for path in run_dir.glob(f'*.rsf{test_name}'))
+
+    def compare_restart(self, test_name: str, cwd: str, npes: int) -> None:
+        """
+        Checks that the restart leg of a restartRun verification ends
+        with the same restart files as the continuous leg, bit for bit.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+        npes : int
+            Processor count
+
+        """
+        continuous = self.get_leg_dir(cwd, npes, 'continuous') / test_name
+        restart = self.get_leg_dir(cwd, npes, 'restart') / test_name
+        names = self.get_restart_files(test_name, continuous)
+        if not names:
+            raise Exception(f'No restart file found in {continuous}.')
+        if names != self.get_restart_files(test_name, restart):
+            raise Exception(f'Restart files of {test_name} on {npes} '
+                            f'processor(s) differ: {names}')
+        for name in names:
+            if not compare_files(str(continuous / name),
+                                 str(restart / name)):
+                raise Exception(f'{name} of {test_name} on {npes} '
+                                f'processor(s) differs after a restart.')
+        logger.info(f'ModelE — {test_name} on {npes} processor(s) '
+                    f'restarts reproducibly')
+
+    def hash_restart_files(self, test_name: str,
+                           run_dir: Path) -> dict[str, str]:
+        """
+        Hashes the final restart files of a run leg.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        run_dir : Path
+            Run directory of the leg
+
+        Returns
+        -------
+        dict[str, str]
+            Digest of each restart file, by name
+
+        """
+        return {name: hash_file(str(run_dir / name))
+                for name in self.get_restart_files(test_name, run_dir)}
+
+    def compare_npes(self, test_name: str, cwd: str) -> str:
+        """
+        Checks that a rundeck ends with the same restart files
+        whatever its processor count. The files of each processor
+        count are hashed once, so N processor counts take N passes
+        over their outputs instead of comparing every pair.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        cwd : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        str
+            Reproducibility count: number of processor counts whose
+            restart files match those of the lowest one, out of the
+            number of processor counts (eg. '2/2')
+
+        """
+        digests = dict()
+        for npes in sorted(self.get_run_npes(test_name, cwd)):
+            run_dir = self.get_leg_dir(cwd, npes, 'continuous') / test_name
+            digests[npes] = self.hash_restart_files(test_name, run_dir)
+            if not digests[npes]:
+                raise Exception(f'No restart file found in {run_dir}.')
+
+        reference = next(iter(digests.values()))
+        matching = [npes for npes, digest in digests.items()
+                    if digest == reference]
+        if len(matching) < len(digests):
+            logger.warning(f'ModelE — {test_name} on '
+                           f'{sorted(set(digests) - set(matching))} '
+                           f'processor(s) differs from {matching[0]} '
+                           f'processor(s)')
+        return f'{len(matching)}/{len(digests)}'
 
     def run(self, test_name: str, cwd: str) -> None:
         """
         ModelE implementation of run()
 
+        restartRun verifications run the continuous and restart legs
+        of each processor count at the same time (see run_restart),
+        or as batch jobs with 'usebatch' (see run_batch), provided
+        the rundeck can run (see can_run).
+
         Parameters
         ----------
         test_name : str
@@ -177,11 +1117,26 @@ class ModelEReg(EarthSystemsReg):
 
         """
         logger.info(f'ModelE — Running {test_name}...')
+        if self.get_verification(test_name) != 'restartRun' or \
+                not self.can_run(test_name, cwd):
+            self.mark_noop(cwd, 'RUN')
+            return
+        if self.batch:
+            self.run_batch(test_name, cwd)
+            return
+        for npes in self.get_run_npes(test_name, cwd):
+            self.run_restart(test_name, cwd, npes)
 
     def compare(self, test_name: str, cwd: str) -> None:
         """
         ModelE implementation of compare()
 
+        restartRun verifications compare the restart files of each
+        processor count's restart leg with its continuous leg, and
+        those of every processor count with each other (reported as
+        the rundeck's NPE reproducibility count). Nothing is compared
+        if no leg was run.
+
         Parameters
         ----------
         test_name : str
@@ -191,6 +1146,383 @@ class ModelEReg(EarthSystemsReg):
 
         """
         logger.info(f'ModelE — Comparing {test_name}...')
+        if self.get_verification(test_name) != 'restartRun' or \
+                not self.has_run(test_name, cwd):
+            logger.info(f'ModelE — {test_name} was not run, nothing '
+                        f'to compare')
+            self.mark_noop(cwd, 'COMPARE')
+            return
+        for npes in self.get_run_npes(test_name, cwd):
+            self.compare_restart(test_name, cwd, npes)
+        if len(self.get_run_npes(test_name, cwd)) > 1:
+            self.add_test_results(cwd, {
+                'NPE': self.compare_npes(test_name, cwd)})
+
+    def new_test_report(self, test_name: str, test_dir: str) -> dict:
+        """
+        ModelE implementation of new_test_report()
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        test_dir : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        dict
+            Results of a test
+
+        """
+        compiler = Path(test_dir).stem.split('-')[0]
+        mode = Path(test_dir).stem.split('-')[1]
+        test_report = {'RUNDECK': test_name,
+                       'COMPILER': compiler,
+                       'MODE': mode}
+        for stage in self.stages:
+            test_report[stage] = False
+        return test_report
+
+    def get_npes(self, test_name: str) -> list[int]:
+        """
+        Retrieves the processor counts a rundeck is run with
+        ('npes' in its testcase config).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+
+        Returns
+        -------
+        list[int]
+            Processor counts (defaults to [1])
+
+        """
+        return parse_npes(self.test_cfg.get_testcase(test_name).get('npes'))
+
+    def get_test_cores(self, test_name: str, test_dir: str) -> int:
+        """
+        ModelE implementation of get_test_cores()
+
+        Serial runs use one core and MPI runs use the largest
+        of the rundeck's npes, twice for restartRun verifications
+        (both legs run at the same time).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        test_dir : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        int
+            Number of cores
+
+        """
+        cores = max(self.get_run_npes(test_name, test_dir))
+        if self.get_verification(test_name) == 'restartRun':
+            # Continuous and restart legs run at the same time
+            cores *= 2
+        return cores
+
+    def get_test_key(self, test_name: str, test_dir: str) -> dict:
+        """
+        ModelE implementation of get_test_key()
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        test_dir : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        dict
+            Rundeck, compiler, mode, npes, and verification
+
+        """
+        compiler = Path(test_dir).stem.split('-')[0]
+        mode = Path(test_dir).stem.split('-')[1]
+        testcase = self.test_cfg.get_testcase(test_name)
+        return make_test_key(test_name, compiler, mode,
+                             testcase.get('npes'),
+                             testcase.get('verification'))
+
+    def get_test_duration(self, test_name: str, test_dir: str) -> float:
+        """
+        ModelE implementation of get_test_duration()
+
+        Rundecks with no recorded durations fall back to the
+        hand-tuned walltime table.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        test_dir : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        float
+            Predicted duration in seconds
+
+        """
+        key = self.get_test_key(test_name, test_dir)
+        return get_duration(self.history, key, self.stages,
+                            deck_name=test_name, mode=key['mode'],
+                            verification=key['verification'])
+
+    def get_compiler_version(self, compiler: str) -> str:
+        """
+        Retrieves the version of a compiler: the configured compiler
+        versions and modules when compilers are loaded with modules,
+        otherwise the first line of the compiler's '--version'.
+
+        Parameters
+        ----------
+        compiler : str
+            Compiler name (eg. intel, gfortran)
+
+        Returns
+        -------
+        str
+            Compiler version, or None if unknown
+
+        """
+        if compiler in self.compiler_versions:
+            return self.compiler_versions[compiler]
+
+        version = None
+        if self.system_cfg.get('modules'):
+            modulelist = self.system_cfg.get('modulelist')
+            version = ' '.join(str(item) for item in [
+                self.system_cfg.get('compiler_versions'),
+                self.system_cfg.get(modulelist) if modulelist else None
+            ])
+        else:
+            executable = {'intel': 'ifort',
+                          'gcc': 'gfortran',
+                          'gnu': 'gfortran'}.get(compiler, compiler)
+            try:
+                run = sp.run([executable, '--version'], stdout=sp.PIPE,
+                             stderr=sp.STDOUT, timeout=30)
+                lines = run.stdout.decode('UTF-8').splitlines()
+                version = lines[0].strip() if lines else None
+            except (OSError, sp.TimeoutExpired):
+                logger.warning(f'Could not get the version of {compiler}')
+
+        self.compiler_versions[compiler] = version
+        return version
+
+    def get_compiler_modules(self, compiler: str) -> list[str]:
+        """
+        Retrieves the modules loaded for a compiler: those of every
+        module list named after its vendor (eg. gcc_openmpi for
+        gfortran), when compilers are loaded with modules.
+
+        Parameters
+        ----------
+        compiler : str
+            Compiler name (eg. intel, gfortran)
+
+        Returns
+        -------
+        list[str]
+            Modules, in load order (empty without modules)
+
+        """
+        use_modules = self.system_cfg.get('modules')
+        if use_modules is not True and str(use_modules).lower() != 'yes':
+            return list()
+        vendor = 'gcc' if compiler in ['gcc', 'gfortran', 'gnu'] \
+            else compiler
+        return [module
+                for name, modules in get_module_lists(self.system_cfg).items()
+                if vendor in name for module in modules]
+
+    def get_modules(self, test_name: str, test_dir: str) -> list[str]:
+        """
+        ModelE implementation of get_modules()
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        test_dir : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        list[str]
+            Modules, in load order
+
+        """
+        return self.get_compiler_modules(Path(test_dir).stem.split('-')[0])
+
+    def get_modelerc_settings(self, compiler: str) -> dict:
+        """
+        Retrieves the system settings written to a compiler's
+        modelErc file.
+
+        Parameters
+        ----------
+        compiler : str
+            Compiler name (eg. intel, gfortran)
+
+        Returns
+        -------
+        dict
+            modelErc settings
+
+        """
+        prefix = 'gcc' if compiler in ['gcc', 'gfortran', 'gnu'] \
+            else compiler
+        names = [prefix + name for name in ['netcdf', 'pnetcdf', 'esmf',
+                                            'mpi', 'mpidir',
+                                            'serialpfunitdir',
+                                            'mpipfunitdir']]
+        names += ['modeldatadir', 'baselibdir', 'fvcubedroot',
+                  'fftwroot', 'esmf', 'makesystem']
+        return {name: self.system_cfg.get(name) for name in names}
+
+    def get_result_key(self, test_name: str, test_dir: str) -> dict:
+        """
+        ModelE implementation of get_result_key()
+
+        Adds the compiler version, build type, and modelErc
+        settings to the commit and testcase.
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        test_dir : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        dict
+            Test description, or None if the commit is unknown
+
+        """
+        key = super().get_result_key(test_name, test_dir)
+        if key is None:
+            return None
+        compiler = Path(test_dir).stem.split('-')[0]
+        key['compiler_version'] = self.get_compiler_version(compiler)
+        key['buildtype'] = self.model_cfg.get('buildtype')
+        key['modelerc'] = self.get_modelerc_settings(compiler)
+        return key
+
+    def get_modelerc_file(self, compiler: str) -> Path:
+        """
+        Retrieves the modelErc file written for a compiler.
+
+        Parameters
+        ----------
+        compiler : str
+            Compiler name (eg. intel, gfortran)
+
+        Returns
+        -------
+        Path
+            modelErc file (may not exist)
+
+        """
+        return Path(self.get_scratch_dir()) / compiler / \
+            f'modelErc.{compiler}'
+
+    def get_build_key(self, test_name: str, test_dir: str) -> dict:
+        """
+        ModelE implementation of get_build_key()
+
+        Source tree of the clone, rundeck, compiler and its version,
+        mode, build type, and modelErc contents (its settings if it
+        was not written).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        test_dir : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        dict
+            Build description, or None if the clone is not a git
+            checkout
+
+        """
+        tree = git_tree_hash(str(Path(test_dir) / 'code'),
+                             host_name=get_hostname())
+        if not tree:
+            return None
+        compiler = Path(test_dir).stem.split('-')[0]
+        modelerc_file = self.get_modelerc_file(compiler)
+        try:
+            modelerc = modelerc_file.read_text()
+        except OSError:
+            modelerc = self.get_modelerc_settings(compiler)
+        return {'tree': tree,
+                'sparse_paths': self.get_clone_options(test_name).get(
+                    'sparse_paths'),
+                'rundeck': test_name,
+                'compiler': compiler,
+                'compiler_version': self.get_compiler_version(compiler),
+                'mode': Path(test_dir).stem.split('-')[1],
+                'buildtype': self.model_cfg.get('buildtype'),
+                'modelerc': modelerc}
+
+    def get_build_artifacts(self, test_name: str,
+                            test_dir: str) -> dict[str, str]:
+        """
+        ModelE implementation of get_build_artifacts()
+
+        The rundeck's bin directory (executable) and the object
+        directory of the clone, or the build directory of the test
+        directory for out-of-source builds (the shared objects are
+        not part of a rundeck's build).
+
+        Parameters
+        ----------
+        test_name : str
+            Name of test (rundeck)
+        test_dir : str
+            Test directory named <compiler>-<mode>
+
+        Returns
+        -------
+        dict[str, str]
+            Path of each artifact, by artifact name
+
+        """
+        if self.is_out_of_source():
+            return {'bin': str(Path(test_dir) / 'build')}
+        code = Path(test_dir) / 'code'
+        return {'bin': str(code / 'decks' / f'{test_name}_bin'),
+                'objects': str(code / 'model')}
+
+    def get_build_patterns(self) -> dict[str, list[str]]:
+        """
+        ModelE implementation of get_build_patterns()
+
+        Only the object, module, and library files of the object
+        directory are cached (the sources come from the clone).
+
+        Returns
+        -------
+        dict[str, list[str]]
+            File name patterns, by artifact name
+
+        """
+        return {'objects': ['*.o', '*.mod', '*.smod', '*.a']}
 
     def initialize(self) -> None:
         """
@@ -198,55 +1530,9 @@ class ModelEReg(EarthSystemsReg):
 
         """
         self.setup()
+        self.run_tests()
 
-        for testname, testdirs in self.test_cfg.get_dirs().items():
-            test_result = True
-            for testdir in testdirs:
-                compiler = Path(testdir).stem.split('-')[0]
-                mode = Path(testdir).stem.split('-')[1]
-                test_report = {'RUNDECK': testname,
-                               'COMPILER': compiler,
-                               'MODE': mode,
-                               'CLONE': False,
-                               'BUILD': False,
-                               'RUN': False,
-                               'COMPARE': False}
-                paths.change_dir(testdir)
-                dir_name = testdir + '/code'
-
-                try:
-                    self.get_repo(directory_name=dir_name,
-                                  overwrite=True)
-                except:
-                    test_result = False
-                else:
-                    test_report['CLONE'] = True
-                    try:
-                        self.compile(test_name=testname, cwd=testdir)
-                    except:
-                        test_result = False
-                    else:
-                        test_report['BUILD'] = True
-                        try:
-                            self.run(test_name=testname, cwd=testdir)
-                        except:
-                            test_result = False
-                        else:
-                            test_report['RUN'] = True
-                            try:
-                                self.compare(test_name=testname,
-                                             cwd=testdir)
-                            except:
-                                test_result = False
-                            else:
-                                test_report['COMPARE'] = True
-                finally:
-                    if test_result:
-                        pass
-                        # Clears out test directory if it passes
-                        paths.clean_dir(testdir)
-                    self.report_cfg.add_test(test_report)
-
+        for testname in self.test_cfg.get_dirs():
             logger.notice(f'ModelE — {testname} tests complete...')
 
         if self.system_cfg['cleanscratch']:
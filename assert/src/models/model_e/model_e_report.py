@@ -103,7 +103,13 @@ class ModelEReport(EarthSystemsReport):
         """
         legend = {'+': 'Operation success',
                   '-': 'Operation failure',
-                  '*': 'Operation not performed'}
+                  '*': 'Operation not performed',
+                  '(cached)': 'Result of a previous run of the same '
+                              'commit and configuration',
+                  '(hang)': 'Run stopped by the watchdog after making '
+                            'no progress (stacks in logs/run.hang)',
+                  'k/N': 'NPE: k of the N processor counts end with the '
+                         'same restart files as the lowest one'}
         return legend
 
     def interpret_test(self, res: Any) -> str:
@@ -150,7 +156,7 @@ class ModelEReport(EarthSystemsReport):
         """
         self.report += f"""
 {'- ' * 60}
-RUNDECK {' ' * 15} COMPILER      MODE     CLONE   BUILD   RUN   COMPARE
+RUNDECK {' ' * 15} COMPILER      MODE     CLONE   BUILD   RUN   COMPARE  NPE
 {'- ' * 60}
 """
         for test in self.test_reports:
@@ -161,7 +167,10 @@ RUNDECK {' ' * 15} COMPILER      MODE     CLONE   BUILD   RUN   COMPARE
                 f"{self.interpret_test(test['CLONE']):^7}" \
                 f"{self.interpret_test(test['BUILD']):^14}" \
                 f"{self.interpret_test(test['RUN']):^6}   " \
-                f"{self.interpret_test(test['COMPARE']):^7}\n"
+                f"{self.interpret_test(test['COMPARE']):^7}" \
+                f"{test.get('NPE') or '':^6}" \
+                f"{' (cached)' if test.get('CACHED') else ''}" \
+                f"{' (hang)' if test.get('HANG') else ''}\n"
         self.report += f"{'- ' * 60}"
 
         logger.info('ModelE — Test results added to report.')
@@ -207,6 +216,12 @@ Legend:
 ASSERT: A Software Suite for Earth-systems Regression Testing
 {'=' * 60}
 MODEL TYPE: ModelE
+"""
+        if self.revision:
+            self.report += f"""\
+REPOSITORY: {self.model_cfg.get('repository')}
+BRANCH:     {self.model_cfg.get('repo_branch')}
+COMMIT:     {self.revision}
 """
         self.add_test_report()
         self.add_legend_report()
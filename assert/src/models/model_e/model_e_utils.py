@@ -9,6 +9,10 @@ import logging
 import time
 import reg_utils as util
 
+from src.lib.utils.access_repo import config_git_clone, git_log, run_cmd
+from src.lib.utils.history import DurationHistory, get_history_file
+from src.models.model_e.model_e_walltime import get_walltime, make_test_key
+
 logger = logging.getLogger('tools')
 
 
@@ -38,19 +42,9 @@ def git_clone_repository(config):
     buildtype = userconfig['buildtype']
 
     clone = os.path.join(scratch, "scratch", branch, branch)
-    filerepo = 'file://' + repo
-    cmd = 'git clone ' + filerepo + ' ' + clone + ' --depth 1 --branch ' + branch
 
     resultsDir = os.path.join(userconfig['scratchdir'], "results", branch)
 
-    cwd = os.getcwd()
-    logger.info('Cloning %s into %s', repo, clone)
-
-    util.sp_call(cmd)
-
-    # Must use "repo" dir instead of "clone" dir to get more than 1 log entry
-    os.chdir(repo)
-
     # traps tests have their own baseline, so use this to specify the path
     if buildtype == 'traps':
         traps = '_traps'
@@ -59,27 +53,35 @@ def git_clone_repository(config):
     # Get date of last baseline update for use with git log
     datePath = base + '/' + branch + traps + '/lastGitDate'
     logger.info('datePath = ' + datePath)
+    baselineDate = None
     if os.path.exists(datePath):
         with open(datePath) as dateFile:
             baselineDate = dateFile.readline().strip() + " 00:00:01"
             logger.info('baseline date = ' + baselineDate)
-        cmd = "git log --pretty=format:'%h - %an, %ad : %s' --date=short --since='" + baselineDate + "'"
-        logger.debug('Log 7cmd: ' + cmd)
-    else:
-        # get last 3 log entries
-        cmd = "git log --pretty=format:'%h - %an, %ad : %s' -3 --date=short"
-
-    logPath = resultsDir + '/gitLog'
-    os.system(cmd + '>' + logPath)
 
-    ##If there are less than 3 entries in gitLog, get the last 3 instead
-    # numEntries = len(open(logPath).readlines(  ))
-    # if numEntries < 3:
-    #    cmd = "git log --pretty=format:'%h - %an, %ad : %s' -3 --date=short"
-    #    os.system(cmd + '>' + logPath)
-
-    os.chdir(cwd)
+    # Clone the history since the baseline date (the last 3 commits
+    # otherwise), so the log can be taken from the clone itself
+    logger.info('Cloning %s into %s', repo, clone)
+    cloned = False
+    if baselineDate:
+        cmd = config_git_clone(repo, clone, branch_name=branch,
+                               shallow_since=baselineDate)
+        cloned = run_cmd(cmd)
+    if not cloned:
+        # No commit since the baseline date
+        if not run_cmd(config_git_clone(repo, clone, branch_name=branch,
+                                        clone_depth=3)):
+            logger.error('Could not clone %s', repo)
+        baselineDate = None
 
+    logPath = resultsDir + '/gitLog'
+    if baselineDate:
+        log = git_log(clone, since=baselineDate)
+    else:
+        # get last 3 log entries
+        log = git_log(clone, max_count=3)
+    with open(logPath, 'w') as logFile:
+        logFile.write(log or '')
 
 def setup_modele_env(config, compconfig):
     # ModelE specific setup
@@ -314,99 +316,18 @@ def create_script_task(config, compconfig, deck, comp, mode):
         # If we are just compiling this rundeck
         if deck.get_opt('verification') == 'compileOnly':
             cores = 4
-            walltime = '00:10:00'
-
-        # customRun is a 2-month run
-        elif deck.get_opt('verification') == 'customRun':
-            if re.search('campi', deckName):
-                walltime = '4:00:00'
-            elif re.search('Tmatrix', deckName):
-                walltime = '4:00:00'
-            elif re.search('Ttomas', deckName):
-                walltime = '4:00:00'
-            elif re.search('cadi', deckName):
-                walltime = '2:00:00'
-            elif re.search('Toma', deckName):
-                walltime = '2:00:00'
-            elif re.search('obio', deckName):
-                walltime = '1:00:00'
-            elif re.search('C12', deckName):
-                walltime = '0:30:00'
-            elif re.search('M20', deckName):
-                walltime = '0:30:00'
-            else:
-                walltime = '1:00:00'
-
         # regular runs (1hr and/or restart)
-        else:
-            if 'mpi' in mode:
-                walltime = '01:30:00'
-                if re.search('E4Tcad', deckName):
-                    walltime = '04:00:00'
-
-            else:  # serial
-                cores = 1
-                walltime = '00:50:00'
-                if re.search('obio', deckName):
-                    walltime = '01:00:00'
-                elif re.search('cadi', deckName):
-                    walltime = '04:00:00'
-                elif re.search('lerner', deckName):
-                    walltime = '01:00:00'
-                elif re.search('E6Tdus', deckName):
-                    walltime = '01:30:00'
-                elif re.search('E_Tdus', deckName):
-                    walltime = '01:00:00'
-                elif re.search('P2SAq', deckName):
-                    walltime = '01:10:00'
-                elif re.search('P2SAp', deckName):
-                    walltime = '01:10:00'
-                elif re.search('P2SNo', deckName):
-                    walltime = '00:55:00'
-                elif re.search('P2Sxo', deckName):
-                    walltime = '01:00:00'
-                elif re.search('LL', deckName):
-                    walltime = '01:00:00'
-                elif re.search('E6F40', deckName):
-                    walltime = '01:00:00'
-
-            # Adjust the walltime for some rundecks
-            if re.search('Mars', deckName):
-                walltime = '00:55:00'
-            elif re.search('SGP', deckName):
-                walltime = '00:10:00'
-            elif re.search('campi', deckName):
-                walltime = '02:00:00'
-            elif re.search('P2SAoF', deckName):
-                walltime = '01:45:00'
-            elif re.search('Toma', deckName):
-                if 'mpi' in mode:
-                    walltime = '03:00:00'
-                else:
-                    walltime = '04:00:00'
-            elif re.search('ctomas', deckName):
-                walltime = '02:00:00'
-            elif re.search('Ttomas', deckName):
-                walltime = '03:00:00'
-            elif re.search('Tmatrix', deckName):
-                walltime = '02:00:00'
-            elif re.search('E_Tdus', deckName):
-                walltime = '02:00:00'
-            elif re.search('E6Twis', deckName):
-                if 'mpi' in mode:
-                    walltime = '02:00:00'
-                else:
-                    walltime = '01:00:00'
-            elif re.search('E6Tlernerpsv', deckName):
-                if 'mpi' in mode:
-                    walltime = '04:00:00'  # parallel
-                else:
-                    walltime = '03:00:00'  # serial
-            elif re.search('vsd', deckName):
-                if 'mpi' in mode:
-                    walltime = '07:00:00'  # parallel
-                else:
-                    walltime = '06:00:00'  # serial
+        elif deck.get_opt('verification') != 'customRun' and 'mpi' not in mode:
+            cores = 1
+
+        # Walltime from the recorded durations of this rundeck (falls
+        # back to the hand-tuned table for rundecks never run before)
+        history = DurationHistory(get_history_file(userconfig))
+        history.load()
+        key = make_test_key(deckName, comp, mode, deck.get_opt('npes'),
+                           deck.get_opt('verification'))
+        walltime = get_walltime(history, key, ['BUILD', 'RUN', 'COMPARE'],
+                                deckName, mode, deck.get_opt('verification'))
 
         outname = os.path.join(resultsDir, jobName + '.' + mode + '.out')
         errname = os.path.join(resultsDir, jobName + '.' + mode + '.err')
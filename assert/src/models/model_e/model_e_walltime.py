@@ -0,0 +1,281 @@
+"""
+ModelE walltime estimates
+
+    - parse_npes
+    - make_test_key
+    - get_table_walltime
+    - get_walltime
+    - get_duration
+"""
+import re
+import logging
+
+from src.lib.utils.logger import logger_setup
+from src.lib.utils.history import (DurationHistory, format_walltime,
+                                   parse_walltime)
+
+logger = logger_setup(filename=__name__,
+                      file_handler=True,
+                      file_level=logging.INFO,
+                      stream_handler=False)
+
+# Fraction of the table walltime a predicted walltime never goes
+# below, so a few unusually short runs cannot get jobs killed
+TABLE_FLOOR = 0.25
+
+
+def parse_npes(npes) -> list[int]:
+    """
+    Normalizes the 'npes' of a testcase config.
+
+    Parameters
+    ----------
+    npes : int, str, or list
+        Processor counts (eg. 4, '1,4', [1, 4], or None)
+
+    Returns
+    -------
+    list[int]
+        Processor counts (defaults to [1])
+
+    """
+    if npes is None:
+        npes = 1
+    if isinstance(npes, str):
+        npes = npes.split(',')
+    elif not isinstance(npes, (list, tuple)):
+        npes = [npes]
+    return [int(npe) for npe in npes] or [1]
+
+
+def make_test_key(deck_name: str, compiler: str, mode: str, npes,
+                  verification: str) -> dict:
+    """
+    Builds the description durations of a rundeck are recorded and
+    predicted by. The regression tool and the generated batch
+    scripts must build the same key for the same rundeck.
+
+    Parameters
+    ----------
+    deck_name : str
+        Rundeck name
+    compiler : str
+        Compiler name (eg. intel, gfortran)
+    mode : str
+        'serial' or 'mpi'
+    npes : int, str, or list
+        Processor counts, as configured (see parse_npes)
+    verification : str
+        Verification type (eg. 'restartRun', 'customRun')
+
+    Returns
+    -------
+    dict
+        Rundeck, compiler, mode, npes, and verification
+
+    """
+    return {'rundeck': deck_name,
+            'compiler': compiler,
+            'mode': mode,
+            'npes': parse_npes(npes),
+            'verification': verification}
+
+
+def get_table_walltime(deck_name: str, mode: str,
+                       verification: str) -> str:
+    """
+    Hand-tuned walltime of a rundeck. Only used for rundecks
+    that have no recorded durations yet.
+
+    Parameters
+    ----------
+    deck_name : str
+        Rundeck name
+    mode : str
+        'serial' or 'mpi'
+    verification : str
+        Verification type (eg. 'restartRun', 'customRun')
+
+    Returns
+    -------
+    str
+        Walltime as 'HH:MM:SS'
+
+    """
+    # If we are just compiling this rundeck
+    if verification == 'compileOnly':
+        walltime = '00:10:00'
+
+    # customRun is a 2-month run
+    elif verification == 'customRun':
+        if re.search('campi', deck_name):
+            walltime = '4:00:00'
+        elif re.search('Tmatrix', deck_name):
+            walltime = '4:00:00'
+        elif re.search('Ttomas', deck_name):
+            walltime = '4:00:00'
+        elif re.search('cadi', deck_name):
+            walltime = '2:00:00'
+        elif re.search('Toma', deck_name):
+            walltime = '2:00:00'
+        elif re.search('obio', deck_name):
+            walltime = '1:00:00'
+        elif re.search('C12', deck_name):
+            walltime = '0:30:00'
+        elif re.search('M20', deck_name):
+            walltime = '0:30:00'
+        else:
+            walltime = '1:00:00'
+
+    # regular runs (1hr and/or restart)
+    else:
+        if 'mpi' in mode:
+            walltime = '01:30:00'
+            if re.search('E4Tcad', deck_name):
+                walltime = '04:00:00'
+
+        else:  # serial
+            walltime = '00:50:00'
+            if re.search('obio', deck_name):
+                walltime = '01:00:00'
+            elif re.search('cadi', deck_name):
+                walltime = '04:00:00'
+            elif re.search('lerner', deck_name):
+                walltime = '01:00:00'
+            elif re.search('E6Tdus', deck_name):
+                walltime = '01:30:00'
+            elif re.search('E_Tdus', deck_name):
+                walltime = '01:00:00'
+            elif re.search('P2SAq', deck_name):
+                walltime = '01:10:00'
+            elif re.search('P2SAp', deck_name):
+                walltime = '01:10:00'
+            elif re.search('P2SNo', deck_name):
+                walltime = '00:55:00'
+            elif re.search('P2Sxo', deck_name):
+                walltime = '01:00:00'
+            elif re.search('LL', deck_name):
+                walltime = '01:00:00'
+            elif re.search('E6F40', deck_name):
+                walltime = '01:00:00'
+
+        # Adjust the walltime for some rundecks
+        if re.search('Mars', deck_name):
+            walltime = '00:55:00'
+        elif re.search('SGP', deck_name):
+            walltime = '00:10:00'
+        elif re.search('campi', deck_name):
+            walltime = '02:00:00'
+        elif re.search('P2SAoF', deck_name):
+            walltime = '01:45:00'
+        elif re.search('Toma', deck_name):
+            if 'mpi' in mode:
+                walltime = '03:00:00'
+            else:
+                walltime = '04:00:00'
+        elif re.search('ctomas', deck_name):
+            walltime = '02:00:00'
+        elif re.search('Ttomas', deck_name):
+            walltime = '03:00:00'
+        elif re.search('Tmatrix', deck_name):
+            walltime = '02:00:00'
+        elif re.search('E_Tdus', deck_name):
+            walltime = '02:00:00'
+        elif re.search('E6Twis', deck_name):
+            if 'mpi' in mode:
+                walltime = '02:00:00'
+            else:
+                walltime = '01:00:00'
+        elif re.search('E6Tlernerpsv', deck_name):
+            if 'mpi' in mode:
+                walltime = '04:00:00'  # parallel
+            else:
+                walltime = '03:00:00'  # serial
+        elif re.search('vsd', deck_name):
+            if 'mpi' in mode:
+                walltime = '07:00:00'  # parallel
+            else:
+                walltime = '06:00:00'  # serial
+
+    return walltime
+
+
+def get_walltime(history: DurationHistory, key: dict,
+                 stages: list[str], deck_name: str, mode: str,
+                 verification: str) -> str:
+    """
+    Walltime to request for a rundeck: a high percentile of its
+    recorded durations plus a margin, or the hand-tuned table
+    value if it has never been recorded. Predictions never go
+    below TABLE_FLOOR of the table value.
+
+    Parameters
+    ----------
+    history : DurationHistory
+        Recorded test durations (loaded)
+    key : dict
+        Test description (rundeck, compiler, mode, npes,
+        verification)
+    stages : list[str]
+        Stages the batch job performs
+    deck_name : str
+        Rundeck name
+    mode : str
+        'serial' or 'mpi'
+    verification : str
+        Verification type (eg. 'restartRun', 'customRun')
+
+    Returns
+    -------
+    str
+        Walltime as 'HH:MM:SS'
+
+    """
+    table_walltime = get_table_walltime(deck_name, mode, verification)
+    prediction = history.predict(key, stages)
+    if prediction is None:
+        logger.debug(f'No history for {deck_name} ({mode}). Using '
+                     f'table walltime {table_walltime}')
+        return table_walltime
+
+    walltime = format_walltime(
+        max(prediction, TABLE_FLOOR * parse_walltime(table_walltime)))
+    logger.debug(f'Predicted walltime of {deck_name} ({mode}): '
+                 f'{walltime}')
+    return walltime
+
+
+def get_duration(history: DurationHistory, key: dict,
+                 stages: list[str], deck_name: str, mode: str,
+                 verification: str) -> float:
+    """
+    Expected duration of a rundeck in seconds, from the same
+    prediction as get_walltime(). Used to order tests longest first.
+
+    Parameters
+    ----------
+    history : DurationHistory
+        Recorded test durations (loaded)
+    key : dict
+        Test description (rundeck, compiler, mode, npes,
+        verification)
+    stages : list[str]
+        Stages included in the duration
+    deck_name : str
+        Rundeck name
+    mode : str
+        'serial' or 'mpi'
+    verification : str
+        Verification type (eg. 'restartRun', 'customRun')
+
+    Returns
+    -------
+    float
+        Duration in seconds
+
+    """
+    prediction = history.predict(key, stages)
+    if prediction is None:
+        return parse_walltime(get_table_walltime(deck_name, mode,
+                                                 verification))
+    return prediction
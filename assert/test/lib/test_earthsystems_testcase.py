@@ -70,3 +70,24 @@ def test_get_runnable_names():
     )
     test_cases.set_runnable_tests()
     assert test_cases.get_runnable_names() == run_names
+
+
+def test_get_dependencies():
+    data = [
+        dict(name='E1oM20', modes='mpi', run=True),
+        dict(name='EM20', modes='mpi', run=False),
+        dict(name='E6TmatrixF40', modes='mpi', run=True,
+             dependencies='E1oM20, EM20'),
+        dict(name='E6TomaF40', modes='mpi', run=True,
+             dependencies=['E6TmatrixF40']),
+        dict(name='LLF40', modes='mpi', run=True, dependencies='none')
+    ]
+
+    test_cases = EarthSystemsTestcase(
+        test_cfg=data, scratch_dir='/Users/deon.kouatchou/scratch'
+    )
+    test_cases.set_runnable_tests()
+    assert test_cases.get_dependencies() == {
+        'E1oM20': [], 'E6TmatrixF40': ['E1oM20'],
+        'E6TomaF40': ['E6TmatrixF40'], 'LLF40': []
+    }
@@ -0,0 +1,134 @@
+"""
+Stand-ins for the SLURM sbatch, squeue, sacct, and scancel commands
+used to test the SLURM batch backend without a batch system.
+
+sbatch runs the tasks of a job array one after the other in a
+background process. Task states are kept in files of a state
+directory, and every call is logged to calls.log in that directory.
+
+"""
+import sys
+from pathlib import Path
+
+SBATCH = """\
+import os, re, subprocess, sys
+from pathlib import Path
+state = Path(sys.argv[0]).parent / 'state'
+state.mkdir(exist_ok=True)
+with open(state / 'calls.log', 'a') as log:
+    log.write('sbatch ' + ' '.join(sys.argv[1:]) + '\\n')
+script = sys.argv[-1]
+first, last = map(int, re.search(r'#SBATCH --array=(\\d+)-(\\d+)',
+                                 open(script).read()).groups())
+counter = state / 'counter'
+array_id = int(counter.read_text()) + 1 if counter.exists() else 1000
+counter.write_text(str(array_id))
+tasks = range(first, last + 1)
+for task in tasks:
+    (state / f'{array_id}_{task}').write_text('PENDING')
+if os.fork() == 0:
+    os.setsid()
+    # Let the caller read sbatch's output without waiting for the tasks
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in range(3):
+        os.dup2(devnull, fd)
+    for task in tasks:
+        task_file = state / f'{array_id}_{task}'
+        if task_file.read_text() == 'CANCELLED':
+            continue
+        task_file.write_text('RUNNING')
+        env = dict(os.environ, SLURM_ARRAY_JOB_ID=str(array_id),
+                   SLURM_ARRAY_TASK_ID=str(task))
+        code = subprocess.call(['bash', script], env=env,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+        task_file.write_text('COMPLETED' if code == 0 else 'FAILED')
+    os._exit(0)
+print(f'{array_id};cluster')
+"""
+
+SQUEUE = """\
+import sys
+from pathlib import Path
+state = Path(sys.argv[0]).parent / 'state'
+with open(state / 'calls.log', 'a') as log:
+    log.write('squeue ' + ' '.join(sys.argv[1:]) + '\\n')
+arrays = sys.argv[sys.argv.index('-j') + 1].split(',')
+for task_file in sorted(state.glob('*_*')):
+    status = task_file.read_text()
+    if task_file.name.split('_')[0] in arrays and \\
+            status in ['PENDING', 'RUNNING']:
+        print(task_file.name, status)
+"""
+
+SACCT = """\
+import sys
+from pathlib import Path
+state = Path(sys.argv[0]).parent / 'state'
+with open(state / 'calls.log', 'a') as log:
+    log.write('sacct ' + ' '.join(sys.argv[1:]) + '\\n')
+arrays = sys.argv[sys.argv.index('-j') + 1].split(',')
+for task_file in sorted(state.glob('*_*')):
+    if task_file.name.split('_')[0] in arrays:
+        print(task_file.name + '|' + task_file.read_text())
+"""
+
+SCANCEL = """\
+import sys
+from pathlib import Path
+state = Path(sys.argv[0]).parent / 'state'
+with open(state / 'calls.log', 'a') as log:
+    log.write('scancel ' + ' '.join(sys.argv[1:]) + '\\n')
+for job_id in sys.argv[1:]:
+    task_file = state / job_id
+    if task_file.exists() and \\
+            task_file.read_text() in ['PENDING', 'RUNNING']:
+        task_file.write_text('CANCELLED')
+"""
+
+
+def make_fake_slurm(bin_dir: Path) -> dict[str, str]:
+    """
+    Writes the fake SLURM commands in a directory.
+
+    Parameters
+    ----------
+    bin_dir : Path
+        Directory the commands are written in
+
+    Returns
+    -------
+    dict[str, str]
+        Path of each command (sbatch, squeue, sacct, scancel)
+
+    """
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    commands = dict()
+    for name, code in [('sbatch', SBATCH), ('squeue', SQUEUE),
+                       ('sacct', SACCT), ('scancel', SCANCEL)]:
+        command = bin_dir / name
+        command.write_text(f'#!{sys.executable}\n' + code)
+        command.chmod(0o755)
+        commands[name] = str(command)
+    return commands
+
+
+def get_calls(bin_dir: Path) -> list[str]:
+    """
+    Lists the fake SLURM commands called so far.
+
+    Parameters
+    ----------
+    bin_dir : Path
+        Directory the commands were written in
+
+    Returns
+    -------
+    list[str]
+        Name of each command called, in order
+
+    """
+    calls_log = bin_dir / 'state' / 'calls.log'
+    if not calls_log.exists():
+        return list()
+    return [line.split()[0] for line in calls_log.read_text().splitlines()]
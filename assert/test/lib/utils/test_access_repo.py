@@ -78,3 +78,250 @@ def test_access_repo(repo_type, repo_url, dir_name, branch_name,
             dir_name = Path(repo_url).stem
         assert confirm == confirm_git_clone(dir_name)
         """
+
+
+def test_git_remote_revision(tmp_path):
+    repo = str(tmp_path / 'repo')
+    git = ['git', '-C', repo, '-c', 'user.name=ASSERT',
+           '-c', 'user.email=assert@example.com']
+    assert run_cmd(['git', 'init', '-q', '-b', 'main', repo])
+    assert run_cmd(git + ['commit', '-q', '--allow-empty', '-m', 'first'])
+    assert run_cmd(git + ['tag', '-a', 'v1', '-m', 'v1'])
+    first = sp.check_output(git + ['rev-parse', 'HEAD']).decode().strip()
+    assert run_cmd(git + ['commit', '-q', '--allow-empty', '-m', 'second'])
+    second = sp.check_output(git + ['rev-parse', 'HEAD']).decode().strip()
+
+    assert git_remote_revision(repo) == second
+    assert git_remote_revision(repo, 'main') == second
+    # Annotated tags resolve to their commit
+    assert git_remote_revision(repo, 'v1') == first
+    assert git_remote_revision(repo, 'missing') is None
+    assert git_remote_revision(str(tmp_path / 'missing')) is None
+
+
+def test_git_mirror_clone(tmp_path):
+    repo = str(tmp_path / 'repo')
+    mirror_root = str(tmp_path / 'mirrors')
+    git = ['git', '-C', repo, '-c', 'user.name=ASSERT',
+           '-c', 'user.email=assert@example.com']
+    assert run_cmd(['git', 'init', '-q', '-b', 'main', repo])
+    (tmp_path / 'repo' / 'file.txt').write_text('first')
+    assert run_cmd(git + ['add', 'file.txt'])
+    assert run_cmd(git + ['commit', '-q', '-m', 'first'])
+    assert run_cmd(git + ['branch', 'stable'])
+
+    # Both test directories share one mirror
+    code1 = tmp_path / 'test1' / 'code'
+    code2 = tmp_path / 'test2' / 'code'
+    git_mirror_clone(repo, mirror_root, str(code1), 'main')
+    git_mirror_clone(repo, mirror_root, str(code2), 'stable',
+                     fetch=False)
+    mirror_dir = get_mirror_dir(mirror_root, repo)
+    assert list(Path(mirror_root).glob('*.git')) == [Path(mirror_dir)]
+    assert (code1 / 'file.txt').read_text() == 'first'
+    assert (code2 / 'file.txt').read_text() == 'first'
+
+    with pytest.raises(Exception):
+        git_mirror_clone(repo, mirror_root, str(code1), 'main')
+
+    # New commits are only seen once the mirror is fetched
+    (tmp_path / 'repo' / 'file.txt').write_text('second')
+    assert run_cmd(git + ['commit', '-q', '-am', 'second'])
+    git_mirror_clone(repo, mirror_root, str(code1), 'main',
+                     overwrite=True, fetch=False)
+    assert (code1 / 'file.txt').read_text() == 'first'
+    git_update_mirror(repo, mirror_root)
+    (code1 / 'build.o').write_text('')
+    git_mirror_clone(repo, mirror_root, str(code1), 'main',
+                     overwrite=True, fetch=False)
+    assert (code1 / 'file.txt').read_text() == 'second'
+    # The existing worktree was reset and cleaned
+    assert is_worktree_of(str(code1), mirror_dir)
+    assert not (code1 / 'build.o').exists()
+
+
+def test_git_update_clone(tmp_path):
+    repo = str(tmp_path / 'repo')
+    other = str(tmp_path / 'other')
+    code = tmp_path / 'code'
+    git = ['git', '-C', repo, '-c', 'user.name=ASSERT',
+           '-c', 'user.email=assert@example.com']
+    assert run_cmd(['git', 'init', '-q', '-b', 'main', repo])
+    (tmp_path / 'repo' / 'file.txt').write_text('first')
+    assert run_cmd(git + ['add', 'file.txt'])
+    assert run_cmd(git + ['commit', '-q', '-m', 'first'])
+    assert run_cmd(['git', 'clone', '-q', repo, other])
+
+    git_clone(repo, str(code), 'main', clone_depth=1)
+    (code / '.git' / 'marker').write_text('kept')
+    (code / 'build.o').write_text('')
+    (code / 'file.txt').write_text('modified')
+    (tmp_path / 'repo' / 'file.txt').write_text('second')
+    assert run_cmd(git + ['commit', '-q', '-am', 'second'])
+
+    # Same repository: fetched and reset in place
+    git_clone(repo, str(code), 'main', clone_depth=1, overwrite=True)
+    assert (code / '.git' / 'marker').exists()
+    assert (code / 'file.txt').read_text() == 'second'
+    assert not (code / 'build.o').exists()
+
+    # Another branch or repository: cloned again
+    assert not git_update_clone(repo, str(code), 'stable')
+    assert not git_update_clone(other, str(code), 'main')
+    git_clone(other, str(code), 'main', overwrite=True)
+    assert not (code / '.git' / 'marker').exists()
+    assert (code / 'file.txt').read_text() == 'first'
+
+
+def test_update_sparse_clone(tmp_path):
+    repo = str(tmp_path / 'repo')
+    git = ['git', '-C', repo, '-c', 'user.name=ASSERT',
+           '-c', 'user.email=assert@example.com']
+    assert run_cmd(['git', 'init', '-q', '-b', 'main', repo])
+    for name in ['model', 'aux']:
+        (tmp_path / 'repo' / name).mkdir()
+        (tmp_path / 'repo' / name / 'file.txt').write_text(name)
+    assert run_cmd(git + ['add', '.'])
+    assert run_cmd(git + ['commit', '-q', '-m', 'first'])
+
+    # A sparse clone updated without sparse paths checks out every file
+    code = tmp_path / 'code'
+    git_clone(repo, str(code), 'main', sparse_paths=['model'])
+    (code / '.git' / 'marker').write_text('kept')
+    assert not (code / 'aux').exists()
+    assert git_update_clone(repo, str(code), 'main')
+    assert (code / '.git' / 'marker').exists()
+    assert (code / 'aux' / 'file.txt').exists()
+    # Updating a clone that is not sparse leaves it as it is
+    assert git_update_clone(repo, str(code), 'main')
+    assert (code / 'aux' / 'file.txt').exists()
+
+    # Likewise for a reused worktree of the mirror
+    mirror_root = str(tmp_path / 'mirrors')
+    worktree = tmp_path / 'worktree'
+    git_mirror_clone(repo, mirror_root, str(worktree), 'main',
+                     sparse_paths=['model'])
+    assert not (worktree / 'aux').exists()
+    git_mirror_clone(repo, mirror_root, str(worktree), 'main',
+                     overwrite=True)
+    assert (worktree / 'aux' / 'file.txt').exists()
+
+
+def test_same_repo_url(tmp_path):
+    assert same_repo_url('https://github.com/a/b.git',
+                         'https://github.com/a/b/')
+    assert not same_repo_url('https://github.com/a/b',
+                             'https://github.com/a/c')
+    assert same_repo_url(str(tmp_path), str(tmp_path / '..' /
+                                            tmp_path.name))
+
+
+def test_config_git_clone_profiles(tmp_path):
+    cmd = config_git_clone('https://github.com/a/b.git', 'b', 'main',
+                           filter_spec='blob:none',
+                           shallow_since='2024-01-31', sparse=True)
+    assert cmd == ['git', 'clone', '-b', 'main', '--filter=blob:none',
+                   '--shallow-since=2024-01-31', '--sparse',
+                   'https://github.com/a/b.git', 'b']
+    # Local repositories are cloned through file:// to honor the options
+    cmd = config_git_clone(str(tmp_path), 'b', clone_depth=1)
+    assert cmd[-2] == 'file://' + str(tmp_path)
+    assert config_git_clone(str(tmp_path), 'b')[-2] == str(tmp_path)
+
+
+def test_git_clone_profiles(tmp_path):
+    repo = str(tmp_path / 'repo')
+    git = ['git', '-C', repo, '-c', 'user.name=ASSERT',
+           '-c', 'user.email=assert@example.com']
+    assert run_cmd(['git', 'init', '-q', '-b', 'main', repo])
+    for name in ['model', 'aux', 'doc']:
+        (tmp_path / 'repo' / name).mkdir()
+        (tmp_path / 'repo' / name / 'file.txt').write_text(name)
+    (tmp_path / 'repo' / 'Makefile').write_text('')
+    assert run_cmd(git + ['add', '.'])
+    for date in ['2020-01-01T00:00:00', '2024-01-01T00:00:00']:
+        env = dict(os.environ, GIT_COMMITTER_DATE=date,
+                   GIT_AUTHOR_DATE=date)
+        assert run_cmd(git + ['commit', '-q', '--allow-empty', '-m', date],
+                       env=env)
+
+    code = tmp_path / 'code'
+    git_clone(repo, str(code), 'main', filter_spec='blob:none',
+              shallow_since='2023-01-01', sparse_paths=['model', 'aux'])
+    assert (code / 'Makefile').exists()
+    assert (code / 'model' / 'file.txt').exists()
+    assert (code / 'aux' / 'file.txt').exists()
+    assert not (code / 'doc').exists()
+    log = git_log(str(code))
+    assert len(log.splitlines()) == 1 and '2024-01-01' in log
+    assert git_log(str(code), since='2025-01-01') == ''
+
+    # No commit since the date: only the last one is cloned
+    git_clone(repo, str(tmp_path / 'recent'), 'main',
+              shallow_since='2030-01-01')
+    assert len(git_log(str(tmp_path / 'recent')).splitlines()) == 1
+
+    # Sparse worktrees of a partial mirror
+    mirror_root = str(tmp_path / 'mirrors')
+    git_mirror_clone(repo, mirror_root, str(tmp_path / 'worktree'),
+                     'main', filter_spec='blob:none',
+                     sparse_paths=['doc'])
+    assert (tmp_path / 'worktree' / 'doc' / 'file.txt').exists()
+    assert not (tmp_path / 'worktree' / 'model').exists()
+
+
+def test_probe_repo(tmp_path):
+    repo = str(tmp_path / 'repo')
+    git = ['git', '-C', repo, '-c', 'user.name=ASSERT',
+           '-c', 'user.email=assert@example.com']
+    assert run_cmd(['git', 'init', '-q', '-b', 'main', repo])
+    assert run_cmd(git + ['commit', '-q', '--allow-empty', '-m', 'first'])
+    assert run_cmd(git + ['branch', 'dev'])
+    first = sp.check_output(git + ['rev-parse', 'HEAD']).decode().strip()
+
+    clear_repo_probes()
+    probe = probe_repo(repo)
+    assert probe['reachable'] and probe['default'] == 'main'
+    assert probe['heads'] == {'main': first, 'dev': first}
+    assert check_repo_url(repo)
+
+    # Probes are reused until they expire
+    assert run_cmd(git + ['commit', '-q', '--allow-empty', '-m', 'second'])
+    assert probe_repo(repo) is probe
+    assert git_remote_revision(repo, 'main') == first
+    assert probe_repo(repo, ttl=0) is not probe
+    assert git_remote_revision(repo, 'main') != first
+    clear_repo_probes()
+    assert probe_repo(repo) is not probe
+
+    # Local directories and unreachable repositories
+    assert check_repo_url(str(tmp_path))
+    assert probe_repo(str(tmp_path))['heads'] == dict()
+    assert not check_repo_url(str(tmp_path / 'missing'))
+    assert not check_repo_url('git@host.invalid:model/repo.git')
+
+
+def test_pinned_clone(tmp_path):
+    repo = str(tmp_path / 'repo')
+    git = ['git', '-C', repo, '-c', 'user.name=ASSERT',
+           '-c', 'user.email=assert@example.com']
+    assert run_cmd(['git', 'init', '-q', '-b', 'main', repo])
+    assert run_cmd(git + ['commit', '-q', '--allow-empty', '-m', 'first'])
+    first = sp.check_output(git + ['rev-parse', 'HEAD']).decode().strip()
+    assert run_cmd(git + ['commit', '-q', '--allow-empty', '-m', 'second'])
+    second = sp.check_output(git + ['rev-parse', 'HEAD']).decode().strip()
+
+    # The branch moved past the pinned commit
+    code = tmp_path / 'code'
+    git_clone(repo, str(code), 'main', clone_depth=1, revision=first)
+    assert git_head_revision(str(code)) == first
+    assert confirm_git_clone(str(code), revision=first)
+    assert not confirm_git_clone(str(code), revision=second)
+    assert not confirm_git_clone(str(tmp_path))
+
+    git_clone(repo, str(code), 'main', overwrite=True, revision=second)
+    assert git_head_revision(str(code)) == second
+
+    git_mirror_clone(repo, str(tmp_path / 'mirrors'),
+                     str(tmp_path / 'worktree'), 'main', revision=first)
+    assert git_head_revision(str(tmp_path / 'worktree')) == first
@@ -0,0 +1,185 @@
+import os
+import time
+import pickle
+import pytest
+
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from src.lib.utils.batch import *
+from src.lib.utils.watcher import CompletionWatcher
+from test.lib.utils.fake_slurm import make_fake_slurm, get_calls
+
+
+def make_jobs(tmp_path, exit_codes: list[int],
+              cores: list[int] = None) -> list[dict]:
+    jobs = list()
+    for index, exit_code in enumerate(exit_codes):
+        run_dir = tmp_path / f'job{index}'
+        run_dir.mkdir()
+        script = run_dir / f'job{index}.bash'
+        script.write_text(f'echo job{index} > done\n'
+                          f'echo output{index}\n'
+                          f'exit {exit_code}\n')
+        jobs.append({'name': f'job{index}',
+                     'script': str(script),
+                     'cwd': str(run_dir),
+                     'cores': cores[index] if cores else 1,
+                     'walltime': '00:10:00'})
+    return jobs
+
+
+@pytest.mark.parametrize("system_cfg, backend",
+                         [({}, LocalBackend),
+                          ({'usebatch': False}, LocalBackend),
+                          ({'usebatch': 'no'}, LocalBackend),
+                          ({'usebatch': True, 'sponsorid': 's1001'},
+                           SlurmBackend),
+                          ({'usebatch': 'yes'}, SlurmBackend)])
+def test_get_batch_backend(system_cfg: dict, backend: type):
+    assert isinstance(get_batch_backend(system_cfg), backend)
+    assert use_batch(system_cfg) == (backend is SlurmBackend)
+
+
+def test_local_backend(tmp_path):
+    jobs = make_jobs(tmp_path, [0, 1, 0])
+    backend = LocalBackend(max_workers=2, interval=0.05)
+    assert backend.run(jobs) == ['COMPLETED', 'FAILED', 'COMPLETED']
+    for index in range(3):
+        assert (tmp_path / f'job{index}' / 'done').exists()
+        assert (tmp_path / f'job{index}' / f'job{index}.out')\
+            .read_text() == f'output{index}\n'
+
+
+def test_local_backend_env(tmp_path):
+    jobs = make_jobs(tmp_path, [0])
+    Path(jobs[0]['script']).write_text('echo $ASSERT_MODULES\n')
+    jobs[0]['env'] = dict(os.environ, ASSERT_MODULES='comp/intel')
+    backend = LocalBackend(interval=0.05)
+    assert backend.run(jobs) == ['COMPLETED']
+    assert (tmp_path / 'job0' / 'job0.out').read_text() == 'comp/intel\n'
+
+
+def test_local_backend_cancel(tmp_path):
+    script = tmp_path / 'sleep.bash'
+    script.write_text('sleep 30\n')
+    jobs = [{'name': f'sleep{index}', 'script': str(script)}
+            for index in range(2)]
+    backend = LocalBackend(max_workers=1, interval=0.05)
+    assert backend.run(jobs, timeout=0.2) == ['CANCELLED', 'CANCELLED']
+
+
+def test_slurm_backend(tmp_path):
+    commands = make_fake_slurm(tmp_path / 'bin')
+    backend = SlurmBackend(account='s1001', interval=0.1, **commands)
+    jobs = make_jobs(tmp_path, [0, 1, 0, 0, 1], cores=[1, 4, 1, 4, 1])
+
+    job_ids = backend.submit(jobs)
+    # One job array per number of cores
+    assert get_calls(tmp_path / 'bin') == ['sbatch', 'sbatch']
+    assert job_ids == ['1000_0', '1001_0', '1000_1', '1001_1', '1000_2']
+
+    polls = [0]
+    poll = backend.poll
+
+    def count_polls(job_ids):
+        polls[0] += 1
+        return poll(job_ids)
+
+    backend.poll = count_polls
+    states = backend.wait(job_ids, timeout=30)
+    assert [states[job_id] for job_id in job_ids] == \
+        ['COMPLETED', 'FAILED', 'COMPLETED', 'COMPLETED', 'FAILED']
+    for index in range(5):
+        assert (tmp_path / f'job{index}' / f'job{index}.out')\
+            .read_text() == f'output{index}\n'
+
+    # Status is polled in bulk: at most one squeue (and one sacct)
+    # per interval, whatever the number of jobs
+    calls = get_calls(tmp_path / 'bin')[2:]
+    assert calls.count('squeue') <= polls[0]
+    assert calls.count('sacct') <= calls.count('squeue')
+
+    array_script = (tmp_path / 'job1').glob('*.bash')
+    text = '\n'.join(path.read_text() for path in array_script)
+    assert '#SBATCH --array=0-1' in text
+    assert '#SBATCH --ntasks=4' in text
+    assert '#SBATCH --account=s1001' in text
+    assert '#SBATCH --time=00:10:00' in text
+
+
+def test_slurm_backend_cancel(tmp_path):
+    commands = make_fake_slurm(tmp_path / 'bin')
+    backend = SlurmBackend(interval=0.1, **commands)
+    script = tmp_path / 'sleep.bash'
+    script.write_text('sleep 2\n')
+    jobs = [{'name': f'sleep{index}', 'script': str(script)}
+            for index in range(3)]
+    states = backend.run(jobs, timeout=0.3)
+    assert states == ['CANCELLED'] * 3
+    assert 'scancel' in get_calls(tmp_path / 'bin')
+
+
+def test_wait_with_watcher(tmp_path):
+    jobs = make_jobs(tmp_path, [0, 3])
+    # Long interval: jobs are only polled early thanks to the watcher
+    backend = LocalBackend(max_workers=2, interval=30)
+    completed = list()
+    with CompletionWatcher([str(tmp_path)], interval=30) as watcher:
+        job_ids = backend.submit(jobs)
+        states = backend.wait(job_ids, timeout=20, watcher=watcher,
+                              on_complete=lambda job_id, state:
+                              completed.append((job_id, state)))
+    assert states == {job_ids[0]: 'COMPLETED', job_ids[1]: 'FAILED'}
+    assert sorted(completed) == sorted(states.items())
+    for index, exit_code in enumerate([0, 3]):
+        assert (tmp_path / f'job{index}' / f'job{index}.exit')\
+            .read_text() == f'{exit_code}\n'
+
+
+def test_wait_ignores_other_files(tmp_path):
+    jobs = make_jobs(tmp_path, [0])
+    # The job writes many other files before it ends
+    Path(jobs[0]['script']).write_text(
+        'for i in $(seq 50); do echo $i > log$i.txt; sleep 0.01; done\n'
+        'sleep 0.5\n')
+    backend = LocalBackend(interval=30)
+    polls = list()
+    poll = backend.poll
+    backend.poll = lambda job_ids: polls.append(job_ids) or poll(job_ids)
+    with CompletionWatcher([str(tmp_path)], suffixes=['.exit'],
+                           interval=30) as watcher:
+        job_ids = backend.submit(jobs)
+        states = backend.wait(job_ids, timeout=20, watcher=watcher)
+    assert states == {job_ids[0]: 'COMPLETED'}
+    # Polled when waiting starts and once the exit marker appears
+    assert len(polls) == 2
+
+
+def test_batch_queue(tmp_path):
+    commands = make_fake_slurm(tmp_path / 'bin')
+    # Long interval: jobs are only polled early thanks to exit markers
+    queue = BatchQueue(SlurmBackend(interval=30, **commands), delay=0.5)
+    jobs = make_jobs(tmp_path, [0, 1, 0, 0], cores=[1, 4, 1, 4])
+
+    # Jobs queued by concurrent callers share the job arrays
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = list(pool.map(queue.submit, [jobs[:2], jobs[2:]]))
+    states = [future.result(timeout=20) for future in sum(futures, [])]
+    assert states == ['COMPLETED', 'FAILED', 'COMPLETED', 'COMPLETED']
+    assert get_calls(tmp_path / 'bin').count('sbatch') == 2
+    # A single thread polls them, and stops once they all ended
+    time.sleep(1)
+    assert queue.thread is None
+
+    # Jobs past their timeout are cancelled
+    script = tmp_path / 'sleep.bash'
+    script.write_text('sleep 5\n')
+    future = queue.submit([{'name': 'sleep', 'script': str(script)}],
+                          timeout=0.5)[0]
+    assert future.result(timeout=20) == 'CANCELLED'
+
+    # Copies (eg. in worker processes) get their own queue
+    copy = pickle.loads(pickle.dumps(queue))
+    assert copy.backend.account == queue.backend.account
+    assert copy.thread is None and copy.running == dict()
@@ -0,0 +1,84 @@
+import os
+import pytest
+from pathlib import Path
+
+from src.lib.utils.build_cache import *
+
+key1 = {'tree': '4b825dc642cb6eb9a060e54bf8d69288fbee4904',
+        'rundeck': 'E1oM20', 'compiler': 'intel',
+        'compiler_version': '2021.3.0', 'mode': 'mpi',
+        'buildtype': 'traps', 'modelerc': 'MODELERC=...'}
+key2 = dict(key1, mode='serial')
+
+
+def make_build(path: Path) -> dict[str, str]:
+    (path / 'decks' / 'E1oM20_bin').mkdir(parents=True)
+    (path / 'decks' / 'E1oM20_bin' / 'E1oM20.exe').write_text('exe')
+    (path / 'model' / 'shared').mkdir(parents=True)
+    (path / 'model' / 'main.o').write_text('object')
+    (path / 'model' / 'main.F90').write_text('source')
+    (path / 'model' / 'shared' / 'constant.mod').write_text('module')
+    return {'bin': str(path / 'decks' / 'E1oM20_bin'),
+            'objects': str(path / 'model')}
+
+
+def test_get_build_cache_dir():
+    assert get_build_cache_dir({'build_cache_dir': '/tmp/b'}, '/s') == \
+        '/tmp/b'
+    assert get_build_cache_dir({}, '/s') == '/s/build_cache'
+    assert get_build_cache_dir({}).endswith('builds')
+
+
+def test_link_file(tmp_path):
+    (tmp_path / 'source').write_text('data')
+    (tmp_path / 'destination').write_text('old')
+    assert link_file(str(tmp_path / 'source'),
+                     str(tmp_path / 'destination')) == 'hardlink'
+    assert (tmp_path / 'destination').read_text() == 'data'
+    assert (tmp_path / 'destination').stat().st_ino == \
+        (tmp_path / 'source').stat().st_ino
+
+
+def test_link_tree(tmp_path):
+    artifacts = make_build(tmp_path / 'build')
+    (tmp_path / 'build' / 'model' / 'link.o').symlink_to('main.o')
+    count = link_tree(artifacts['objects'], str(tmp_path / 'objects'),
+                      patterns=['*.o', '*.mod'])
+    assert count == 3
+    assert (tmp_path / 'objects' / 'shared' / 'constant.mod').exists()
+    assert not (tmp_path / 'objects' / 'main.F90').exists()
+    assert os.readlink(tmp_path / 'objects' / 'link.o') == 'main.o'
+
+
+def test_store_and_restore(tmp_path):
+    cache = BuildCache(str(tmp_path / 'cache'))
+    artifacts = make_build(tmp_path / 'build')
+    patterns = {'objects': ['*.o', '*.mod']}
+    assert not cache.restore(key1, artifacts)
+
+    # Missing artifacts are not cached
+    assert not cache.store(key1, dict(artifacts, exe='missing'))
+    assert cache.store(key1, artifacts, patterns=patterns)
+    entry = cache.get_entry(key1)
+    assert (entry / 'key.json').exists()
+    assert not (entry / 'objects' / 'main.F90').exists()
+    # No temporary directories are left behind
+    assert [path.name for path in entry.parent.iterdir()] == [entry.name]
+    # Stored again by another instance: the first copy is kept
+    assert cache.store(key1, artifacts, patterns=patterns)
+
+    restored = {'bin': str(tmp_path / 'restored' / 'decks' / 'E1oM20_bin'),
+                'objects': str(tmp_path / 'restored' / 'model')}
+    assert not cache.restore(key2, restored)
+    assert cache.restore(key1, restored)
+    exe = Path(restored['bin']) / 'E1oM20.exe'
+    assert exe.read_text() == 'exe'
+    assert exe.stat().st_ino == \
+        (entry / 'bin' / 'E1oM20.exe').stat().st_ino
+    assert (Path(restored['objects']) / 'shared' /
+            'constant.mod').read_text() == 'module'
+    # Cached files can't be changed through the builds sharing them
+    assert not os.access(exe, os.W_OK) or os.geteuid() == 0
+
+    # Incomplete entries are ignored
+    assert not cache.restore(key1, dict(restored, lib='lib'))
@@ -0,0 +1,152 @@
+import os
+import sys
+import asyncio
+import shutil
+import pytest
+import subprocess as sp
+from pathlib import Path
+
+from src.lib.utils.checkout import *
+from src.lib.utils.vcs import GitBackend, CvsBackend
+
+GIT = ['git', '-c', 'user.name=ASSERT', '-c', 'user.email=assert@example.com']
+
+
+def make_git_repo(path: Path, text: str) -> str:
+    sp.check_call(['git', 'init', '-q', '-b', 'main', str(path)])
+    (path / 'file.txt').write_text(text)
+    sp.check_call(GIT + ['-C', str(path), 'add', 'file.txt'])
+    sp.check_call(GIT + ['-C', str(path), 'commit', '-q', '-m', text])
+    return 'file://' + str(path)
+
+
+def test_get_backend(tmp_path):
+    manager = get_checkout_manager({'checkout_workers': 2,
+                                    'checkout_retries': 1})
+    assert (manager.max_workers, manager.retries) == (2, 1)
+    assert isinstance(manager.get_backend('cvs'), CvsBackend)
+    manager = CheckoutManager(timeout=5, commands={'git': '/opt/git'})
+    backend = manager.get_backend('git')
+    assert isinstance(backend, GitBackend)
+    assert (backend.executable, backend.timeout) == ('/opt/git', 5)
+    with pytest.raises(Exception):
+        manager.get_backend('hg')
+
+
+@pytest.mark.parametrize("error, transient",
+                         [('fatal: unable to access: Could not resolve '
+                           'host: github.com', True),
+                          ('fatal: the remote end hung up unexpectedly',
+                           True),
+                          ('The requested URL returned error: 503', True),
+                          ("fatal: repository 'x' does not exist", False),
+                          ('cvs checkout: could not find module', False)])
+def test_is_transient(error, transient):
+    assert is_transient(error) == transient
+
+
+def test_run_git_checkouts(tmp_path):
+    cwd = os.getcwd()
+    specs = [{'name': f'repo{i}', 'type': 'git',
+              'repo_url': make_git_repo(tmp_path / f'repo{i}', f'repo{i}'),
+              'branch_name': 'main', 'clone_depth': 1,
+              'directory_name': str(tmp_path / 'checkouts' / f'repo{i}')}
+             for i in range(3)]
+    specs.append({'name': 'missing', 'type': 'git',
+                  'repo_url': 'file://' + str(tmp_path / 'missing'),
+                  'directory_name': str(tmp_path / 'checkouts' /
+                                        'missing')})
+
+    results = CheckoutManager(max_workers=2, backoff=0.01).run(specs)
+    assert os.getcwd() == cwd
+    assert [result['name'] for result in results] == \
+        ['repo0', 'repo1', 'repo2', 'missing']
+    assert [result['success'] for result in results] == \
+        [True, True, True, False]
+    assert all(result['revision'] for result in results[:3])
+    for i in range(3):
+        assert (tmp_path / 'checkouts' / f'repo{i}' /
+                'file.txt').read_text() == f'repo{i}'
+    # Permanent failures are not retried
+    assert results[-1]['attempts'] == 1
+    assert results[-1]['error']
+
+
+def test_retry_transient_failures(tmp_path):
+    url = make_git_repo(tmp_path / 'repo', 'repo')
+    # Fails twice with a network error, then runs git
+    fake_git = tmp_path / 'git'
+    fake_git.write_text(
+        f'#!{sys.executable}\n'
+        f'import os, sys\n'
+        f'from pathlib import Path\n'
+        f'counter = Path({str(tmp_path / "counter")!r})\n'
+        f'count = int(counter.read_text()) if counter.exists() else 0\n'
+        f'counter.write_text(str(count + 1))\n'
+        f'if count < 2:\n'
+        f'    sys.exit("fatal: Connection reset by peer")\n'
+        f'os.execvp("git", ["git"] + sys.argv[1:])\n'
+    )
+    fake_git.chmod(0o755)
+    spec = {'type': 'git', 'repo_url': url,
+            'directory_name': str(tmp_path / 'checkout')}
+
+    manager = CheckoutManager(retries=3, backoff=0.01,
+                              commands={'git': str(fake_git)})
+    result = asyncio.run(manager.checkout(spec))
+    assert result['success'] and result['attempts'] == 3
+    assert (tmp_path / 'checkout' / 'file.txt').exists()
+
+    # Gives up after the last retry
+    (tmp_path / 'counter').unlink()
+    shutil.rmtree(tmp_path / 'checkout')
+    manager.retries = 1
+    result = asyncio.run(manager.checkout(spec))
+    assert not result['success'] and result['attempts'] == 2
+    assert 'Connection reset' in result['error']
+
+
+def test_backoff():
+    manager = CheckoutManager(backoff=2, max_backoff=5)
+    assert [manager.get_delay(attempt) for attempt in range(1, 5)] == \
+        [2, 4, 5, 5]
+
+
+@pytest.mark.skipif(shutil.which('cvs') is None, reason='cvs not found')
+def test_run_cvs_checkout(tmp_path):
+    cvs_root = str(tmp_path / 'cvsroot')
+    sp.check_call(['cvs', '-d', cvs_root, 'init'])
+    module = tmp_path / 'module'
+    module.mkdir()
+    (module / 'file.txt').write_text('cvs')
+    sp.check_call(['cvs', '-Q', '-d', cvs_root, 'import', '-m', 'import',
+                   'GEOSgcm', 'vendor', 'start'], cwd=str(module))
+
+    results = CheckoutManager().run([
+        {'type': 'cvs', 'repo_url': cvs_root, 'module': 'GEOSgcm',
+         'directory_name': str(tmp_path / 'checkouts' / 'baseline')}
+    ])
+    assert results[0]['success']
+    assert (tmp_path / 'checkouts' / 'baseline' /
+            'file.txt').read_text() == 'cvs'
+
+
+@pytest.mark.skipif(shutil.which('svnadmin') is None,
+                    reason='svn not found')
+def test_run_svn_checkout(tmp_path):
+    svn_root = tmp_path / 'svnroot'
+    sp.check_call(['svnadmin', 'create', str(svn_root)])
+    trunk = tmp_path / 'trunk'
+    trunk.mkdir()
+    (trunk / 'file.txt').write_text('svn')
+    sp.check_call(['svn', '--quiet', 'import', '-m', 'import', str(trunk),
+                   f'file://{svn_root}/trunk'])
+
+    results = CheckoutManager().run([
+        {'type': 'svn', 'repo_url': f'file://{svn_root}',
+         'branch_name': 'trunk',
+         'directory_name': str(tmp_path / 'checkouts' / 'geosctm')}
+    ])
+    assert results[0]['success']
+    assert (tmp_path / 'checkouts' / 'geosctm' /
+            'file.txt').read_text() == 'svn'
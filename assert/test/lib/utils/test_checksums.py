@@ -0,0 +1,80 @@
+import hashlib
+import threading
+from pathlib import Path
+
+from src.lib.utils.checksums import *
+
+
+def test_hash_file(tmp_path):
+    data = bytes(range(256)) * 1000
+    (tmp_path / 'fort.1').write_bytes(data)
+    assert hash_file(str(tmp_path / 'fort.1'), chunk_size=1000) == \
+        hashlib.sha256(data).hexdigest()
+    assert hash_file(str(tmp_path / 'fort.1'), algorithm='md5') == \
+        hashlib.md5(data).hexdigest()
+
+
+def test_compare_files(tmp_path):
+    data = bytes(range(256)) * 1000
+    (tmp_path / 'a').write_bytes(data)
+    (tmp_path / 'b').write_bytes(data)
+    (tmp_path / 'c').write_bytes(data[:-1] + b'\0')
+    (tmp_path / 'd').write_bytes(data[:-1])
+    assert compare_files(str(tmp_path / 'a'), str(tmp_path / 'b'),
+                         chunk_size=1000)
+    assert not compare_files(str(tmp_path / 'a'), str(tmp_path / 'c'),
+                             chunk_size=1000)
+    assert not compare_files(str(tmp_path / 'a'), str(tmp_path / 'd'))
+
+
+def test_wait_for_file(tmp_path):
+    checkpoint = tmp_path / 'fort.1'
+    done = threading.Event()
+
+    def write() -> None:
+        with open(checkpoint, 'wb') as fid:
+            for _ in range(3):
+                fid.write(b'x' * 1000)
+                fid.flush()
+                done.wait(0.15)
+        done.set()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    assert wait_for_file(str(checkpoint), lambda: False, interval=0.1)
+    thread.join()
+    assert checkpoint.stat().st_size == 3000
+
+    # The writer ended without writing it
+    assert not wait_for_file(str(tmp_path / 'fort.2'), lambda: True)
+
+
+def test_wait_for_signaled_file(tmp_path):
+    checkpoint = tmp_path / 'fort.1'
+    signal = tmp_path / 'fort.2'
+    done = threading.Event()
+
+    def write() -> None:
+        # Pauses mid-write for several polls
+        with open(checkpoint, 'wb') as fid:
+            fid.write(b'x' * 1000)
+            fid.flush()
+            done.wait(0.6)
+            fid.write(b'x' * 1000)
+        signal.write_text('next')
+        done.wait(0.3)
+        done.set()
+
+    def ready() -> bool:
+        return signal.exists()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    assert wait_for_file(str(checkpoint), done.is_set, interval=0.1,
+                         ready=ready)
+    assert checkpoint.stat().st_size == 2000
+    thread.join()
+
+    assert get_file_state(str(checkpoint)) == \
+        (2000, checkpoint.stat().st_mtime_ns)
+    assert get_file_state(str(tmp_path / 'fort.3')) is None
@@ -0,0 +1,212 @@
+import os
+import time
+import pytest
+
+from src.lib.utils.executor import *
+from src.lib.utils.scheduler import AdaptiveLimit
+
+
+def square_after(value: int, delay: float) -> tuple[int, int]:
+    time.sleep(delay)
+    return value * value, os.getpid()
+
+
+@pytest.mark.parametrize("system_cfg, max_workers",
+                         [({}, 1), ({'max_workers': None}, 1),
+                          ({'max_workers': 4}, 4),
+                          ({'max_workers': '8'}, 8),
+                          ({'max_workers': 0}, 1),
+                          ({'max_workers': -3}, 1),
+                          ({'max_workers': 'many'}, 1)])
+def test_get_max_workers(system_cfg: dict, max_workers: int):
+    assert get_max_workers(system_cfg) == max_workers
+
+
+def test_run_serial():
+    executor = TestExecutor(max_workers=1)
+    results = executor.run(square_after, [(2, 0), (3, 0)])
+    assert [res[0] for res in results] == [4, 9]
+    assert {res[1] for res in results} == {os.getpid()}
+
+
+def test_run_parallel_keeps_job_order():
+    # Earlier jobs finish last but results stay in job order
+    jobs = [(1, 0.3), (2, 0.2), (3, 0.1), (4, 0.0)]
+    executor = TestExecutor(max_workers=4)
+    results = executor.run(square_after, jobs)
+    assert [res[0] for res in results] == [1, 4, 9, 16]
+    assert os.getpid() not in {res[1] for res in results}
+
+
+def record_order(name: str, delay: float, log: str) -> str:
+    time.sleep(delay)
+    with open(log, 'a') as fid:
+        fid.write(name + '\n')
+    return name
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_run_with_dependencies(tmp_path, max_workers: int):
+    log = str(tmp_path / 'order.log')
+    jobs = [('short', 0.0, log), ('child', 0.0, log),
+            ('parent', 0.2, log), ('fail', 0.0, log),
+            ('after_fail', 0.0, log)]
+    executor = TestExecutor(max_workers=max_workers)
+    results = executor.run(record_order, jobs,
+                           dependencies={1: [2], 4: [3]},
+                           is_success=lambda name: name != 'fail',
+                           on_skip=lambda name, *_: 'skipped ' + name)
+    assert results == ['short', 'child', 'parent', 'fail',
+                       'skipped after_fail']
+
+    with open(log) as fid:
+        order = fid.read().split()
+    assert order.index('parent') < order.index('child')
+    assert 'after_fail' not in order
+    if max_workers == 1:
+        # Longest critical path (parent -> child) runs first
+        assert order[0] == 'parent'
+
+
+@pytest.mark.parametrize("system_cfg, stage_workers",
+                         [({}, {}), ({'pipeline': None}, {}),
+                          ({'pipeline': 4}, {}),
+                          ({'pipeline': {'clone': 8, 'BUILD': '2'}},
+                           {'CLONE': 8, 'BUILD': 2, 'RUN': 1}),
+                          ({'pipeline': {'run': 'x', 'build': 0}},
+                           {'CLONE': 1, 'BUILD': 1, 'RUN': 1})])
+def test_get_stage_workers(system_cfg: dict, stage_workers: dict):
+    stages = ['CLONE', 'BUILD', 'RUN']
+    assert get_stage_workers(system_cfg, stages) == stage_workers
+
+
+def test_pipeline_stages_overlap():
+    events = list()
+
+    def stage_func(stage: str, name: str) -> bool:
+        events.append(('start', stage, name))
+        time.sleep(0.05 if stage == 'BUILD' else 0.01)
+        events.append(('end', stage, name))
+        return not (stage == 'BUILD' and name == 'bad')
+
+    jobs = [('a',), ('b',), ('bad',), ('child',)]
+    executor = PipelineExecutor({'CLONE': 2, 'BUILD': 1, 'RUN': 1})
+    results = executor.run(stage_func, jobs, dependencies={3: [2]})
+
+    assert results == [{'CLONE': True, 'BUILD': True, 'RUN': True},
+                       {'CLONE': True, 'BUILD': True, 'RUN': True},
+                       {'CLONE': True, 'BUILD': False},
+                       {}]
+
+    # The single BUILD slot is never shared, and some test is
+    # cloned while another one is being built
+    in_progress = {'CLONE': 0, 'BUILD': 0, 'RUN': 0}
+    overlap = False
+    for event, stage, _ in events:
+        in_progress[stage] += 1 if event == 'start' else -1
+        assert in_progress['BUILD'] <= 1
+        overlap |= in_progress['CLONE'] > 0 and in_progress['BUILD'] > 0
+    assert overlap
+
+
+def record_times(name: str, delay: float, log: str) -> str:
+    start = time.time()
+    time.sleep(delay)
+    with open(log, 'a') as fid:
+        fid.write(f'{name} {start} {time.time()}\n')
+    return name
+
+
+def max_cores_in_use(log: str, cores: dict[str, int]) -> int:
+    events = list()
+    with open(log) as fid:
+        for line in fid:
+            name, start, end = line.split()
+            events.append((float(start), cores[name]))
+            events.append((float(end), -cores[name]))
+    in_use = peak = 0
+    for _, change in sorted(events, key=lambda e: (e[0], e[1])):
+        in_use += change
+        peak = max(peak, in_use)
+    return peak
+
+
+def test_run_within_core_budget(tmp_path):
+    log = str(tmp_path / 'times.log')
+    names = ['mpi88', 'mpi22a', 'mpi22b', 'serial1', 'serial2']
+    cores = {'mpi88': 88, 'mpi22a': 22, 'mpi22b': 22,
+             'serial1': 1, 'serial2': 1}
+    jobs = [(name, 0.2 if name.startswith('mpi') else 0.05, log)
+            for name in names]
+
+    executor = TestExecutor(max_workers=5, max_cores=24)
+    results = executor.run(record_times, jobs,
+                           cores={i: cores[name]
+                                  for i, name in enumerate(names)})
+    assert results == names
+
+    # 88 cores are clamped to the whole budget
+    cores['mpi88'] = 24
+    assert max_cores_in_use(log, cores) <= 24
+
+    # Serial runs backfill next to a 22-core run
+    with open(log) as fid:
+        times = {line.split()[0]: float(line.split()[1]) for line in fid}
+    assert times['serial1'] < times['mpi22b']
+
+
+def test_pipeline_within_core_budget(tmp_path):
+    log = str(tmp_path / 'times.log')
+    cores = {'a': 4, 'b': 4, 'c': 2, 'd': 1}
+
+    def stage_func(stage: str, name: str) -> bool:
+        if stage == 'RUN':
+            record_times(name, 0.05, log)
+        return True
+
+    executor = PipelineExecutor({'CLONE': 4, 'RUN': 4}, max_cores=5)
+    executor.run(stage_func, [(name,) for name in cores],
+                 cores={i: cores[name] for i, name in enumerate(cores)})
+    assert max_cores_in_use(log, cores) <= 5
+
+
+def test_run_within_adaptive_limit(tmp_path):
+    log = str(tmp_path / 'times.log')
+    names = ['a', 'b', 'c', 'd']
+    # The node is too loaded for more than one job at a time
+    limit = AdaptiveLimit(min_workers=1, max_workers=4, max_load=0.001,
+                          interval=0.05)
+    limit.limit = 1
+
+    executor = TestExecutor(max_workers=4, limit=limit)
+    assert executor.run(record_times, [(name, 0.1, log)
+                                       for name in names]) == names
+    assert max_cores_in_use(log, {name: 1 for name in names}) == 1
+
+    # Stages of all pools count towards the limit
+    log = str(tmp_path / 'stages.log')
+    executor = PipelineExecutor({'CLONE': 4, 'RUN': 4}, limit=limit)
+    executor.run(lambda stage, name: bool(record_times(stage + name,
+                                                       0.05, log)),
+                 [(name,) for name in names])
+    assert max_cores_in_use(log, {stage + name: 1 for name in names
+                                  for stage in ['CLONE', 'RUN']}) == 1
+
+
+def test_pipeline_logs_changed_depths(monkeypatch):
+    messages = list()
+    monkeypatch.setattr('src.lib.utils.executor.logger.info',
+                        messages.append)
+    # The scheduler loop wakes up every 10 ms while the job runs
+    limit = AdaptiveLimit(min_workers=1, max_workers=4, interval=0.01)
+
+    def stage_func(stage: str, name: str) -> bool:
+        time.sleep(0.3)
+        return True
+
+    executor = PipelineExecutor({'CLONE': 1, 'RUN': 1}, limit=limit)
+    executor.run(stage_func, [('a',)])
+    depths = [message for message in messages
+              if message.startswith('Pipeline')]
+    # Once per stage the job enters
+    assert len(depths) == 2
@@ -0,0 +1,64 @@
+import pytest
+
+from src.lib.utils.history import *
+
+key1 = {'rundeck': 'E1oM20', 'compiler': 'intel', 'mode': 'mpi',
+        'npes': [1, 4], 'verification': 'restartRun'}
+key2 = dict(key1, mode='serial')
+
+
+@pytest.mark.parametrize("seconds, walltime",
+                         [(0, '00:01:00'), (59, '00:01:00'),
+                          (61, '00:02:00'), (5400, '01:30:00'),
+                          (25199, '07:00:00')])
+def test_format_walltime(seconds: float, walltime: str):
+    assert format_walltime(seconds) == walltime
+
+
+@pytest.mark.parametrize("walltime, seconds",
+                         [('00:10:00', 600), ('4:00:00', 14400),
+                          ('01:30:00', 5400), ('55:00', 3300)])
+def test_parse_walltime(walltime: str, seconds: float):
+    assert parse_walltime(walltime) == seconds
+
+
+def test_make_history_key():
+    assert make_history_key(key1) == make_history_key(
+        dict(reversed(list(key1.items())))
+    )
+
+
+def test_get_history_file():
+    assert get_history_file({'history_file': '/tmp/h.jsonl'}) == \
+        '/tmp/h.jsonl'
+    assert get_history_file({}).endswith('durations.jsonl')
+
+
+def test_record_and_predict(tmp_path):
+    history_file = str(tmp_path / 'history' / 'durations.jsonl')
+    history = DurationHistory(history_file, percentile=90, margin=0.5,
+                              max_samples=10)
+    assert history.predict(key1, ['RUN']) is None
+
+    for seconds in range(1, 21):
+        history.record(key1, 'RUN', seconds * 10)
+    history.record(key1, 'BUILD', 100, usage={'user_time': 350.5,
+                                              'max_rss': 2048})
+    assert '"usage": {"user_time": 350.5' in \
+        Path(history_file).read_text().splitlines()[-1]
+
+    # Partially written records are ignored
+    with open(history_file, 'a') as fid:
+        fid.write('{"key": "broken')
+
+    reloaded = DurationHistory(history_file, percentile=90, margin=0.5,
+                               max_samples=10)
+    reloaded.load()
+    # Only the 10 most recent runs are kept (110 to 200)
+    assert reloaded.durations(key1, 'RUN') == \
+        [float(s * 10) for s in range(11, 21)]
+    assert reloaded.predict(key1, ['RUN']) == 190 * 1.5
+    assert reloaded.predict(key1, ['BUILD', 'RUN']) == (100 + 190) * 1.5
+    assert reloaded.predict(key2, ['BUILD', 'RUN']) is None
+    # Stages without history are not left out of the sum
+    assert reloaded.predict(key1, ['BUILD', 'RUN', 'COMPARE']) is None
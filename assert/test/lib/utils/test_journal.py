@@ -0,0 +1,63 @@
+import pytest
+import datetime as dt
+
+from src.lib.utils.journal import *
+
+
+def test_run_id():
+    start = dt.datetime(2024, 1, 31, 23, 59, 58)
+    assert get_run_id(start) == '20240131_235958'
+    assert get_run_start(get_run_id(start)) == start
+
+
+@pytest.mark.parametrize("run_id", ['', '2024-01-31', '20240131'])
+def test_invalid_run_id(run_id: str):
+    with pytest.raises(Exception):
+        get_run_start(run_id)
+
+
+def test_get_journal_file():
+    assert get_journal_file({'journal_dir': '/tmp/journals'},
+                            '20240131_235958') == \
+        '/tmp/journals/20240131_235958.jsonl'
+    assert get_journal_file({}, '20240131_235958').endswith(
+        'journals/20240131_235958.jsonl'
+    )
+
+
+def test_record_and_load(tmp_path):
+    journal_file = str(tmp_path / 'journals' / 'run.jsonl')
+    journal = RunJournal(journal_file)
+    assert journal.load() == dict()
+
+    journal.record('E1oM20', '/scratch/E1oM20/intel-mpi', 'CLONE', True)
+    journal.record('E1oM20', '/scratch/E1oM20/intel-mpi', 'BUILD', False)
+    journal.record('E1oM20', '/scratch/E1oM20/gfortran-mpi', 'CLONE',
+                   True)
+    # The last result of a stage wins
+    journal.record('E1oM20', '/scratch/E1oM20/intel-mpi', 'BUILD', True)
+
+    # A crash while writing leaves a partial last line
+    with open(journal_file, 'a') as fid:
+        fid.write('{"test": "E1oM20", "directory": "/scr')
+
+    assert RunJournal(journal_file).load() == {
+        ('E1oM20', '/scratch/E1oM20/intel-mpi'): {'CLONE': True,
+                                                  'BUILD': True},
+        ('E1oM20', '/scratch/E1oM20/gfortran-mpi'): {'CLONE': True}
+    }
+
+
+def test_record_revision(tmp_path):
+    journal_file = str(tmp_path / 'run.jsonl')
+    journal = RunJournal(journal_file)
+    assert journal.load_revision() is None
+
+    journal.record_revision('abc123')
+    journal.record('E1oM20', '/scratch/E1oM20/intel-mpi', 'CLONE', True)
+    journal.record_revision('def456')
+    # The commit is not mistaken for a stage result
+    assert RunJournal(journal_file).load() == {
+        ('E1oM20', '/scratch/E1oM20/intel-mpi'): {'CLONE': True}
+    }
+    assert RunJournal(journal_file).load_revision() == 'def456'
@@ -0,0 +1,100 @@
+import os
+import time
+import pytest
+from pathlib import Path
+
+from src.lib.utils.modules import *
+
+
+def make_modulecmd(path: Path) -> str:
+    # Stand-in for Lmod/Tcl modulecmd: every module adds its bin
+    # directory to PATH, and every call is logged
+    path.mkdir(parents=True, exist_ok=True)
+    modulecmd = path / 'modulecmd'
+    modulecmd.write_text(
+        '#!/bin/bash\n'
+        f'echo "$@" >> {path / "calls.log"}\n'
+        'shift\n'
+        'if [ "$1" = purge ]; then\n'
+        '  echo "unset LOADEDMODULES;"\n'
+        '  exit 0\n'
+        'fi\n'
+        'shift\n'
+        'for module in "$@"; do\n'
+        '  if [ "$module" = missing ]; then\n'
+        '    echo "ERROR: Unable to locate $module" >&2\n'
+        '    echo "false;"\n'
+        '    exit 0\n'
+        '  fi\n'
+        '  echo "export PATH=/opt/$module/bin:\\$PATH;"\n'
+        'done\n'
+        'echo "export LOADEDMODULES=\'$(IFS=:; echo "$*")\';"\n'
+    )
+    modulecmd.chmod(0o755)
+    return str(modulecmd)
+
+
+def get_calls(path: Path) -> list[str]:
+    calls = path / 'calls.log'
+    return calls.read_text().splitlines() if calls.exists() else list()
+
+
+def test_get_module_lists():
+    system_cfg = {'modulelist': 'intel_intelmpi, gcc_openmpi',
+                  'intel_intelmpi': 'comp/intel/2021.3.0,mpi/impi/2021.3.0',
+                  'gcc_openmpi': ['comp/gcc/10.1.0', 'mpi/hpcx/2.4.0']}
+    assert get_module_lists(system_cfg) == {
+        'intel_intelmpi': ['comp/intel/2021.3.0', 'mpi/impi/2021.3.0'],
+        'gcc_openmpi': ['comp/gcc/10.1.0', 'mpi/hpcx/2.4.0']}
+    assert get_module_lists({}) == dict()
+
+
+def test_get_modulecmd(monkeypatch):
+    assert get_modulecmd({'modulecmd': '/usr/bin/modulecmd'}) == \
+        '/usr/bin/modulecmd'
+    monkeypatch.setenv('LMOD_CMD', '/opt/lmod/libexec/lmod')
+    assert get_modulecmd({}) == '/opt/lmod/libexec/lmod'
+    monkeypatch.delenv('LMOD_CMD')
+    monkeypatch.delenv('MODULESHOME', raising=False)
+    assert get_modulecmd({}) == 'modulecmd'
+
+
+def test_apply_env_diff():
+    env = {'PATH': '/usr/bin', 'LOADEDMODULES': 'old'}
+    assert apply_env_diff({'PATH': '/opt/bin:/usr/bin',
+                           'LOADEDMODULES': None}, env) == \
+        {'PATH': '/opt/bin:/usr/bin'}
+    assert env == {'PATH': '/usr/bin', 'LOADEDMODULES': 'old'}
+
+
+def test_resolve(tmp_path, monkeypatch):
+    monkeypatch.setenv('LOADEDMODULES', 'previous')
+    modulecmd = make_modulecmd(tmp_path / 'bin')
+    modules = ['comp/intel/2021.3.0', 'mpi/impi/2021.3.0']
+    resolver = ModuleResolver(str(tmp_path / 'cache'), modulecmd)
+
+    diff = resolver.resolve(modules)
+    assert diff['PATH'] == '/opt/mpi/impi/2021.3.0/bin:' \
+        '/opt/comp/intel/2021.3.0/bin:' + os.environ['PATH']
+    assert diff['LOADEDMODULES'] == 'comp/intel/2021.3.0:mpi/impi/2021.3.0'
+    assert 'SHLVL' not in diff and 'HOME' not in diff
+    assert get_calls(tmp_path / 'bin') == ['bash purge',
+                                           'bash load ' + ' '.join(modules)]
+
+    # Resolved once: later lookups (from other instances or
+    # processes) read the cache
+    env = ModuleResolver(str(tmp_path / 'cache'), modulecmd).get_env(modules)
+    assert env['PATH'] == diff['PATH']
+    assert len(get_calls(tmp_path / 'bin')) == 2
+    assert len(list((tmp_path / 'cache').glob('*.json'))) == 1
+
+    # Differences cached before the run started are resolved again
+    resolver = ModuleResolver(str(tmp_path / 'cache'), modulecmd,
+                              since=time.time() + 60)
+    resolver.resolve(modules)
+    assert len(get_calls(tmp_path / 'bin')) == 4
+
+    # Module lists that don't load aren't cached
+    with pytest.raises(Exception, match='Unable to locate'):
+        resolver.resolve(['missing'])
+    assert not resolver.get_file(['missing']).exists()
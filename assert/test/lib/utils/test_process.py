@@ -0,0 +1,101 @@
+import sys
+import time
+import pytest
+from pathlib import Path
+
+from src.lib.utils.process import *
+from src.lib.utils.watchdog import RunWatchdog
+
+
+def test_run_process(tmp_path):
+    log_file = tmp_path / 'logs' / 'build.log'
+    result = run_process([sys.executable, '-u', '-c',
+                          'import sys\n'
+                          'for i in range(1000): print(f"line {i}")\n'
+                          'sys.stderr.write("error\\n")\n'
+                          'data = bytearray(64 * 1024 * 1024)\n'
+                          'sys.exit(2)'],
+                         log_file=str(log_file), tail_lines=3)
+    assert result['returncode'] == 2
+    assert not result['timed_out']
+    # Only the tail is kept in memory, the whole output is logged
+    assert result['tail'] == ['line 998', 'line 999', 'error']
+    lines = log_file.read_text().splitlines()
+    assert lines[0].startswith(f'$ {sys.executable} -u -c')
+    assert len([line for line in lines if line.startswith('line ')]) == 1000
+    assert lines[-1].startswith('# exit 2')
+    # Resource usage of the command (KiB)
+    assert result['max_rss'] > 64 * 1024
+    assert result['user_time'] + result['system_time'] > 0
+    assert 'max RSS' in format_usage(result)
+
+    # Output is appended
+    run_process(['echo', 'again'], log_file=str(log_file))
+    assert 'again' in log_file.read_text().splitlines()
+
+
+def test_long_lines(tmp_path):
+    result = run_process([sys.executable, '-c',
+                          'print("x" * 200000, end="")'])
+    assert result['returncode'] == 0
+    assert len(''.join(result['tail'])) == 200000
+
+
+def test_timeout(tmp_path):
+    # Ignores SIGTERM, so it is killed after the grace period, and
+    # leaves a child holding the output open
+    script = ('import signal, subprocess, time\n'
+              'signal.signal(signal.SIGTERM, signal.SIG_IGN)\n'
+              'subprocess.Popen(["sleep", "60"])\n'
+              'print("started", flush=True)\n'
+              'time.sleep(60)')
+    start = time.monotonic()
+    result = run_process([sys.executable, '-c', script], timeout=0.5,
+                         grace=0.5)
+    assert time.monotonic() - start < 10
+    assert result['timed_out']
+    assert result['returncode'] == -9
+    assert result['tail'] == ['started']
+    assert format_usage(result).startswith('timed out')
+
+    # Terminated gracefully when it handles SIGTERM
+    result = run_process(['sleep', '60'], timeout=0.2)
+    assert result['returncode'] == -15
+
+
+def test_watchdog(tmp_path):
+    log_file = tmp_path / 'run.log'
+    watchdog = RunWatchdog([str(log_file)], stall_interval=0.5,
+                           interval=0.1)
+    result = run_process([sys.executable, '-u', '-c',
+                          'import time\n'
+                          'for step in range(5):\n'
+                          '    print(step); time.sleep(0.2)\n'
+                          'time.sleep(60)'],
+                         log_file=str(log_file), watchdog=watchdog,
+                         timeout=30)
+    assert result['hung'] and not result['timed_out']
+    assert result['returncode'] == -15
+    assert result['tail'] == ['0', '1', '2', '3', '4']
+    assert '=== ' in result['stacks']
+    assert log_file.read_text().splitlines()[-1].startswith('# hung')
+
+    # Commands that end are not hung
+    result = run_process(['true'], watchdog=RunWatchdog(
+        [str(log_file)], stall_interval=0.5, interval=0.1))
+    assert result['returncode'] == 0 and not result['hung']
+
+
+def test_missing_command(tmp_path):
+    with pytest.raises(OSError):
+        run_process([str(tmp_path / 'missing')],
+                    log_file=str(tmp_path / 'missing.log'))
+
+
+def test_merge_usage():
+    result = {'user_time': 1.25, 'system_time': 0.5, 'max_rss': 2048}
+    usage = merge_usage(dict(), get_usage(result))
+    merge_usage(usage, {'commands': 2, 'user_time': 1.0,
+                        'system_time': 0.25, 'max_rss': 1024})
+    assert usage == {'commands': 3, 'user_time': 2.25,
+                     'system_time': 0.75, 'max_rss': 2048}
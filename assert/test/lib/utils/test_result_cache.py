@@ -0,0 +1,40 @@
+import pytest
+
+from src.lib.utils.result_cache import *
+
+key1 = {'revision': 'c6342e1588fba48bc7c35c01e1ffc9318456b580',
+        'testcase': {'name': 'E1oM20', 'npes': [1, 4]},
+        'compiler_version': '2021.3.0'}
+key2 = dict(key1, compiler_version='2021.4.0')
+report = {'RUNDECK': 'E1oM20', 'COMPILER': 'intel', 'MODE': 'mpi',
+          'CLONE': True, 'BUILD': True, 'RUN': False, 'COMPARE': False}
+
+
+def test_get_result_cache_dir():
+    assert get_result_cache_dir({'result_cache_dir': '/tmp/r'}) == '/tmp/r'
+    assert get_result_cache_dir({}).endswith('results')
+
+
+def test_make_cache_key():
+    reordered = {'compiler_version': '2021.3.0',
+                 'testcase': {'npes': [1, 4], 'name': 'E1oM20'},
+                 'revision': 'c6342e1588fba48bc7c35c01e1ffc9318456b580'}
+    assert make_cache_key(key1) == make_cache_key(reordered)
+    assert make_cache_key(key1) != make_cache_key(key2)
+    assert len(make_cache_key(key1)) == 64
+
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path / 'results'))
+    assert cache.get(key1) is None
+
+    cache.put(key1, report)
+    assert cache.get(key1) == report
+    assert cache.get(key2) is None
+    # No temporary files are left behind
+    assert [path.suffix for path in
+            cache.get_file(key1).parent.iterdir()] == ['.json']
+
+    # Unreadable results are ignored
+    cache.get_file(key1).write_text('{"test_report": ')
+    assert cache.get(key1) is None
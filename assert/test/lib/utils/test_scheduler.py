@@ -0,0 +1,179 @@
+import pytest
+
+from src.lib.utils.scheduler import *
+
+
+def test_unknown_dependency():
+    with pytest.raises(Exception):
+        DagScheduler({'A': ['Z'], 'B': []})
+
+
+@pytest.mark.parametrize("dependencies",
+                         [{'A': ['A']},
+                          {'A': ['B'], 'B': ['A']},
+                          {'A': [], 'B': ['A', 'D'], 'C': ['B'],
+                           'D': ['C']}])
+def test_cycle_detected(dependencies):
+    with pytest.raises(Exception, match='cycle'):
+        DagScheduler(dependencies)
+
+
+def test_critical_path_first():
+    # Short independent jobs are listed first but the chain
+    # E1oM20 -> E6TmatrixF40 must start first
+    dependencies = {'SGP4TESTS': [], 'EM20': [],
+                    'E1oM20': [], 'E6TmatrixF40': ['E1oM20']}
+    weights = {'SGP4TESTS': 1, 'EM20': 2,
+               'E1oM20': 2, 'E6TmatrixF40': 4}
+    scheduler = DagScheduler(dependencies, weights)
+    assert scheduler.critical_path('E1oM20') == 6
+    assert scheduler.ready() == ['E1oM20', 'EM20', 'SGP4TESTS']
+
+
+def test_release_on_parent_finish():
+    scheduler = DagScheduler({'A': [], 'B': ['A'], 'C': ['A', 'B']})
+    assert scheduler.ready() == ['A']
+    scheduler.start('A')
+    assert scheduler.ready() == []
+    scheduler.finish('A')
+    assert scheduler.ready() == ['B']
+    scheduler.start('B')
+    scheduler.finish('B')
+    assert scheduler.ready() == ['C']
+    scheduler.start('C')
+    scheduler.finish('C')
+    assert scheduler.done()
+
+
+def test_failure_skips_dependents():
+    scheduler = DagScheduler({'A': [], 'B': ['A'], 'C': ['B'], 'D': []})
+    scheduler.start('A')
+    assert scheduler.finish('A', success=False) == ['B', 'C']
+    assert scheduler.ready() == ['D']
+    scheduler.start('D')
+    scheduler.finish('D')
+    assert scheduler.done()
+
+
+@pytest.mark.parametrize("system_cfg, max_cores",
+                         [({'max_cores': 48}, 48),
+                          ({'max_cores': '12'}, 12),
+                          ({'max_cores': -2}, 1)])
+def test_get_max_cores(system_cfg: dict, max_cores: int):
+    assert get_max_cores(system_cfg) == max_cores
+
+
+def test_get_max_cores_default():
+    assert get_max_cores({}) >= 1
+    assert get_max_cores({'max_cores': 'all'}) == get_max_cores({})
+
+
+def test_core_budget():
+    budget = CoreBudget(48)
+    assert budget.request(88) == 48
+    assert budget.request(0) == 1
+    budget.acquire(44)
+    assert budget.fits(4) and not budget.fits(22)
+    budget.release(44)
+    assert budget.fits(48)
+
+
+def write_proc(proc_dir, load: float, busy: int, iowait: int,
+               available: int):
+    proc_dir.mkdir(exist_ok=True)
+    (proc_dir / 'loadavg').write_text(f'{load} 1.00 1.00 2/300 4000\n')
+    (proc_dir / 'stat').write_text(f'cpu  {busy} 0 0 1000 {iowait} '
+                                   f'0 0 0 0 0\ncpu0 1 2 3 4 5\n')
+    (proc_dir / 'meminfo').write_text(f'MemTotal:  1000 kB\n'
+                                      f'MemFree:  10 kB\n'
+                                      f'MemAvailable:  {available} kB\n')
+
+
+def test_read_system_load(tmp_path):
+    write_proc(tmp_path, 3.5, 200, 50, 250)
+    load = read_system_load(str(tmp_path))
+    assert load == {'load': 3.5, 'cpu_times': (1250, 50),
+                    'free_memory': 0.25}
+    assert read_system_load(str(tmp_path / 'missing')) == \
+        {'load': None, 'cpu_times': None, 'free_memory': None}
+
+
+@pytest.mark.parametrize("system_cfg, bounds",
+                         [({}, None), ({'adaptive': False}, None),
+                          ({'adaptive': True}, (1, 8)),
+                          ({'adaptive': {'min_workers': 2}}, (2, 8)),
+                          ({'adaptive': {'min_workers': 'x'}}, None),
+                          ({'adaptive': {'max_workers': 4,
+                                         'min_workers': 6}}, (4, 4))])
+def test_get_adaptive_limit(system_cfg: dict, bounds: tuple):
+    limit = get_adaptive_limit(system_cfg, 8)
+    if bounds is None:
+        assert limit is None
+    else:
+        assert (limit.min_workers, limit.max_workers) == bounds
+
+
+def test_adaptive_limit(tmp_path):
+    write_proc(tmp_path, 1.0, 100, 0, 800)
+    limit = AdaptiveLimit(min_workers=2, max_workers=6, max_load=8,
+                          max_iowait=0.2, min_free_memory=0.1,
+                          interval=0, proc_dir=str(tmp_path))
+    assert limit.limit == 4
+
+    # Idle node: one more job each sample, up to the upper bound
+    for expected in [5, 6, 6]:
+        write_proc(tmp_path, 1.0, 100, 0, 800)
+        assert limit.update() == expected
+
+    # Loaded, waiting for I/O, or short of memory: one job less
+    # each sample, down to the lower bound
+    for load, iowait, available, expected in [(9.0, 0, 800, 5),
+                                              (1.0, 500, 800, 4),
+                                              (1.0, 500, 50, 3),
+                                              (9.0, 500, 50, 2),
+                                              (9.0, 500, 50, 2)]:
+        busy = limit.cpu_times[0] + 100 - limit.cpu_times[1]
+        write_proc(tmp_path, load, busy, limit.cpu_times[1] + iowait,
+                   available)
+        assert limit.update() == expected
+
+    # In between: unchanged
+    write_proc(tmp_path, 7.0, 100, 0, 800)
+    assert limit.update() == 2
+
+
+def test_adaptive_limit_interval(tmp_path):
+    write_proc(tmp_path, 1.0, 100, 0, 800)
+    limit = AdaptiveLimit(min_workers=1, max_workers=4, interval=3600,
+                          max_load=8, proc_dir=str(tmp_path))
+    assert limit.update() == 3
+    # Not sampled again before the interval has elapsed
+    assert limit.update() == 3
+
+
+def test_job_token_pool(tmp_path):
+    pool = JobTokenPool(str(tmp_path / 'cores.json'), max_cores=16,
+                        build_slots=2)
+    # Model runs hold their cores, builds share the rest
+    run, cores = pool.acquire('run', 6)
+    assert cores == 6
+    build1, jobs1 = pool.acquire('build')
+    assert jobs1 == 5
+    build2, jobs2 = pool.acquire('build')
+    assert jobs2 == 5
+    # Builds always get a job
+    _, jobs3 = pool.acquire('build')
+    assert jobs3 == 1
+    pool.release(run)
+    pool.release(build1)
+    assert sum(holder['cores'] for holder in pool.read().values()) == 6
+    _, jobs4 = pool.acquire('build')
+    assert jobs4 == 8
+
+    # Holders of processes that are gone are dropped
+    pool.write({'stale': {'kind': 'run', 'cores': 16, 'pid': 2 ** 22 + 1}})
+    pool.build_slots = 1
+    with pool.hold('build') as jobs:
+        assert jobs == 16
+        assert len(pool.read()) == 1
+    assert pool.read() == dict()
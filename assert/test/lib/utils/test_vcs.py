@@ -0,0 +1,194 @@
+import sys
+import time
+import shutil
+import asyncio
+import pytest
+import subprocess as sp
+from pathlib import Path
+
+from src.lib.utils.vcs import *
+from src.lib.utils.access_repo import get_repo, get_mirror_dir
+from src.lib.utils.paths import lock_path
+
+GIT = ['git', '-c', 'user.name=ASSERT', '-c', 'user.email=assert@example.com']
+
+
+def make_git_repo(path: Path) -> list[str]:
+    sp.check_call(['git', 'init', '-q', '-b', 'main', str(path)])
+    revisions = list()
+    for text in ['first', 'second']:
+        (path / 'file.txt').write_text(text)
+        sp.check_call(GIT + ['-C', str(path), 'add', 'file.txt'])
+        sp.check_call(GIT + ['-C', str(path), 'commit', '-q', '-m', text])
+        revisions.append(sp.check_output(
+            ['git', '-C', str(path), 'rev-parse', 'HEAD']).decode().strip())
+    return revisions
+
+
+def test_get_vcs_backend():
+    assert isinstance(get_vcs_backend('git'), GitBackend)
+    assert isinstance(get_vcs_backend('cvs'), CvsBackend)
+    assert isinstance(get_vcs_backend('svn'), SvnBackend)
+    with pytest.raises(Exception):
+        get_vcs_backend('hg')
+
+
+def test_git_checkout(tmp_path):
+    first, second = make_git_repo(tmp_path / 'repo')
+    backend = GitBackend()
+    code = tmp_path / 'tests' / 'code'
+
+    result = asyncio.run(backend.checkout(str(tmp_path / 'repo'), str(code),
+                                          'main', clone_depth=1))
+    assert result['directory'] == str(code)
+    assert result['revision'] == second
+    assert result['bytes'] == get_dir_size(str(code)) > 0
+    assert result['duration'] >= 0
+    assert (code / 'file.txt').read_text() == 'second'
+
+    # Existing directories are only replaced if asked to
+    with pytest.raises(Exception):
+        asyncio.run(backend.checkout(str(tmp_path / 'repo'), str(code)))
+    result = asyncio.run(backend.checkout(str(tmp_path / 'repo'), str(code),
+                                          'main', revision=first,
+                                          overwrite=True))
+    assert result['revision'] == first
+    assert asyncio.run(backend.get_revision(str(code))) == first
+
+    result = asyncio.run(backend.update(str(code), 'main'))
+    assert result['revision'] == second
+
+    with pytest.raises(Exception):
+        asyncio.run(backend.checkout(str(tmp_path / 'missing'),
+                                     str(tmp_path / 'other')))
+
+
+def test_get_repo(tmp_path):
+    _, second = make_git_repo(tmp_path / 'repo')
+    result = get_repo(repo_type='git', repo_url=str(tmp_path / 'repo'),
+                      directory_name=str(tmp_path / 'code'))
+    assert result['revision'] == second
+
+    result = get_repo(repo_type='git', repo_url=str(tmp_path / 'repo'),
+                      directory_name=str(tmp_path / 'worktree'),
+                      mirror_root=str(tmp_path / 'mirrors'))
+    assert result['revision'] == second
+    assert (tmp_path / 'worktree' / 'file.txt').read_text() == 'second'
+
+
+def test_cancel_mirror_update(tmp_path):
+    make_git_repo(tmp_path / 'repo')
+    mirror_root = str(tmp_path / 'mirrors')
+    mirror_dir = get_mirror_dir(mirror_root, str(tmp_path / 'repo'))
+    backend = GitBackend()
+
+    async def cancel() -> None:
+        task = asyncio.create_task(backend.update_mirror(
+            str(tmp_path / 'repo'), mirror_root))
+        await asyncio.sleep(0.5)
+        assert not task.done()
+        task.cancel()
+        await task
+
+    # Waiting for the lock of a mirror (held by another run) stops
+    # when cancelled
+    with lock_path(mirror_dir):
+        start = time.monotonic()
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(cancel())
+        assert time.monotonic() - start < 5
+    assert not Path(mirror_dir).exists()
+    assert asyncio.run(backend.update_mirror(str(tmp_path / 'repo'),
+                                             mirror_root)) == mirror_dir
+
+
+def test_stderr_streaming(tmp_path):
+    backend = VcsBackend(sys.executable)
+    code, output, error = asyncio.run(backend.run(
+        ['-c', 'import sys; print("out"); '
+               'sys.stderr.write("line 1\\nline 2\\n"); sys.exit(3)'],
+        str(tmp_path)))
+    assert code == 3
+    assert output == 'out\n'
+    assert error == 'line 1\nline 2'
+
+    with pytest.raises(Exception):
+        asyncio.run(backend.check(['-c', 'import sys; sys.exit(1)'],
+                                  str(tmp_path), 'test'))
+
+
+def test_cancellation(tmp_path):
+    backend = VcsBackend(sys.executable)
+    marker = tmp_path / 'marker'
+    script = ['-c', 'import os, time; '
+                    f'open({str(marker)!r}, "w").write(str(os.getpid())); '
+                    'time.sleep(60)']
+
+    async def cancel() -> None:
+        task = asyncio.create_task(backend.run(script, str(tmp_path)))
+        while not marker.exists() or not marker.read_text():
+            await asyncio.sleep(0.05)
+        task.cancel()
+        await task
+
+    start = time.monotonic()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancel())
+    assert time.monotonic() - start < 30
+    # The command was terminated
+    assert not Path(f'/proc/{marker.read_text()}').exists() or \
+        'Z' in Path(f'/proc/{marker.read_text()}/stat').read_text()
+
+    backend.timeout = 0.5
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(backend.run(script, str(tmp_path)))
+
+
+@pytest.mark.skipif(shutil.which('cvs') is None, reason='cvs not found')
+def test_cvs_checkout(tmp_path):
+    cvs_root = str(tmp_path / 'cvsroot')
+    sp.check_call(['cvs', '-d', cvs_root, 'init'])
+    module = tmp_path / 'module'
+    module.mkdir()
+    (module / 'file.txt').write_text('cvs')
+    sp.check_call(['cvs', '-Q', '-d', cvs_root, 'import', '-m', 'import',
+                   'GEOSgcm', 'vendor', 'start'], cwd=str(module))
+
+    result = asyncio.run(CvsBackend().checkout(
+        cvs_root, str(tmp_path / 'builds' / 'GEOSgcm'), module='GEOSgcm'))
+    assert result['revision'] == 'HEAD'
+    assert (tmp_path / 'builds' / 'GEOSgcm' / 'file.txt').read_text() == \
+        'cvs'
+
+
+@pytest.mark.skipif(shutil.which('svnadmin') is None,
+                    reason='svn not found')
+def test_svn_checkout(tmp_path):
+    svn_root = tmp_path / 'svnroot'
+    sp.check_call(['svnadmin', 'create', str(svn_root)])
+    trunk = tmp_path / 'trunk'
+    trunk.mkdir()
+    (trunk / 'file.txt').write_text('svn')
+    sp.check_call(['svn', '--quiet', 'import', '-m', 'import', str(trunk),
+                   f'file://{svn_root}/trunk'])
+
+    result = asyncio.run(SvnBackend().checkout(
+        f'file://{svn_root}', str(tmp_path / 'geosctm_repo'),
+        branch_name='trunk'))
+    assert result['revision'] == '1'
+    assert (tmp_path / 'geosctm_repo' / 'file.txt').read_text() == 'svn'
+
+    # Updating to another branch switches the checkout to it
+    sp.check_call(['svn', '--quiet', 'copy', '-m', 'branch',
+                   f'file://{svn_root}/trunk', f'file://{svn_root}/b1'])
+    backend = SvnBackend()
+    with pytest.raises(Exception):
+        asyncio.run(backend.update(str(tmp_path / 'geosctm_repo'),
+                                   branch_name='b1'))
+    result = asyncio.run(backend.update(str(tmp_path / 'geosctm_repo'),
+                                        branch_name='b1',
+                                        repo_url=f'file://{svn_root}'))
+    assert result['revision'] == '2'
+    url = sp.check_output(['svn', 'info', '--show-item', 'url',
+                           str(tmp_path / 'geosctm_repo')]).decode()
+    assert url.strip() == f'file://{svn_root}/b1'
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import subprocess as sp
+from pathlib import Path
+
+from src.lib.utils.watchdog import *
+
+
+def test_process_tree():
+    parent = sp.Popen([sys.executable, '-c',
+                       'import subprocess, time\n'
+                       'subprocess.Popen(["sleep", "30"])\n'
+                       'while True: pass'])
+    try:
+        for _ in range(100):
+            tree = get_process_tree(parent.pid)
+            if len(tree) == 2:
+                break
+            time.sleep(0.05)
+        assert tree[0] == parent.pid and len(tree) == 2
+        assert read_stat(tree[1])[1] == str(parent.pid)
+        time.sleep(0.3)
+        assert get_cpu_time(tree) > 0
+        assert os.getpid() not in tree
+    finally:
+        sp.run(['kill', str(get_process_tree(parent.pid)[-1])])
+        parent.kill()
+        parent.wait()
+    assert read_stat(parent.pid) is None
+
+
+def test_files_state(tmp_path):
+    assert get_files_state([str(tmp_path / 'missing')]) == (0, 0, 0.0)
+    (tmp_path / 'output').mkdir()
+    (tmp_path / 'output' / 'acc').write_text('12')
+    (tmp_path / 'run.log').write_text('123')
+    count, size, _ = get_files_state([str(tmp_path / 'run.log'),
+                                      str(tmp_path / 'output')])
+    assert (count, size) == (2, 5)
+
+
+def test_sample_stacks():
+    process = sp.Popen(['sleep', '30'])
+    try:
+        stacks = sample_stacks(process.pid, timeout=10)
+    finally:
+        process.kill()
+        process.wait()
+    assert stacks.startswith(f'=== {process.pid}: sleep 30')
+
+
+def test_check(tmp_path):
+    log = tmp_path / 'run.log'
+    log.write_text('')
+    process = sp.Popen(['sleep', '30'])
+    try:
+        watchdog = RunWatchdog([str(log)], stall_interval=0.3,
+                               interval=0.1)
+        assert not watchdog.check(process.pid)
+        # Output is progress
+        for _ in range(5):
+            time.sleep(0.1)
+            with open(log, 'a') as fid:
+                fid.write('step\n')
+            assert not watchdog.check(process.pid)
+        time.sleep(0.4)
+        assert watchdog.check(process.pid)
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_check_spinning(tmp_path):
+    # Uses CPU without writing output (eg. spinning in MPI)
+    process = sp.Popen([sys.executable, '-c', 'while True: pass'])
+    try:
+        watchdog = RunWatchdog([str(tmp_path / 'run.log')],
+                               stall_interval=0.3, max_silence=1.2,
+                               interval=0.1, min_cpu=0.01)
+        start = time.monotonic()
+        while not watchdog.check(process.pid):
+            time.sleep(0.1)
+        assert time.monotonic() - start >= 1.2
+    finally:
+        process.kill()
+        process.wait()
@@ -0,0 +1,103 @@
+import os
+import time
+import shutil
+import pytest
+import threading
+
+from src.lib.utils.watcher import *
+
+
+def write_later(path, delay: float = 0.2) -> threading.Timer:
+    def write():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('done\n')
+    timer = threading.Timer(delay, write)
+    timer.start()
+    return timer
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_existing_files(tmp_path, use_inotify: bool):
+    (tmp_path / 'intel').mkdir()
+    (tmp_path / 'intel' / 'E1oM20.mpi.diff').write_text('')
+    (tmp_path / 'intel' / 'E1oM20.mpi.out').write_text('')
+    (tmp_path / 'E1oM20.serial.err').write_text('')
+
+    with CompletionWatcher([str(tmp_path)], interval=60,
+                           use_inotify=use_inotify) as watcher:
+        assert watcher.poll(0) == [str(tmp_path / 'E1oM20.serial.err'),
+                                   str(tmp_path / 'intel' /
+                                       'E1oM20.mpi.diff')]
+        # Files are only reported once
+        assert watcher.poll(0) == []
+
+
+def test_inotify_events(tmp_path):
+    with CompletionWatcher([str(tmp_path)], interval=60) as watcher:
+        assert watcher.fd is not None
+        assert watcher.poll(0) == []
+
+        # Reported as soon as written, long before the next rescan
+        marker = tmp_path / 'job.exit'
+        timer = write_later(marker)
+        assert next(watcher.watch(timeout=5)) == str(marker)
+        timer.join()
+
+        # New subdirectories are watched too
+        nested = tmp_path / 'gfortran' / 'serial' / 'E1oM20.diff'
+        timer = write_later(nested)
+        assert next(watcher.watch(timeout=5)) == str(nested)
+        timer.join()
+
+        # Files without a completion suffix are ignored
+        timer = write_later(tmp_path / 'job.exit.tmp', delay=0)
+        timer.join()
+        assert list(watcher.watch(timeout=0.3)) == []
+
+
+def test_scan_fallback(tmp_path):
+    with CompletionWatcher([str(tmp_path)], interval=0.1,
+                           use_inotify=False) as watcher:
+        assert watcher.fd is None
+        marker = tmp_path / 'run' / 'job.exit'
+        timer = write_later(marker)
+        assert next(watcher.watch(timeout=5)) == str(marker)
+        timer.join()
+
+
+def test_other_files_keep_waiting(tmp_path):
+    with CompletionWatcher([str(tmp_path)], suffixes=['.exit'],
+                           interval=60) as watcher:
+        assert watcher.poll(0) == []
+        timers = [write_later(tmp_path / f'log{index}.txt', delay=0.05)
+                  for index in range(5)]
+        marker = tmp_path / 'job.exit'
+        timers.append(write_later(marker, delay=0.5))
+        # Not woken up for good by the log files
+        assert watcher.poll(5) == [str(marker)]
+        for timer in timers:
+            timer.join()
+        start = time.monotonic()
+        (tmp_path / 'log.txt').write_text('')
+        assert watcher.poll(0.3) == []
+        assert time.monotonic() - start >= 0.3
+
+
+def test_add_path(tmp_path):
+    run_dir = tmp_path / 'run'
+    run_dir.mkdir()
+    with CompletionWatcher([], suffixes=['.exit'], interval=60) as watcher:
+        watcher.add_path(str(run_dir))
+        assert watcher.poll(0) == []
+        timer = write_later(run_dir / 'first.exit')
+        assert watcher.poll(5) == [str(run_dir / 'first.exit')]
+        timer.join()
+
+        # Directories cleaned up and created again are watched again
+        shutil.rmtree(run_dir)
+        assert watcher.poll(0.1) == []
+        run_dir.mkdir()
+        watcher.add_path(str(run_dir))
+        timer = write_later(run_dir / 'second.exit')
+        assert watcher.poll(5) == [str(run_dir / 'second.exit')]
+        timer.join()
@@ -1,10 +1,20 @@
+import sys
+import json
+import time
 import pytest
 import datetime as dt
 import tempfile as tmp
+import subprocess as sp
 import src.lib.utils.paths as paths
 
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from src.models.model_e.model_e_reg import ModelEReg
+from src.lib.utils.checksums import hash_file
+from src.lib.utils.batch import LocalBackend, SlurmBackend, BatchQueue
+from test.lib.utils.test_modules import make_modulecmd, get_calls
+from test.lib.utils.fake_slurm import make_fake_slurm
+from test.lib.utils.fake_slurm import get_calls as get_slurm_calls
 
 paths.create_dir('scratch_test-model-e-reg')
 scratch_dir = Path.cwd() / 'scratch_test-model-e-reg'
@@ -37,3 +47,682 @@ def test_reset_scratch():
 
 
 file1.close()
+
+
+def test_resume_from_journal(tmp_path):
+    yaml_file = tmp_path / 'resume.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        'systemconfig:\n',
+        f'systemconfig:\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  history_file: {str(tmp_path / "durations.jsonl")}\n'
+    ))
+    start_time = dt.datetime(2024, 1, 31, 23, 59, 58)
+    test_dir = str(tmp_path / 'E1oM20' / 'intel-mpi')
+
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=start_time)
+    assert reg.run_id == '20240131_235958'
+    assert reg.run_stage('BUILD', 'E1oM20', test_dir)
+    assert not reg.run_stage('UNKNOWN', 'E1oM20', test_dir)
+
+    # Journaled stages are not performed again when resuming
+    resumed = ModelEReg(yaml_file=str(yaml_file), start_time=start_time,
+                        resume=True)
+    assert resumed.journaled == {
+        ('E1oM20', test_dir): {'BUILD': True, 'UNKNOWN': False}
+    }
+    resumed.compile = None
+    assert resumed.run_stage('BUILD', 'E1oM20', test_dir)
+    assert not resumed.run_stage('UNKNOWN', 'E1oM20', test_dir)
+
+    # A new run does not reuse the journal
+    assert not ModelEReg(yaml_file=str(yaml_file),
+                         start_time=start_time).journaled
+
+
+def test_result_cache(tmp_path):
+    repo = str(tmp_path / 'repo')
+    paths.create_dir(repo)
+    git = ['git', '-C', repo, '-c', 'user.name=ASSERT',
+           '-c', 'user.email=assert@example.com']
+    sp.check_call(['git', 'init', '-q', '-b', 'main', repo])
+    sp.check_call(git + ['commit', '-q', '--allow-empty', '-m', 'first'])
+
+    yaml_file = tmp_path / 'cache.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        'modelconfig:\n',
+        f'modelconfig:\n'
+        f'   repository: {repo}\n'
+        f'   repo_branch: main\n'
+        f'   buildtype: traps\n'
+    ).replace(
+        'systemconfig:\n',
+        f'systemconfig:\n'
+        f'  result_cache_dir: {str(tmp_path / "results")}\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  modules: yes\n'
+        f'  compiler_versions: 2021.3.0\n'
+    ))
+    jobs = [('Test Case 1', str(tmp_path / 'Test Case 1' / 'intel-mpi')),
+            ('Test Case 2', str(tmp_path / 'Test Case 2' / 'intel-mpi'))]
+    reports = [{'RUNDECK': 'Test Case 1', 'COMPILER': 'intel',
+                'MODE': 'mpi', 'CLONE': True, 'BUILD': False,
+                'RUN': False, 'COMPARE': False},
+               {'RUNDECK': 'Test Case 2', 'COMPILER': 'intel',
+                'MODE': 'mpi', 'CLONE': False, 'BUILD': False,
+                'RUN': False, 'COMPARE': False}]
+
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    assert reg.get_cached_results(jobs) == dict()
+    reg.cache_results(jobs, reports)
+
+    # Only tests that got past their first operation are cached
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    reg.cached = reg.get_cached_results(jobs)
+    assert reg.cached == {jobs[0]: reports[0]}
+    assert reg.run_stage('CLONE', *jobs[0])
+    assert not reg.run_stage('BUILD', *jobs[0])
+
+    # Forced runs bypass the cache
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now(),
+                    force=True)
+    assert reg.get_cached_results(jobs) == dict()
+
+    # A new commit invalidates the cache
+    sp.check_call(git + ['commit', '-q', '--allow-empty', '-m', 'second'])
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    assert reg.get_cached_results(jobs) == dict()
+
+
+def test_build_cache(tmp_path):
+    yaml_file = tmp_path / 'builds.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        'modelconfig:\n',
+        'modelconfig:\n'
+        '   buildtype: traps\n'
+    ).replace(
+        'systemconfig:\n',
+        f'systemconfig:\n'
+        f'  build_cache_dir: {str(tmp_path / "builds")}\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  modules: yes\n'
+        f'  compiler_versions: 2021.3.0\n'
+    ))
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    test_dirs = [str(tmp_path / run / mode) for run, mode in
+                 [('first', 'intel-mpi'), ('first', 'intel-serial'),
+                  ('second', 'intel-mpi')]]
+    for test_dir in test_dirs:
+        code = str(Path(test_dir) / 'code')
+        sp.check_call(['git', 'init', '-q', '-b', 'main', code])
+        Path(code, 'Makefile').write_text('all:')
+        sp.check_call(['git', '-C', code, '-c', 'user.name=ASSERT',
+                       '-c', 'user.email=assert@example.com', 'add', '.'])
+        sp.check_call(['git', '-C', code, '-c', 'user.name=ASSERT',
+                       '-c', 'user.email=assert@example.com', 'commit',
+                       '-q', '-m', 'first'])
+
+    key = reg.get_build_key('E1oM20', test_dirs[0])
+    assert key['mode'] == 'mpi' and key['buildtype'] == 'traps'
+    assert key['tree'] == reg.get_build_key('E1oM20', test_dirs[2])['tree']
+    assert reg.get_build_key('E1oM20', str(tmp_path)) is None
+
+    # The first build is cached and restored in the identical one
+    artifacts = reg.get_build_artifacts('E1oM20', test_dirs[0])
+    paths.create_dir(artifacts['bin'])
+    Path(artifacts['bin'], 'E1oM20.exe').write_text('exe')
+    paths.create_dir(artifacts['objects'])
+    Path(artifacts['objects'], 'main.o').write_text('object')
+    assert not reg.restore_build('E1oM20', test_dirs[0])
+    reg.compile('E1oM20', test_dirs[0])
+
+    assert not reg.restore_build('E1oM20', test_dirs[1])
+    assert reg.restore_build('E1oM20', test_dirs[2])
+    restored = reg.get_build_artifacts('E1oM20', test_dirs[2])
+    assert Path(restored['bin'], 'E1oM20.exe').read_text() == 'exe'
+    assert Path(restored['objects'], 'main.o').read_text() == 'object'
+
+
+def test_out_of_source_build(tmp_path):
+    repo = str(tmp_path / 'repo')
+    sp.check_call(['git', 'init', '-q', '-b', 'main', repo])
+    (tmp_path / 'repo' / 'decks').mkdir()
+    (tmp_path / 'repo' / 'decks' / 'Makefile').write_text('gcm:')
+    sp.check_call(['git', '-C', repo, 'add', '.'])
+    sp.check_call(['git', '-C', repo, '-c', 'user.name=ASSERT',
+                   '-c', 'user.email=assert@example.com', 'commit', '-q',
+                   '-m', 'first'])
+    # Records its targets and "links" executables, failing if
+    # another gcm build uses the same build directory
+    make = tmp_path / 'make'
+    make.write_text(
+        f'#!{sys.executable}\n'
+        f'import os, sys, time\n'
+        f'from pathlib import Path\n'
+        f'args = dict(arg.split("=", 1) for arg in sys.argv[5:])\n'
+        f'with open({str(tmp_path / "make.log")!r}, "a") as log:\n'
+        f'    log.write(sys.argv[4] + " " + args.get("RUN", "") + "\\n")\n'
+        f'busy = Path(args.get("BUILDDIR", ".")) / "gcm.busy"\n'
+        f'if sys.argv[4] == "gcm":\n'
+        f'    busy.parent.mkdir(parents=True, exist_ok=True)\n'
+        f'    os.close(os.open(busy, os.O_CREAT | os.O_EXCL))\n'
+        f'time.sleep(0.2)\n'
+        f'if sys.argv[4] == "gcm":\n'
+        f'    busy.unlink()\n'
+        f'    Path(args["EXECDIR"]).mkdir(parents=True)\n'
+        f'    (Path(args["EXECDIR"]) / (args["RUN"] + ".exe")).touch()\n'
+    )
+    make.chmod(0o755)
+
+    yaml_file = tmp_path / 'oos.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        'modelconfig:\n',
+        f'modelconfig:\n'
+        f'   repository: {repo}\n'
+        f'   repo_branch: main\n'
+    ).replace(
+        f'  scratchdir: {str(scratch_dir)}\n',
+        f'  scratchdir: {str(tmp_path / "scratch")}\n'
+        f'  makesystem: makeNew\n'
+        f'  make: {str(make)}\n'
+        f'  use_mirror: no\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  history_file: {str(tmp_path / "durations.jsonl")}\n'
+        f'  build_cache_dir: {str(tmp_path / "builds")}\n'
+        f'  max_cores: 4\n'
+    ))
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    assert reg.is_out_of_source()
+    jobs = [(test_name, str(tmp_path / test_name / f'intel-{mode}'))
+            for test_name in ['E1oM20', 'E4F40', 'E4TcadF40']
+            for mode in ['serial', 'mpi']]
+
+    def build(job: tuple) -> bool:
+        return reg.run_stage('CLONE', *job) and reg.run_stage('BUILD', *job)
+
+    with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+        assert all(pool.map(build, jobs))
+
+    # One clone and one build of the shared objects per compiler
+    shared = reg.get_shared_dir('intel')
+    assert (shared / 'code' / 'decks' / 'Makefile').exists()
+    for test_name, test_dir in jobs:
+        assert Path(test_dir, 'code').resolve() == shared / 'code'
+        assert Path(test_dir, 'build', f'{test_name}.exe').exists()
+    targets = (tmp_path / 'make.log').read_text().splitlines()
+    assert sorted(targets) == sorted(['libs ', 'libs '] +
+                                     [f'rundeck {test_name}' for test_name
+                                      in ['E1oM20', 'E4F40', 'E4TcadF40']] +
+                                     [f'gcm {test_name}'
+                                      for test_name, _ in jobs])
+
+    # make output goes to the BUILD log of each test directory, and
+    # the resource usage of the stage is recorded with its duration
+    log = Path(jobs[0][1], 'logs', 'build.log').read_text()
+    assert log.startswith(f'$ {make} -j') and '# exit 0' in log
+    records = [json.loads(line) for line in
+               (tmp_path / 'durations.jsonl').read_text().splitlines()]
+    assert all(record['usage']['max_rss'] > 0 for record in records
+               if record['stage'] in ['BUILD', 'MAKE'])
+
+    # Build times are recorded by number of make jobs
+    scaling = reg.get_make_scaling({'compiler': 'intel', 'mode': 'serial',
+                                    'target': 'libs'})
+    assert len(scaling) == 1 and 1 <= list(scaling)[0] <= 4
+
+    # Failures of shared builds are not retried by every test
+    (shared / 'serial.done').write_text('make libs failed.')
+    with pytest.raises(Exception):
+        reg.build_shared('intel', 'serial', jobs[0][1])
+
+
+def test_clone_options(tmp_path):
+    repo = str(tmp_path / 'repo')
+    git = ['git', '-C', repo, '-c', 'user.name=ASSERT',
+           '-c', 'user.email=assert@example.com']
+    sp.check_call(['git', 'init', '-q', '-b', 'main', repo])
+    for name in ['model', 'aux']:
+        (tmp_path / 'repo' / name).mkdir()
+        (tmp_path / 'repo' / name / 'file.txt').write_text(name)
+    sp.check_call(git + ['add', '.'])
+    sp.check_call(git + ['commit', '-q', '-m', 'first'])
+    (tmp_path / 'base' / 'main_traps').mkdir(parents=True)
+    (tmp_path / 'base' / 'main_traps' / 'lastGitDate').write_text(
+        '2020-01-31\n')
+
+    yaml_file = tmp_path / 'clone.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        'modelconfig:\n',
+        f'modelconfig:\n'
+        f'   repository: {repo}\n'
+        f'   repo_branch: main\n'
+        f'   buildtype: traps\n'
+        f'   clone_filter: blob:none\n'
+        f'   shallow_since: yes\n'
+        f'   sparse_paths: [model]\n'
+    ).replace(
+        'systemconfig:\n',
+        f'systemconfig:\n'
+        f'  basedir: {str(tmp_path / "base")}\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  result_cache_dir: {str(tmp_path / "results")}\n'
+        f'  mirror_dir: {str(tmp_path / "mirrors")}\n'
+        f'  history_file: {str(tmp_path / "durations.jsonl")}\n'
+    ).replace(
+        '    variables: [other, 3, no]\n',
+        '    variables: [other, 3, no]\n'
+        '    sparse_paths: model,aux\n'
+    ))
+
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    assert reg.get_clone_options() == {'filter_spec': 'blob:none',
+                                       'shallow_since': '2020-01-31',
+                                       'sparse_paths': ['model']}
+    assert reg.get_clone_options('Test Case 2')['sparse_paths'] == \
+        ['model', 'aux']
+
+    # Test directories check out sparse worktrees of the mirror
+    reg.update_mirror()
+    assert reg.mirror_root == str(tmp_path / 'mirrors')
+    for test_name in ['Test Case 1', 'Test Case 2']:
+        test_dir = tmp_path / test_name / 'intel-mpi'
+        assert reg.run_stage('CLONE', test_name, str(test_dir))
+        assert (test_dir / 'code' / 'model' / 'file.txt').exists()
+    assert not (tmp_path / 'Test Case 1' / 'intel-mpi' / 'code' /
+                'aux').exists()
+    assert (tmp_path / 'Test Case 2' / 'intel-mpi' / 'code' /
+            'aux').exists()
+
+
+def test_pin_revision(tmp_path):
+    repo = str(tmp_path / 'repo')
+    git = ['git', '-C', repo, '-c', 'user.name=ASSERT',
+           '-c', 'user.email=assert@example.com']
+    sp.check_call(['git', 'init', '-q', '-b', 'main', repo])
+    sp.check_call(git + ['commit', '-q', '--allow-empty', '-m', 'first'])
+    first = sp.check_output(git + ['rev-parse', 'HEAD']).decode().strip()
+
+    yaml_file = tmp_path / 'pin.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        'modelconfig:\n',
+        f'modelconfig:\n'
+        f'   repository: {repo}\n'
+        f'   repo_branch: main\n'
+    ).replace(
+        'systemconfig:\n',
+        f'systemconfig:\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  history_file: {str(tmp_path / "durations.jsonl")}\n'
+        f'  use_mirror: no\n'
+    ))
+    start_time = dt.datetime.now()
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=start_time)
+    assert reg.pin_revision() == first
+
+    # Test directories stay at the pinned commit when the branch moves
+    sp.check_call(git + ['commit', '-q', '--allow-empty', '-m', 'second'])
+    test_dir = tmp_path / 'Test Case 1' / 'intel-serial'
+    assert reg.run_stage('CLONE', 'Test Case 1', str(test_dir))
+    head = sp.check_output(['git', '-C', str(test_dir / 'code'),
+                            'rev-parse', 'HEAD']).decode().strip()
+    assert head == first
+
+    report = reg.report_cfg.send_report(dt.datetime.now())
+    assert f'COMMIT:     {first}' in report
+
+    # A resumed run tests the journaled commit, not the branch head
+    resumed = ModelEReg(yaml_file=str(yaml_file), start_time=start_time,
+                        resume=True)
+    assert resumed.pin_revision() == first
+    new_run = ModelEReg(yaml_file=str(yaml_file),
+                        start_time=start_time + dt.timedelta(seconds=1))
+    assert new_run.pin_revision() != first
+
+
+def test_module_environment(tmp_path):
+    modulecmd = make_modulecmd(tmp_path / 'bin')
+    # Records the modules loaded when it runs
+    make = tmp_path / 'make'
+    make.write_text(f'#!/bin/bash\n'
+                    f'echo $LOADEDMODULES >> {tmp_path / "make.log"}\n')
+    make.chmod(0o755)
+
+    yaml_file = tmp_path / 'modules.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        f'  scratchdir: {str(scratch_dir)}\n',
+        f'  scratchdir: {str(tmp_path / "scratch")}\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  history_file: {str(tmp_path / "durations.jsonl")}\n'
+        f'  modules: yes\n'
+        f'  modulecmd: {modulecmd}\n'
+        f'  module_cache_dir: {str(tmp_path / "modules")}\n'
+        f'  modulelist: intel_intelmpi,gcc_openmpi\n'
+        f'  intel_intelmpi: comp/intel/2021.3.0,mpi/impi/2021.3.0\n'
+        f'  gcc_openmpi: comp/gcc/10.1.0,mpi/hpcx/2.4.0\n'
+    ))
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    assert reg.get_compiler_modules('gfortran') == ['comp/gcc/10.1.0',
+                                                    'mpi/hpcx/2.4.0']
+    assert reg.get_modules('E1oM20', str(tmp_path / 'E1oM20' /
+                                         'intel-serial')) == \
+        ['comp/intel/2021.3.0', 'mpi/impi/2021.3.0']
+
+    # Modules are resolved once, and make runs with them loaded
+    for mode in ['serial', 'mpi']:
+        test_dir = str(tmp_path / 'E1oM20' / f'intel-{mode}')
+        reg.run_make([str(make)], {'compiler': 'intel', 'mode': mode},
+                     test_dir=test_dir, env=reg.get_env('E1oM20', test_dir))
+    assert (tmp_path / 'make.log').read_text() == \
+        'comp/intel/2021.3.0:mpi/impi/2021.3.0\n' * 2
+    assert len(get_calls(tmp_path / 'bin')) == 2
+
+    # Without modules, subprocesses inherit the current environment
+    reg.system_cfg['modules'] = 'no'
+    assert reg.get_env('E1oM20', str(tmp_path / 'intel-serial')) is None
+
+
+def test_run_watchdog(tmp_path):
+    yaml_file = tmp_path / 'watchdog.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        f'  scratchdir: {str(scratch_dir)}\n',
+        f'  scratchdir: {str(tmp_path / "scratch")}\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  history_file: {str(tmp_path / "durations.jsonl")}\n'
+        f'  stall_interval: 0.5\n'
+        f'  watchdog_interval: 0.1\n'
+    ))
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    test_dir = str(tmp_path / 'E1oM20' / 'intel-mpi')
+
+    def run(test_name: str, cwd: str) -> None:
+        # Writes a few steps, then deadlocks
+        reg.run_command([sys.executable, '-u', '-c',
+                         'import time\n'
+                         'print("step 1", flush=True)\n'
+                         'time.sleep(60)'], cwd, 'RUN')
+
+    reg.run = run
+    assert not reg.run_stage('RUN', 'E1oM20', test_dir)
+    assert Path(reg.get_hang_file(test_dir)).read_text().startswith('=== ')
+    log = Path(reg.get_stage_log(test_dir, 'RUN')).read_text()
+    assert 'step 1' in log and '# hung' in log
+
+    test_report = reg.new_test_report('E1oM20', test_dir)
+    test_report['HANG'] = True
+    reg.report_cfg.add_test(test_report)
+    reg.report_cfg.add_test_report()
+    assert '(hang)' in reg.report_cfg.report
+
+    # Hang markers of previous attempts are cleared
+    reg.run = lambda test_name, cwd: None
+    assert reg.run_stage('RUN', 'E1oM20', test_dir)
+    assert not Path(reg.get_hang_file(test_dir)).exists()
+
+
+def make_rune(path: Path) -> Path:
+    # Stand-in for runE: 4 steps, checkpoints after step 2 (fort.1,
+    # paused mid-write) and step 3 (fort.2), and a final restart file.
+    # Restarts continue from a complete fort.1
+    rune = path / 'runE'
+    rune.write_text(
+        f'#!{sys.executable}\n'
+        f'import os, sys, time\n'
+        f'from pathlib import Path\n'
+        f'deck, npes = sys.argv[1], sys.argv[3]\n'
+        f'cold = "-cold-restart" in sys.argv\n'
+        f'rundir = [line.split("=", 1)[1] for line in\n'
+        f'          open(os.environ["MODELERC"]).read().splitlines()\n'
+        f'          if line.startswith("CMRUNDIR=")][0]\n'
+        f'assert Path.cwd() == Path(rundir) / deck\n'
+        f'with open({str(path / "legs.log")!r}, "a") as log:\n'
+        f'    log.write(f"start {{cold}} {{npes}} {{time.time()}}\\n")\n'
+        f'if not cold:\n'
+        f'    text = Path("fort.1").read_text()\n'
+        f'    assert text.endswith(" done"), text\n'
+        f'step = 0 if cold else int(text.split()[0])\n'
+        f'while step < 4:\n'
+        f'    step += 1\n'
+        f'    print("step", step, flush=True)\n'
+        f'    if step == 2:\n'
+        f'        with open("fort.1", "w") as fid:\n'
+        f'            fid.write(str(step))\n'
+        f'            fid.flush()\n'
+        f'            time.sleep(0.4)\n'
+        f'            fid.write(" done")\n'
+        f'    if step == 3:\n'
+        f'        Path("fort.2").write_text(str(step))\n'
+        f'    time.sleep(0.4)\n'
+        f'Path("1JAN1950.rsf" + deck).write_text(f"state {{step}}")\n'
+        f'with open({str(path / "legs.log")!r}, "a") as log:\n'
+        f'    log.write(f"end {{cold}} {{npes}} {{time.time()}}\\n")\n'
+    )
+    rune.chmod(0o755)
+    return rune
+
+
+def test_restart_run(tmp_path):
+    rune = make_rune(tmp_path)
+    yaml_file = tmp_path / 'restart.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        f'  scratchdir: {str(scratch_dir)}\n',
+        f'  scratchdir: {str(tmp_path / "scratch")}\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  history_file: {str(tmp_path / "durations.jsonl")}\n'
+        f'  rune: {str(rune)}\n'
+        f'  checkpoint_interval: 0.1\n'
+    ).replace(
+        '  Test Case 1:\n',
+        '  E1oM20:\n'
+        '    run: yes\n'
+        '    compilers: intel\n'
+        '    modes: mpi\n'
+        '    npes: [1, 4]\n'
+        '    verification: restartRun\n'
+        '  Test Case 1:\n'
+    ))
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    test_dir = str(tmp_path / 'E1oM20' / 'intel-mpi')
+    assert reg.get_run_npes('E1oM20', test_dir) == [1, 4]
+    # Both legs run at the same time
+    assert reg.get_test_cores('E1oM20', test_dir) == 8
+    assert reg.get_test_cores('E1oM20', str(tmp_path / 'intel-serial')) == 2
+
+    # Nothing is run (or compared) if no executable was built, even
+    # though the setup created the run directory
+    reg.test_cfg.set_runnable_tests()
+    reg.test_cfg.setup_tests()
+    test_dir = reg.test_cfg.get_dirs()['E1oM20'][0]
+    assert Path(reg.get_run_outputs(test_dir)[0]).is_dir()
+    assert reg.run_stage('RUN', 'E1oM20', test_dir)
+    assert reg.run_stage('COMPARE', 'E1oM20', test_dir)
+    assert not (tmp_path / 'legs.log').exists()
+    # Their durations would make predicted walltimes far too short
+    history = tmp_path / 'durations.jsonl'
+    assert not history.exists() or \
+        '"stage": "RUN"' not in history.read_text()
+    bin_dir = Path(reg.get_build_artifacts('E1oM20', test_dir)['bin'])
+    bin_dir.mkdir(parents=True)
+    (bin_dir / 'E1oM20.exe').write_text('')
+    reg.system_cfg['rune'] = str(tmp_path / 'missing' / 'runE')
+    assert not reg.can_run('E1oM20', test_dir)
+    reg.system_cfg['rune'] = str(rune)
+    assert reg.can_run('E1oM20', test_dir)
+
+    assert reg.run_stage('RUN', 'E1oM20', test_dir)
+    events = [line.split() for line in
+              (tmp_path / 'legs.log').read_text().splitlines()]
+    assert len(events) == 8
+    # The usage of every leg is recorded with the stage
+    records = [json.loads(line) for line in
+               (tmp_path / 'durations.jsonl').read_text().splitlines()]
+    assert records[-1]['stage'] == 'RUN'
+    assert records[-1]['usage']['commands'] == 4
+    for npes in ['1', '4']:
+        times = {(event, cold): float(seconds)
+                 for event, cold, leg_npes, seconds in events
+                 if leg_npes == npes}
+        # The restart leg starts before the continuous leg ends
+        assert times['start', 'False'] < times['end', 'True']
+        leg_dir = reg.get_leg_dir(test_dir, int(npes), 'restart')
+        assert 'step 3' in (leg_dir / 'restart.log').read_text()
+        assert 'step 1' not in (leg_dir / 'restart.log').read_text()
+
+    # Restart files that differ fail the comparison
+    restart = reg.get_leg_dir(test_dir, 4, 'restart') / 'E1oM20'
+    (restart / '1JAN1950.rsfE1oM20').write_text('state 5')
+    with pytest.raises(Exception, match='differs after a restart'):
+        reg.compare_restart('E1oM20', test_dir, 4)
+    (restart / '1JAN1950.rsfE1oM20').write_text('state 4')
+    assert reg.run_stage('COMPARE', 'E1oM20', test_dir)
+
+    # Stacks of hung legs end up in the test directory's hang file
+    for leg in ['continuous', 'restart']:
+        leg_dir = reg.get_leg_dir(test_dir, 1, leg)
+        leg_dir.mkdir(parents=True)
+        (leg_dir / f'{leg}.hang').write_text(f'=== {leg} stacks')
+    reg.merge_legs(test_dir, 1, [None, None])
+    stacks = Path(reg.get_hang_file(test_dir)).read_text()
+    assert '=== continuous stacks' in stacks
+    assert '=== restart stacks' in stacks
+
+
+def test_npe_reproducibility(tmp_path, monkeypatch):
+    rune = make_rune(tmp_path)
+    yaml_file = tmp_path / 'npe.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        f'  scratchdir: {str(scratch_dir)}\n',
+        f'  scratchdir: {str(tmp_path / "scratch")}\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  history_file: {str(tmp_path / "durations.jsonl")}\n'
+        f'  rune: {str(rune)}\n'
+        f'  checkpoint_interval: 0.1\n'
+    ).replace(
+        '  Test Case 1:\n',
+        '  E1oM20:\n'
+        '    npes: [1, 4, 8]\n'
+        '    verification: restartRun\n'
+        '  Test Case 1:\n'
+    ))
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    test_dir = str(tmp_path / 'E1oM20' / 'intel-mpi')
+    bin_dir = Path(reg.get_build_artifacts('E1oM20', test_dir)['bin'])
+    bin_dir.mkdir(parents=True)
+    (bin_dir / 'E1oM20.exe').write_text('')
+    assert reg.run_stage('RUN', 'E1oM20', test_dir)
+
+    # Each processor count's restart files are hashed once
+    hashed = list()
+
+    def count_hash(path: str, *args, **kwargs) -> str:
+        hashed.append(path)
+        return hash_file(path, *args, **kwargs)
+
+    monkeypatch.setattr('src.models.model_e.model_e_reg.hash_file',
+                        count_hash)
+    assert reg.compare_npes('E1oM20', test_dir) == '3/3'
+    assert len(hashed) == 3
+
+    continuous = reg.get_leg_dir(test_dir, 8, 'continuous') / 'E1oM20'
+    (continuous / '1JAN1950.rsfE1oM20').write_text('state 5')
+    assert reg.compare_npes('E1oM20', test_dir) == '2/3'
+    (continuous / '1JAN1950.rsfE1oM20').write_text('state 4')
+
+    # The count outlives the test directory being cleared out
+    assert reg.run_stage('COMPARE', 'E1oM20', test_dir)
+    assert not (Path(test_dir) / 'run').exists()
+    assert reg.read_test_results(test_dir) == {'NPE': '3/3'}
+    test_report = reg.new_test_report('E1oM20', test_dir)
+    test_report.update(reg.read_test_results(test_dir))
+    reg.report_cfg.add_test(test_report)
+    reg.report_cfg.add_test_report()
+    assert '3/3' in reg.report_cfg.report
+
+    # Results of previous attempts are cleared
+    reg.run = lambda test_name, cwd: None
+    assert reg.run_stage('RUN', 'E1oM20', test_dir)
+    assert reg.read_test_results(test_dir) == dict()
+
+
+@pytest.mark.parametrize("backend", ['local', 'slurm'])
+def test_batch_run(tmp_path, backend):
+    rune = make_rune(tmp_path)
+    yaml_file = tmp_path / 'batch.yaml'
+    yaml_file.write_text(yaml_text.replace(
+        f'  scratchdir: {str(scratch_dir)}\n',
+        f'  scratchdir: {str(tmp_path / "scratch")}\n'
+        f'  journal_dir: {str(tmp_path / "journals")}\n'
+        f'  history_file: {str(tmp_path / "durations.jsonl")}\n'
+        f'  rune: {str(rune)}\n'
+    ).replace(
+        '  Test Case 1:\n',
+        '  E1oM20:\n'
+        '    npes: [1, 4]\n'
+        '    verification: restartRun\n'
+        '  Test Case 1:\n'
+    ))
+    reg = ModelEReg(yaml_file=str(yaml_file), start_time=dt.datetime.now())
+    # Runs are only submitted with usebatch
+    assert reg.batch is None
+    if backend == 'local':
+        reg.batch = LocalBackend(max_workers=2, interval=60)
+    else:
+        reg.batch = SlurmBackend(interval=60,
+                                 **make_fake_slurm(tmp_path / 'bin'))
+    reg.batch_queue = BatchQueue(reg.batch)
+    test_dirs = [str(tmp_path / 'E1oM20' / f'{compiler}-mpi')
+                 for compiler in ['intel', 'gfortran']]
+    for test_dir in test_dirs:
+        bin_dir = Path(reg.get_build_artifacts('E1oM20', test_dir)['bin'])
+        bin_dir.mkdir(parents=True)
+        (bin_dir / 'E1oM20.exe').write_text('')
+    # Batch jobs don't hold cores of the node
+    reg.tokens = None
+
+    # Legs ask for the table walltime until runs are recorded, then
+    # for the predicted one (within the stage timeout)
+    test_dir = test_dirs[0]
+    job = reg.get_leg_job('E1oM20', test_dir, 1, 'continuous')
+    assert job['walltime'] == '01:30:00'
+    reg.history.record(reg.get_test_key('E1oM20', test_dir), 'RUN', 7200)
+    job = reg.get_leg_job('E1oM20', test_dir, 1, 'continuous')
+    assert job['walltime'] == '02:24:00'
+    reg.system_cfg['timeouts'] = {'RUN': '02:00:00'}
+    job = reg.get_leg_job('E1oM20', test_dir, 1, 'continuous')
+    assert job['walltime'] == '02:00:00'
+    del reg.system_cfg['timeouts']
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        assert all(pool.map(lambda test_dir: reg.run_stage(
+            'RUN', 'E1oM20', test_dir), test_dirs))
+    # Ended jobs are noticed through their exit markers, not polls
+    assert time.monotonic() - start < 30
+    events = [line.split() for line in
+              (tmp_path / 'legs.log').read_text().splitlines()]
+    assert len(events) == 16
+    for npes in ['1', '4']:
+        ends = [float(seconds) for event, cold, leg_npes, seconds
+                in events if (event, cold, leg_npes) == ('end', 'True',
+                                                         npes)]
+        starts = [float(seconds) for event, cold, leg_npes, seconds
+                  in events if (event, cold, leg_npes) == ('start',
+                                                           'False', npes)]
+        # Restart legs are submitted once a continuous leg ended
+        assert min(ends) <= min(starts)
+        for test_dir in test_dirs:
+            leg_dir = reg.get_leg_dir(test_dir, int(npes), 'restart')
+            assert 'step 3' in (leg_dir / 'restart.log').read_text()
+    if backend == 'slurm':
+        # The continuous legs of both tests share one array per
+        # processor count, restart legs ending together share one
+        state = tmp_path / 'bin' / 'state'
+        assert (state / '1000_1').exists() and (state / '1001_1').exists()
+        assert get_slurm_calls(tmp_path / 'bin').count('sbatch') <= 6
+    for test_dir in test_dirs:
+        assert reg.run_stage('COMPARE', 'E1oM20', test_dir)
+
+    # Failed legs fail the stage
+    bin_dir.mkdir(parents=True)
+    (bin_dir / 'E1oM20.exe').write_text('')
+    rune.write_text('#!/bin/sh\nexit 1\n')
+    assert not reg.run_stage('RUN', 'E1oM20', test_dir)
@@ -0,0 +1,66 @@
+import pytest
+
+from src.lib.utils.history import DurationHistory
+from src.models.model_e.model_e_walltime import *
+
+key = {'rundeck': 'E6TvsdF40', 'compiler': 'intel', 'mode': 'mpi',
+       'npes': [1, 22], 'verification': 'restartRun'}
+
+
+@pytest.mark.parametrize("deck_name, mode, verification, walltime",
+                         [('E6TvsdF40', 'mpi', 'restartRun', '07:00:00'),
+                          ('E6TvsdF40', 'serial', 'restartRun',
+                           '06:00:00'),
+                          ('SGP4TESTS', 'serial', 'restartRun',
+                           '00:10:00'),
+                          ('EM20', 'mpi', 'restartRun', '01:30:00'),
+                          ('E6TmatrixF40', 'mpi', 'customRun', '4:00:00'),
+                          ('EM20', 'mpi', 'compileOnly', '00:10:00')])
+def test_get_table_walltime(deck_name, mode, verification, walltime):
+    assert get_table_walltime(deck_name, mode, verification) == walltime
+
+
+def test_get_walltime_from_history(tmp_path):
+    history = DurationHistory(str(tmp_path / 'durations.jsonl'),
+                              percentile=95, margin=0.2)
+    # No history: hand-tuned table
+    assert get_walltime(history, key, ['RUN'], 'E6TvsdF40', 'mpi',
+                        'restartRun') == '07:00:00'
+    assert get_duration(history, key, ['RUN'], 'E6TvsdF40', 'mpi',
+                        'restartRun') == 7 * 3600
+
+    for seconds in [1500, 1600, 1700]:
+        history.record(key, 'RUN', seconds)
+    # 1700s + 20% = 34 minutes, but never less than a quarter of the
+    # table walltime
+    assert get_walltime(history, key, ['RUN'], 'E6TvsdF40', 'mpi',
+                        'restartRun') == '01:45:00'
+    assert get_duration(history, key, ['RUN'], 'E6TvsdF40', 'mpi',
+                        'restartRun') == pytest.approx(2040)
+    for seconds in [8000, 9000]:
+        history.record(key, 'RUN', seconds)
+    # 9000s + 20% = 3 hours
+    assert get_walltime(history, key, ['RUN'], 'E6TvsdF40', 'mpi',
+                        'restartRun') == '03:00:00'
+
+    # Stages without history: hand-tuned table
+    history.record(key, 'BUILD', 120)
+    assert get_walltime(history, key, ['BUILD', 'RUN', 'COMPARE'],
+                        'E6TvsdF40', 'mpi', 'restartRun') == '07:00:00'
+
+
+@pytest.mark.parametrize("npes, expected", [
+    (None, [1]), (4, [4]), ('1,4', [1, 4]), ([1, 8], [1, 8]),
+    (['1', '22'], [1, 22]), ([], [1])
+])
+def test_parse_npes(npes, expected):
+    assert parse_npes(npes) == expected
+
+
+def test_make_test_key():
+    # Raw config values and normalized ones give the same key
+    assert make_test_key('E1oM20', 'intel', 'mpi', '1,4', 'restartRun') == \
+        make_test_key('E1oM20', 'intel', 'mpi', [1, 4], 'restartRun')
+    assert make_test_key('E1oM20', 'intel', 'mpi', [1, 4], 'restartRun') \
+        == {'rundeck': 'E1oM20', 'compiler': 'intel', 'mode': 'mpi',
+            'npes': [1, 4], 'verification': 'restartRun'}